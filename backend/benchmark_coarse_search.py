@@ -0,0 +1,85 @@
+"""
+Báo cáo recall vs latency cho two-stage search (Matryoshka)
+Đo từng coarse dimension trên dữ liệu của store để chọn k trước khi migrate
+"""
+
+import os
+import sys
+import json
+import argparse
+import logging
+
+# Add backend to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from db.faiss_store import FAISSStore
+from db.sharded_store import PARTITIONS, ShardedFAISSStore
+
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Recall vs latency của two-stage search theo coarse dimension")
+    parser.add_argument("--index-path", default="data/faiss_index", help="Thư mục FAISS index")
+    parser.add_argument("--metadata-path", default="data/metadata", help="Thư mục metadata")
+    parser.add_argument("--dimension", type=int, default=1024, help="Dimension của vector")
+    parser.add_argument("--shard-by", default=os.getenv("FAISS_SHARD_BY", ""), choices=("",) + PARTITIONS,
+                        help="Store chia shard (mặc định theo FAISS_SHARD_BY)")
+    parser.add_argument("--num-shards", type=int, default=int(os.getenv("FAISS_NUM_SHARDS", "4")),
+                        help="Số shard khi chia theo hash")
+    parser.add_argument("--dimensions", default="64,128,256,512", help="Các coarse dimension cần đo, cách nhau bởi dấu phẩy")
+    parser.add_argument("--num-queries", type=int, default=200, help="Số queries lấy mẫu từ store")
+    parser.add_argument("--top-k", type=int, default=10, help="Số kết quả mỗi query")
+    parser.add_argument("--rerank-factor", type=int, default=4, help="Shortlist = top_k * rerank_factor")
+    parser.add_argument("--output", help="Ghi báo cáo ra file JSON")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+
+    print("📊 Two-stage Search Report")
+    print("=" * 50)
+
+    if args.shard_by:
+        store = ShardedFAISSStore(
+            index_path=args.index_path,
+            metadata_path=args.metadata_path,
+            dimension=args.dimension,
+            partition=args.shard_by,
+            num_shards=args.num_shards,
+            wal_enabled=False
+        )
+    else:
+        store = FAISSStore(
+            index_path=args.index_path,
+            metadata_path=args.metadata_path,
+            dimension=args.dimension,
+            wal_enabled=False
+        )
+    store.load_index()
+    stats = store.get_stats()
+    print(f"Store: {stats['total_vectors']} vectors, index {stats['index_type']}, dimension {args.dimension}")
+
+    report = store.coarse_search_report(
+        dimensions=[int(value) for value in args.dimensions.split(",")],
+        num_queries=args.num_queries,
+        top_k=args.top_k,
+        rerank_factor=args.rerank_factor
+    )
+
+    print(f"\n{'k':>6} {'recall coarse':>14} {'recall 2-stage':>15} {'ms coarse':>10} {'ms 2-stage':>11} {'bytes/vec':>10}")
+    for row in report:
+        print(
+            f"{row['coarse_dimension']:>6} {row['recall_coarse']:>14.3f} {row['recall_two_stage']:>15.3f} "
+            f"{row['latency_ms_coarse']:>10.3f} {row['latency_ms_two_stage']:>11.3f} {row['index_bytes_per_vector']:>10}"
+        )
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({"top_k": args.top_k, "rerank_factor": args.rerank_factor, "report": report}, f, indent=2)
+        print(f"\n💾 Saved report to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Benchmark throughput của các embedding backend trên CPU
+So sánh PyTorch fp32 (SentenceTransformer) với ONNX Runtime fp32 / int8 theo số intra-op threads
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+
+import numpy as np
+
+# Add backend to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.onnx_embedding import EXPORT_CONFIG_FILE, OnnxEmbeddingModel, embedding_parity
+from export_embedding_onnx import SAMPLE_TEXTS
+
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Throughput embedding: PyTorch vs ONNX fp32/int8")
+    parser.add_argument("--model-path", default="models/embedding", help="Thư mục model sentence-transformers")
+    parser.add_argument("--onnx-dir", default="models/embedding_onnx", help="Thư mục model ONNX đã export")
+    parser.add_argument("--texts-file", help="File texts (mỗi dòng một chunk), mặc định sinh từ texts mẫu")
+    parser.add_argument("--num-texts", type=int, default=256, help="Số texts mỗi lần đo")
+    parser.add_argument("--batch-size", type=int, default=16, help="Batch size khi encode")
+    parser.add_argument("--threads", default="0", help="Các số intra-op threads cần đo, cách nhau bởi dấu phẩy (0 = mặc định)")
+    parser.add_argument("--skip-torch", action="store_true", help="Bỏ qua backend PyTorch")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--output", help="Ghi báo cáo ra file JSON")
+    return parser.parse_args()
+
+def build_texts(args) -> list:
+    """Texts dạng chunk với độ dài khác nhau (ghép ngẫu nhiên các câu mẫu)"""
+    if args.texts_file:
+        with open(args.texts_file, 'r', encoding='utf-8') as f:
+            texts = [line.strip() for line in f if line.strip()]
+        return ["query: " + text for text in texts[:args.num_texts]]
+
+    rng = np.random.default_rng(args.seed)
+    return [
+        "query: " + " ".join(rng.choice(SAMPLE_TEXTS, size=rng.integers(1, 12)))
+        for _ in range(args.num_texts)
+    ]
+
+def measure(encode, texts, batch_size) -> dict:
+    """Warm-up một batch rồi đo thời gian encode toàn bộ texts"""
+    encode(texts[:batch_size], batch_size)
+    start = time.perf_counter()
+    embeddings = encode(texts, batch_size)
+    elapsed = time.perf_counter() - start
+    return {
+        "seconds": round(elapsed, 3),
+        "texts_per_second": round(len(texts) / elapsed, 2),
+        "embeddings": embeddings
+    }
+
+def main():
+    args = parse_args()
+    texts = build_texts(args)
+    thread_counts = [int(value) for value in args.threads.split(",")]
+
+    print("📊 Embedding Backend Benchmark")
+    print("=" * 50)
+    print(f"{len(texts)} texts, batch size {args.batch_size}, {os.cpu_count()} CPUs")
+
+    report = {"num_texts": len(texts), "batch_size": args.batch_size, "cpu_count": os.cpu_count(), "runs": []}
+    reference = None
+
+    if not args.skip_torch:
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        model = SentenceTransformer(args.model_path, device="cpu")
+        for threads in thread_counts:
+            if threads:
+                torch.set_num_threads(threads)
+            result = measure(
+                lambda batch, size: model.encode(batch, batch_size=size, convert_to_numpy=True, show_progress_bar=False),
+                texts, args.batch_size
+            )
+            reference = result.pop("embeddings")
+            report["runs"].append({"backend": "torch-fp32", "threads": threads or torch.get_num_threads(), **result})
+            print(f"⏳ torch-fp32  threads={threads or 'default'}: {result['texts_per_second']:.1f} texts/s")
+        del model
+
+    with open(os.path.join(args.onnx_dir, EXPORT_CONFIG_FILE), 'r', encoding='utf-8') as f:
+        variants = list(json.load(f)["files"])
+
+    for variant in variants:
+        for threads in thread_counts:
+            model = OnnxEmbeddingModel(args.onnx_dir, quantized=variant == "int8", intra_op_threads=threads or None)
+            result = measure(lambda batch, size: model.encode(batch, batch_size=size), texts, args.batch_size)
+            embeddings = result.pop("embeddings")
+            run = {"backend": f"onnx-{variant}", "threads": threads or "default", **result}
+            if reference is not None:
+                run["parity"] = embedding_parity(reference, embeddings)
+            report["runs"].append(run)
+            parity = f", min cosine {run['parity']['min_cosine']:.4f}" if "parity" in run else ""
+            print(f"⏳ onnx-{variant:<5} threads={threads or 'default'}: {result['texts_per_second']:.1f} texts/s{parity}")
+
+    best = max(report["runs"], key=lambda run: run["texts_per_second"])
+    baseline = next((run for run in report["runs"] if run["backend"] == "torch-fp32"), None)
+    if baseline:
+        report["best_speedup"] = round(best["texts_per_second"] / baseline["texts_per_second"], 2)
+    print(f"\n🚀 Best: {best['backend']} threads={best['threads']} ({best['texts_per_second']:.1f} texts/s)"
+          + (f", {report['best_speedup']}x vs torch-fp32" if baseline else ""))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Saved report to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Benchmark latency xóa document của VectorDB
+So sánh delete vectorized (remove_ids + mask, ghi disk khi flush) với cách cũ
+(reconstruct từng vector, normalize lại, ghi pickle sau mỗi lần xóa)
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+import tempfile
+
+import faiss
+import numpy as np
+
+# Add backend to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from db.vector_db import VectorDB
+
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Latency xóa document của VectorDB")
+    parser.add_argument("--num-vectors", type=int, default=100000, help="Số vectors trong index")
+    parser.add_argument("--dimension", type=int, default=768, help="Dimension của vector")
+    parser.add_argument("--chunks-per-doc", type=int, default=50, help="Số vectors mỗi document")
+    parser.add_argument("--num-deletes", type=int, default=20, help="Số documents xóa bằng delete mới")
+    parser.add_argument("--legacy-deletes", type=int, default=3, help="Số documents xóa bằng cách cũ (0 để bỏ qua)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--output", help="Ghi báo cáo ra file JSON")
+    return parser.parse_args()
+
+def build_db(path: str, args) -> VectorDB:
+    """Tạo VectorDB với num_vectors vectors ngẫu nhiên chia đều theo documents"""
+    rng = np.random.default_rng(args.seed)
+    vectors = rng.standard_normal((args.num_vectors, args.dimension), dtype=np.float32)
+    metadata_list = [
+        {"document_id": f"doc_{i // args.chunks_per_doc}", "chunk_index": i % args.chunks_per_doc}
+        for i in range(args.num_vectors)
+    ]
+    db = VectorDB(dimension=args.dimension, index_path=path)
+    db.add_vectors(vectors, metadata_list)
+    return db
+
+def legacy_delete(db: VectorDB, document_id: str) -> int:
+    """Cách xóa cũ: reconstruct từng vector, rebuild + normalize, ghi pickle ngay"""
+    vectors_to_remove = set(db.doc_positions.get(document_id, []))
+    if not vectors_to_remove:
+        return 0
+
+    new_metadata = []
+    new_vectors = []
+    for i, metadata in enumerate(db.metadata):
+        if i not in vectors_to_remove:
+            new_metadata.append(metadata)
+            new_vectors.append(db.index.reconstruct(i))
+
+    db.index = faiss.IndexFlatIP(db.dimension)
+    if new_vectors:
+        new_vectors = np.array(new_vectors)
+        faiss.normalize_L2(new_vectors)
+        db.index.add(new_vectors)
+
+    db.metadata = new_metadata
+    db._rebuild_doc_positions()
+    db._save_index()
+    return len(vectors_to_remove)
+
+def time_deletes(db: VectorDB, document_ids, delete_fn) -> list:
+    """Latency (ms) từng lần xóa"""
+    latencies = []
+    for document_id in document_ids:
+        start = time.perf_counter()
+        removed = delete_fn(db, document_id)
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert removed > 0, f"{document_id} has no vectors"
+    return latencies
+
+def summarize(latencies: list) -> dict:
+    values = np.array(latencies)
+    return {
+        "deletes": len(latencies),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "max_ms": round(float(values.max()), 3)
+    }
+
+def main():
+    args = parse_args()
+    num_documents = args.num_vectors // args.chunks_per_doc
+    if args.num_deletes + args.legacy_deletes > num_documents:
+        raise SystemExit(f"❌ Only {num_documents} documents, cannot delete {args.num_deletes + args.legacy_deletes}")
+
+    print("📊 VectorDB Delete Benchmark")
+    print("=" * 50)
+    print(f"{args.num_vectors} vectors, dimension {args.dimension}, {args.chunks_per_doc} vectors/document")
+
+    rng = np.random.default_rng(args.seed)
+    picked = [f"doc_{i}" for i in rng.choice(num_documents, args.num_deletes + args.legacy_deletes, replace=False)]
+
+    report = {
+        "num_vectors": args.num_vectors,
+        "dimension": args.dimension,
+        "chunks_per_doc": args.chunks_per_doc
+    }
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = build_db(os.path.join(tmp_dir, "vectorized"), args)
+        latencies = time_deletes(db, picked[:args.num_deletes], VectorDB.delete_document_vectors)
+        start = time.perf_counter()
+        db.flush()
+        flush_ms = (time.perf_counter() - start) * 1000
+        report["vectorized"] = {**summarize(latencies), "flush_ms": round(flush_ms, 3)}
+        print(f"\n⏳ Vectorized: p50 {report['vectorized']['p50_ms']:.1f} ms, "
+              f"p95 {report['vectorized']['p95_ms']:.1f} ms, flush {flush_ms:.1f} ms")
+        del db
+
+        if args.legacy_deletes:
+            db = build_db(os.path.join(tmp_dir, "legacy"), args)
+            latencies = time_deletes(db, picked[args.num_deletes:], legacy_delete)
+            report["legacy"] = summarize(latencies)
+            report["speedup_p50"] = round(report["legacy"]["p50_ms"] / report["vectorized"]["p50_ms"], 1)
+            print(f"⏳ Legacy:     p50 {report['legacy']['p50_ms']:.1f} ms, p95 {report['legacy']['p95_ms']:.1f} ms")
+            print(f"🚀 Speedup (p50): {report['speedup_p50']}x")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Saved report to {args.output}")
+
+if __name__ == "__main__":
+    main()
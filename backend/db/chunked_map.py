@@ -0,0 +1,168 @@
+"""
+Chunked Map - Cấu trúc copy-on-write cho snapshot của FAISS Store
+ChunkedDict chia dict theo bucket (copy chỉ copy danh sách bucket, ghi chỉ copy bucket bị sửa),
+AppendLog là list append-only dùng chung giữa các bản copy (mỗi bản chỉ thấy count phần tử đầu)
+"""
+
+from collections.abc import MutableMapping
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set
+
+MIN_BUCKETS = 64
+
+class ChunkedDict(MutableMapping):
+    """
+    Dict copy-on-write theo bucket
+
+    copy() chỉ copy danh sách bucket (O(số bucket)), lần ghi đầu vào một bucket sau khi copy
+    mới copy bucket đó; số bucket tăng theo căn bậc hai số phần tử nên một lần ghi tốn
+    O(sqrt(n)) thay vì O(n) như dict(...).
+    """
+    __slots__ = ("_buckets", "_owned", "_size")
+
+    def __init__(self, items: Any = None, num_buckets: int = MIN_BUCKETS):
+        self._buckets: List[Dict[Any, Any]] = [{} for _ in range(num_buckets)]
+        self._owned: Set[int] = set(range(num_buckets))
+        self._size = 0
+        if items:
+            self.update(items)
+
+    def copy(self) -> "ChunkedDict":
+        """
+        Bản copy dùng chung các bucket; bản này và bản copy đều copy bucket trước khi sửa
+        """
+        clone = ChunkedDict.__new__(ChunkedDict)
+        clone._buckets = list(self._buckets)
+        clone._owned = set()
+        clone._size = self._size
+        self._owned = set()
+        return clone
+
+    def _slot(self, key: Any) -> int:
+        return hash(key) % len(self._buckets)
+
+    def _writable_bucket(self, key: Any) -> Dict[Any, Any]:
+        slot = self._slot(key)
+        if slot not in self._owned:
+            self._buckets[slot] = dict(self._buckets[slot])
+            self._owned.add(slot)
+        return self._buckets[slot]
+
+    def _maybe_grow(self):
+        # Giữ kích thước bucket ~ số bucket (căn bậc hai số phần tử)
+        num_buckets = len(self._buckets)
+        if self._size <= num_buckets * num_buckets:
+            return
+        buckets = [{} for _ in range(num_buckets * 4)]
+        for bucket in self._buckets:
+            for key, value in bucket.items():
+                buckets[hash(key) % len(buckets)][key] = value
+        self._buckets = buckets
+        self._owned = set(range(len(buckets)))
+
+    def __getitem__(self, key: Any) -> Any:
+        return self._buckets[self._slot(key)][key]
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        return self._buckets[self._slot(key)].get(key, default)
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self._buckets[self._slot(key)]
+
+    def __setitem__(self, key: Any, value: Any):
+        bucket = self._writable_bucket(key)
+        if key not in bucket:
+            self._size += 1
+        bucket[key] = value
+        self._maybe_grow()
+
+    def __delitem__(self, key: Any):
+        if key not in self:
+            raise KeyError(key)
+        del self._writable_bucket(key)[key]
+        self._size -= 1
+
+    def pop(self, key: Any, *default: Any) -> Any:
+        # Luôn copy bucket (kể cả khi không có key): cache của bản cũ có thể được ghi thêm sau copy()
+        bucket = self._writable_bucket(key)
+        if key in bucket:
+            self._size -= 1
+            return bucket.pop(key)
+        if default:
+            return default[0]
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[Any]:
+        for bucket in self._buckets:
+            yield from list(bucket)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __repr__(self) -> str:
+        return f"ChunkedDict({dict(self.items())!r})"
+
+class AppendLog:
+    """
+    List append-only dùng chung giữa các bản copy, tìm phần tử theo key
+
+    Bản copy thấy count phần tử đầu, các phần tử này không bao giờ bị sửa nên append
+    của bản mới không ảnh hưởng bản cũ đang được đọc. Append vào bản không còn ở cuối
+    list (bản khác đã append sau nó, vd. transaction bị rollback) thì tách ra list riêng.
+    """
+    __slots__ = ("_items", "_positions", "_count", "_key")
+
+    def __init__(self, key: Optional[Callable[[Any], Any]] = None):
+        """
+        Args:
+            key: Hàm lấy key của phần tử (None: chính phần tử là key)
+        """
+        self._items: List[Any] = []
+        self._positions: Dict[Any, int] = {}
+        self._count = 0
+        self._key = key
+
+    def copy(self) -> "AppendLog":
+        """Bản copy dùng chung list (O(1))"""
+        clone = AppendLog.__new__(AppendLog)
+        clone._items = self._items
+        clone._positions = self._positions
+        clone._count = self._count
+        clone._key = self._key
+        return clone
+
+    def _key_of(self, item: Any) -> Any:
+        return item if self._key is None else self._key(item)
+
+    def append(self, item: Any) -> int:
+        """
+        Thêm phần tử, trả về vị trí của phần tử
+        """
+        if len(self._items) != self._count:
+            self._items = self._items[:self._count]
+            self._positions = {self._key_of(existing): i for i, existing in enumerate(self._items)}
+        self._items.append(item)
+        self._positions[self._key_of(item)] = self._count
+        self._count += 1
+        return self._count - 1
+
+    def find(self, key: Any) -> Optional[int]:
+        """
+        Vị trí của phần tử có key trong bản này (None nếu không có)
+        """
+        position = self._positions.get(key)
+        if position is None or position >= self._count or self._key_of(self._items[position]) != key:
+            return None
+        return position
+
+    def __getitem__(self, position: int) -> Any:
+        if not 0 <= position < self._count:
+            raise IndexError(position)
+        return self._items[position]
+
+    def __iter__(self) -> Iterator[Any]:
+        items = self._items
+        for position in range(self._count):
+            yield items[position]
+
+    def __len__(self) -> int:
+        return self._count
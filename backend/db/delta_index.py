@@ -0,0 +1,164 @@
+"""
+Delta Index - Vectors thêm sau lần merge gần nhất của FAISS Store
+Buffer append-only dùng chung giữa các generation: mỗi bản chỉ đọc count dòng đầu,
+thêm vectors chỉ ghi các dòng sau count (O(số vectors thêm), không copy index chính)
+"""
+
+import logging
+import numpy as np
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MIN_CAPACITY = 1024
+
+class DeltaIndex:
+    """
+    Index phẳng (inner product) nhỏ cho các vectors mới, có ID tăng dần
+
+    Bản trả về bởi appended() dùng chung buffer với bản cũ khi còn chỗ: các dòng
+    < count của bản cũ không bao giờ bị ghi lại, nên snapshot đang được đọc không bị ảnh hưởng.
+    """
+    __slots__ = ("dimension", "count", "_ids", "_vectors")
+
+    def __init__(self,
+                 dimension: int,
+                 ids: Optional[np.ndarray] = None,
+                 vectors: Optional[np.ndarray] = None,
+                 count: int = 0):
+        """
+        Khởi tạo Delta Index (rỗng nếu không truyền buffer)
+
+        Args:
+            dimension: Dimension của vectors (dimension của index chính)
+            ids: Buffer vector IDs dùng chung
+            vectors: Buffer vectors dùng chung (capacity, dimension)
+            count: Số dòng đầu của buffer thuộc bản này
+        """
+        self.dimension = dimension
+        self.count = count
+        self._ids = ids if ids is not None else np.empty(0, dtype=np.int64)
+        self._vectors = vectors if vectors is not None else np.empty((0, dimension), dtype=np.float32)
+
+    @property
+    def ntotal(self) -> int:
+        return self.count
+
+    def appended(self, vector_ids: np.ndarray, vectors: np.ndarray) -> "DeltaIndex":
+        """
+        Bản mới có thêm vectors (không sửa các dòng mà bản này và các bản cũ đọc)
+
+        Args:
+            vector_ids: IDs mới, tăng dần và lớn hơn mọi ID đã có
+            vectors: Ma trận (n, dimension)
+
+        Returns:
+            DeltaIndex: Bản mới với count + n dòng
+        """
+        vector_ids = np.asarray(vector_ids, dtype=np.int64)
+        if len(vector_ids) == 0:
+            return self
+        if (np.diff(vector_ids) <= 0).any() or (self.count and vector_ids[0] <= self._ids[self.count - 1]):
+            raise ValueError("Delta index requires increasing vector IDs")
+
+        needed = self.count + len(vector_ids)
+        ids, buffer = self._ids, self._vectors
+        if needed > len(ids):
+            # Hết chỗ: buffer mới gấp đôi, bản cũ vẫn giữ buffer cũ
+            capacity = max(needed, 2 * len(ids), MIN_CAPACITY)
+            ids = np.empty(capacity, dtype=np.int64)
+            buffer = np.empty((capacity, self.dimension), dtype=np.float32)
+            ids[:self.count] = self._ids[:self.count]
+            buffer[:self.count] = self._vectors[:self.count]
+        ids[self.count:needed] = vector_ids
+        buffer[self.count:needed] = vectors
+        return DeltaIndex(self.dimension, ids, buffer, needed)
+
+    def ids(self) -> np.ndarray:
+        """Vector IDs của bản này (tăng dần)"""
+        return self._ids[:self.count]
+
+    def vectors(self) -> np.ndarray:
+        """Vectors của bản này theo thứ tự ids()"""
+        return self._vectors[:self.count]
+
+    def get(self, vector_ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Lấy vectors theo ID
+
+        Returns:
+            (vectors (n, dimension), found (n,) bool) - dòng không tìm thấy là vector 0
+        """
+        vector_ids = np.asarray(vector_ids, dtype=np.int64)
+        vectors = np.zeros((len(vector_ids), self.dimension), dtype=np.float32)
+        found = np.zeros(len(vector_ids), dtype=bool)
+        if self.count and len(vector_ids):
+            ids = self.ids()
+            rows = np.minimum(np.searchsorted(ids, vector_ids), self.count - 1)
+            found = ids[rows] == vector_ids
+            vectors[found] = self._vectors[rows[found]]
+        return vectors, found
+
+    def search(self,
+               queries: np.ndarray,
+               top_k: int,
+               candidate_ids: Optional[np.ndarray] = None,
+               excluded_ids: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Tính điểm inner product chính xác trên các vectors của bản này
+
+        Args:
+            queries: Ma trận queries (nq, dimension)
+            top_k: Số kết quả mỗi query
+            candidate_ids: Chỉ xét các IDs này (None: tất cả)
+            excluded_ids: Bỏ qua các IDs này (tombstones)
+
+        Returns:
+            (scores, indices) (nq, min(top_k, count)) như faiss, thiếu kết quả thì ID -1
+        """
+        nq = len(queries)
+        top_k = min(top_k, self.count)
+        if top_k <= 0:
+            return np.empty((nq, 0), dtype=np.float32), np.empty((nq, 0), dtype=np.int64)
+
+        ids = self.ids()
+        scores = queries @ self.vectors().T
+        keep = None
+        if candidate_ids is not None:
+            keep = np.isin(ids, candidate_ids)
+        elif excluded_ids is not None and len(excluded_ids) > 0:
+            keep = ~np.isin(ids, excluded_ids)
+        if keep is not None:
+            scores[:, ~keep] = -np.inf
+
+        top = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        top_ids = ids[np.take_along_axis(top, order, axis=1)]
+        top_ids[np.isneginf(top_scores)] = -1
+        return top_scores, top_ids
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Số vectors và dung lượng buffer"""
+        return {
+            "vectors": self.count,
+            "capacity": len(self._ids),
+            "buffer_bytes": int(self._vectors.nbytes + self._ids.nbytes)
+        }
+
+def merge_search_results(results: Tuple[Tuple[np.ndarray, np.ndarray], ...], top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Gộp kết quả search (scores, indices) của nhiều index thành top_k theo điểm giảm dần
+    """
+    scores = np.concatenate([result[0] for result in results], axis=1)
+    indices = np.concatenate([result[1] for result in results], axis=1)
+    scores = np.where(indices == -1, -np.inf, scores).astype(np.float32)
+    order = np.argsort(-scores, axis=1, kind="stable")[:, :top_k]
+    scores, indices = np.take_along_axis(scores, order, axis=1), np.take_along_axis(indices, order, axis=1)
+    if indices.shape[1] < top_k:
+        # Giữ đủ top_k cột như faiss (ID -1 khi thiếu kết quả)
+        missing = top_k - indices.shape[1]
+        scores = np.pad(scores, ((0, 0), (0, missing)), constant_values=-np.inf)
+        indices = np.pad(indices, ((0, 0), (0, missing)), constant_values=-1)
+    return scores, indices
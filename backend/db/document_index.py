@@ -0,0 +1,173 @@
+"""
+Document Index - Tra cứu chunks theo document và category
+doc_id -> mảng vector IDs (theo thứ tự chunk), category -> tập doc_ids,
+doc_id -> vị trí chunk (chunk_index tăng dần -> vector ID) để lấy chunks lân cận
+"""
+
+import logging
+import numpy as np
+from typing import Dict, Any, Iterable, Optional, Set, Tuple
+
+from .chunked_map import ChunkedDict
+
+logger = logging.getLogger(__name__)
+
+class DocumentIndex:
+    """
+    Index bất biến trên doc metadata của FAISS Store
+
+    Mỗi snapshot của store giữ một DocumentIndex; thao tác ghi tạo bản mới bằng
+    updated() (chỉ tính lại các documents bị thay đổi) thay vì sửa bản đang được đọc.
+    Các bảng theo doc_id là ChunkedDict nên bản mới chỉ copy các bucket bị sửa.
+    """
+
+    def __init__(self):
+        self._doc_vector_ids: ChunkedDict = ChunkedDict()  # doc_id -> vector IDs
+        self._doc_category: ChunkedDict = ChunkedDict()  # doc_id -> category
+        self._category_docs: Dict[Optional[str], ChunkedDict] = {}  # category -> {doc_id: True}
+        self._category_cache: Dict[Optional[str], np.ndarray] = {}
+        self._position_cache: ChunkedDict = ChunkedDict()  # doc_id -> (chunk_index, vector IDs)
+
+    @classmethod
+    def build(cls, doc_metadata: Dict[str, Dict[str, Any]]) -> "DocumentIndex":
+        """
+        Build index từ toàn bộ doc metadata (khi load hoặc clear)
+        """
+        index = cls()
+        for doc_id, doc_info in doc_metadata.items():
+            index._set_doc(doc_id, doc_info)
+        return index
+
+    def updated(self, doc_metadata: Dict[str, Dict[str, Any]], doc_ids: Iterable[str]) -> "DocumentIndex":
+        """
+        Tạo index mới với các documents doc_ids được tính lại theo doc_metadata
+        (document không còn trong doc_metadata thì bị xóa khỏi index)
+        """
+        doc_ids = set(doc_ids)
+        index = DocumentIndex()
+        index._doc_vector_ids = self._doc_vector_ids.copy()
+        index._doc_category = self._doc_category.copy()
+        index._category_docs = dict(self._category_docs)
+
+        # Các tập doc_ids của category được copy (theo bucket) trước khi sửa: bản cũ có thể đang được đọc
+        changed_categories = set()
+        for doc_id in doc_ids:
+            if doc_id in index._doc_category:
+                index._remove_doc(doc_id, changed_categories)
+            doc_info = doc_metadata.get(doc_id)
+            if doc_info is not None:
+                index._set_doc(doc_id, doc_info, changed_categories)
+
+        # Giữ cache của các category không đổi
+        index._category_cache = {
+            category: vector_ids for category, vector_ids in self._category_cache.items()
+            if category not in changed_categories
+        }
+        index._position_cache = self._position_cache.copy()
+        for doc_id in doc_ids:
+            index._position_cache.pop(doc_id, None)
+        return index
+
+    def vector_ids(self, doc_id: str) -> Optional[np.ndarray]:
+        """
+        Vector IDs của document theo thứ tự chunk (None nếu không có document)
+        """
+        return self._doc_vector_ids.get(doc_id)
+
+    def chunk_positions(self, doc_id: str, metadata) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        (chunk_index tăng dần, vector IDs tương ứng) của document, dùng để lấy các chunks
+        trong một khoảng chunk_index bằng searchsorted; tính từ cột chunk_index của metadata
+        (cùng snapshot) ở lần đầu rồi cache
+
+        Args:
+            doc_id: ID của document
+            metadata: Metadata store cùng generation (có chunk_indices)
+        """
+        cached = self._position_cache.get(doc_id)
+        if cached is not None:
+            return cached
+        vector_ids = self._doc_vector_ids.get(doc_id)
+        if vector_ids is None:
+            return None
+        chunk_indices = metadata.chunk_indices(vector_ids)
+        live = chunk_indices >= 0
+        order = np.argsort(chunk_indices[live], kind="stable")
+        positions = (chunk_indices[live][order], vector_ids[live][order])
+        self._position_cache[doc_id] = positions
+        return positions
+
+    def category_vector_ids(self, category: Optional[str]) -> np.ndarray:
+        """
+        Vector IDs của tất cả documents thuộc category
+        """
+        cached = self._category_cache.get(category)
+        if cached is not None:
+            return cached
+        doc_ids = self._category_docs.get(category, ())
+        vector_ids = (
+            np.concatenate([self._doc_vector_ids[doc_id] for doc_id in doc_ids])
+            if doc_ids else np.empty(0, dtype=np.int64)
+        )
+        self._category_cache[category] = vector_ids
+        return vector_ids
+
+    def candidate_ids(self, doc_id: Optional[str], category: Optional[str]) -> Optional[np.ndarray]:
+        """
+        Tập vector IDs thỏa filter doc_id/category (None nếu không filter)
+        """
+        if doc_id is None and category is None:
+            return None
+
+        if doc_id is not None:
+            vector_ids = self._doc_vector_ids.get(doc_id)
+            if vector_ids is None or (category is not None and self._doc_category[doc_id] != category):
+                return np.empty(0, dtype=np.int64)
+            return vector_ids
+
+        return self.category_vector_ids(category)
+
+    def category_doc_ids(self, category: Optional[str]) -> Set[str]:
+        """
+        Các doc_ids thuộc category
+        """
+        return set(self._category_docs.get(category, ()))
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._doc_vector_ids
+
+    def __len__(self) -> int:
+        return len(self._doc_vector_ids)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Thống kê số documents theo category
+        """
+        return {
+            "documents": len(self._doc_vector_ids),
+            "categories": {
+                str(category): len(doc_ids) for category, doc_ids in self._category_docs.items()
+            }
+        }
+
+    def _category_set(self, category: Optional[str], copied: Optional[Set[Optional[str]]]) -> ChunkedDict:
+        """Tập doc_ids của category để sửa (copy một lần nếu copied không phải None)"""
+        if copied is not None and category not in copied:
+            doc_ids = self._category_docs.get(category)
+            self._category_docs[category] = doc_ids.copy() if doc_ids is not None else ChunkedDict()
+            copied.add(category)
+        return self._category_docs.setdefault(category, ChunkedDict())
+
+    def _set_doc(self, doc_id: str, doc_info: Dict[str, Any], copied: Optional[Set[Optional[str]]] = None):
+        category = doc_info.get("category")
+        self._doc_vector_ids[doc_id] = np.array(doc_info.get("vector_ids", []), dtype=np.int64)
+        self._doc_category[doc_id] = category
+        self._category_set(category, copied)[doc_id] = True
+
+    def _remove_doc(self, doc_id: str, copied: Optional[Set[Optional[str]]] = None):
+        category = self._doc_category.pop(doc_id)
+        self._doc_vector_ids.pop(doc_id, None)
+        doc_ids = self._category_set(category, copied)
+        doc_ids.pop(doc_id, None)
+        if not doc_ids:
+            del self._category_docs[category]
@@ -9,18 +9,96 @@ import numpy as np
 import faiss
 import pickle
 import json
+import shutil
+import time
+import threading
+from contextlib import contextmanager
 from typing import List, Dict, Any, Optional, Tuple
 from pathlib import Path
 import uuid
 from datetime import datetime
 
+from .metadata_store import ChunkMetadataStore
+from .chunked_map import ChunkedDict
+from .document_index import DocumentIndex
+from .delta_index import DeltaIndex, merge_search_results
+from .raw_vector_store import RawVectorStore
+from .store_backup import clear_backup, read_manifest, restore_files, snapshot_files, write_manifest
+from .write_ahead_log import WriteAheadLog
+from .vector_store import VectorStore, create_metadata_store, normalize_chunk_metadata
+from .index_factory import (
+    QUANTIZED_INDEX_TYPES,
+    build_index,
+    describe_index,
+    detect_index_type,
+    index_ids,
+    make_search_params,
+    read_index,
+    resolve_index_params,
+    supports_remove_ids,
+    train_index
+)
+
 logger = logging.getLogger(__name__)
 
-class FAISSStore:
+class StoreSnapshot:
+    """
+    Một generation bất biến của store: index, metadata và doc metadata luôn khớp nhau.
+    Search đọc snapshot hiện tại mà không cần lock; writer sửa bản sao rồi thay snapshot.
+    delta: vectors thêm sau lần merge gần nhất (index chính không bị sửa khi thêm vectors)
+    tombstones: vector IDs đã xóa nhưng còn trong index/delta (search loại ra, compaction dọn)
+    """
+    __slots__ = (
+        "generation", "index", "metadata", "doc_metadata", "doc_index", "index_mmapped", "raw_vectors", "tombstones",
+        "delta"
+    )
+
+    def __init__(self,
+                 generation: int,
+                 index: Optional[faiss.Index],
+                 metadata: ChunkMetadataStore,
+                 doc_metadata: Dict[str, Any],
+                 doc_index: DocumentIndex,
+                 index_mmapped: bool = False,
+                 raw_vectors: Optional[RawVectorStore] = None,
+                 tombstones: Optional[np.ndarray] = None,
+                 delta: Optional[DeltaIndex] = None):
+        self.generation = generation
+        self.index = index
+        self.metadata = metadata
+        self.doc_metadata = doc_metadata
+        self.doc_index = doc_index
+        self.index_mmapped = index_mmapped
+        self.raw_vectors = raw_vectors
+        self.tombstones = tombstones if tombstones is not None else np.empty(0, dtype=np.int64)
+        self.delta = delta if delta is not None else DeltaIndex(index.d if index is not None else 0)
+
+    @property
+    def ntotal(self) -> int:
+        """Số vectors trong index và delta (kể cả tombstones)"""
+        return (self.index.ntotal if self.index is not None else 0) + self.delta.ntotal
+
+class FAISSStore(VectorStore):
     def __init__(self, 
                  index_path: str = "data/faiss_index",
                  metadata_path: str = "data/metadata",
-                 dimension: int = 1024):
+                 dimension: int = 1024,
+                 embedding_batch_size: int = 64,
+                 index_type: str = "flat",
+                 index_params: Optional[Dict[str, Any]] = None,
+                 exact_filter_threshold: int = 4096,
+                 mmap_index: bool = False,
+                 wal_enabled: bool = True,
+                 wal_sync: bool = True,
+                 checkpoint_wal_bytes: int = 256 * 1024 * 1024,
+                 checkpoint_interval: Optional[float] = 600.0,
+                 exact_rerank: bool = False,
+                 rerank_factor: int = 4,
+                 coarse_dimension: Optional[int] = None,
+                 compaction_threshold: Optional[float] = 0.2,
+                 background_compaction: bool = True,
+                 metadata_backend: str = "columnar",
+                 delta_max_vectors: int = 16384):
         """
         Khởi tạo FAISS Store
         
@@ -28,30 +106,113 @@ class FAISSStore:
             index_path: Đường dẫn lưu FAISS index
             metadata_path: Đường dẫn lưu metadata
             dimension: Dimension của vector (multilingual-e5-large = 1024)
+            embedding_batch_size: Batch size khi encode chunks trong bulk ingestion
+            index_type: Loại index (flat, sq8, fp16, hnsw, ivf_flat, ivf_pq, opq_ivf_pq)
+            index_params: Tham số index (nlist, nprobe, hnsw_m, ef_search, pq_m, ...)
+            exact_filter_threshold: Filtered search tính điểm chính xác trên các vectors
+                ứng viên khi số ứng viên không vượt quá ngưỡng này
+            mmap_index: Load index bằng mmap read-only (khởi động nhanh, các worker
+                dùng chung page cache); vectors mới nằm trong delta trong RAM, checkpoint
+                copy index vào RAM tạm thời để merge delta rồi map lại file vừa ghi
+            wal_enabled: Ghi thao tác thêm/xóa vào write-ahead log để phục hồi sau crash
+            wal_sync: fsync WAL sau mỗi batch
+            checkpoint_wal_bytes: Checkpoint (save_index + xóa WAL) khi WAL vượt kích thước này
+            checkpoint_interval: Checkpoint khi đã quá số giây này kể từ checkpoint trước
+                (kiểm tra khi ghi WAL; None để tắt)
+            exact_rerank: Giữ bản float32 của vectors trên disk (mmap) để re-rank chính xác
+                kết quả của index nén (sq8, fp16, ivf_pq, ...) và rebuild index không mất độ chính xác
+            rerank_factor: Index nén lấy top_k * rerank_factor ứng viên để re-rank
+            coarse_dimension: Two-stage search (Matryoshka): index trong RAM chỉ giữ
+                coarse_dimension chiều đầu (normalize lại), shortlist top_k * rerank_factor
+                được tính lại điểm bằng vectors đầy đủ trên disk (mmap, luôn bật exact_rerank)
+            compaction_threshold: Xóa chỉ đánh dấu tombstone; khi tỷ lệ tombstone / vectors trong
+                index vượt ngưỡng này thì compaction build lại index (None để chỉ chạy thủ công)
+            background_compaction: Tự chạy compaction trong background thread khi vượt ngưỡng
+            metadata_backend: Metadata backend đã đăng ký trong vector_store.METADATA_BACKENDS
+            delta_max_vectors: Vectors mới nằm trong delta index (phẳng, chính xác) thay vì sửa index chính;
+                merge vào index chính khi checkpoint/compaction hoặc khi delta vượt số vectors này
         """
         self.index_path = index_path
         self.metadata_path = metadata_path
         self.dimension = dimension
+        self.embedding_batch_size = embedding_batch_size
+        self.index_type = index_type
+        self.index_params = resolve_index_params(index_params)
+        self.exact_filter_threshold = exact_filter_threshold
+        self.mmap_index = mmap_index
+        self.exact_rerank = exact_rerank
+        self.rerank_factor = rerank_factor
+        self.coarse_dimension = coarse_dimension if coarse_dimension and coarse_dimension < dimension else None
+        self.compaction_threshold = compaction_threshold
+        self.background_compaction = background_compaction
+        self.metadata_backend = metadata_backend
+        self.delta_max_vectors = max(int(delta_max_vectors), 1)
         self.index = None
-        self.metadata = []
-        self.doc_metadata = {}  # {doc_id: {chunks: [], total_chunks: int}}
+        self.delta = DeltaIndex(self.index_dimension)  # Vectors thêm sau lần merge gần nhất
+        self.index_mmapped = False  # Index hiện tại đang map từ file (chỉ đọc)
+        self.load_stats = {}  # Thời gian load và kích thước file index
+        self.metadata = create_metadata_store(metadata_backend, metadata_path, dimension)  # {vector_id: chunk_metadata}
+        self.doc_metadata = ChunkedDict()  # {doc_id: {chunks: [], vector_ids: [], total_chunks: int}}
+        self.raw_vectors = self._new_raw_vector_store()  # Vectors float32 trên disk (exact_rerank)
+        self.tombstones = np.empty(0, dtype=np.int64)  # Vector IDs đã xóa còn nằm trong index (tăng dần)
+        self.next_vector_id = 0  # ID 64-bit ổn định cho chunk tiếp theo
+        self.last_ingest_stats = {}  # Timings của lần bulk ingestion gần nhất
+        self.wal = WriteAheadLog(os.path.join(metadata_path, "store.wal"), sync=wal_sync) if wal_enabled else None
+        self.checkpoint_wal_bytes = checkpoint_wal_bytes
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoint_lsn = 0  # LSN cuối cùng đã nằm trong snapshot
+        self.last_checkpoint_time = time.time()
+        self._replaying = False  # Đang replay WAL: không ghi lại vào WAL
+        self._pending_wal = []  # Records WAL của write transaction đang chạy, ghi khi transaction ngoài cùng publish
+        
+        # Copy-on-write: self.index/metadata/doc_metadata là bản làm việc của writer
+        # (chỉ sửa khi giữ _write_lock), search chỉ đọc self._snapshot
+        self._write_lock = threading.RLock()
+        self._write_depth = 0
+        self._snapshot = StoreSnapshot(
+            0, None, self.metadata, self.doc_metadata, DocumentIndex(), raw_vectors=self.raw_vectors, delta=self.delta
+        )
+        self._index_owned = False
+        self._metadata_owned = False
+        self._raw_vectors_owned = False
+        self._doc_metadata_owned = False
+        self._owned_docs = set()
+        self._touched_docs = set()  # Documents thay đổi trong lần ghi hiện tại (cập nhật DocumentIndex)
+        self._doc_index_stale = False  # doc_metadata bị thay toàn bộ: build lại DocumentIndex
+        self._index_epoch = 0  # Tăng khi index bị thay toàn bộ (load, clear_all, migrate): compaction dở bị bỏ
+        
+        # Compaction chạy ngoài write lock, mỗi lúc tối đa một lần
+        self._compaction_lock = threading.Lock()
+        self._compaction_thread = None
+        self.compaction_stats = {"running": False, "runs": 0, "last_run": None}
         
         # Tạo thư mục nếu chưa có
         os.makedirs(index_path, exist_ok=True)
         os.makedirs(metadata_path, exist_ok=True)
         
-        logger.info(f"FAISS Store initialized. Dimension: {dimension}")
+        logger.info(f"FAISS Store initialized. Dimension: {dimension}, index type: {index_type}")
         logger.info(f"Index path: {index_path}")
         logger.info(f"Metadata path: {metadata_path}")
 
+    @property
+    def index_dimension(self) -> int:
+        """Dimension của vectors trong index (coarse_dimension khi bật two-stage search)"""
+        return self.coarse_dimension or self.dimension
+
     def initialize_index(self):
         """
         Khởi tạo FAISS index
         """
         try:
-            # Tạo IndexFlatIP (Inner Product) cho cosine similarity
-            self.index = faiss.IndexFlatIP(self.dimension)
-            logger.info("✅ FAISS index initialized")
+            with self._write_transaction():
+                # Inner Product cho cosine similarity, mỗi chunk có ID 64-bit ổn định
+                self.index = build_index(self.index_type, self.index_dimension, self.index_params)
+                self.delta = DeltaIndex(self.index.d)
+                self.index_mmapped = False
+                self._index_owned = True
+                self.tombstones = np.empty(0, dtype=np.int64)
+                self._index_epoch += 1
+                logger.info(f"✅ FAISS index initialized ({self.index_type})")
         except Exception as e:
             logger.error(f"❌ Error initializing FAISS index: {e}")
             raise
@@ -61,31 +222,613 @@ class FAISSStore:
         Load FAISS index từ file
         """
         try:
-            index_file = os.path.join(self.index_path, "faiss_index.bin")
-            metadata_file = os.path.join(self.metadata_path, "metadata.json")
-            doc_metadata_file = os.path.join(self.metadata_path, "doc_metadata.json")
+            with self._write_transaction():
+                index_file = os.path.join(self.index_path, "faiss_index.bin")
+                metadata_file = os.path.join(self.metadata_path, "metadata.json")
+                doc_metadata_file = os.path.join(self.metadata_path, "doc_metadata.json")
+                state_file = os.path.join(self.metadata_path, "store_state.json")
+                
+                # Load vào các object mới: search đang chạy vẫn dùng snapshot cũ
+                self.metadata = create_metadata_store(self.metadata_backend, self.metadata_path, self.dimension)
+                self.doc_metadata = ChunkedDict()
+                self.raw_vectors = self._new_raw_vector_store()
+                self._metadata_owned = True
+                self._doc_metadata_owned = True
+                self._raw_vectors_owned = True
+                self._doc_index_stale = True
+                
+                # Load store state (ID tiếp theo, cấu hình index)
+                state = {}
+                if os.path.exists(state_file):
+                    with open(state_file, 'r', encoding='utf-8') as f:
+                        state = json.load(f)
+                    self.index_params = resolve_index_params(state.get("index_params", self.index_params))
+                
+                if os.path.exists(index_file):
+                    load_start = time.perf_counter()
+                    self.index = read_index(index_file, mmap=self.mmap_index)
+                    self.delta = DeltaIndex(self.index.d)
+                    self.index_mmapped = self.mmap_index
+                    self._index_owned = not self.index_mmapped
+                    self._index_epoch += 1
+                    self.index_type = detect_index_type(self.index)
+                    # Cấu hình two-stage theo index trên disk (đổi bằng migrate_index)
+                    self.coarse_dimension = self.index.d if self.index.d < self.dimension else None
+                    if self.raw_vectors is None:
+                        self.raw_vectors = self._new_raw_vector_store()
+                    self.load_stats = {
+                        "mmap": self.index_mmapped,
+                        "load_time_seconds": time.perf_counter() - load_start,
+                        "index_file_bytes": os.path.getsize(index_file)
+                    }
+                    logger.info(
+                        f"✅ Loaded FAISS index ({self.index_type}{', mmap' if self.index_mmapped else ''}) "
+                        f"with {self.index.ntotal} vectors in {self.load_stats['load_time_seconds']:.3f}s"
+                    )
+                else:
+                    self.initialize_index()
+                    logger.info("✅ Created new FAISS index")
+                
+                # Load metadata dạng cột (memory-mapped); metadata.json cũ được import một lần
+                if self.metadata.exists():
+                    self.metadata.load()
+                    logger.info(f"✅ Loaded {len(self.metadata)} metadata entries")
+                elif os.path.exists(metadata_file):
+                    self.metadata.clear()
+                    with open(metadata_file, 'r', encoding='utf-8') as f:
+                        self.metadata.import_records(json.load(f))
+                    logger.info(f"✅ Imported {len(self.metadata)} metadata entries from metadata.json")
+                
+                # Load document metadata
+                if os.path.exists(doc_metadata_file):
+                    with open(doc_metadata_file, 'r', encoding='utf-8') as f:
+                        self.doc_metadata = ChunkedDict(json.load(f))
+                    logger.info(f"✅ Loaded metadata for {len(self.doc_metadata)} documents")
+                
+                # Index cũ (IndexFlatIP không có ID map): vector_index chính là vị trí
+                if isinstance(self.index, faiss.IndexFlat):
+                    self._migrate_to_id_map()
+                
+                # Tombstones không lưu riêng: là các vectors trong index không còn metadata
+                # (xóa chưa compaction, hoặc index được ghi trước khi crash còn metadata thì chưa)
+                self.tombstones = np.setdiff1d(index_ids(self.index), self.metadata.keys())
+                if len(self.tombstones) > 0:
+                    logger.info(f"✅ Found {len(self.tombstones)} tombstoned vectors in index")
+                
+                # Bổ sung vector_ids cho doc metadata cũ
+                missing_docs = {
+                    doc_id for doc_id, doc_info in self.doc_metadata.items()
+                    if "vector_ids" not in doc_info
+                }
+                if missing_docs:
+                    for doc_id in missing_docs:
+                        self.doc_metadata[doc_id]["vector_ids"] = []
+                    for vector_id, chunk_metadata in self.metadata.items():
+                        if chunk_metadata["doc_id"] in missing_docs:
+                            self.doc_metadata[chunk_metadata["doc_id"]]["vector_ids"].append(vector_id)
+                
+                # Vectors float32 cho re-rank; store chưa có bản float32 thì lấy lại từ index một lần
+                if self.raw_vectors is not None:
+                    self.raw_vectors.load()
+                    self._backfill_raw_vectors()
+                
+                # ID tiếp theo không bao giờ dùng lại ID đã cấp
+                self.next_vector_id = max(self.metadata.max_id() + 1, state.get("next_vector_id", 0))
+                
+                # Phục hồi các thao tác sau checkpoint cuối từ WAL
+                self.checkpoint_lsn = state.get("wal_lsn", 0)
+                self.last_checkpoint_time = time.time()
+                self._replay_wal()
             
-            if os.path.exists(index_file):
-                self.index = faiss.read_index(index_file)
-                logger.info(f"✅ Loaded FAISS index with {self.index.ntotal} vectors")
+            self._maybe_schedule_compaction()
+                
+        except Exception as e:
+            logger.error(f"❌ Error loading FAISS index: {e}")
+            raise
+
+    def _migrate_to_id_map(self):
+        """
+        Chuyển index phẳng cũ sang IndexIDMap2, giữ nguyên vector_index = vị trí cũ
+        """
+        old_index = self.index
+        self.index = build_index("flat", self.dimension)
+        self.index_type = "flat"
+        self.index_mmapped = False
+        self._index_owned = True
+        if old_index.ntotal > 0:
+            vectors = old_index.reconstruct_n(0, old_index.ntotal)
+            ids = np.arange(old_index.ntotal, dtype=np.int64)
+            self.index.add_with_ids(vectors, ids)
+        logger.info(f"✅ Migrated {old_index.ntotal} vectors to ID-mapped index")
+
+    @contextmanager
+    def _write_transaction(self):
+        """
+        Thao tác ghi: giữ write lock, sửa bản sao copy-on-write rồi công bố snapshot mới.
+        Lỗi giữa chừng thì bỏ bản sao, search không bao giờ thấy trạng thái dở dang.
+        Records WAL của các thao tác lồng nhau chỉ được ghi khi transaction ngoài cùng thành công
+        (rollback thì bỏ), checkpoint chỉ chạy sau khi đã publish.
+        """
+        with self._write_lock:
+            self._write_depth += 1
+            outermost = self._write_depth == 1
+            try:
+                yield
+                if outermost:
+                    self._flush_wal()
+            except Exception:
+                if outermost:
+                    self._pending_wal = []
+                    self._rollback()
+                raise
             else:
-                self.initialize_index()
-                logger.info("✅ Created new FAISS index")
-            
-            # Load metadata
-            if os.path.exists(metadata_file):
-                with open(metadata_file, 'r', encoding='utf-8') as f:
-                    self.metadata = json.load(f)
-                logger.info(f"✅ Loaded {len(self.metadata)} metadata entries")
+                if outermost:
+                    self._publish()
+            finally:
+                self._write_depth -= 1
             
-            # Load document metadata
-            if os.path.exists(doc_metadata_file):
-                with open(doc_metadata_file, 'r', encoding='utf-8') as f:
-                    self.doc_metadata = json.load(f)
-                logger.info(f"✅ Loaded metadata for {len(self.doc_metadata)} documents")
+            if outermost:
+                self._maybe_checkpoint()
+                self._maybe_merge_delta()
+
+    def _publish(self):
+        """
+        Thay snapshot bằng bản làm việc hiện tại (một phép gán, atomic với readers)
+        """
+        # DocumentIndex chỉ tính lại các documents vừa thay đổi
+        doc_index = self._snapshot.doc_index
+        if self._doc_index_stale:
+            doc_index = DocumentIndex.build(self.doc_metadata)
+        elif self._touched_docs:
+            doc_index = doc_index.updated(self.doc_metadata, self._touched_docs)
+        
+        self._snapshot = StoreSnapshot(
+            self._snapshot.generation + 1,
+            self.index,
+            self.metadata,
+            self.doc_metadata,
+            doc_index,
+            self.index_mmapped,
+            self.raw_vectors,
+            self.tombstones,
+            self.delta
+        )
+        # Các object vừa công bố được readers dùng chung: lần ghi sau phải copy trước khi sửa
+        self._index_owned = False
+        self._metadata_owned = False
+        self._doc_metadata_owned = False
+        self._raw_vectors_owned = False
+        self._owned_docs = set()
+        self._touched_docs = set()
+        self._doc_index_stale = False
+
+    def _rollback(self):
+        """
+        Bỏ bản làm việc, quay về snapshot đã công bố
+        """
+        snapshot = self._snapshot
+        self.index = snapshot.index
+        self.metadata = snapshot.metadata
+        self.doc_metadata = snapshot.doc_metadata
+        self.index_mmapped = snapshot.index_mmapped
+        self.raw_vectors = snapshot.raw_vectors
+        self.tombstones = snapshot.tombstones
+        self.delta = snapshot.delta
+        self.index_type = detect_index_type(snapshot.index) if snapshot.index is not None else self.index_type
+        self._index_owned = False
+        self._metadata_owned = False
+        self._doc_metadata_owned = False
+        self._raw_vectors_owned = False
+        self._owned_docs = set()
+        self._touched_docs = set()
+        self._doc_index_stale = False
+        logger.warning(f"⚠️ Rolled back to store generation {snapshot.generation}")
+
+    def _ensure_writable(self):
+        """
+        Copy-on-write index trước khi sửa (chỉ khi merge delta): clone index đang được readers dùng,
+        index mmap (chỉ đọc) thì đọc lại toàn bộ file vào RAM đến khi save_index() map lại file mới
+        """
+        if self._index_owned:
+            return
+        start = time.perf_counter()
+        if self.index_mmapped:
+            self.index = read_index(os.path.join(self.index_path, "faiss_index.bin"))
+            self.index_mmapped = False
+            logger.info(f"🔄 Copied mmapped FAISS index into memory in {time.perf_counter() - start:.3f}s")
+        else:
+            self.index = faiss.clone_index(self.index)
+            logger.debug(f"Cloned FAISS index for write in {time.perf_counter() - start:.3f}s")
+        self._index_owned = True
+
+    def _merge_delta(self):
+        """
+        Gộp delta vào index chính (gọi trong write transaction): copy index chính một lần cho
+        cả delta thay vì mỗi lần thêm vectors; vectors đã xóa trong delta bị bỏ
+        """
+        if self.delta.ntotal == 0:
+            return
+        start = time.perf_counter()
+        vector_ids, vectors = self.delta.ids(), self.delta.vectors()
+        live = ~np.isin(vector_ids, self.tombstones)
+        self._ensure_writable()
+        if live.any():
+            for offset in range(0, int(live.sum()), 65536):
+                self.index.add_with_ids(
+                    np.ascontiguousarray(vectors[live][offset:offset + 65536]),
+                    vector_ids[live][offset:offset + 65536]
+                )
+        self.tombstones = np.setdiff1d(self.tombstones, vector_ids[~live])
+        self.delta = DeltaIndex(self.index.d)
+        logger.info(f"🔄 Merged {int(live.sum())} delta vectors into FAISS index in {time.perf_counter() - start:.3f}s")
+
+    def _maybe_merge_delta(self):
+        """
+        Merge delta khi vượt delta_max_vectors (chỉ gọi sau khi đã publish); index mmap thì
+        merge qua checkpoint để index chính vẫn được map từ file mới
+        """
+        if self._replaying or self.delta.ntotal < self.delta_max_vectors:
+            return
+        try:
+            if self.index_mmapped:
+                self.save_index()
+            else:
+                with self._write_transaction():
+                    self._merge_delta()
+        except Exception as e:
+            # Delta vẫn đúng, merge sẽ thử lại ở lần ghi sau
+            logger.warning(f"⚠️ Delta merge failed: {e}")
+
+    def _own_metadata(self):
+        """
+        Copy-on-write metadata store (dùng chung phần đã map, copy phần chưa lưu)
+        """
+        if not self._metadata_owned:
+            self.metadata = self.metadata.snapshot()
+            self._metadata_owned = True
+
+    def _own_raw_vectors(self):
+        """
+        Copy-on-write raw vector store (dùng chung phần đã map)
+        """
+        if self.raw_vectors is not None and not self._raw_vectors_owned:
+            self.raw_vectors = self.raw_vectors.snapshot()
+            self._raw_vectors_owned = True
+
+    def _new_raw_vector_store(self) -> Optional[RawVectorStore]:
+        if not self.exact_rerank and self.coarse_dimension is None:
+            return None
+        return RawVectorStore(os.path.join(self.metadata_path, "raw_vectors"), self.dimension)
+
+    def _add_raw_vectors(self, vector_ids: np.ndarray, vectors: np.ndarray):
+        """
+        Lưu bản float32 của vectors vừa thêm (khi bật exact_rerank)
+        """
+        if self.raw_vectors is None:
+            return
+        self._own_raw_vectors()
+        vector_ids = np.asarray(vector_ids, dtype=np.int64)
+        missing = ~self.raw_vectors.contains(vector_ids)
+        if missing.any():
+            self.raw_vectors.add(vector_ids[missing], np.asarray(vectors, dtype=np.float32)[missing])
+
+    def _backfill_raw_vectors(self):
+        """
+        Bổ sung bản float32 cho các chunks chưa có (bật exact_rerank trên store cũ):
+        lấy lại từ index hiện tại, chính xác nếu index chưa nén (flat, hnsw, ivf_flat)
+        """
+        vector_ids = self.metadata.keys()
+        missing_ids = vector_ids[~self.raw_vectors.contains(vector_ids)]
+        if len(missing_ids) == 0 or self.index is None:
+            return
+        if self.index.d != self.dimension:
+            logger.warning(f"⚠️ {len(missing_ids)} chunks have no full-dimension vectors (coarse index only)")
+            return
+        if self.index_type in QUANTIZED_INDEX_TYPES:
+            logger.warning(f"⚠️ Backfilling raw vectors from quantized {self.index_type} index (approximate)")
+        self._own_raw_vectors()
+        for start in range(0, len(missing_ids), 65536):
+            batch_ids = missing_ids[start:start + 65536]
+            self.raw_vectors.add(batch_ids, self._reconstruct_vectors(self.index, batch_ids, delta=self.delta))
+        logger.info(f"✅ Backfilled {len(missing_ids)} raw vectors from index")
+
+    def _own_doc_entry(self, doc_id: Optional[str] = None):
+        """
+        Copy-on-write doc metadata: copy dict ngoài (chỉ các bucket bị sửa), và entry doc_id nếu sắp sửa entry đó
+        """
+        if not self._doc_metadata_owned:
+            self.doc_metadata = self.doc_metadata.copy()
+            self._doc_metadata_owned = True
+        if doc_id is not None:
+            self._touched_docs.add(doc_id)
+        if doc_id is not None and doc_id not in self._owned_docs:
+            doc_info = self.doc_metadata.get(doc_id)
+            if doc_info is not None:
+                self.doc_metadata[doc_id] = {
+                    **doc_info,
+                    "chunks": list(doc_info["chunks"]),
+                    "vector_ids": list(doc_info.get("vector_ids", []))
+                }
+            self._owned_docs.add(doc_id)
+
+    def _log_operation(self, operation: Dict[str, Any], vectors: Optional[np.ndarray] = None):
+        """
+        Ghi nhận thao tác đã áp dụng (gọi trong write transaction); record được ghi vào WAL
+        khi transaction ngoài cùng publish
+        """
+        if self.wal is None or self._replaying:
+            return
+        self._pending_wal.append((operation, vectors))
+
+    def _flush_wal(self):
+        """
+        Ghi các records WAL của transaction vào file (trước khi publish: lỗi ghi WAL thì rollback)
+        """
+        pending, self._pending_wal = self._pending_wal, []
+        for operation, vectors in pending:
+            self.wal.append(operation, vectors)
+
+    def _maybe_checkpoint(self):
+        """
+        Checkpoint (save_index + reset WAL) nếu WAL đủ lớn / đủ lâu; chỉ gọi sau khi đã publish
+        """
+        if self.wal is None or self._replaying or self.wal.records == 0:
+            return
+        checkpoint_due = self.wal.size() >= self.checkpoint_wal_bytes or (
+            self.checkpoint_interval is not None
+            and time.time() - self.last_checkpoint_time >= self.checkpoint_interval
+        )
+        if checkpoint_due:
+            logger.info(f"💾 WAL checkpoint ({self.wal.records} records, {self.wal.size()} bytes)")
+            try:
+                self.save_index()
+            except Exception as e:
+                # Thao tác đã nằm trong WAL, checkpoint sẽ thử lại ở lần ghi sau
+                logger.warning(f"⚠️ WAL checkpoint failed: {e}")
+
+    def _log_add(self, vector_ids: np.ndarray, vectors: np.ndarray, rows: List[list], created_at: datetime):
+        """
+        Ghi thao tác thêm chunks vào WAL; rows là [doc_id, chunk_index, text, filename, category]
+        """
+        self._log_operation({
+            "op": "add",
+            "dimension": self.dimension,
+            "created_at": created_at.timestamp(),
+            "vector_ids": [int(vector_id) for vector_id in vector_ids],
+            "chunks": rows
+        }, vectors)
+
+    def _replay_wal(self):
+        """
+        Áp dụng lại các record WAL có LSN lớn hơn checkpoint_lsn (idempotent)
+        """
+        if self.wal is None:
+            return
+        
+        self.wal.close()
+        replayed = 0
+        self._replaying = True
+        try:
+            for lsn, operation, vectors in self.wal.replay(self.checkpoint_lsn):
+                if operation["op"] == "add":
+                    self._replay_add(operation, vectors)
+                elif operation["op"] == "delete":
+                    if operation["doc_id"] in self.doc_metadata:
+                        self.clear_doc(operation["doc_id"])
+                elif operation["op"] == "clear_category":
+                    self.clear_category(operation["category"])
+                elif operation["op"] == "clear_all":
+                    self.clear_all()
+                replayed += 1
+        finally:
+            self._replaying = False
+        
+        # Mở lại để append tiếp (cắt record ghi dở ở cuối file)
+        self.wal.open()
+        if replayed:
+            logger.info(f"🔄 Replayed {replayed} WAL records after checkpoint LSN {self.checkpoint_lsn}")
+
+    def _replay_add(self, operation: Dict[str, Any], vectors: np.ndarray):
+        """
+        Replay một thao tác add, bỏ qua các chunks đã có trong snapshot
+        """
+        vector_ids = np.array(operation["vector_ids"], dtype=np.int64)
+        pending = ~np.isin(vector_ids, self.metadata.keys())
+        if not pending.any():
+            return
+        
+        vector_ids = vector_ids[pending]
+        vectors = np.ascontiguousarray(vectors[pending], dtype=np.float32)
+        # Index có thể đã được ghi trước khi crash còn metadata thì chưa: các vectors đó
+        # đang là tombstone (ID không dùng lại nên vector giống hệt), chỉ cần bỏ đánh dấu
+        in_index = np.isin(vector_ids, self.tombstones)
+        if in_index.any():
+            self.tombstones = np.setdiff1d(self.tombstones, vector_ids)
+            self._add_raw_vectors(vector_ids[in_index], vectors[in_index])
+        if not in_index.all():
+            self._index_add(vector_ids[~in_index], vectors[~in_index])
+        
+        created_at = datetime.fromtimestamp(operation["created_at"])
+        rows = [row for row, keep in zip(operation["chunks"], pending) if keep]
+        for vector_id, (doc_id, chunk_index, text, filename, category) in zip(vector_ids.tolist(), rows):
+            self._register_chunk(vector_id, doc_id, chunk_index, text, filename, category, created_at)
+        self.next_vector_id = max(self.next_vector_id, int(vector_ids.max()) + 1)
+
+    def _allocate_vector_ids(self, count: int) -> np.ndarray:
+        """
+        Cấp phát count ID 64-bit liên tiếp cho chunks mới
+        """
+        ids = np.arange(self.next_vector_id, self.next_vector_id + count, dtype=np.int64)
+        self.next_vector_id += count
+        return ids
+
+    def _register_chunk(self,
+                        vector_id: int,
+                        doc_id: str,
+                        chunk_index: int,
+                        text: str,
+                        filename: str,
+                        category: Optional[str],
+                        created_at: datetime) -> str:
+        """
+        Ghi metadata cho một chunk vừa thêm vào index và cập nhật document metadata
+        """
+        chunk_id = f"{doc_id}_{chunk_index}"
+        self._own_metadata()
+        self._own_doc_entry(doc_id)
+        self.metadata.add(
+            vector_id=vector_id,
+            doc_id=doc_id,
+            chunk_index=chunk_index,
+            text=text,
+            filename=filename,
+            category=category,
+            created_at=created_at.timestamp()
+        )
+        
+        if doc_id not in self.doc_metadata:
+            self.doc_metadata[doc_id] = {
+                "filename": filename,
+                "category": category,
+                "chunks": [],
+                "vector_ids": [],
+                "total_chunks": 0,
+                "created_at": created_at.isoformat()
+            }
+        self.doc_metadata[doc_id]["chunks"].append(chunk_id)
+        self.doc_metadata[doc_id]["vector_ids"].append(vector_id)
+        self.doc_metadata[doc_id]["total_chunks"] += 1
+        return chunk_id
+
+    def _index_add(self, vector_ids: np.ndarray, vectors: np.ndarray):
+        """
+        Thêm vectors (đầy đủ dimension) vào delta của index hiện tại (O(số vectors thêm));
+        two-stage search thì index chỉ giữ coarse_dimension chiều đầu, bản đầy đủ vào raw vector store
+        """
+        index_vectors = truncate_vectors(vectors, self.index.d)
+        if not self.index.is_trained:
+            # Index xấp xỉ (IVF/PQ) rỗng: train bằng batch đầu tiên như trước, copy index rỗng không tốn gì
+            self._ensure_writable()
+            self._ensure_trained(index_vectors)
+        self.delta = self.delta.appended(vector_ids, index_vectors)
+        self._add_raw_vectors(vector_ids, vectors)
+
+    def _ensure_trained(self, vectors: np.ndarray):
+        """
+        Train index xấp xỉ (IVF/PQ) bằng batch vectors đầu tiên nếu chưa train
+        """
+        if not self.index.is_trained:
+            train_index(self.index, vectors, self.index_params)
+
+    def _reconstruct_vectors(self,
+                             index: faiss.Index,
+                             vector_ids: np.ndarray,
+                             batch_size: int = 65536,
+                             raw_vectors: Optional[RawVectorStore] = None,
+                             delta: Optional[DeltaIndex] = None) -> np.ndarray:
+        """
+        Lấy lại vectors theo ID, theo từng batch: ưu tiên bản float32 (raw_vectors),
+        rồi delta, còn lại reconstruct từ index (xấp xỉ nếu index nén)
+        """
+        vectors = np.empty((len(vector_ids), self.dimension), dtype=np.float32)
+        for start in range(0, len(vector_ids), batch_size):
+            batch_ids = vector_ids[start:start + batch_size]
+            if raw_vectors is not None:
+                batch_vectors, found = raw_vectors.get(batch_ids)
+            else:
+                batch_vectors = np.empty((len(batch_ids), self.dimension), dtype=np.float32)
+                found = np.zeros(len(batch_ids), dtype=bool)
+            if not found.all():
+                if index.d != self.dimension:
+                    raise RuntimeError(f"Missing full-dimension vectors for {int((~found).sum())} chunks")
+                if delta is not None and delta.ntotal:
+                    delta_vectors, in_delta = delta.get(batch_ids[~found])
+                    missing = np.flatnonzero(~found)
+                    batch_vectors[missing[in_delta]] = delta_vectors[in_delta]
+                    found[missing[in_delta]] = True
+                if not found.all():
+                    batch_vectors[~found] = index.reconstruct_batch(batch_ids[~found])
+            vectors[start:start + len(batch_ids)] = batch_vectors
+        return vectors
+
+    def _rebuild_index(self,
+                       index_type: str,
+                       vector_ids: np.ndarray,
+                       source_index: Optional[faiss.Index] = None,
+                       raw_vectors: Optional[RawVectorStore] = None):
+        """
+        Build index mới loại index_type từ các vectors có ID vector_ids của source_index
+        (mặc định index hiện tại và raw vectors hiện tại)
+        """
+        delta = None
+        if source_index is None:
+            source_index, raw_vectors, delta = self.index, self.raw_vectors, self.delta
+        vectors = truncate_vectors(
+            self._reconstruct_vectors(source_index, vector_ids, raw_vectors=raw_vectors, delta=delta),
+            self.index_dimension
+        )
+        new_index = build_index(index_type, self.index_dimension, self.index_params)
+        if len(vectors) > 0:
+            train_index(new_index, vectors, self.index_params)
+            for start in range(0, len(vectors), 65536):
+                new_index.add_with_ids(vectors[start:start + 65536], vector_ids[start:start + 65536])
+        return new_index
+
+    def migrate_index(self,
+                      index_type: str,
+                      index_params: Optional[Dict[str, Any]] = None,
+                      coarse_dimension: Optional[int] = None):
+        """
+        Rebuild index hiện tại (ví dụ flat) thành loại index khác, giữ nguyên vector IDs
+        
+        Args:
+            index_type: Loại index đích (flat, sq8, fp16, hnsw, ivf_flat, ivf_pq, opq_ivf_pq)
+            index_params: Tham số cho index đích
+            coarse_dimension: Số chiều của index cho two-stage search
+                (None giữ nguyên, bằng dimension để tắt two-stage)
+        """
+        try:
+            with self._write_transaction():
+                if self.index is None:
+                    self.load_index()
+                
+                if index_params:
+                    self.index_params = resolve_index_params({
+                        **self.index_params,
+                        **{key: value for key, value in index_params.items() if value is not None}
+                    })
+                
+                if coarse_dimension is not None:
+                    if not 0 < coarse_dimension <= self.dimension:
+                        raise ValueError(f"coarse_dimension must be in (0, {self.dimension}]")
+                    self.coarse_dimension = coarse_dimension if coarse_dimension < self.dimension else None
+                    if self.coarse_dimension and self.raw_vectors is None:
+                        # Lưu vectors đầy đủ trước khi index bị cắt chiều
+                        self.raw_vectors = self._new_raw_vector_store()
+                        self.raw_vectors.load()
+                        self._raw_vectors_owned = True
+                        self._backfill_raw_vectors()
+                
+                vector_ids = self.metadata.keys()
+                old_type = self.index_type
+                logger.info(f"⏳ Migrating {len(vector_ids)} vectors from {old_type} to {index_type}...")
+                
+                start_time = time.perf_counter()
+                self.index = self._rebuild_index(index_type, vector_ids)
+                self.delta = DeltaIndex(self.index.d)
+                self.index_mmapped = False
+                self._index_owned = True
+                self.index_type = index_type
+                self.tombstones = np.empty(0, dtype=np.int64)
+                self._index_epoch += 1
+                
+                logger.info(
+                    f"✅ Migrated index {old_type} -> {index_type} "
+                    f"in {time.perf_counter() - start_time:.2f}s"
+                )
                 
         except Exception as e:
-            logger.error(f"❌ Error loading FAISS index: {e}")
+            logger.error(f"❌ Error migrating FAISS index: {e}")
             raise
 
     def save_index(self):
@@ -93,26 +836,65 @@ class FAISSStore:
         Lưu FAISS index và metadata
         """
         try:
-            if self.index is None:
-                logger.warning("No index to save")
-                return
-            
-            # Save FAISS index
-            index_file = os.path.join(self.index_path, "faiss_index.bin")
-            faiss.write_index(self.index, index_file)
-            
-            # Save metadata
-            metadata_file = os.path.join(self.metadata_path, "metadata.json")
-            with open(metadata_file, 'w', encoding='utf-8') as f:
-                json.dump(self.metadata, f, ensure_ascii=False, indent=2)
-            
-            # Save document metadata
-            doc_metadata_file = os.path.join(self.metadata_path, "doc_metadata.json")
-            with open(doc_metadata_file, 'w', encoding='utf-8') as f:
-                json.dump(self.doc_metadata, f, ensure_ascii=False, indent=2)
-            
-            logger.info(f"✅ Saved FAISS index with {self.index.ntotal} vectors")
-            
+            with self._write_transaction():
+                if self.index is None:
+                    logger.warning("No index to save")
+                    return
+                
+                # Checkpoint: gộp delta vào index chính trước khi ghi file
+                self._merge_delta()
+                
+                # Save vectors float32 trước index: WAL replay bỏ qua các vectors đã có
+                if self.raw_vectors is not None:
+                    self._own_raw_vectors()
+                    self.raw_vectors.save(live_ids=self.metadata.keys())
+                
+                # Save FAISS index: ghi file tạm rồi rename để process đang mmap file cũ không bị ảnh hưởng
+                # (index mmap chưa bị sửa thì file trên disk chính là index hiện tại)
+                if not self.index_mmapped:
+                    index_file = os.path.join(self.index_path, "faiss_index.bin")
+                    tmp_index_file = index_file + ".tmp"
+                    faiss.write_index(self.index, tmp_index_file)
+                    os.replace(tmp_index_file, index_file)
+                    if self.mmap_index:
+                        # Map lại file vừa ghi: bản trong RAM (merge delta, compaction) chỉ giữ đến checkpoint
+                        self.index = read_index(index_file, mmap=True)
+                        self.index_mmapped = True
+                        self._index_owned = False
+                
+                # Save metadata (cột nhị phân + text blob append-only)
+                self._own_metadata()
+                self.metadata.save()
+                
+                # Save document metadata (file mới rồi rename: backup hardlink file cũ không bị ghi đè)
+                doc_metadata_file = os.path.join(self.metadata_path, "doc_metadata.json")
+                tmp_doc_metadata_file = doc_metadata_file + ".tmp"
+                with open(tmp_doc_metadata_file, 'w', encoding='utf-8') as f:
+                    json.dump(dict(self.doc_metadata), f, ensure_ascii=False, indent=2)
+                os.replace(tmp_doc_metadata_file, doc_metadata_file)
+                
+                # Save store state (wal_lsn: mọi record WAL tới LSN này đã nằm trong snapshot)
+                wal_lsn = self.wal.last_lsn if self.wal else 0
+                state_file = os.path.join(self.metadata_path, "store_state.json")
+                tmp_state_file = state_file + ".tmp"
+                with open(tmp_state_file, 'w', encoding='utf-8') as f:
+                    json.dump({
+                        "next_vector_id": self.next_vector_id,
+                        "index_type": self.index_type,
+                        "index_params": self.index_params,
+                        "coarse_dimension": self.coarse_dimension,
+                        "wal_lsn": wal_lsn
+                    }, f, indent=2)
+                os.replace(tmp_state_file, state_file)
+                
+                # Checkpoint xong: WAL chỉ còn giữ các thao tác sau snapshot này
+                if self.wal:
+                    self.wal.reset(wal_lsn)
+                self.checkpoint_lsn = wal_lsn
+                self.last_checkpoint_time = time.time()
+                
+                logger.info(f"✅ Saved FAISS index with {self.index.ntotal} vectors")
+                
         except Exception as e:
             logger.error(f"❌ Error saving FAISS index: {e}")
             raise
@@ -122,7 +904,8 @@ class FAISSStore:
                     doc_id: str, 
                     chunk_index: int = 0,
                     filename: str = "",
-                    embedding_service=None) -> str:
+                    embedding_service=None,
+                    category: Optional[str] = None) -> str:
         """
         Thêm một document vào FAISS store
         
@@ -132,13 +915,11 @@ class FAISSStore:
             chunk_index: Index của chunk trong document
             filename: Tên file
             embedding_service: Embedding service instance
+            category: Category của document (Luat, TaiLieuTiengViet, ...)
             
         Returns:
             str: Chunk ID được tạo
         """
-        if self.index is None:
-            self.initialize_index()
-        
         if embedding_service is None:
             raise ValueError("Embedding service is required")
         
@@ -156,34 +937,26 @@ class FAISSStore:
             # Tạo chunk ID
             chunk_id = f"{doc_id}_{chunk_index}"
             
-            # Thêm vào FAISS index
-            self.index.add(embedding.reshape(1, -1))
-            
-            # Tạo metadata
-            chunk_metadata = {
-                "chunk_id": chunk_id,
-                "doc_id": doc_id,
-                "chunk_index": chunk_index,
-                "content": text,
-                "filename": filename,
-                "vector_index": self.index.ntotal - 1,  # Index trong FAISS
-                "created_at": datetime.now().isoformat(),
-                "embedding_dimension": self.dimension
-            }
-            
-            self.metadata.append(chunk_metadata)
-            
-            # Update document metadata
-            if doc_id not in self.doc_metadata:
-                self.doc_metadata[doc_id] = {
-                    "filename": filename,
-                    "chunks": [],
-                    "total_chunks": 0,
-                    "created_at": datetime.now().isoformat()
-                }
-            
-            self.doc_metadata[doc_id]["chunks"].append(chunk_id)
-            self.doc_metadata[doc_id]["total_chunks"] += 1
+            # Thêm vào FAISS index với ID ổn định (bản copy-on-write, công bố khi xong)
+            vector = embedding.reshape(1, -1).astype(np.float32)
+            with self._write_transaction():
+                if self.index is None:
+                    self.initialize_index()
+                vector_id = int(self._allocate_vector_ids(1)[0])
+                self._index_add(np.array([vector_id], dtype=np.int64), vector)
+                
+                # Tạo metadata
+                created_at = datetime.now()
+                self._register_chunk(
+                    vector_id=vector_id,
+                    doc_id=doc_id,
+                    chunk_index=chunk_index,
+                    text=text,
+                    filename=filename,
+                    category=category,
+                    created_at=created_at
+                )
+                self._log_add([vector_id], vector, [[doc_id, chunk_index, text, filename, category]], created_at)
             
             logger.info(f"✅ Added chunk {chunk_id} to FAISS store")
             return chunk_id
@@ -196,7 +969,8 @@ class FAISSStore:
                            chunks: List[str], 
                            doc_id: str,
                            filename: str = "",
-                           embedding_service=None) -> List[str]:
+                           embedding_service=None,
+                           category: Optional[str] = None) -> List[str]:
         """
         Thêm nhiều chunks của một document
         
@@ -205,116 +979,408 @@ class FAISSStore:
             doc_id: ID của document
             filename: Tên file
             embedding_service: Embedding service instance
+            category: Category của document
             
         Returns:
             List[str]: Danh sách chunk IDs được tạo
         """
-        chunk_ids = []
-        
         try:
-            for i, chunk in enumerate(chunks):
-                chunk_id = self.add_document(
-                    text=chunk,
-                    doc_id=doc_id,
-                    chunk_index=i,
-                    filename=filename,
-                    embedding_service=embedding_service
-                )
-                chunk_ids.append(chunk_id)
+            result = self.add_documents_batch(
+                documents=[{
+                    "doc_id": doc_id,
+                    "chunks": chunks,
+                    "filename": filename,
+                    "category": category
+                }],
+                embedding_service=embedding_service
+            )
             
             logger.info(f"✅ Added {len(chunks)} chunks for document {doc_id}")
-            return chunk_ids
+            return result["chunk_ids"].get(doc_id, [])
             
         except Exception as e:
             logger.error(f"❌ Error adding document chunks: {e}")
             raise
 
-    def search(self, 
-               query_vector: np.ndarray, 
-               top_k: int = 5, 
-               doc_id: Optional[str] = None,
-               category: Optional[str] = None) -> List[Dict[str, Any]]:
+    def add_documents_batch(self,
+                            documents: List[Dict[str, Any]],
+                            embedding_service=None,
+                            batch_size: Optional[int] = None,
+                            embeddings: Optional[np.ndarray] = None) -> Dict[str, Any]:
         """
-        Tìm kiếm vectors tương tự
+        Bulk ingestion: encode chunks của một hoặc nhiều documents theo batch lớn,
+        normalize cả ma trận một lần và thêm vào index + metadata trong một lần gọi
         
         Args:
-            query_vector: Vector query đã được normalize
-            top_k: Số lượng kết quả trả về
-            doc_id: Nếu có, chỉ tìm trong document này
-            category: Nếu có, chỉ tìm trong category này
+            documents: Danh sách {"doc_id": str, "chunks": List[str], "filename": str, "category": str}
+            embedding_service: Embedding service instance
+            batch_size: Batch size khi encode (mặc định self.embedding_batch_size)
+            embeddings: Embeddings đã encode sẵn của các chunks (theo thứ tự documents), bỏ qua bước encode
             
         Returns:
-            List[Dict]: Danh sách kết quả với metadata
+            Dict: {"chunk_ids": {doc_id: [chunk_id]}, "total_chunks": int, "timings": {...}}
         """
-        if self.index is None or self.index.ntotal == 0:
-            logger.warning("No vectors in index")
-            return []
+        if embedding_service is None and embeddings is None:
+            raise ValueError("Embedding service is required")
         
         try:
-            # Tìm kiếm
-            scores, indices = self.index.search(query_vector.reshape(1, -1), top_k)
+            total_start = time.perf_counter()
+            timings = {}
             
-            results = []
-            for score, idx in zip(scores[0], indices[0]):
-                if idx == -1:  # FAISS trả về -1 nếu không đủ kết quả
-                    continue
-                
-                # Lấy metadata
-                if idx < len(self.metadata):
-                    chunk_metadata = self.metadata[idx].copy()
-                    chunk_metadata["similarity_score"] = float(score)
-                    
-                    # Filter theo doc_id và category nếu có
-                    if doc_id is not None and chunk_metadata["doc_id"] != doc_id:
-                        continue
-                    
-                    if category is not None and chunk_metadata.get("category") != category:
-                        continue
-                    
-                    results.append(chunk_metadata)
+            texts, owners = self._flatten_documents(documents)
+            
+            if not texts:
+                logger.warning("No chunks to add")
+                return {"chunk_ids": {}, "total_chunks": 0, "timings": {}}
+            
+            # Stage 1: Encode theo batch lớn
+            stage_start = time.perf_counter()
+            if embeddings is None:
+                embeddings = embedding_service.generate_embeddings_batch(
+                    texts,
+                    batch_size=batch_size or self.embedding_batch_size,
+                    show_progress_bar=False
+                )
+            timings["embedding"] = time.perf_counter() - stage_start
+            
+            # Stage 2-5: normalize, thêm vào index, metadata, WAL
+            added_ids = self._add_embeddings(embeddings, texts, owners, timings)
+            chunk_ids = {}
+            for chunk_id, (doc_id, _, _, _) in zip(added_ids, owners):
+                chunk_ids.setdefault(doc_id, []).append(chunk_id)
+            
+            timings["total"] = time.perf_counter() - total_start
+            self.last_ingest_stats = {
+                "documents": len(chunk_ids),
+                "chunks": len(texts),
+                "timings": timings,
+                "chunks_per_second": len(texts) / timings["total"] if timings["total"] > 0 else 0.0
+            }
             
-            logger.info(f"✅ Found {len(results)} results for search")
-            return results
+            logger.info(
+                f"✅ Bulk added {len(texts)} chunks for {len(chunk_ids)} documents "
+                f"(embed {timings['embedding']:.3f}s, normalize {timings['normalize']:.3f}s, "
+                f"add {timings['index_add']:.3f}s, metadata {timings['metadata']:.3f}s)"
+            )
+            return {
+                "chunk_ids": chunk_ids,
+                "total_chunks": len(texts),
+                "timings": timings
+            }
             
         except Exception as e:
-            logger.error(f"❌ Error searching FAISS index: {e}")
+            logger.error(f"❌ Error in bulk ingestion: {e}")
             raise
 
-    def search_text(self, 
-                   query_text: str, 
-                   top_k: int = 5, 
-                   doc_id: Optional[str] = None,
-                   category: Optional[str] = None,
-                   embedding_service=None) -> List[Dict[str, Any]]:
+    def _flatten_documents(self, documents: List[Dict[str, Any]]) -> Tuple[List[str], List[Tuple[str, int, str, Optional[str]]]]:
         """
-        Tìm kiếm bằng text query
+        Gom chunks của các documents thành một danh sách phẳng
+
+        Returns:
+            Tuple: (texts, owners) với owners là (doc_id, chunk_index, filename, category) cho từng text
+        """
+        texts = []
+        owners = []
+        for document in documents:
+            doc_id = document["doc_id"]
+            filename = document.get("filename", "")
+            category = document.get("category")
+            for chunk_index, chunk in enumerate(document.get("chunks", [])):
+                texts.append(chunk)
+                owners.append((doc_id, chunk_index, filename, category))
+        return texts, owners
+
+    def add_vectors(self,
+                    vectors: np.ndarray,
+                    metadata_list: List[Dict[str, Any]]) -> List[str]:
+        """
+        Thêm vectors đã có embedding kèm metadata (schema chung trong vector_store,
+        chấp nhận field cũ document_id/text); dùng chung pipeline với bulk ingestion
         
         Args:
-            query_text: Text query
-            top_k: Số lượng kết quả
+            vectors: Ma trận embeddings (n, dimension)
+            metadata_list: Metadata từng vector (doc_id, chunk_index, content, filename, category)
+            
+        Returns:
+            List[str]: Chunk IDs theo thứ tự vectors
+        """
+        try:
+            if len(vectors) != len(metadata_list):
+                raise ValueError("Number of vectors must match number of metadata")
+            if len(metadata_list) == 0:
+                return []
+            
+            records = [normalize_chunk_metadata(metadata) for metadata in metadata_list]
+            timings = {}
+            chunk_ids = self._add_embeddings(
+                vectors,
+                [record["content"] for record in records],
+                [(record["doc_id"], record["chunk_index"], record["filename"], record["category"]) for record in records],
+                timings
+            )
+            
+            logger.info(f"✅ Added {len(chunk_ids)} vectors to FAISS store")
+            return chunk_ids
+            
+        except Exception as e:
+            logger.error(f"❌ Error adding vectors: {e}")
+            raise
+
+    def _add_embeddings(self,
+                        embeddings: np.ndarray,
+                        texts: List[str],
+                        owners: List[Tuple[str, int, str, Optional[str]]],
+                        timings: Dict[str, float]) -> List[str]:
+        """
+        Validate + normalize cả ma trận, thêm vào index, ghi metadata và WAL trong một
+        write transaction (search chỉ thấy batch khi đã hoàn tất)
+        
+        Args:
+            embeddings: Ma trận embeddings (n, dimension)
+            texts: Nội dung từng chunk
+            owners: (doc_id, chunk_index, filename, category) cho từng chunk
+            timings: Dict nhận thời gian từng stage
+            
+        Returns:
+            List[str]: Chunk IDs theo thứ tự embeddings
+        """
+        # Stage 2: Validate + normalize cả ma trận
+        stage_start = time.perf_counter()
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if embeddings.shape != (len(texts), self.dimension):
+            raise ValueError(
+                f"Invalid embeddings shape {embeddings.shape}, "
+                f"expected ({len(texts)}, {self.dimension})"
+            )
+        if not np.isfinite(embeddings).all():
+            raise ValueError("Invalid embedding generated")
+        faiss.normalize_L2(embeddings)
+        timings["normalize"] = time.perf_counter() - stage_start
+        
+        # Stage 3-5 trên bản copy-on-write, search chỉ thấy batch khi đã hoàn tất
+        with self._write_transaction():
+            # Stage 3: Thêm vào delta của FAISS index một lần
+            stage_start = time.perf_counter()
+            if self.index is None:
+                self.initialize_index()
+            vector_ids = self._allocate_vector_ids(len(texts))
+            self._index_add(vector_ids, embeddings)
+            timings["index_add"] = time.perf_counter() - stage_start
+            
+            # Stage 4: Tạo metadata
+            stage_start = time.perf_counter()
+            created_at = datetime.now()
+            chunk_ids = []
+            for vector_id, text, (doc_id, chunk_index, filename, category) in zip(vector_ids.tolist(), texts, owners):
+                chunk_id = self._register_chunk(
+                    vector_id=vector_id,
+                    doc_id=doc_id,
+                    chunk_index=chunk_index,
+                    text=text,
+                    filename=filename,
+                    category=category,
+                    created_at=created_at
+                )
+                chunk_ids.append(chunk_id)
+            timings["metadata"] = time.perf_counter() - stage_start
+            
+            # Stage 5: Ghi WAL (một record cho cả batch)
+            stage_start = time.perf_counter()
+            self._log_add(
+                vector_ids,
+                embeddings,
+                [[doc_id, chunk_index, text, filename, category]
+                 for text, (doc_id, chunk_index, filename, category) in zip(texts, owners)],
+                created_at
+            )
+            timings["wal"] = time.perf_counter() - stage_start
+        
+        return chunk_ids
+
+    def search_batch(self,
+                     query_vectors: np.ndarray,
+                     top_k: int = 5,
+                     doc_id: Optional[str] = None,
+                     category: Optional[str] = None,
+                     nprobe: Optional[int] = None,
+                     ef_search: Optional[int] = None) -> List[List[Dict[str, Any]]]:
+        """
+        Tìm kiếm nhiều queries cùng lúc: một lần index.search với ma trận (nq, d)
+        
+        Args:
+            query_vectors: Ma trận queries đã normalize (nq, dimension)
+            top_k: Số lượng kết quả mỗi query
             doc_id: Nếu có, chỉ tìm trong document này
             category: Nếu có, chỉ tìm trong category này
-            embedding_service: Embedding service instance
+            nprobe: Số cluster quét (IVF), mặc định theo index
+            ef_search: Độ rộng search (HNSW), mặc định theo index
             
         Returns:
-            List[Dict]: Danh sách kết quả
+            List[List[Dict]]: Kết quả theo thứ tự các queries
         """
-        if embedding_service is None:
-            raise ValueError("Embedding service is required")
+        queries = np.ascontiguousarray(query_vectors, dtype=np.float32)
+        if queries.ndim != 2 or queries.shape[1] != self.dimension:
+            raise ValueError(f"Invalid query shape {queries.shape}, expected (nq, {self.dimension})")
+        if len(queries) == 0:
+            return []
+        
+        # Đọc một snapshot duy nhất: index và metadata luôn cùng generation, không cần lock
+        snapshot = self._snapshot
+        if snapshot.index is None or snapshot.ntotal == 0:
+            logger.warning("No vectors in index")
+            return [[] for _ in range(len(queries))]
         
         try:
-            # Tạo embedding cho query
-            query_embedding = embedding_service.generate_embedding(query_text)
-            query_embedding = embedding_service.normalize_embedding(query_embedding)
+            # Pre-filter: giới hạn tập ứng viên trước khi tính điểm
+            candidate_ids = snapshot.doc_index.candidate_ids(doc_id, category)
+            if candidate_ids is None:
+                # Tìm kiếm (tham số nprobe/efSearch chỉ áp dụng cho lần gọi này), bỏ qua tombstones
+                tombstone_selector = faiss.IDSelectorBatch(snapshot.tombstones) if len(snapshot.tombstones) > 0 else None
+                search_params = make_search_params(
+                    snapshot.index, nprobe=nprobe, ef_search=ef_search,
+                    selector=faiss.IDSelectorNot(tombstone_selector) if tombstone_selector is not None else None
+                )
+                scores, indices = self._index_search(snapshot, queries, top_k, search_params)
+            elif len(candidate_ids) == 0:
+                logger.info("✅ No chunks match the search filter")
+                return [[] for _ in range(len(queries))]
+            else:
+                scores, indices = self._filtered_search(snapshot, queries, candidate_ids, top_k, nprobe, ef_search)
+            
+            # Lấy metadata theo vector ID (chỉ đọc text của các hits, mỗi ID một lần)
+            records = {}
+            batch_results = []
+            for row_scores, row_indices in zip(scores, indices):
+                results = []
+                for score, idx in zip(row_scores, row_indices):
+                    if idx == -1:  # FAISS trả về -1 nếu không đủ kết quả
+                        continue
+                    idx = int(idx)
+                    if idx not in records:
+                        records[idx] = snapshot.metadata.get(idx)
+                    if records[idx] is not None:
+                        results.append({**records[idx], "similarity_score": float(score)})
+                batch_results.append(results)
             
-            # Tìm kiếm
-            return self.search(query_embedding, top_k, doc_id, category)
+            logger.info(
+                f"✅ Found {sum(len(results) for results in batch_results)} results "
+                f"for {len(queries)} queries"
+            )
+            return batch_results
             
         except Exception as e:
-            logger.error(f"❌ Error in text search: {e}")
+            logger.error(f"❌ Error searching FAISS index: {e}")
             raise
 
-    def clear_doc(self, doc_id: str) -> bool:
+    def _filtered_search(self,
+                         snapshot: StoreSnapshot,
+                         queries: np.ndarray,
+                         candidate_ids: np.ndarray,
+                         top_k: int,
+                         nprobe: Optional[int] = None,
+                         ef_search: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Tìm top_k trong tập ứng viên cho mỗi query: tính điểm trực tiếp nếu tập nhỏ,
+        ngược lại search với IDSelector để FAISS bỏ qua vectors ngoài filter
+        """
+        top_k = min(top_k, len(candidate_ids))
+        if top_k <= 0:
+            return np.empty((len(queries), 0), dtype=np.float32), np.empty((len(queries), 0), dtype=np.int64)
+        
+        if len(candidate_ids) <= self.exact_filter_threshold:
+            return self._exact_search(snapshot, queries, candidate_ids, top_k)
+        
+        selector = faiss.IDSelectorBatch(candidate_ids)
+        search_params = make_search_params(
+            snapshot.index, nprobe=nprobe, ef_search=ef_search, selector=selector
+        )
+        scores, indices = self._index_search(snapshot, queries, top_k, search_params, candidate_ids=candidate_ids)
+        
+        # Index xấp xỉ có thể trả thiếu khi filter chặt: fallback tính điểm trực tiếp cho các query đó
+        short_rows = np.flatnonzero((indices != -1).sum(axis=1) < top_k)
+        if len(short_rows) > 0:
+            exact_scores, exact_indices = self._exact_search(
+                snapshot, queries[short_rows], candidate_ids, top_k
+            )
+            scores[short_rows] = exact_scores
+            indices[short_rows] = exact_indices
+        return scores, indices
+
+    def _index_search(self,
+                      snapshot: StoreSnapshot,
+                      queries: np.ndarray,
+                      top_k: int,
+                      search_params: Optional[faiss.SearchParameters] = None,
+                      rerank_factor: Optional[int] = None,
+                      candidate_ids: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Search trên index và delta (search_params áp dụng cho index, delta lọc theo candidate_ids
+        hoặc tombstones); index nén hoặc index coarse (two-stage) có bản float32 thì lấy
+        top_k * rerank_factor ứng viên rồi tính lại điểm bằng vectors đầy đủ và giữ top_k
+        """
+        coarse = snapshot.index.d < queries.shape[1]
+        rerank = snapshot.raw_vectors is not None and (
+            coarse or detect_index_type(snapshot.index) in QUANTIZED_INDEX_TYPES
+        )
+        index_queries = truncate_vectors(queries, snapshot.index.d)
+        shortlist = top_k * (rerank_factor or self.rerank_factor) if rerank else top_k
+        
+        results = []
+        if snapshot.index.ntotal > 0:
+            results.append(snapshot.index.search(index_queries, shortlist, params=search_params))
+        if snapshot.delta.ntotal > 0:
+            results.append(snapshot.delta.search(
+                index_queries, shortlist, candidate_ids=candidate_ids, excluded_ids=snapshot.tombstones
+            ))
+        if len(results) == 1 and snapshot.delta.ntotal == 0:
+            scores, indices = results[0]
+        else:
+            scores, indices = merge_search_results(results, shortlist)
+        if not rerank:
+            return scores, indices
+        
+        valid = indices != -1
+        vectors, found = snapshot.raw_vectors.get(indices[valid])
+        exact_scores = np.full(indices.shape, -np.inf, dtype=np.float32)
+        exact_scores[valid] = np.where(
+            found,
+            np.einsum("nd,nd->n", vectors, np.repeat(queries, valid.sum(axis=1), axis=0)),
+            scores[valid]  # Thiếu bản float32: giữ điểm xấp xỉ
+        )
+        order = np.argsort(-exact_scores, axis=1, kind="stable")[:, :top_k]
+        exact_scores = np.take_along_axis(exact_scores, order, axis=1)
+        indices = np.take_along_axis(indices, order, axis=1)
+        exact_scores[indices == -1] = -np.inf
+        return exact_scores, indices
+
+    def _exact_search(self,
+                      snapshot: StoreSnapshot,
+                      queries: np.ndarray,
+                      candidate_ids: np.ndarray,
+                      top_k: int,
+                      batch_size: int = 16384) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Tính điểm inner product của các queries trên vectors ứng viên, giữ top_k theo từng batch
+        """
+        nq = len(queries)
+        best_scores = np.empty((nq, 0), dtype=np.float32)
+        best_ids = np.empty((nq, 0), dtype=np.int64)
+        for start in range(0, len(candidate_ids), batch_size):
+            batch_ids = candidate_ids[start:start + batch_size]
+            batch_scores = queries @ self._reconstruct_vectors(
+                snapshot.index, batch_ids, raw_vectors=snapshot.raw_vectors, delta=snapshot.delta
+            ).T
+            best_scores = np.concatenate([best_scores, batch_scores], axis=1)
+            best_ids = np.concatenate([best_ids, np.broadcast_to(batch_ids, (nq, len(batch_ids)))], axis=1)
+            if best_scores.shape[1] > top_k:
+                keep = np.argpartition(-best_scores, top_k - 1, axis=1)[:, :top_k]
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                best_ids = np.take_along_axis(best_ids, keep, axis=1)
+        
+        order = np.argsort(-best_scores, axis=1)
+        return np.take_along_axis(best_scores, order, axis=1), np.take_along_axis(best_ids, order, axis=1)
+
+    def delete_document_vectors(self, doc_id: str) -> int:
         """
         Xóa tất cả chunks của một document khỏi FAISS store
         
@@ -322,48 +1388,295 @@ class FAISSStore:
             doc_id: ID của document cần xóa
             
         Returns:
-            bool: True nếu xóa thành công
+            int: Số vectors đã xóa (0 nếu không tìm thấy document)
         """
         try:
-            if doc_id not in self.doc_metadata:
-                logger.warning(f"Document {doc_id} not found")
-                return False
-            
-            # Lấy danh sách chunks cần xóa
-            chunks_to_remove = self.doc_metadata[doc_id]["chunks"]
-            
-            if not chunks_to_remove:
-                logger.warning(f"No chunks found for document {doc_id}")
-                return False
-            
-            # Tạo index mới (FAISS không hỗ trợ xóa trực tiếp)
-            new_index = faiss.IndexFlatIP(self.dimension)
-            new_metadata = []
-            
-            # Copy các vectors không thuộc document này
-            for i, chunk_metadata in enumerate(self.metadata):
-                if chunk_metadata["doc_id"] != doc_id:
-                    # Lấy vector từ index cũ
-                    vector = self.index.reconstruct(i)
-                    new_index.add(vector.reshape(1, -1))
-                    
-                    # Update vector index trong metadata
-                    chunk_metadata["vector_index"] = new_index.ntotal - 1
-                    new_metadata.append(chunk_metadata)
-            
-            # Thay thế index và metadata
-            self.index = new_index
-            self.metadata = new_metadata
-            
-            # Xóa document metadata
+            with self._write_transaction():
+                if doc_id not in self.doc_metadata:
+                    logger.warning(f"Document {doc_id} not found")
+                    return 0
+                
+                # Lấy danh sách chunks cần xóa
+                chunks_to_remove = self.doc_metadata[doc_id]["chunks"]
+                
+                if not chunks_to_remove:
+                    logger.warning(f"No chunks found for document {doc_id}")
+                    return 0
+                
+                removed = self._remove_documents([doc_id])
+                self._log_operation({"op": "delete", "doc_id": doc_id})
+                
+                logger.info(f"✅ Removed document {doc_id} with {removed} chunks")
+            
+            self._maybe_schedule_compaction()
+            return removed
+            
+        except Exception as e:
+            logger.error(f"❌ Error deleting document {doc_id}: {e}")
+            raise
+
+    def _remove_documents(self, doc_ids: List[str]) -> int:
+        """
+        Xóa chunks của các documents khỏi metadata và đánh dấu tombstone (gọi trong write transaction)
+        
+        Returns:
+            int: Số chunks đã xóa
+        """
+        # Không sửa index: đánh dấu tombstone (search loại ra ngay), compaction dọn sau
+        vector_ids = np.array(
+            [vector_id for doc_id in doc_ids for vector_id in self.doc_metadata[doc_id].get("vector_ids", [])],
+            dtype=np.int64
+        )
+        if len(vector_ids) > 0:
+            self.tombstones = np.union1d(self.tombstones, vector_ids)
+        self._own_metadata()
+        self.metadata.remove(vector_ids)
+        if self.raw_vectors is not None:
+            self._own_raw_vectors()
+            self.raw_vectors.remove(vector_ids)
+        
+        # Xóa document metadata
+        for doc_id in doc_ids:
+            self._own_doc_entry(doc_id)
             del self.doc_metadata[doc_id]
+        return len(vector_ids)
+
+    def clear_category(self, category: Optional[str]) -> int:
+        """
+        Xóa tất cả documents thuộc một category trong một lần ghi
+        
+        Args:
+            category: Category cần xóa
+            
+        Returns:
+            int: Số documents đã xóa
+        """
+        try:
+            with self._write_transaction():
+                doc_ids = [
+                    doc_id for doc_id, doc_info in self.doc_metadata.items()
+                    if doc_info.get("category") == category
+                ]
+                if not doc_ids:
+                    return 0
+                
+                if len(doc_ids) == len(self.doc_metadata):
+                    # Cả store chỉ có category này (vd. một shard theo category): tạo index mới
+                    self.clear_all()
+                else:
+                    removed_chunks = self._remove_documents(doc_ids)
+                    self._log_operation({"op": "clear_category", "category": category})
+                    logger.info(f"✅ Removed {len(doc_ids)} documents ({removed_chunks} chunks) of category {category}")
+            
+            self._maybe_schedule_compaction()
+            return len(doc_ids)
+                
+        except Exception as e:
+            logger.error(f"❌ Error clearing category {category}: {e}")
+            raise
+
+    def reload_category(self,
+                        category: Optional[str],
+                        documents: List[Dict[str, Any]],
+                        embedding_service=None,
+                        batch_size: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Thay toàn bộ documents của một category: encode documents mới trước (ngoài write lock),
+        sau đó xóa bản cũ và thêm embeddings đã có trong cùng một write transaction
+        (search thấy bản cũ cho tới khi hoàn tất, encode lỗi thì store không đổi)
+        
+        Args:
+            category: Category cần reload
+            documents: Danh sách {"doc_id": str, "chunks": List[str], "filename": str}
+            embedding_service: Embedding service instance
+            batch_size: Batch size khi encode
+            
+        Returns:
+            Dict: {"category", "removed_documents", "chunk_ids", "total_chunks"}
+        """
+        try:
+            documents = [{**document, "category": category} for document in documents]
+            
+            # Encode ngoài write lock: không chặn các writer khác trong lúc encode cả category
+            texts, _ = self._flatten_documents(documents)
+            embeddings = None
+            if texts:
+                if embedding_service is None:
+                    raise ValueError("Embedding service is required")
+                embeddings = embedding_service.generate_embeddings_batch(
+                    texts,
+                    batch_size=batch_size or self.embedding_batch_size,
+                    show_progress_bar=False
+                )
+            
+            with self._write_transaction():
+                removed_documents = self.clear_category(category)
+                result = self.add_documents_batch(documents, embeddings=embeddings) if texts else {
+                    "chunk_ids": {}, "total_chunks": 0, "timings": {}
+                }
+            
+            logger.info(
+                f"✅ Reloaded category {category}: removed {removed_documents} documents, "
+                f"added {result['total_chunks']} chunks"
+            )
+            return {
+                "category": category,
+                "removed_documents": removed_documents,
+                "chunk_ids": result["chunk_ids"],
+                "total_chunks": result["total_chunks"]
+            }
+            
+        except Exception as e:
+            logger.error(f"❌ Error reloading category {category}: {e}")
+            raise
+
+    def compact(self) -> Dict[str, Any]:
+        """
+        Dọn tombstones: build index mới không còn các vectors đã xóa từ snapshot hiện tại
+        (ngoài write lock, search và ghi vẫn chạy), sau đó áp dụng các thay đổi xảy ra
+        trong lúc build và thay index bằng một lần publish atomic
+        
+        Returns:
+            Dict: Kết quả lần chạy {status, removed_vectors, caught_up_vectors, build_seconds, ...}
+        """
+        if not self._compaction_lock.acquire(blocking=False):
+            logger.info("Compaction already running")
+            return {"status": "running"}
+        
+        start = time.perf_counter()
+        run = {"started_at": datetime.now().isoformat(), "status": "running"}
+        self.compaction_stats["running"] = True
+        try:
+            # Stage 1: Chụp trạng thái đã công bố (index của snapshot không bao giờ bị sửa tại chỗ)
+            with self._write_lock:
+                snapshot = self._snapshot
+                epoch = self._index_epoch
+                # Chỉ dọn index chính: vectors của delta được lọc tombstones khi merge
+                tombstones = np.setdiff1d(snapshot.tombstones, snapshot.delta.ids())
+                if snapshot.index is None or len(tombstones) == 0:
+                    run["status"] = "skipped"
+                    return run
+                source_index = snapshot.index
+                if snapshot.index_mmapped:
+                    # Index mmap không bao giờ bị sửa: file trên disk chính là index của snapshot
+                    source_index = read_index(os.path.join(self.index_path, "faiss_index.bin"))
+                kept_ids = np.setdiff1d(snapshot.metadata.keys(), snapshot.delta.ids())
             
-            logger.info(f"✅ Removed document {doc_id} with {len(chunks_to_remove)} chunks")
-            return True
+            # Stage 2: Build index mới ngoài lock
+            stage_start = time.perf_counter()
+            index_type = detect_index_type(source_index)
+            logger.info(f"⏳ Compacting {index_type} index: removing {len(tombstones)} tombstoned vectors...")
+            if supports_remove_ids(source_index):
+                new_index = source_index if snapshot.index_mmapped else faiss.clone_index(source_index)
+                new_index.remove_ids(tombstones)
+            else:
+                # HNSW không hỗ trợ xóa: build lại từ các vectors còn sống
+                new_index = self._rebuild_index(index_type, kept_ids, source_index, snapshot.raw_vectors)
+            run["build_seconds"] = time.perf_counter() - stage_start
+            
+            # Stage 3: Bổ sung chunks thêm trong lúc build rồi thay index
+            stage_start = time.perf_counter()
+            with self._write_transaction():
+                if self._index_epoch != epoch:
+                    # Index đã bị thay toàn bộ (load, clear_all, migrate) trong lúc build
+                    logger.warning("⚠️ Index replaced during compaction, discarding compacted index")
+                    run["status"] = "aborted"
+                    return run
+                
+                # Vectors merge từ delta vào index chính trong lúc build (delta hiện tại giữ nguyên)
+                added_ids = np.setdiff1d(np.setdiff1d(self.metadata.keys(), kept_ids), self.delta.ids())
+                if len(added_ids) > 0:
+                    vectors = self._reconstruct_vectors(self.index, added_ids, raw_vectors=self.raw_vectors)
+                    new_index.add_with_ids(truncate_vectors(vectors, new_index.d), added_ids)
+                
+                self.index = new_index
+                self.index_mmapped = False
+                self._index_owned = True
+                # Chunks xóa trong lúc build: còn trong index mới nếu đã có lúc chụp snapshot,
+                # chunks vừa thêm rồi xóa ngay thì không được bổ sung vào index mới; tombstones của delta giữ nguyên
+                self.tombstones = np.intersect1d(
+                    np.setdiff1d(self.tombstones, tombstones), np.union1d(kept_ids, self.delta.ids())
+                )
+            run["swap_seconds"] = time.perf_counter() - stage_start
             
+            run.update({
+                "status": "completed",
+                "index_type": index_type,
+                "removed_vectors": len(tombstones),
+                "caught_up_vectors": len(added_ids),
+                "remaining_tombstones": len(self.tombstones)
+            })
+            logger.info(
+                f"✅ Compacted index: removed {len(tombstones)} vectors "
+                f"(build {run['build_seconds']:.3f}s, swap {run['swap_seconds']:.3f}s)"
+            )
+            return run
+        
         except Exception as e:
-            logger.error(f"❌ Error clearing document {doc_id}: {e}")
+            run.update({"status": "failed", "error": str(e)})
+            logger.error(f"❌ Error compacting FAISS index: {e}")
+            raise
+        finally:
+            run["duration_seconds"] = time.perf_counter() - start
+            self.compaction_stats["running"] = False
+            self.compaction_stats["runs"] += 1
+            self.compaction_stats["last_run"] = run
+            self._compaction_lock.release()
+
+    def start_compaction(self) -> bool:
+        """
+        Chạy compaction trong background thread
+        
+        Returns:
+            bool: False nếu đang có compaction chạy
+        """
+        if self.compaction_stats["running"] or (self._compaction_thread is not None and self._compaction_thread.is_alive()):
             return False
+        self._compaction_thread = threading.Thread(target=self._compaction_worker, name="faiss-compaction", daemon=True)
+        self._compaction_thread.start()
+        return True
+
+    def wait_for_compaction(self, timeout: Optional[float] = None) -> bool:
+        """
+        Chờ compaction background hiện tại chạy xong
+        
+        Returns:
+            bool: True nếu không còn compaction nào đang chạy
+        """
+        thread = self._compaction_thread
+        if thread is not None:
+            thread.join(timeout)
+        return not self.compaction_stats["running"]
+
+    def _compaction_worker(self):
+        try:
+            self.compact()
+        except Exception:
+            pass  # Đã log và ghi vào compaction_stats
+
+    def _maybe_schedule_compaction(self):
+        """
+        Khởi chạy compaction background khi tỷ lệ tombstone vượt compaction_threshold
+        """
+        if self._replaying or not self.background_compaction or self.compaction_threshold is None:
+            return
+        if _tombstone_ratio(self._snapshot) >= self.compaction_threshold and self.start_compaction():
+            logger.info(f"🔄 Started background compaction ({len(self.tombstones)} tombstones)")
+
+    def get_compaction_status(self) -> Dict[str, Any]:
+        """
+        Trạng thái tombstones và compaction
+        """
+        snapshot = self._snapshot
+        return {
+            "running": self.compaction_stats["running"],
+            "tombstones": len(snapshot.tombstones),
+            "tombstone_ratio": _tombstone_ratio(snapshot),
+            "threshold": self.compaction_threshold,
+            "background": self.background_compaction,
+            "runs": self.compaction_stats["runs"],
+            "last_run": self.compaction_stats["last_run"]
+        }
 
     def get_document_chunks(self, doc_id: str) -> List[Dict[str, Any]]:
         """
@@ -376,10 +1689,10 @@ class FAISSStore:
             List[Dict]: Danh sách chunks
         """
         try:
-            chunks = []
-            for chunk_metadata in self.metadata:
-                if chunk_metadata["doc_id"] == doc_id:
-                    chunks.append(chunk_metadata)
+            # Tra theo DocumentIndex: chỉ đọc metadata của các chunks thuộc document
+            snapshot = self._snapshot
+            vector_ids = snapshot.doc_index.vector_ids(doc_id)
+            chunks = snapshot.metadata.get_many(vector_ids) if vector_ids is not None else []
             
             # Sắp xếp theo chunk_index
             chunks.sort(key=lambda x: x["chunk_index"])
@@ -391,22 +1704,156 @@ class FAISSStore:
             logger.error(f"❌ Error getting document chunks: {e}")
             raise
 
+    def get_chunk_windows(self, windows: List[Tuple[str, int, int]]) -> List[List[Dict[str, Any]]]:
+        """
+        Lấy chunks theo khoảng chunk_index của document: vị trí chunk (DocumentIndex) cho vector IDs
+        bằng searchsorted, metadata của tất cả các khoảng được đọc trong một lần get_many
+        
+        Args:
+            windows: Danh sách (doc_id, chunk_index đầu, chunk_index cuối) - gồm cả hai đầu
+            
+        Returns:
+            List[List[Dict]]: Chunks của từng khoảng theo chunk_index
+        """
+        try:
+            # Index và metadata cùng một snapshot
+            snapshot = self._snapshot
+            window_ids = []
+            for doc_id, start, end in windows:
+                positions = snapshot.doc_index.chunk_positions(doc_id, snapshot.metadata)
+                if positions is None:
+                    window_ids.append(np.empty(0, dtype=np.int64))
+                    continue
+                chunk_indices, vector_ids = positions
+                first = np.searchsorted(chunk_indices, start, side="left")
+                last = np.searchsorted(chunk_indices, end, side="right")
+                window_ids.append(vector_ids[first:last])
+            
+            if not window_ids:
+                return []
+            records = {
+                record["vector_index"]: record
+                for record in snapshot.metadata.get_many(np.unique(np.concatenate(window_ids)))
+            }
+            return [
+                [records[vector_id] for vector_id in ids.tolist() if vector_id in records]
+                for ids in window_ids
+            ]
+            
+        except Exception as e:
+            logger.error(f"❌ Error getting chunk windows: {e}")
+            raise
+
+    def coarse_search_report(self,
+                             dimensions: List[int],
+                             num_queries: int = 200,
+                             top_k: int = 10,
+                             rerank_factor: Optional[int] = None,
+                             seed: int = 1234) -> List[Dict[str, Any]]:
+        """
+        Đo recall và latency của two-stage search theo từng coarse dimension để chọn k:
+        queries là các vectors lấy mẫu từ store, ground truth là search chính xác trên
+        vectors đầy đủ; mỗi k build một index flat tạm trong RAM
+        
+        Args:
+            dimensions: Các coarse dimension cần đo (vd. [64, 128, 256, 512])
+            num_queries: Số queries lấy mẫu
+            top_k: Số kết quả mỗi query
+            rerank_factor: Kích thước shortlist = top_k * rerank_factor (mặc định self.rerank_factor)
+            seed: Seed lấy mẫu queries
+            
+        Returns:
+            List[Dict]: Mỗi dimension một dòng {coarse_dimension, recall_coarse, recall_two_stage,
+                latency_ms_coarse, latency_ms_two_stage, index_bytes_per_vector}
+        """
+        snapshot = self._snapshot
+        vector_ids = snapshot.metadata.keys()
+        if len(vector_ids) == 0:
+            return []
+        
+        vectors = self._reconstruct_vectors(
+            snapshot.index, vector_ids, raw_vectors=snapshot.raw_vectors, delta=snapshot.delta
+        )
+        raw_vectors = snapshot.raw_vectors
+        if raw_vectors is None:
+            # Store chưa có bản float32 trên disk: giữ tạm trong RAM cho phép đo
+            raw_vectors = RawVectorStore(os.path.join(self.metadata_path, "raw_vectors"), self.dimension)
+            raw_vectors.add(vector_ids, vectors)
+        
+        rng = np.random.default_rng(seed)
+        queries = vectors[rng.choice(len(vectors), min(num_queries, len(vectors)), replace=False)]
+        top_k = min(top_k, len(vector_ids))
+        
+        # Ground truth: search chính xác trên vectors đầy đủ
+        exact_index = faiss.IndexIDMap2(faiss.IndexFlatIP(self.dimension))
+        exact_index.add_with_ids(vectors, vector_ids)
+        _, truth = exact_index.search(queries, top_k)
+        
+        def recall(indices: np.ndarray) -> float:
+            return float(np.mean([len(np.intersect1d(found, expected)) / top_k for found, expected in zip(indices, truth)]))
+        
+        report = []
+        for dimension in sorted(dimensions):
+            coarse_index = faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+            coarse_index.add_with_ids(truncate_vectors(vectors, dimension), vector_ids)
+            coarse_snapshot = StoreSnapshot(
+                snapshot.generation, coarse_index, snapshot.metadata, snapshot.doc_metadata,
+                snapshot.doc_index, raw_vectors=raw_vectors
+            )
+            
+            start = time.perf_counter()
+            _, coarse_indices = coarse_index.search(truncate_vectors(queries, dimension), top_k)
+            coarse_seconds = time.perf_counter() - start
+            
+            start = time.perf_counter()
+            _, two_stage_indices = self._index_search(
+                coarse_snapshot, queries, top_k, rerank_factor=rerank_factor
+            )
+            two_stage_seconds = time.perf_counter() - start
+            
+            report.append({
+                "coarse_dimension": dimension,
+                "recall_coarse": recall(coarse_indices),
+                "recall_two_stage": recall(two_stage_indices),
+                "latency_ms_coarse": coarse_seconds * 1000 / len(queries),
+                "latency_ms_two_stage": two_stage_seconds * 1000 / len(queries),
+                "index_bytes_per_vector": dimension * 4
+            })
+        
+        return report
+
     def get_stats(self) -> Dict[str, Any]:
         """
         Lấy thống kê về FAISS store
         """
         try:
+            snapshot = self._snapshot
             stats = {
-                "total_vectors": self.index.ntotal if self.index else 0,
-                "total_documents": len(self.doc_metadata),
-                "total_chunks": len(self.metadata),
+                "total_vectors": snapshot.ntotal - len(snapshot.tombstones),
+                "total_documents": len(snapshot.doc_metadata),
+                "total_chunks": len(snapshot.metadata),
                 "dimension": self.dimension,
-                "index_type": "IndexFlatIP",
+                **describe_index(snapshot.index),
+                "generation": snapshot.generation,
+                "next_vector_id": self.next_vector_id,
+                "last_ingest": self.last_ingest_stats,
+                "metadata_store": snapshot.metadata.get_stats(),
+                "document_index": snapshot.doc_index.get_stats(),
+                "index_load": self.load_stats,
+                "index_mmapped": snapshot.index_mmapped,
+                "mmap_index": self.mmap_index,
+                "delta": snapshot.delta.get_stats(),
+                "exact_rerank": snapshot.raw_vectors is not None,
+                "coarse_dimension": snapshot.index.d if snapshot.index and snapshot.index.d < self.dimension else None,
+                "raw_vectors": snapshot.raw_vectors.get_stats() if snapshot.raw_vectors is not None else None,
+                "wal": {**self.wal.get_stats(), "checkpoint_lsn": self.checkpoint_lsn} if self.wal else None,
+                "compaction": self.get_compaction_status(),
+                "process_memory": _process_memory(),
                 "documents": {}
             }
             
             # Thống kê theo document
-            for doc_id, doc_info in self.doc_metadata.items():
+            for doc_id, doc_info in snapshot.doc_metadata.items():
                 stats["documents"][doc_id] = {
                     "filename": doc_info["filename"],
                     "chunks": doc_info["total_chunks"],
@@ -424,43 +1871,199 @@ class FAISSStore:
         Xóa tất cả dữ liệu trong FAISS store
         """
         try:
-            self.initialize_index()
-            self.metadata = []
-            self.doc_metadata = {}
-            
-            logger.info("✅ Cleared all data from FAISS store")
-            
+            with self._write_transaction():
+                self.initialize_index()
+                self._own_metadata()
+                self.metadata.clear()
+                if self.raw_vectors is not None:
+                    self._own_raw_vectors()
+                    self.raw_vectors.clear()
+                self.doc_metadata = ChunkedDict()
+                self._doc_metadata_owned = True
+                self._doc_index_stale = True
+                self._log_operation({"op": "clear_all"})
+                
+                logger.info("✅ Cleared all data from FAISS store")
+                
         except Exception as e:
             logger.error(f"❌ Error clearing FAISS store: {e}")
             raise
 
-    def backup(self, backup_path: str):
+    def backup(self, backup_path: str) -> Dict[str, Any]:
         """
-        Backup FAISS store
+        Snapshot backup: checkpoint một lần rồi hardlink các file của checkpoint vào backup_path
+        (khác filesystem thì copy/reflink), ghi manifest kèm checksum SHA-256 từng file.
+        Writer chỉ bị chặn trong lúc checkpoint và link, checksum tính sau khi nhả lock.
+        
+        Args:
+            backup_path: Thư mục backup (backup cũ tại đây bị thay thế)
+            
+        Returns:
+            Dict: Manifest của backup
         """
         try:
+            start_time = time.perf_counter()
             os.makedirs(backup_path, exist_ok=True)
+            clear_backup(backup_path, ["index", "metadata"])
             
-            # Backup index
-            if self.index:
-                backup_index = os.path.join(backup_path, "faiss_index.bin")
-                faiss.write_index(self.index, backup_index)
-            
-            # Backup metadata
-            backup_metadata = os.path.join(backup_path, "metadata.json")
-            with open(backup_metadata, 'w', encoding='utf-8') as f:
-                json.dump(self.metadata, f, ensure_ascii=False, indent=2)
+            # Không lần save nào chen giữa checkpoint và link
+            with self._write_transaction():
+                self.save_index()
+                entries = snapshot_files(self._persisted_files(), backup_path)
+                info = {
+                    "generation": self._snapshot.generation,
+                    "dimension": self.dimension,
+                    "index_type": self.index_type,
+                    "coarse_dimension": self.coarse_dimension,
+                    "wal_lsn": self.checkpoint_lsn,
+                    "total_chunks": len(self.metadata),
+                    "total_documents": len(self.doc_metadata)
+                }
+            link_seconds = time.perf_counter() - start_time
             
-            # Backup document metadata
-            backup_doc_metadata = os.path.join(backup_path, "doc_metadata.json")
-            with open(backup_doc_metadata, 'w', encoding='utf-8') as f:
-                json.dump(self.doc_metadata, f, ensure_ascii=False, indent=2)
+            # File bất biến (và prefix của file append-only) không đổi: checksum ngoài lock
+            manifest = write_manifest(backup_path, entries, info)
             
-            logger.info(f"✅ Backed up FAISS store to {backup_path}")
+            hardlinks = sum(1 for entry in entries if entry["method"] == "hardlink")
+            logger.info(
+                f"✅ Backed up FAISS store to {backup_path}: {len(entries)} files "
+                f"({hardlinks} hardlinked, {manifest['total_bytes']} bytes), "
+                f"writers blocked {link_seconds:.3f}s, total {time.perf_counter() - start_time:.3f}s"
+            )
+            return manifest
             
         except Exception as e:
             logger.error(f"❌ Error backing up FAISS store: {e}")
             raise
 
-# Global instance
-faiss_store = FAISSStore()
\ No newline at end of file
+    def restore(self, backup_path: str, verify: bool = True) -> Dict[str, Any]:
+        """
+        Restore store từ snapshot backup: kiểm tra manifest và checksum trước khi thay
+        file của store, sau đó load lại (search vẫn dùng snapshot cũ tới khi load xong)
+        
+        Args:
+            backup_path: Thư mục backup (tạo bởi backup())
+            verify: Kiểm tra checksum các file của backup
+            
+        Returns:
+            Dict: Manifest của backup đã restore
+        """
+        try:
+            manifest = read_manifest(backup_path, verify=verify)
+            if manifest["dimension"] != self.dimension:
+                raise ValueError(f"Backup dimension {manifest['dimension']} does not match store dimension {self.dimension}")
+            
+            with self._write_transaction():
+                # File cũ bị xóa khỏi thư mục, các mmap của snapshot hiện tại vẫn đọc được
+                self._remove_store_files()
+                restore_files(backup_path, manifest, {"index": self.index_path, "metadata": self.metadata_path})
+                
+                # WAL sau backup không còn áp dụng được: bắt đầu lại từ checkpoint của backup
+                if self.wal:
+                    self.wal.reset(manifest["wal_lsn"])
+                self.load_index()
+            
+            logger.info(
+                f"✅ Restored FAISS store from {backup_path} "
+                f"({manifest['total_chunks']} chunks, backup of {manifest['created_at']})"
+            )
+            return manifest
+            
+        except Exception as e:
+            logger.error(f"❌ Error restoring FAISS store: {e}")
+            raise
+
+    def _persisted_files(self) -> List[Tuple[str, str, int, bool]]:
+        """
+        Các file của checkpoint hiện tại: (đường dẫn, đường dẫn trong backup, số bytes, append_only)
+        """
+        files = []
+        index_file = os.path.join(self.index_path, "faiss_index.bin")
+        if os.path.exists(index_file):
+            files.append((index_file, "index/faiss_index.bin", os.path.getsize(index_file), False))
+        for relative_path, size, append_only in self.metadata.persisted_files():
+            files.append((os.path.join(self.metadata_path, relative_path), f"metadata/{relative_path}", size, append_only))
+        for name in ("doc_metadata.json", "store_state.json"):
+            path = os.path.join(self.metadata_path, name)
+            if os.path.exists(path):
+                files.append((path, f"metadata/{name}", os.path.getsize(path), False))
+        if self.raw_vectors is not None:
+            for relative_path, size, append_only in self.raw_vectors.persisted_files():
+                files.append((
+                    os.path.join(self.raw_vectors.directory, relative_path),
+                    f"metadata/raw_vectors/{relative_path}",
+                    size,
+                    append_only
+                ))
+        return files
+
+    def _remove_store_files(self):
+        """
+        Xóa các file dữ liệu của store trên disk (trước khi restore), giữ WAL
+        """
+        index_file = os.path.join(self.index_path, "faiss_index.bin")
+        if os.path.exists(index_file):
+            os.remove(index_file)
+        self.metadata.remove_files()
+        shutil.rmtree(os.path.join(self.metadata_path, "raw_vectors"), ignore_errors=True)
+        for name in ("doc_metadata.json", "store_state.json", "metadata.json"):
+            path = os.path.join(self.metadata_path, name)
+            if os.path.exists(path):
+                os.remove(path)
+
+def truncate_vectors(vectors: np.ndarray, dimension: int) -> np.ndarray:
+    """
+    Giữ dimension chiều đầu của vectors (embedding kiểu Matryoshka) và normalize lại
+    để inner product vẫn là cosine; trả về nguyên vectors nếu không cần cắt
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if vectors.shape[1] <= dimension:
+        return vectors
+    truncated = np.array(vectors[:, :dimension], dtype=np.float32, order="C")  # Luôn copy: normalize tại chỗ
+    faiss.normalize_L2(truncated)
+    return truncated
+
+def _tombstone_ratio(snapshot: StoreSnapshot) -> float:
+    """Tỷ lệ vectors đã xóa (chưa compaction) trong index và delta"""
+    if snapshot.ntotal == 0:
+        return 0.0
+    return len(snapshot.tombstones) / snapshot.ntotal
+
+def _process_memory() -> Dict[str, int]:
+    """
+    Bộ nhớ resident của process (bytes); rss_file_bytes là phần page cache map từ file
+    (dùng chung giữa các worker khi load index bằng mmap)
+    """
+    fields = {"VmRSS": "rss_bytes", "RssAnon": "rss_anon_bytes", "RssFile": "rss_file_bytes"}
+    memory = {}
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in fields:
+                    memory[fields[key]] = int(value.split()[0]) * 1024
+    except OSError:
+        # Không có /proc (macOS, Windows): chỉ có peak RSS
+        import resource
+        memory["max_rss_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return memory
+
+# Global instance (FAISS_SHARD_BY=category|hash: chia store thành nhiều shard)
+_store_config = {
+    "index_type": os.getenv("FAISS_INDEX_TYPE", "flat"),
+    "mmap_index": os.getenv("FAISS_MMAP_INDEX", "false").lower() == "true",
+    "exact_rerank": os.getenv("FAISS_EXACT_RERANK", "false").lower() == "true",
+    "compaction_threshold": float(os.getenv("FAISS_COMPACTION_THRESHOLD", "0.2")),
+    "delta_max_vectors": int(os.getenv("FAISS_DELTA_MAX_VECTORS", "16384")),
+    "metadata_backend": os.getenv("FAISS_METADATA_BACKEND", "columnar")
+}
+_shard_by = os.getenv("FAISS_SHARD_BY", "").lower()
+if _shard_by:
+    from .sharded_store import ShardedFAISSStore
+    faiss_store = ShardedFAISSStore(
+        partition=_shard_by,
+        num_shards=int(os.getenv("FAISS_NUM_SHARDS", "4")),
+        **_store_config
+    )
+else:
+    faiss_store = FAISSStore(**_store_config)
\ No newline at end of file
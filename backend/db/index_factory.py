@@ -0,0 +1,317 @@
+"""
+FAISS Index Factory - Tạo các loại index cho FAISS Store
+Hỗ trợ index chính xác (Flat), lưu nén (SQ8, fp16) và index xấp xỉ (HNSW, IVF-Flat, IVF-PQ, OPQ+IVF-PQ)
+"""
+
+import logging
+import numpy as np
+import faiss
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Các loại index được hỗ trợ
+INDEX_TYPES = ["flat", "sq8", "fp16", "hnsw", "ivf_flat", "ivf_pq", "opq_ivf_pq"]
+
+# Các loại index lưu vectors dạng nén: điểm trả về là xấp xỉ, nên re-rank bằng vectors float32
+QUANTIZED_INDEX_TYPES = ("sq8", "fp16", "ivf_pq", "opq_ivf_pq")
+
+# Scalar quantizer cho các loại index flat nén
+SCALAR_QUANTIZERS = {
+    "sq8": faiss.ScalarQuantizer.QT_8bit,
+    "fp16": faiss.ScalarQuantizer.QT_fp16
+}
+
+# Tham số mặc định cho từng loại index
+DEFAULT_INDEX_PARAMS = {
+    "nlist": 1024,           # Số cluster cho IVF
+    "nprobe": 16,            # Số cluster quét khi search (IVF)
+    "hnsw_m": 32,            # Số neighbor mỗi node (HNSW)
+    "ef_construction": 200,  # Độ rộng khi build graph (HNSW)
+    "ef_search": 128,        # Độ rộng khi search (HNSW)
+    "pq_m": 64,              # Số sub-quantizer (PQ), phải chia hết dimension
+    "pq_nbits": 8,           # Số bit mỗi code (PQ)
+    "sq_train_size": 256,    # Số vector tối thiểu để train min/max từng chiều (SQ8)
+    "train_sample_size": 100000  # Số vector tối đa dùng để train
+}
+
+def resolve_index_params(index_params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Gộp tham số người dùng với tham số mặc định
+    """
+    params = dict(DEFAULT_INDEX_PARAMS)
+    if index_params:
+        params.update({key: value for key, value in index_params.items() if value is not None})
+    return params
+
+def build_index(index_type: str, dimension: int, index_params: Optional[Dict[str, Any]] = None) -> faiss.Index:
+    """
+    Tạo FAISS index rỗng theo loại
+
+    Args:
+        index_type: Một trong INDEX_TYPES
+        dimension: Dimension của vector
+        index_params: Tham số index (nlist, hnsw_m, pq_m, ...)
+
+    Returns:
+        faiss.Index: Index hỗ trợ add_with_ids với ID 64-bit
+    """
+    params = resolve_index_params(index_params)
+    metric = faiss.METRIC_INNER_PRODUCT
+
+    if index_type == "flat":
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+
+    if index_type in SCALAR_QUANTIZERS:
+        return faiss.IndexIDMap2(faiss.IndexScalarQuantizer(dimension, SCALAR_QUANTIZERS[index_type], metric))
+
+    if index_type == "hnsw":
+        hnsw = faiss.IndexHNSWFlat(dimension, params["hnsw_m"], metric)
+        hnsw.hnsw.efConstruction = params["ef_construction"]
+        hnsw.hnsw.efSearch = params["ef_search"]
+        return faiss.IndexIDMap2(hnsw)
+
+    if index_type == "ivf_flat":
+        description = f"IVF{params['nlist']},Flat"
+    elif index_type == "ivf_pq":
+        description = f"IVF{params['nlist']},PQ{params['pq_m']}x{params['pq_nbits']}"
+    elif index_type == "opq_ivf_pq":
+        description = f"OPQ{params['pq_m']},IVF{params['nlist']},PQ{params['pq_m']}x{params['pq_nbits']}"
+    else:
+        raise ValueError(f"Unsupported index type: {index_type}. Supported: {INDEX_TYPES}")
+
+    if dimension % params["pq_m"] != 0 and index_type != "ivf_flat":
+        raise ValueError(f"pq_m={params['pq_m']} must divide dimension {dimension}")
+
+    # IVF tự quản lý ID, không cần IndexIDMap2
+    index = faiss.index_factory(dimension, description, metric)
+    ivf = faiss.extract_index_ivf(index)
+    ivf.nprobe = params["nprobe"]
+    # Direct map dạng hashtable để reconstruct/remove theo ID bất kỳ
+    ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+    return index
+
+def detect_index_type(index: faiss.Index) -> str:
+    """
+    Xác định loại index (theo INDEX_TYPES) của một index đã load
+    """
+    if isinstance(index, faiss.IndexIDMap2):
+        inner = faiss.downcast_index(index.index)
+        if isinstance(inner, faiss.IndexHNSW):
+            return "hnsw"
+        if isinstance(inner, faiss.IndexScalarQuantizer):
+            for index_type, qtype in SCALAR_QUANTIZERS.items():
+                if inner.sq.qtype == qtype:
+                    return index_type
+        return "flat"
+
+    if isinstance(index, faiss.IndexPreTransform):
+        return "opq_ivf_pq"
+
+    ivf = _try_extract_ivf(index)
+    if ivf is not None:
+        if isinstance(faiss.downcast_index(ivf), faiss.IndexIVFPQ):
+            return "ivf_pq"
+        return "ivf_flat"
+
+    return "flat"
+
+def describe_index(index: Optional[faiss.Index]) -> Dict[str, Any]:
+    """
+    Mô tả index để hiển thị trong stats
+    """
+    if index is None:
+        return {"index_type": None, "faiss_class": None, "is_trained": False}
+
+    description = {
+        "index_type": detect_index_type(index),
+        "faiss_class": type(faiss.downcast_index(index)).__name__,
+        "is_trained": bool(index.is_trained)
+    }
+
+    ivf = _try_extract_ivf(index)
+    if ivf is not None:
+        description["nlist"] = ivf.nlist
+        description["nprobe"] = ivf.nprobe
+    elif isinstance(index, faiss.IndexIDMap2):
+        inner = faiss.downcast_index(index.index)
+        if isinstance(inner, faiss.IndexHNSW):
+            description["ef_search"] = inner.hnsw.efSearch
+            description["hnsw_m"] = inner.hnsw.nb_neighbors(1)
+
+    description.update(vector_memory(index))
+    return description
+
+def vector_memory(index: faiss.Index) -> Dict[str, Any]:
+    """
+    Ước lượng bộ nhớ mỗi vector của index: code lưu vector + ID + cấu trúc phụ
+    (ID map, liên kết HNSW); dùng để so sánh các loại index trong stats
+    """
+    index_type = detect_index_type(index)
+    overhead = 8  # ID 64-bit
+    ivf = _try_extract_ivf(index)
+    if ivf is not None:
+        code_bytes = ivf.code_size
+        overhead += 16  # Direct map dạng hashtable
+    else:
+        inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else faiss.downcast_index(index)
+        overhead += 16 if isinstance(index, faiss.IndexIDMap2) else 0  # Reverse map ID -> vị trí
+        if isinstance(inner, faiss.IndexHNSW):
+            code_bytes = faiss.downcast_index(inner.storage).code_size
+            overhead += 2 * inner.hnsw.nb_neighbors(1) * 4  # Liên kết ở level 0
+        else:
+            code_bytes = inner.code_size
+
+    return {
+        "code_bytes_per_vector": int(code_bytes),
+        "memory_per_vector_bytes": int(code_bytes + overhead),
+        "float32_bytes_per_vector": index.d * 4,
+        "compression_ratio": round(index.d * 4 / code_bytes, 2) if code_bytes else None,
+        "estimated_index_bytes": int((code_bytes + overhead) * index.ntotal),
+        "quantized": index_type in QUANTIZED_INDEX_TYPES
+    }
+
+def training_size_required(index_type: str, index_params: Optional[Dict[str, Any]] = None) -> int:
+    """
+    Số vector tối thiểu cần để train index (0 nếu không cần train)
+    """
+    params = resolve_index_params(index_params)
+    if index_type in ("flat", "fp16", "hnsw"):
+        return 0
+    if index_type == "sq8":
+        return params["sq_train_size"]
+    if index_type == "ivf_flat":
+        return params["nlist"]
+    return max(params["nlist"], 2 ** params["pq_nbits"])
+
+def train_index(index: faiss.Index, vectors: np.ndarray, index_params: Optional[Dict[str, Any]] = None):
+    """
+    Train index trên một mẫu ngẫu nhiên của vectors
+
+    Args:
+        index: Index chưa train
+        vectors: Ma trận vectors đã normalize (n, dimension)
+        index_params: Tham số index (train_sample_size)
+    """
+    if index.is_trained:
+        return
+
+    params = resolve_index_params(index_params)
+    index_type = detect_index_type(index)
+    required = training_size_required(index_type, params)
+    if len(vectors) < required:
+        raise ValueError(
+            f"Index {index_type} needs at least {required} vectors to train, got {len(vectors)}. "
+            f"Ingest with the flat index first, then migrate."
+        )
+
+    sample_size = min(len(vectors), params["train_sample_size"])
+    if sample_size < len(vectors):
+        rng = np.random.default_rng(1234)
+        sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    else:
+        sample = vectors
+
+    logger.info(f"⏳ Training {index_type} index on {sample_size} vectors...")
+    index.train(np.ascontiguousarray(sample, dtype=np.float32))
+    logger.info(f"✅ Trained {index_type} index")
+
+def make_search_params(index: faiss.Index,
+                       nprobe: Optional[int] = None,
+                       ef_search: Optional[int] = None,
+                       selector: Optional[faiss.IDSelector] = None) -> Optional[faiss.SearchParameters]:
+    """
+    Tạo SearchParameters cho một query (không thay đổi trạng thái của index)
+
+    Args:
+        index: Index sẽ search
+        nprobe: Số cluster quét (IVF)
+        ef_search: Độ rộng search (HNSW)
+        selector: IDSelector giới hạn tập ứng viên
+
+    Returns:
+        SearchParameters hoặc None nếu dùng mặc định của index
+    """
+    index_type = detect_index_type(index)
+
+    if index_type in ("ivf_flat", "ivf_pq", "opq_ivf_pq"):
+        if nprobe is None and selector is None:
+            return None
+        params = faiss.SearchParametersIVF()
+        params.nprobe = nprobe if nprobe is not None else faiss.extract_index_ivf(index).nprobe
+    elif index_type == "hnsw":
+        if ef_search is None and selector is None:
+            return None
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = ef_search if ef_search is not None else faiss.downcast_index(index.index).hnsw.efSearch
+    else:
+        if selector is None:
+            return None
+        params = faiss.SearchParameters()
+
+    if selector is not None:
+        params.sel = selector
+    return params
+
+def read_index(index_file: str, mmap: bool = False) -> faiss.Index:
+    """
+    Đọc index từ file, tùy chọn memory-map để các worker dùng chung page cache
+
+    Args:
+        index_file: Đường dẫn file index
+        mmap: True để map file read-only thay vì copy vào RAM
+            (flat/HNSW: IO_FLAG_MMAP_IFC, IVF: inverted lists on-disk)
+
+    Returns:
+        faiss.Index: Index đã load (chỉ đọc nếu mmap=True)
+    """
+    if not mmap:
+        return faiss.read_index(index_file)
+
+    flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    # IO_FLAG_MMAP_IFC (zero-copy cho codes phẳng/HNSW) chỉ có từ faiss 1.11
+    mmap_ifc = getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+    if mmap_ifc:
+        try:
+            return faiss.read_index(index_file, flags | mmap_ifc)
+        except RuntimeError:
+            # IVF: inverted lists on-disk không đọc được qua reader mmap
+            pass
+    return faiss.read_index(index_file, flags)
+
+def supports_remove_ids(index: faiss.Index) -> bool:
+    """
+    Index có hỗ trợ remove_ids trực tiếp hay không (HNSW thì không)
+    """
+    return detect_index_type(index) != "hnsw"
+
+def index_ids(index: faiss.Index) -> np.ndarray:
+    """
+    Tất cả vector IDs đang nằm trong index (IndexIDMap2: id_map, IVF: ids của inverted lists)
+
+    Returns:
+        np.ndarray: IDs int64 tăng dần
+    """
+    if isinstance(index, faiss.IndexIDMap2):
+        return np.sort(faiss.vector_to_array(index.id_map).astype(np.int64))
+
+    ivf = _try_extract_ivf(index)
+    if ivf is None:
+        return np.arange(index.ntotal, dtype=np.int64)
+
+    invlists = ivf.invlists
+    ids = [np.empty(0, dtype=np.int64)]
+    for list_no in range(ivf.nlist):
+        list_size = invlists.list_size(list_no)
+        if list_size == 0:
+            continue
+        list_ids = invlists.get_ids(list_no)
+        ids.append(faiss.rev_swig_ptr(list_ids, list_size).astype(np.int64))
+        invlists.release_ids(list_no, list_ids)
+    return np.sort(np.concatenate(ids))
+
+def _try_extract_ivf(index: faiss.Index):
+    try:
+        return faiss.extract_index_ivf(index)
+    except Exception:
+        return None
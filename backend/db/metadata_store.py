@@ -0,0 +1,535 @@
+"""
+Chunk Metadata Store - Lưu metadata của chunks dạng cột nhị phân
+Các cột fixed-width (.npy, load bằng memory mapping) + text blob append-only địa chỉ theo offset
+"""
+
+import os
+import json
+import mmap
+import shutil
+import logging
+import numpy as np
+from datetime import datetime
+from operator import itemgetter
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Tuple
+
+from .chunked_map import AppendLog, ChunkedDict
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "chunk_store.json"
+COLUMNS_DIR = "chunk_columns"
+
+# Các cột fixed-width, sắp xếp tăng dần theo vector_id
+COLUMN_DTYPES = {
+    "vector_id": np.int64,
+    "doc_idx": np.int32,       # Vị trí trong bảng documents
+    "chunk_index": np.int32,
+    "text_offset": np.int64,   # Offset (byte) của text trong blob
+    "text_length": np.int32,   # Độ dài (byte, UTF-8) của text
+    "created_at": np.float64   # Unix timestamp
+}
+
+class ChunkMetadataStore:
+    """
+    Metadata store dạng cột cho FAISS Store
+
+    Dữ liệu đã lưu được map từ disk (không parse khi khởi động), chunks mới nằm
+    trong bộ nhớ đến lần save() tiếp theo. Truy cập giống dict {vector_id: metadata}.
+    """
+
+    def __init__(self, metadata_path: str, dimension: int = 1024, blob_compaction_ratio: float = 0.5):
+        """
+        Khởi tạo Chunk Metadata Store
+
+        Args:
+            metadata_path: Thư mục lưu các cột và text blob
+            dimension: Dimension của vector (ghi vào metadata trả về)
+            blob_compaction_ratio: Viết lại text blob khi tỷ lệ text đã xóa vượt ngưỡng này
+        """
+        self.metadata_path = metadata_path
+        self.dimension = dimension
+        self.blob_compaction_ratio = blob_compaction_ratio
+        self._orphan_blobs = []
+        self._reset()
+
+    def _reset(self):
+        # Phần đã lưu (memory-mapped, chỉ đọc)
+        self._columns = {name: np.empty(0, dtype=dtype) for name, dtype in COLUMN_DTYPES.items()}
+        self._blob = None
+        self._blob_file = None
+        self._blob_size = 0
+        self._generation = 0
+        # Bảng documents: doc_idx -> (doc_id, filename, category)
+        self._docs = AppendLog()
+        # Phần chưa lưu: (vector_id, doc_idx, chunk_index, text, created_at) theo vector_id tăng dần,
+        # append-only và dùng chung với các snapshot (xóa chỉ đánh dấu trong _pending_removed)
+        self._pending = AppendLog(key=itemgetter(0))
+        self._pending_removed = ChunkedDict()
+        self._deleted = ChunkedDict()  # Vector IDs đã lưu bị xóa
+        self._deleted_text_bytes = 0
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    def exists(self) -> bool:
+        """Đã có dữ liệu dạng cột trên disk hay chưa"""
+        return os.path.exists(os.path.join(self.metadata_path, MANIFEST_FILE))
+
+    def load(self):
+        """
+        Map các cột và text blob từ disk (lazy, không đọc toàn bộ vào RAM)
+        """
+        # Không close mmap cũ: snapshot khác có thể còn đọc, GC đóng khi hết tham chiếu
+        self._reset()
+
+        manifest_file = os.path.join(self.metadata_path, MANIFEST_FILE)
+        if not os.path.exists(manifest_file):
+            return
+
+        with open(manifest_file, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+
+        self._generation = manifest["generation"]
+        for doc in manifest["docs"]:
+            self._docs.append(tuple(doc))
+        self._deleted_text_bytes = manifest.get("deleted_text_bytes", 0)
+
+        columns_dir = self._columns_dir(self._generation)
+        for name in COLUMN_DTYPES:
+            self._columns[name] = np.load(os.path.join(columns_dir, f"{name}.npy"), mmap_mode="r")
+
+        self._blob_file = manifest["text_blob"]
+        self._blob_size = manifest["text_blob_size"]
+        self._map_blob()
+
+        logger.info(f"✅ Mapped {len(self._columns['vector_id'])} chunk metadata rows")
+
+    def save(self):
+        """
+        Ghi các chunks mới vào text blob, viết lại các cột (bỏ các dòng đã xóa)
+        và cập nhật manifest một cách atomic
+        """
+        os.makedirs(self.metadata_path, exist_ok=True)
+
+        live_mask = self._live_mask()
+        live_text_bytes = int(self._columns["text_length"][live_mask].sum())
+        compact_blob = (
+            self._blob_file is not None
+            and self._blob_size > 0
+            and self._deleted_text_bytes > self.blob_compaction_ratio * self._blob_size
+        )
+
+        generation = self._generation + 1
+        blob_file = self._blob_file or f"chunk_texts.{generation}.bin"
+        columns = {name: np.asarray(column[live_mask]) for name, column in self._columns.items()}
+
+        if compact_blob:
+            # Viết blob mới chỉ chứa text còn sống
+            blob_file = f"chunk_texts.{generation}.bin"
+            new_offsets = np.empty(len(columns["text_offset"]), dtype=np.int64)
+            with open(os.path.join(self.metadata_path, blob_file), 'wb') as f:
+                position = 0
+                for i, (offset, length) in enumerate(zip(columns["text_offset"], columns["text_length"])):
+                    f.write(self._blob[offset:offset + length])
+                    new_offsets[i] = position
+                    position += int(length)
+            columns["text_offset"] = new_offsets
+            blob_size = position
+            deleted_text_bytes = 0
+        else:
+            blob_size = self._blob_size
+            deleted_text_bytes = self._deleted_text_bytes
+
+        # Append text của chunks mới vào blob
+        new_rows = {name: [] for name in COLUMN_DTYPES}
+        with open(os.path.join(self.metadata_path, blob_file), 'ab') as f:
+            f.truncate(blob_size)  # Bỏ phần ghi dở của lần save bị lỗi trước đó
+            f.seek(blob_size)
+            for vector_id, doc_idx, chunk_index, text, created_at in self._pending:
+                if vector_id in self._pending_removed:
+                    continue
+                encoded = text.encode("utf-8")
+                f.write(encoded)
+                new_rows["vector_id"].append(vector_id)
+                new_rows["doc_idx"].append(doc_idx)
+                new_rows["chunk_index"].append(chunk_index)
+                new_rows["text_offset"].append(blob_size)
+                new_rows["text_length"].append(len(encoded))
+                new_rows["created_at"].append(created_at)
+                blob_size += len(encoded)
+            f.flush()
+            os.fsync(f.fileno())
+
+        for name, dtype in COLUMN_DTYPES.items():
+            columns[name] = np.concatenate([columns[name], np.array(new_rows[name], dtype=dtype)])
+
+        # Các cột luôn sắp xếp theo vector_id để tìm bằng binary search
+        if len(columns["vector_id"]) > 1 and (np.diff(columns["vector_id"]) <= 0).any():
+            order = np.argsort(columns["vector_id"], kind="stable")
+            columns = {name: column[order] for name, column in columns.items()}
+
+        # Ghi các cột vào thư mục generation mới
+        columns_dir = self._columns_dir(generation)
+        os.makedirs(columns_dir, exist_ok=True)
+        for name, column in columns.items():
+            np.save(os.path.join(columns_dir, f"{name}.npy"), column)
+
+        manifest = {
+            "version": 1,
+            "generation": generation,
+            "rows": len(columns["vector_id"]),
+            "text_blob": blob_file,
+            "text_blob_size": blob_size,
+            "deleted_text_bytes": deleted_text_bytes,
+            "live_text_bytes": live_text_bytes + sum(new_rows["text_length"]),
+            "docs": [list(doc) for doc in self._docs]
+        }
+        manifest_file = os.path.join(self.metadata_path, MANIFEST_FILE)
+        tmp_file = manifest_file + ".tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, manifest_file)
+
+        # Dọn generation và blob cũ (các mmap đang mở vẫn đọc được trên Linux)
+        self._remove_old_generations(keep=generation)
+        old_blobs = self._orphan_blobs + ([self._blob_file] if self._blob_file else [])
+        for old_blob in old_blobs:
+            if old_blob != blob_file:
+                try:
+                    os.remove(os.path.join(self.metadata_path, old_blob))
+                except OSError:
+                    pass
+        self._orphan_blobs = []
+
+        self.load()
+        logger.info(f"💾 Saved {manifest['rows']} chunk metadata rows (generation {generation})")
+
+    def import_records(self, records: Iterable[Dict[str, Any]]):
+        """
+        Import metadata dạng dict (từ metadata.json cũ) vào store
+        """
+        count = 0
+        for record in records:
+            created_at = record.get("created_at")
+            try:
+                timestamp = datetime.fromisoformat(created_at).timestamp() if created_at else 0.0
+            except (TypeError, ValueError):
+                timestamp = 0.0
+            self.add(
+                vector_id=int(record["vector_index"]),
+                doc_id=record["doc_id"],
+                chunk_index=int(record.get("chunk_index", 0)),
+                text=record.get("content", ""),
+                filename=record.get("filename", ""),
+                category=record.get("category"),
+                created_at=timestamp
+            )
+            count += 1
+        logger.info(f"✅ Imported {count} legacy metadata entries")
+
+    def close(self):
+        """Đóng mmap của text blob"""
+        if isinstance(self._blob, mmap.mmap):
+            try:
+                self._blob.close()
+            except BufferError:
+                # Còn view đang tham chiếu, để GC tự đóng
+                pass
+            self._blob = None
+
+    def clear(self):
+        """Xóa toàn bộ metadata (trên disk chỉ thay đổi ở lần save tiếp theo)"""
+        generation = self._generation
+        if self._blob_file:
+            self._orphan_blobs.append(self._blob_file)
+        self._reset()
+        # Giữ số generation để lần save sau tạo blob mới thay vì ghi đè blob cũ
+        self._generation = generation
+
+    def snapshot(self) -> "ChunkMetadataStore":
+        """
+        Bản sao copy-on-write: dùng chung các cột và blob đã map (chỉ đọc), phần chưa lưu
+        append-only và các tập đã xóa theo bucket, nên không phụ thuộc số chunks chưa lưu;
+        sửa bản sao không ảnh hưởng store gốc
+        """
+        clone = ChunkMetadataStore.__new__(ChunkMetadataStore)
+        clone.__dict__.update(self.__dict__)
+        clone._columns = dict(self._columns)
+        clone._docs = self._docs.copy()
+        clone._pending = self._pending.copy()
+        clone._pending_removed = self._pending_removed.copy()
+        clone._deleted = self._deleted.copy()
+        clone._orphan_blobs = list(self._orphan_blobs)
+        return clone
+
+    def copy_to(self, target_path: str) -> "ChunkMetadataStore":
+        """
+        Ghi toàn bộ metadata hiện tại (kể cả chunks chưa lưu) thành store mới ở target_path
+        """
+        target = ChunkMetadataStore(target_path, self.dimension, self.blob_compaction_ratio)
+        for vector_id in self.keys():
+            record = self.get(vector_id)
+            target.add(
+                vector_id=int(vector_id),
+                doc_id=record["doc_id"],
+                chunk_index=record["chunk_index"],
+                text=record["content"],
+                filename=record["filename"],
+                category=record["category"],
+                created_at=datetime.fromisoformat(record["created_at"]).timestamp()
+            )
+        target.save()
+        return target
+
+    def persisted_files(self) -> List[Tuple[str, int, bool]]:
+        """
+        Các file của lần save gần nhất (đường dẫn tương đối, số bytes, append_only);
+        chỉ text blob được append tiếp, các file còn lại không bao giờ bị ghi đè
+        """
+        if not self.exists():
+            return []
+        files = [(MANIFEST_FILE, os.path.getsize(os.path.join(self.metadata_path, MANIFEST_FILE)), False)]
+        columns_dir = self._columns_dir(self._generation)
+        for name in COLUMN_DTYPES:
+            column_file = os.path.join(columns_dir, f"{name}.npy")
+            files.append((os.path.relpath(column_file, self.metadata_path), os.path.getsize(column_file), False))
+        if self._blob_file is not None:
+            files.append((self._blob_file, self._blob_size, True))
+        return files
+
+    def remove_files(self):
+        """Xóa manifest, các cột và text blob của store trên disk (các mmap đang mở vẫn đọc được)"""
+        manifest_file = os.path.join(self.metadata_path, MANIFEST_FILE)
+        if os.path.exists(manifest_file):
+            os.remove(manifest_file)
+        shutil.rmtree(os.path.join(self.metadata_path, COLUMNS_DIR), ignore_errors=True)
+        for name in os.listdir(self.metadata_path):
+            if name.startswith("chunk_texts."):
+                os.remove(os.path.join(self.metadata_path, name))
+
+    # ------------------------------------------------------------------
+    # Truy cập kiểu dict {vector_id: metadata}
+    # ------------------------------------------------------------------
+
+    def add(self,
+            vector_id: int,
+            doc_id: str,
+            chunk_index: int,
+            text: str,
+            filename: str = "",
+            category: Optional[str] = None,
+            created_at: Optional[float] = None):
+        """
+        Thêm metadata cho một chunk (vector_id phải lớn hơn mọi ID đã có)
+        """
+        doc_key = (doc_id, filename, category)
+        doc_idx = self._docs.find(doc_key)
+        if doc_idx is None:
+            doc_idx = self._docs.append(doc_key)
+        if created_at is None:
+            created_at = datetime.now().timestamp()
+        self._pending.append((vector_id, doc_idx, chunk_index, text, created_at))
+
+    def remove(self, vector_ids: Iterable[int]) -> int:
+        """
+        Xóa metadata của các vector IDs, trả về số dòng đã xóa
+        """
+        removed = 0
+        for vector_id in vector_ids:
+            vector_id = int(vector_id)
+            if self._pending_get(vector_id) is not None:
+                self._pending_removed[vector_id] = True
+                removed += 1
+                continue
+            row = self._find_row(vector_id)
+            if row is not None and vector_id not in self._deleted:
+                self._deleted[vector_id] = True
+                self._deleted_text_bytes += int(self._columns["text_length"][row])
+                removed += 1
+        return removed
+
+    def get(self, vector_id: int, default=None) -> Optional[Dict[str, Any]]:
+        """
+        Lấy metadata của một chunk (chỉ đọc text của chunk này từ blob)
+        """
+        vector_id = int(vector_id)
+        pending = self._pending_get(vector_id)
+        if pending is not None:
+            return self._make_record(*pending)
+
+        row = self._find_row(vector_id)
+        if row is None or vector_id in self._deleted:
+            return default
+        return self._record_at(vector_id, row)
+
+    def get_many(self, vector_ids: Iterable[int]) -> List[Dict[str, Any]]:
+        """
+        Lấy metadata của nhiều chunks (giữ thứ tự), bỏ qua IDs không tồn tại.
+        Vị trí các dòng đã lưu được tìm bằng một lần searchsorted cho cả mảng IDs.
+        """
+        vector_ids = np.asarray(vector_ids, dtype=np.int64).ravel()
+        ids = self._columns["vector_id"]
+        if len(ids) > 0 and len(vector_ids) > 0:
+            rows = np.minimum(np.searchsorted(ids, vector_ids), len(ids) - 1)
+            found = ids[rows] == vector_ids
+        else:
+            rows = np.zeros(len(vector_ids), dtype=np.int64)
+            found = np.zeros(len(vector_ids), dtype=bool)
+
+        records = []
+        for vector_id, row, is_found in zip(vector_ids.tolist(), rows.tolist(), found.tolist()):
+            pending = self._pending_get(vector_id)
+            if pending is not None:
+                records.append(self._make_record(*pending))
+            elif is_found and vector_id not in self._deleted:
+                records.append(self._record_at(vector_id, row))
+        return records
+
+    def chunk_indices(self, vector_ids: Iterable[int]) -> np.ndarray:
+        """
+        chunk_index của nhiều vector IDs chỉ từ cột chunk_index (không đọc text), -1 nếu không tồn tại
+        """
+        vector_ids = np.asarray(vector_ids, dtype=np.int64).ravel()
+        chunk_indices = np.full(len(vector_ids), -1, dtype=np.int64)
+        ids = self._columns["vector_id"]
+        if len(ids) > 0 and len(vector_ids) > 0:
+            rows = np.minimum(np.searchsorted(ids, vector_ids), len(ids) - 1)
+            found = ids[rows] == vector_ids
+            if self._deleted:
+                found &= ~np.isin(vector_ids, np.fromiter(self._deleted, dtype=np.int64, count=len(self._deleted)))
+            chunk_indices[found] = self._columns["chunk_index"][rows[found]]
+        if len(self._pending):
+            for position, vector_id in enumerate(vector_ids.tolist()):
+                pending = self._pending_get(vector_id)
+                if pending is not None:
+                    chunk_indices[position] = pending[2]
+        return chunk_indices
+
+    def __getitem__(self, vector_id: int) -> Dict[str, Any]:
+        record = self.get(vector_id)
+        if record is None:
+            raise KeyError(vector_id)
+        return record
+
+    def __contains__(self, vector_id) -> bool:
+        vector_id = int(vector_id)
+        if self._pending_get(vector_id) is not None:
+            return True
+        return vector_id not in self._deleted and self._find_row(vector_id) is not None
+
+    def __len__(self) -> int:
+        return len(self._columns["vector_id"]) - len(self._deleted) + self._pending_rows()
+
+    def keys(self) -> np.ndarray:
+        """Tất cả vector IDs còn sống, tăng dần"""
+        persisted = np.asarray(self._columns["vector_id"][self._live_mask()])
+        pending = np.sort(np.array(
+            [item[0] for item in self._pending if item[0] not in self._pending_removed], dtype=np.int64
+        ))
+        return np.concatenate([persisted, pending])
+
+    def values(self) -> Iterator[Dict[str, Any]]:
+        """Duyệt metadata của tất cả chunks (đọc toàn bộ text - chỉ dùng cho export)"""
+        for vector_id in self.keys():
+            yield self.get(vector_id)
+
+    def items(self) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        for vector_id in self.keys():
+            yield int(vector_id), self.get(vector_id)
+
+    def max_id(self) -> int:
+        """Vector ID lớn nhất đã từng lưu (-1 nếu rỗng)"""
+        candidates = [-1]
+        if len(self._columns["vector_id"]):
+            candidates.append(int(self._columns["vector_id"][-1]))
+        if len(self._pending):
+            candidates.append(self._pending[len(self._pending) - 1][0])
+        return max(candidates)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Thống kê dung lượng metadata store"""
+        return {
+            "backend": "columnar",
+            "persisted_rows": len(self._columns["vector_id"]),
+            "pending_rows": self._pending_rows(),
+            "deleted_rows": len(self._deleted),
+            "text_blob_bytes": self._blob_size,
+            "deleted_text_bytes": self._deleted_text_bytes,
+            "generation": self._generation
+        }
+
+    # ------------------------------------------------------------------
+    # Helpers
+    # ------------------------------------------------------------------
+
+    def _make_record(self, vector_id: int, doc_idx: int, chunk_index: int, text: str, created_at: float) -> Dict[str, Any]:
+        doc_id, filename, category = self._docs[doc_idx]
+        return {
+            "chunk_id": f"{doc_id}_{chunk_index}",
+            "doc_id": doc_id,
+            "chunk_index": chunk_index,
+            "content": text,
+            "filename": filename,
+            "category": category,
+            "vector_index": vector_id,
+            "created_at": datetime.fromtimestamp(created_at).isoformat(),
+            "embedding_dimension": self.dimension
+        }
+
+    def _pending_get(self, vector_id: int) -> Optional[Tuple[int, int, int, str, float]]:
+        """Dòng chưa lưu (vector_id, doc_idx, chunk_index, text, created_at) của vector_id, None nếu không có"""
+        position = self._pending.find(vector_id)
+        if position is None or vector_id in self._pending_removed:
+            return None
+        return self._pending[position]
+
+    def _pending_rows(self) -> int:
+        return len(self._pending) - len(self._pending_removed)
+
+    def _record_at(self, vector_id: int, row: int) -> Dict[str, Any]:
+        """Metadata của dòng đã lưu (chỉ đọc text của dòng này từ blob)"""
+        offset = int(self._columns["text_offset"][row])
+        length = int(self._columns["text_length"][row])
+        text = self._blob[offset:offset + length].decode("utf-8") if length else ""
+        return self._make_record(
+            vector_id,
+            int(self._columns["doc_idx"][row]),
+            int(self._columns["chunk_index"][row]),
+            text,
+            float(self._columns["created_at"][row])
+        )
+
+    def _find_row(self, vector_id: int) -> Optional[int]:
+        ids = self._columns["vector_id"]
+        if len(ids) == 0:
+            return None
+        row = int(np.searchsorted(ids, vector_id))
+        if row < len(ids) and ids[row] == vector_id:
+            return row
+        return None
+
+    def _live_mask(self) -> np.ndarray:
+        ids = self._columns["vector_id"]
+        if not self._deleted:
+            return np.ones(len(ids), dtype=bool)
+        return ~np.isin(ids, np.fromiter(self._deleted, dtype=np.int64, count=len(self._deleted)))
+
+    def _map_blob(self):
+        if self._blob_size == 0:
+            self._blob = b""
+            return
+        with open(os.path.join(self.metadata_path, self._blob_file), 'rb') as f:
+            self._blob = mmap.mmap(f.fileno(), self._blob_size, access=mmap.ACCESS_READ)
+
+    def _columns_dir(self, generation: int) -> str:
+        return os.path.join(self.metadata_path, COLUMNS_DIR, str(generation))
+
+    def _remove_old_generations(self, keep: int):
+        root = os.path.join(self.metadata_path, COLUMNS_DIR)
+        for name in os.listdir(root):
+            if name != str(keep):
+                shutil.rmtree(os.path.join(root, name), ignore_errors=True)
@@ -0,0 +1,309 @@
+"""
+Raw Vector Store - Bản float32 đầy đủ của vectors trên disk (memory-mapped)
+Dùng để re-rank chính xác khi index lưu vectors dạng nén (SQ8, fp16, PQ) và để rebuild index không mất độ chính xác
+"""
+
+import os
+import json
+import logging
+import numpy as np
+from typing import List, Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "raw_vectors.json"
+
+class RawVectorStore:
+    """
+    Vectors float32 theo vector_id: phần đã lưu là một file phẳng (rows x dimension)
+    map read-only từ disk, vectors mới nằm trong bộ nhớ đến lần save() tiếp theo.
+    Chỉ đọc các dòng được hỏi, không giữ cả ma trận trong RAM.
+    """
+
+    def __init__(self, directory: str, dimension: int = 1024, compaction_ratio: float = 0.5):
+        """
+        Khởi tạo Raw Vector Store
+
+        Args:
+            directory: Thư mục lưu file vectors và vector_ids
+            dimension: Dimension của vector
+            compaction_ratio: Viết lại file khi tỷ lệ dòng đã xóa vượt ngưỡng này
+        """
+        self.directory = directory
+        self.dimension = dimension
+        self.compaction_ratio = compaction_ratio
+        self._orphan_files = []
+        self._reset()
+
+    def _reset(self):
+        # Phần đã lưu: vector_ids tăng dần, dòng i của file vectors ứng với vector_ids[i]
+        self._ids = np.empty(0, dtype=np.int64)
+        self._vectors = np.empty((0, self.dimension), dtype=np.float32)
+        self._vectors_file = None
+        self._generation = 0
+        self._dead_rows = 0  # Dòng của vectors đã xóa (dọn khi compaction)
+        # Phần chưa lưu: các block (ids tăng dần, vectors) bất biến, block sau nhỏ hơn một nửa block trước
+        # (gộp như binary counter nên mỗi vector chỉ bị copy O(log n) lần)
+        self._pending: List[Tuple[np.ndarray, np.ndarray]] = []
+
+    def exists(self) -> bool:
+        """Đã có dữ liệu trên disk hay chưa"""
+        return os.path.exists(os.path.join(self.directory, MANIFEST_FILE))
+
+    def load(self):
+        """
+        Map file vectors từ disk (lazy)
+        """
+        self._reset()
+
+        manifest_file = os.path.join(self.directory, MANIFEST_FILE)
+        if not os.path.exists(manifest_file):
+            return
+
+        with open(manifest_file, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+
+        self._generation = manifest["generation"]
+        self._dead_rows = manifest.get("dead_rows", 0)
+        self._vectors_file = manifest["vectors_file"]
+        self._ids = np.load(os.path.join(self.directory, manifest["ids_file"]), mmap_mode="r")
+        if len(self._ids) > 0:
+            self._vectors = np.memmap(
+                os.path.join(self.directory, self._vectors_file),
+                dtype=np.float32,
+                mode="r",
+                shape=(len(self._ids), self.dimension)
+            )
+
+        logger.info(f"✅ Mapped {len(self._ids)} raw vectors")
+
+    def save(self, live_ids: Optional[np.ndarray] = None):
+        """
+        Ghi vectors mới xuống disk; viết lại file (bỏ các dòng đã xóa) khi quá nhiều dòng chết
+
+        Args:
+            live_ids: Các vector IDs còn sống (bắt buộc để compaction, None thì chỉ append)
+        """
+        os.makedirs(self.directory, exist_ok=True)
+
+        pending_ids, pending_vectors = self._merged_pending()
+        generation = self._generation + 1
+        row_bytes = self.dimension * np.dtype(np.float32).itemsize
+        compact = self._vectors_file is None or (
+            live_ids is not None
+            and self._dead_rows > self.compaction_ratio * max(len(self._ids), 1)
+        ) or (
+            # ID mới nhỏ hơn ID đã lưu (replay): viết lại để giữ thứ tự tăng dần
+            len(pending_ids) > 0 and len(self._ids) > 0 and pending_ids[0] <= self._ids[-1]
+        )
+
+        if compact:
+            vectors_file = f"vectors.{generation}.f32"
+            keep = np.ones(len(self._ids), dtype=bool) if live_ids is None else np.isin(self._ids, live_ids)
+            ids = np.concatenate([np.asarray(self._ids)[keep], pending_ids])
+            order = np.argsort(ids, kind="stable")
+            with open(os.path.join(self.directory, vectors_file), 'wb') as f:
+                kept_rows = np.flatnonzero(keep)
+                for start in range(0, len(order), 65536):
+                    rows = order[start:start + 65536]
+                    block = np.empty((len(rows), self.dimension), dtype=np.float32)
+                    old = rows < len(kept_rows)
+                    block[old] = self._vectors[kept_rows[rows[old]]]
+                    block[~old] = pending_vectors[rows[~old] - len(kept_rows)]
+                    f.write(block.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            ids = ids[order]
+            dead_rows = 0
+            if self._vectors_file is not None:
+                self._orphan_files.append(self._vectors_file)
+        else:
+            # Append vào file hiện tại sau các dòng đã lưu (snapshot cũ chỉ map phần trước đó)
+            vectors_file = self._vectors_file
+            with open(os.path.join(self.directory, vectors_file), 'r+b') as f:
+                f.truncate(len(self._ids) * row_bytes)  # Bỏ phần ghi dở của lần save bị lỗi trước đó
+                f.seek(len(self._ids) * row_bytes)
+                f.write(np.ascontiguousarray(pending_vectors).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            ids = np.concatenate([np.asarray(self._ids), pending_ids])
+            dead_rows = self._dead_rows
+
+        ids_file = f"vector_ids.{generation}.npy"
+        np.save(os.path.join(self.directory, ids_file), ids)
+
+        manifest = {
+            "version": 1,
+            "generation": generation,
+            "rows": len(ids),
+            "dimension": self.dimension,
+            "vectors_file": vectors_file,
+            "ids_file": ids_file,
+            "dead_rows": dead_rows
+        }
+        manifest_file = os.path.join(self.directory, MANIFEST_FILE)
+        tmp_file = manifest_file + ".tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, manifest_file)
+
+        # Dọn file cũ (các mmap đang mở vẫn đọc được trên Linux)
+        for name in os.listdir(self.directory):
+            if name.startswith("vector_ids.") and name != ids_file:
+                self._remove_file(name)
+        for old_file in self._orphan_files:
+            if old_file != vectors_file:
+                self._remove_file(old_file)
+        self._orphan_files = []
+
+        self.load()
+        logger.info(f"💾 Saved {len(ids)} raw vectors (generation {generation})")
+
+    def clear(self):
+        """Xóa toàn bộ vectors (trên disk chỉ thay đổi ở lần save tiếp theo)"""
+        generation = self._generation
+        if self._vectors_file:
+            self._orphan_files.append(self._vectors_file)
+        self._reset()
+        self._generation = generation
+
+    def snapshot(self) -> "RawVectorStore":
+        """
+        Bản sao copy-on-write: dùng chung phần đã map và các block pending (bất biến, O(log n) block)
+        """
+        clone = RawVectorStore.__new__(RawVectorStore)
+        clone.__dict__.update(self.__dict__)
+        clone._pending = list(self._pending)
+        clone._orphan_files = list(self._orphan_files)
+        return clone
+
+    def copy_to(self, target_directory: str, live_ids: Optional[np.ndarray] = None) -> "RawVectorStore":
+        """
+        Ghi các vectors còn sống (kể cả chưa lưu) thành store mới ở target_directory
+        """
+        target = RawVectorStore(target_directory, self.dimension, self.compaction_ratio)
+        ids = self.keys() if live_ids is None else np.asarray(live_ids, dtype=np.int64)
+        for start in range(0, len(ids), 65536):
+            batch_ids = ids[start:start + 65536]
+            vectors, found = self.get(batch_ids)
+            target.add(batch_ids[found], vectors[found])
+        target.save()
+        return target
+
+    def persisted_files(self) -> List[Tuple[str, int, bool]]:
+        """
+        Các file của lần save gần nhất (đường dẫn tương đối, số bytes, append_only);
+        file vectors được append tiếp ở các lần save sau
+        """
+        if not self.exists() or self._vectors_file is None:
+            return []
+        ids_file = f"vector_ids.{self._generation}.npy"
+        return [
+            (MANIFEST_FILE, os.path.getsize(os.path.join(self.directory, MANIFEST_FILE)), False),
+            (ids_file, os.path.getsize(os.path.join(self.directory, ids_file)), False),
+            (self._vectors_file, len(self._ids) * self.dimension * np.dtype(np.float32).itemsize, True)
+        ]
+
+    def add(self, vector_ids: np.ndarray, vectors: np.ndarray):
+        """
+        Thêm vectors float32 (n, dimension) cho các vector IDs mới
+        """
+        vector_ids = np.array(vector_ids, dtype=np.int64)
+        if len(vector_ids) == 0:
+            return
+        vectors = np.array(vectors, dtype=np.float32).reshape(len(vector_ids), self.dimension)
+        if (np.diff(vector_ids) <= 0).any():
+            order = np.argsort(vector_ids, kind="stable")
+            vector_ids, vectors = vector_ids[order], vectors[order]
+        self._pending.append((vector_ids, vectors))
+        while len(self._pending) > 1 and len(self._pending[-2][0]) <= 2 * len(self._pending[-1][0]):
+            newer = self._pending.pop()
+            older = self._pending.pop()
+            self._pending.append(self._merge_blocks([older, newer]))
+
+    def remove(self, vector_ids: np.ndarray):
+        """
+        Xóa vectors theo ID (dòng đã lưu được dọn ở lần compaction)
+        """
+        vector_ids = np.asarray(vector_ids, dtype=np.int64)
+        if len(vector_ids) == 0:
+            return
+        if self._pending:
+            blocks = []
+            for ids, vectors in self._pending:
+                keep = ~np.isin(ids, vector_ids)
+                if keep.all():
+                    blocks.append((ids, vectors))
+                elif keep.any():
+                    blocks.append((ids[keep], vectors[keep]))
+            self._pending = blocks
+        self._dead_rows += int(np.isin(vector_ids, self._ids).sum())
+
+    def get(self, vector_ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Lấy vectors theo ID (chỉ đọc các dòng cần từ file)
+
+        Returns:
+            (vectors (n, dimension), found (n,) bool) - dòng không tìm thấy là vector 0
+        """
+        vector_ids = np.asarray(vector_ids, dtype=np.int64)
+        vectors = np.zeros((len(vector_ids), self.dimension), dtype=np.float32)
+        found = np.zeros(len(vector_ids), dtype=bool)
+        for ids, source in [(self._ids, self._vectors)] + self._pending:
+            if len(ids) == 0:
+                continue
+            rows = np.minimum(np.searchsorted(ids, vector_ids), len(ids) - 1)
+            hit = ids[rows] == vector_ids
+            vectors[hit] = source[rows[hit]]
+            found |= hit
+        return vectors, found
+
+    def contains(self, vector_ids: np.ndarray) -> np.ndarray:
+        """Mask các vector IDs đã có vector"""
+        vector_ids = np.asarray(vector_ids, dtype=np.int64)
+        found = np.isin(vector_ids, self._ids)
+        for ids, _ in self._pending:
+            found |= np.isin(vector_ids, ids)
+        return found
+
+    def keys(self) -> np.ndarray:
+        """Tất cả vector IDs có vector (kể cả dòng chết chưa compaction), tăng dần"""
+        return np.unique(np.concatenate([np.asarray(self._ids)] + [ids for ids, _ in self._pending]))
+
+    def __len__(self) -> int:
+        return len(self._ids) - self._dead_rows + sum(len(ids) for ids, _ in self._pending)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Thống kê dung lượng raw vector store"""
+        return {
+            "persisted_rows": len(self._ids),
+            "pending_rows": sum(len(ids) for ids, _ in self._pending),
+            "dead_rows": self._dead_rows,
+            "file_bytes": len(self._ids) * self.dimension * np.dtype(np.float32).itemsize,
+            "bytes_per_vector": self.dimension * np.dtype(np.float32).itemsize,
+            "generation": self._generation
+        }
+
+    def _merged_pending(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Gộp các block pending thành một (ids tăng dần); thay list bằng block đã gộp"""
+        if not self._pending:
+            return np.empty(0, dtype=np.int64), np.empty((0, self.dimension), dtype=np.float32)
+        if len(self._pending) > 1:
+            self._pending = [self._merge_blocks(self._pending)]
+        return self._pending[0]
+
+    @staticmethod
+    def _merge_blocks(blocks: List[Tuple[np.ndarray, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray]:
+        """Gộp các block (ids tăng dần) thành một block mới, ids tăng dần"""
+        ids = np.concatenate([ids for ids, _ in blocks])
+        vectors = np.concatenate([vectors for _, vectors in blocks])
+        order = np.argsort(ids, kind="stable")
+        return ids[order], vectors[order]
+
+    def _remove_file(self, name: str):
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except OSError:
+            pass
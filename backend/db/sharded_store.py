@@ -0,0 +1,721 @@
+"""
+Sharded FAISS Store - Chia vector store thành nhiều shard (index + metadata riêng)
+Partition theo category hoặc hash của doc_id; search fan-out song song và merge top-k
+"""
+
+import os
+import re
+import json
+import heapq
+import shutil
+import zlib
+import logging
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from operator import itemgetter
+from typing import List, Dict, Any, Optional, Tuple
+
+from .faiss_store import FAISSStore, _process_memory
+from .store_backup import read_manifest
+from .vector_store import VectorStore, normalize_chunk_metadata
+
+logger = logging.getLogger(__name__)
+
+PARTITIONS = ("category", "hash")
+DEFAULT_SHARD = "default"  # Shard cho documents không có category (partition theo category)
+
+class ShardedFAISSStore(VectorStore):
+    def __init__(self,
+                 index_path: str = "data/faiss_index",
+                 metadata_path: str = "data/metadata",
+                 dimension: int = 1024,
+                 partition: str = "category",
+                 num_shards: int = 4,
+                 max_workers: Optional[int] = None,
+                 **store_kwargs):
+        """
+        Khởi tạo Sharded FAISS Store
+
+        Args:
+            index_path: Thư mục gốc chứa index của các shard (index_path/shards/<shard>)
+            metadata_path: Thư mục gốc chứa metadata của các shard
+            dimension: Dimension của vector
+            partition: "category" (mỗi category một shard, tạo khi cần) hoặc
+                "hash" (num_shards shard cố định, chọn theo hash của doc_id)
+            num_shards: Số shard khi partition theo hash
+            max_workers: Số thread fan-out search (mặc định theo số CPU)
+            store_kwargs: Tham số truyền cho FAISSStore của từng shard
+                (index_type, index_params, mmap_index, wal_enabled, ...)
+        """
+        if partition not in PARTITIONS:
+            raise ValueError(f"Unsupported partition: {partition}. Supported: {', '.join(PARTITIONS)}")
+        if partition == "hash" and num_shards < 1:
+            raise ValueError("num_shards must be >= 1")
+
+        self.index_path = index_path
+        self.metadata_path = metadata_path
+        self.dimension = dimension
+        self.partition = partition
+        self.num_shards = num_shards
+        self.store_kwargs = store_kwargs
+        self.manifest_file = os.path.join(metadata_path, "shards.json")
+        self.last_ingest_stats = {}
+
+        # Dict shards được thay nguyên (copy-on-write) khi thêm shard: search đọc không cần lock
+        self._shards: Dict[str, FAISSStore] = {}
+        self._shard_categories: Dict[str, Optional[str]] = {}
+        self._shards_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or min(32, os.cpu_count() or 1),
+            thread_name_prefix="faiss-shard"
+        )
+
+        os.makedirs(index_path, exist_ok=True)
+        os.makedirs(metadata_path, exist_ok=True)
+
+        manifest_shards = self._read_manifest()
+        if partition == "hash":
+            if manifest_shards and len(manifest_shards) != num_shards:
+                # Đổi số shard làm thay đổi routing theo hash: cần re-shard dữ liệu trước
+                raise ValueError(f"Store has {len(manifest_shards)} hash shards, configured {num_shards}")
+            for shard_number in range(num_shards):
+                self._get_or_create_shard(f"shard_{shard_number:03d}")
+            self._write_manifest()
+        else:
+            for shard_name, category in manifest_shards.items():
+                self._get_or_create_shard(shard_name, category)
+
+        logger.info(f"Sharded FAISS Store initialized. Partition: {partition}, shards: {len(self._shards)}")
+
+    def _read_manifest(self) -> Dict[str, Optional[str]]:
+        """
+        Đọc danh sách shard -> category đã lưu
+        """
+        if not os.path.exists(self.manifest_file):
+            return {}
+        with open(self.manifest_file, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get("partition") != self.partition:
+            raise ValueError(
+                f"Shard manifest partition {manifest.get('partition')} "
+                f"does not match configured partition {self.partition}"
+            )
+        return manifest.get("shards", {})
+
+    def _write_manifest(self):
+        """
+        Ghi manifest (tmp + replace để không bao giờ thấy file ghi dở)
+        """
+        manifest = {
+            "partition": self.partition,
+            "num_shards": len(self._shards),
+            "shards": self._shard_categories
+        }
+        tmp_file = self.manifest_file + ".tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, self.manifest_file)
+
+    def _category_shard_name(self, category: Optional[str]) -> str:
+        """
+        Tên shard (tên thư mục) cho category
+        """
+        if category is None:
+            return DEFAULT_SHARD
+        safe_name = re.sub(r"[^0-9A-Za-z_-]", "_", category)
+        if safe_name != category:
+            # Tránh trùng tên thư mục giữa các category chỉ khác nhau ở ký tự đặc biệt
+            safe_name = f"{safe_name}_{zlib.crc32(category.encode('utf-8')):08x}"
+        return f"category_{safe_name}"
+
+    def _hash_shard_name(self, doc_id: str) -> str:
+        """
+        Tên shard theo hash ổn định của doc_id (không dùng hash() vì bị random theo process)
+        """
+        return f"shard_{zlib.crc32(doc_id.encode('utf-8')) % self.num_shards:03d}"
+
+    def _get_or_create_shard(self, shard_name: str, category: Optional[str] = None) -> FAISSStore:
+        """
+        Lấy shard theo tên, tạo mới (index rỗng) nếu chưa có
+        """
+        shard = self._shards.get(shard_name)
+        if shard is not None:
+            return shard
+
+        with self._shards_lock:
+            shard = self._shards.get(shard_name)
+            if shard is not None:
+                return shard
+
+            shard = FAISSStore(
+                index_path=os.path.join(self.index_path, "shards", shard_name),
+                metadata_path=os.path.join(self.metadata_path, "shards", shard_name),
+                dimension=self.dimension,
+                **self.store_kwargs
+            )
+            shard.initialize_index()
+            self._shards = {**self._shards, shard_name: shard}
+            self._shard_categories = {**self._shard_categories, shard_name: category}
+            if self.partition == "category":
+                self._write_manifest()
+            logger.info(f"✅ Created shard {shard_name}")
+            return shard
+
+    def _shard_for_write(self, doc_id: str, category: Optional[str]) -> str:
+        """
+        Tên shard nhận document mới (tạo shard của category nếu chưa có)
+        """
+        if self.partition == "hash":
+            return self._hash_shard_name(doc_id)
+        shard_name = self._category_shard_name(category)
+        self._get_or_create_shard(shard_name, category)
+        return shard_name
+
+    def _shard_of_doc(self, doc_id: str) -> Optional[str]:
+        """
+        Tên shard đang chứa document (None nếu không có)
+        """
+        if self.partition == "hash":
+            return self._hash_shard_name(doc_id)
+        for shard_name, shard in self._shards.items():
+            if doc_id in shard._snapshot.doc_index:
+                return shard_name
+        return None
+
+    def _target_shards(self, doc_id: Optional[str], category: Optional[str]) -> Dict[str, FAISSStore]:
+        """
+        Các shard cần search theo filter: doc_id và category (partition theo category)
+        chỉ cần một shard, ngược lại fan-out tất cả
+        """
+        shards = self._shards
+        if doc_id is not None:
+            shard_name = self._shard_of_doc(doc_id)
+            return {shard_name: shards[shard_name]} if shard_name in shards else {}
+        if category is not None and self.partition == "category":
+            shard_name = self._category_shard_name(category)
+            return {shard_name: shards[shard_name]} if shard_name in shards else {}
+        return shards
+
+    def initialize_index(self):
+        """
+        Khởi tạo index rỗng cho tất cả shard
+        """
+        for shard in self._shards.values():
+            shard.initialize_index()
+
+    def load_index(self):
+        """
+        Load index + metadata của các shard song song
+        """
+        try:
+            shards = self._shards
+            list(self._executor.map(lambda shard: shard.load_index(), shards.values()))
+            logger.info(
+                f"✅ Loaded {len(shards)} shards with "
+                f"{sum(shard._snapshot.ntotal for shard in shards.values())} vectors"
+            )
+        except Exception as e:
+            logger.error(f"❌ Error loading sharded FAISS store: {e}")
+            raise
+
+    def save_index(self):
+        """
+        Lưu tất cả shard (mỗi shard checkpoint WAL của riêng nó)
+        """
+        try:
+            for shard in self._shards.values():
+                shard.save_index()
+            self._write_manifest()
+        except Exception as e:
+            logger.error(f"❌ Error saving sharded FAISS store: {e}")
+            raise
+
+    def migrate_index(self,
+                      index_type: str,
+                      index_params: Optional[Dict[str, Any]] = None,
+                      coarse_dimension: Optional[int] = None):
+        """
+        Chuyển loại index cho tất cả shard (shard tạo sau dùng cùng cấu hình)
+
+        Args:
+            index_type: Loại index đích
+            index_params: Tham số cho index đích
+            coarse_dimension: Số chiều của index cho two-stage search
+                (None giữ nguyên, bằng dimension để tắt two-stage)
+        """
+        for shard in self._shards.values():
+            shard.migrate_index(index_type, index_params, coarse_dimension)
+        self.store_kwargs = {**self.store_kwargs, "index_type": index_type, "index_params": index_params}
+        if coarse_dimension is not None:
+            self.store_kwargs["coarse_dimension"] = coarse_dimension if coarse_dimension < self.dimension else None
+
+    def coarse_search_report(self,
+                             dimensions: List[int],
+                             num_queries: int = 200,
+                             top_k: int = 10,
+                             rerank_factor: Optional[int] = None,
+                             seed: int = 1234) -> List[Dict[str, Any]]:
+        """
+        Báo cáo recall/latency two-stage search của store: chia num_queries cho các shard theo số vectors,
+        mỗi shard đo trên dữ liệu của nó (FAISSStore.coarse_search_report), kết quả lấy trung bình
+        theo số queries của từng shard
+
+        Returns:
+            List[Dict]: Mỗi dimension một dòng như FAISSStore.coarse_search_report, thêm "shards"
+        """
+        shards = [shard for shard in self._shards.values() if len(shard._snapshot.metadata) > 0]
+        total_vectors = sum(len(shard._snapshot.metadata) for shard in shards)
+        if total_vectors == 0:
+            return []
+
+        combined = {}
+        for shard in shards:
+            shard_vectors = len(shard._snapshot.metadata)
+            shard_queries = min(max(round(num_queries * shard_vectors / total_vectors), 1), shard_vectors)
+            for row in shard.coarse_search_report(dimensions, shard_queries, top_k, rerank_factor, seed):
+                entry = combined.setdefault(row["coarse_dimension"], {"queries": 0, "shards": 0, "sums": {}})
+                entry["queries"] += shard_queries
+                entry["shards"] += 1
+                for key in ("recall_coarse", "recall_two_stage", "latency_ms_coarse", "latency_ms_two_stage"):
+                    entry["sums"][key] = entry["sums"].get(key, 0.0) + row[key] * shard_queries
+
+        return [
+            {
+                "coarse_dimension": dimension,
+                **{key: value / entry["queries"] for key, value in entry["sums"].items()},
+                "index_bytes_per_vector": dimension * 4,
+                "shards": entry["shards"]
+            }
+            for dimension, entry in sorted(combined.items())
+        ]
+
+    def add_document(self,
+                    text: str,
+                    doc_id: str,
+                    chunk_index: int = 0,
+                    filename: str = "",
+                    embedding_service=None,
+                    category: Optional[str] = None) -> str:
+        """
+        Thêm một chunk vào shard của document
+        """
+        return self._shards[self._shard_for_write(doc_id, category)].add_document(
+            text, doc_id, chunk_index, filename, embedding_service, category
+        )
+
+    def add_document_chunks(self,
+                           chunks: List[str],
+                           doc_id: str,
+                           filename: str = "",
+                           embedding_service=None,
+                           category: Optional[str] = None) -> List[str]:
+        """
+        Thêm nhiều chunks của một document vào shard của nó
+        """
+        return self._shards[self._shard_for_write(doc_id, category)].add_document_chunks(
+            chunks, doc_id, filename, embedding_service, category
+        )
+
+    def add_documents_batch(self,
+                            documents: List[Dict[str, Any]],
+                            embedding_service=None,
+                            batch_size: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Bulk ingestion: gom documents theo shard, mỗi shard một lần add_documents_batch
+
+        Args:
+            documents: Danh sách {"doc_id": str, "chunks": List[str], "filename": str, "category": str}
+            embedding_service: Embedding service instance
+            batch_size: Batch size khi encode
+
+        Returns:
+            Dict: {"chunk_ids": {doc_id: [chunk_id]}, "total_chunks": int, "timings": {...}, "shards": {...}}
+        """
+        if embedding_service is None:
+            raise ValueError("Embedding service is required")
+
+        try:
+            groups: Dict[str, List[Dict[str, Any]]] = {}
+            for document in documents:
+                shard_name = self._shard_for_write(document["doc_id"], document.get("category"))
+                groups.setdefault(shard_name, []).append(document)
+
+            chunk_ids = {}
+            timings = {}
+            shard_chunks = {}
+            for shard_name, shard_documents in groups.items():
+                result = self._shards[shard_name].add_documents_batch(shard_documents, embedding_service, batch_size)
+                chunk_ids.update(result["chunk_ids"])
+                shard_chunks[shard_name] = result["total_chunks"]
+                for stage, seconds in result["timings"].items():
+                    timings[stage] = timings.get(stage, 0.0) + seconds
+
+            total_chunks = sum(shard_chunks.values())
+            self.last_ingest_stats = {
+                "documents": len(chunk_ids),
+                "chunks": total_chunks,
+                "timings": timings,
+                "shards": shard_chunks
+            }
+            logger.info(f"✅ Bulk added {total_chunks} chunks to {len(groups)} shards")
+            return {
+                "chunk_ids": chunk_ids,
+                "total_chunks": total_chunks,
+                "timings": timings,
+                "shards": shard_chunks
+            }
+
+        except Exception as e:
+            logger.error(f"❌ Error in sharded bulk ingestion: {e}")
+            raise
+
+    def add_vectors(self,
+                    vectors: np.ndarray,
+                    metadata_list: List[Dict[str, Any]]) -> List[str]:
+        """
+        Thêm vectors đã có embedding: gom theo shard của document, mỗi shard một lần add_vectors
+
+        Returns:
+            List[str]: Chunk IDs theo thứ tự vectors
+        """
+        if len(vectors) != len(metadata_list):
+            raise ValueError("Number of vectors must match number of metadata")
+
+        try:
+            vectors = np.asarray(vectors, dtype=np.float32)
+            groups: Dict[str, List[int]] = {}
+            records = [normalize_chunk_metadata(metadata) for metadata in metadata_list]
+            for position, record in enumerate(records):
+                shard_name = self._shard_for_write(record["doc_id"], record["category"])
+                groups.setdefault(shard_name, []).append(position)
+
+            chunk_ids: List[Optional[str]] = [None] * len(records)
+            for shard_name, positions in groups.items():
+                shard_chunk_ids = self._shards[shard_name].add_vectors(
+                    vectors[positions], [records[position] for position in positions]
+                )
+                for position, chunk_id in zip(positions, shard_chunk_ids):
+                    chunk_ids[position] = chunk_id
+            return chunk_ids
+
+        except Exception as e:
+            logger.error(f"❌ Error adding vectors to sharded FAISS store: {e}")
+            raise
+
+    def delete_document_vectors(self, doc_id: str) -> int:
+        """
+        Xóa document khỏi shard chứa nó
+
+        Returns:
+            int: Số vectors đã xóa
+        """
+        shard_name = self._shard_of_doc(doc_id)
+        if shard_name is None or shard_name not in self._shards:
+            logger.warning(f"Document {doc_id} not found")
+            return 0
+        return self._shards[shard_name].delete_document_vectors(doc_id)
+
+    def clear_category(self, category: Optional[str]) -> int:
+        """
+        Xóa documents của category (partition theo category: chỉ shard của category)
+
+        Returns:
+            int: Số documents đã xóa
+        """
+        return sum(shard.clear_category(category) for shard in self._target_shards(None, category).values())
+
+    def reload_category(self,
+                        category: Optional[str],
+                        documents: List[Dict[str, Any]],
+                        embedding_service=None,
+                        batch_size: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Thay toàn bộ documents của category; partition theo category chỉ ghi vào shard
+        của category đó, các shard khác giữ nguyên generation
+
+        Args:
+            category: Category cần reload
+            documents: Danh sách {"doc_id": str, "chunks": List[str], "filename": str}
+            embedding_service: Embedding service instance
+            batch_size: Batch size khi encode
+
+        Returns:
+            Dict: {"category", "removed_documents", "chunk_ids", "total_chunks", "shards"}
+        """
+        try:
+            if self.partition == "category":
+                shard_name = self._category_shard_name(category)
+                shard = self._get_or_create_shard(shard_name, category)
+                result = shard.reload_category(category, documents, embedding_service, batch_size)
+                result["shards"] = [shard_name]
+                return result
+
+            # Partition theo hash: documents của category nằm rải trên các shard
+            groups: Dict[str, List[Dict[str, Any]]] = {shard_name: [] for shard_name in self._shards}
+            for document in documents:
+                groups[self._hash_shard_name(document["doc_id"])].append(document)
+
+            removed_documents = 0
+            chunk_ids = {}
+            for shard_name, shard_documents in groups.items():
+                result = self._shards[shard_name].reload_category(
+                    category, shard_documents, embedding_service, batch_size
+                )
+                removed_documents += result["removed_documents"]
+                chunk_ids.update(result["chunk_ids"])
+
+            return {
+                "category": category,
+                "removed_documents": removed_documents,
+                "chunk_ids": chunk_ids,
+                "total_chunks": sum(len(ids) for ids in chunk_ids.values()),
+                "shards": list(groups)
+            }
+
+        except Exception as e:
+            logger.error(f"❌ Error reloading category {category}: {e}")
+            raise
+
+    def clear_all(self):
+        """
+        Xóa dữ liệu của tất cả shard
+        """
+        for shard in self._shards.values():
+            shard.clear_all()
+        logger.info("✅ Cleared all shards")
+
+    def compact(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Compaction lần lượt từng shard (mỗi shard thay index của riêng nó)
+
+        Returns:
+            Dict: {shard_name: kết quả compaction}
+        """
+        return {shard_name: shard.compact() for shard_name, shard in self._shards.items()}
+
+    def start_compaction(self) -> bool:
+        """
+        Chạy compaction background cho các shard có tombstones
+
+        Returns:
+            bool: True nếu có ít nhất một shard bắt đầu compaction
+        """
+        started = [shard.start_compaction() for shard in self._shards.values() if len(shard._snapshot.tombstones) > 0]
+        return any(started)
+
+    def wait_for_compaction(self, timeout: Optional[float] = None) -> bool:
+        """
+        Chờ compaction background của tất cả shard
+        """
+        return all([shard.wait_for_compaction(timeout) for shard in self._shards.values()])
+
+    def get_compaction_status(self) -> Dict[str, Any]:
+        """
+        Trạng thái compaction tổng hợp và theo từng shard
+        """
+        shards = self._shards
+        shard_status = {shard_name: shard.get_compaction_status() for shard_name, shard in shards.items()}
+        index_vectors = sum(shard._snapshot.ntotal for shard in shards.values())
+        tombstones = sum(status["tombstones"] for status in shard_status.values())
+        return {
+            "running": any(status["running"] for status in shard_status.values()),
+            "tombstones": tombstones,
+            "tombstone_ratio": tombstones / index_vectors if index_vectors else 0.0,
+            "runs": sum(status["runs"] for status in shard_status.values()),
+            "shards": shard_status
+        }
+
+    def search_batch(self,
+                     query_vectors: np.ndarray,
+                     top_k: int = 5,
+                     doc_id: Optional[str] = None,
+                     category: Optional[str] = None,
+                     nprobe: Optional[int] = None,
+                     ef_search: Optional[int] = None) -> List[List[Dict[str, Any]]]:
+        """
+        Fan-out queries tới các shard song song (FAISS nhả GIL khi search),
+        mỗi shard trả top_k đã sắp xếp, merge bằng heap lấy top_k toàn cục
+
+        Args:
+            query_vectors: Ma trận queries đã normalize (nq, dimension)
+            top_k: Số lượng kết quả mỗi query
+            doc_id: Nếu có, chỉ search shard chứa document
+            category: Nếu có, chỉ tìm trong category (partition theo category: một shard)
+            nprobe: Số cluster quét (IVF)
+            ef_search: Độ rộng search (HNSW)
+
+        Returns:
+            List[List[Dict]]: Kết quả theo thứ tự các queries (mỗi kết quả có thêm "shard")
+        """
+        queries = np.ascontiguousarray(query_vectors, dtype=np.float32)
+        if queries.ndim != 2 or queries.shape[1] != self.dimension:
+            raise ValueError(f"Invalid query shape {queries.shape}, expected (nq, {self.dimension})")
+
+        shards = self._target_shards(doc_id, category)
+        if len(queries) == 0 or not shards:
+            return [[] for _ in range(len(queries))]
+
+        try:
+            if len(shards) == 1:
+                shard_results = {
+                    shard_name: shard.search_batch(queries, top_k, doc_id, category, nprobe, ef_search)
+                    for shard_name, shard in shards.items()
+                }
+            else:
+                futures = {
+                    shard_name: self._executor.submit(
+                        shard.search_batch, queries, top_k, doc_id, category, nprobe, ef_search
+                    )
+                    for shard_name, shard in shards.items()
+                }
+                shard_results = {shard_name: future.result() for shard_name, future in futures.items()}
+
+            for shard_name, batch_results in shard_results.items():
+                for results in batch_results:
+                    for result in results:
+                        result["shard"] = shard_name
+
+            # Kết quả mỗi shard đã giảm dần theo score: heap merge k danh sách, dừng ở top_k
+            return [
+                list(islice(
+                    heapq.merge(
+                        *(batch_results[query_number] for batch_results in shard_results.values()),
+                        key=itemgetter("similarity_score"),
+                        reverse=True
+                    ),
+                    top_k
+                ))
+                for query_number in range(len(queries))
+            ]
+
+        except Exception as e:
+            logger.error(f"❌ Error searching sharded FAISS store: {e}")
+            raise
+
+    def get_document_chunks(self, doc_id: str) -> List[Dict[str, Any]]:
+        """
+        Lấy tất cả chunks của document từ shard chứa nó
+        """
+        shard_name = self._shard_of_doc(doc_id)
+        if shard_name is None or shard_name not in self._shards:
+            return []
+        return self._shards[shard_name].get_document_chunks(doc_id)
+
+    def get_chunk_windows(self, windows: List[Tuple[str, int, int]]) -> List[List[Dict[str, Any]]]:
+        """
+        Lấy chunks theo khoảng chunk_index: gom các khoảng theo shard chứa document,
+        mỗi shard một lần get_chunk_windows
+        """
+        groups: Dict[str, List[int]] = {}
+        for position, (doc_id, _, _) in enumerate(windows):
+            shard_name = self._shard_of_doc(doc_id)
+            if shard_name is not None and shard_name in self._shards:
+                groups.setdefault(shard_name, []).append(position)
+
+        results: List[List[Dict[str, Any]]] = [[] for _ in windows]
+        for shard_name, positions in groups.items():
+            shard_windows = self._shards[shard_name].get_chunk_windows([windows[position] for position in positions])
+            for position, chunks in zip(positions, shard_windows):
+                results[position] = chunks
+        return results
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Thống kê tổng hợp và theo từng shard
+        """
+        try:
+            shards = self._shards
+            shard_stats = {shard_name: shard.get_stats() for shard_name, shard in shards.items()}
+
+            documents = {}
+            for stats in shard_stats.values():
+                documents.update(stats.pop("documents", {}))
+                stats.pop("process_memory", None)
+
+            return {
+                "total_vectors": sum(stats.get("total_vectors", 0) for stats in shard_stats.values()),
+                "total_documents": len(documents),
+                "total_chunks": sum(stats.get("total_chunks", 0) for stats in shard_stats.values()),
+                "dimension": self.dimension,
+                "index_type": self.store_kwargs.get("index_type", "flat"),
+                "partition": self.partition,
+                "num_shards": len(shards),
+                "shard_categories": dict(self._shard_categories),
+                "last_ingest": self.last_ingest_stats,
+                "process_memory": _process_memory(),
+                "shards": shard_stats,
+                "documents": documents
+            }
+
+        except Exception as e:
+            logger.error(f"❌ Error getting stats: {e}")
+            return {"error": str(e)}
+
+    def backup(self, backup_path: str) -> Dict[str, Dict[str, Any]]:
+        """
+        Snapshot backup từng shard vào backup_path/shards/<shard> kèm manifest shards.json
+
+        Returns:
+            Dict: {shard_name: manifest backup của shard}
+        """
+        try:
+            os.makedirs(backup_path, exist_ok=True)
+            manifests = {
+                shard_name: shard.backup(os.path.join(backup_path, "shards", shard_name))
+                for shard_name, shard in self._shards.items()
+            }
+            self._write_manifest()
+            shutil.copyfile(self.manifest_file, os.path.join(backup_path, "shards.json"))
+            logger.info(f"✅ Backed up {len(manifests)} shards to {backup_path}")
+            return manifests
+
+        except Exception as e:
+            logger.error(f"❌ Error backing up sharded FAISS store: {e}")
+            raise
+
+    def restore(self, backup_path: str, verify: bool = True) -> Dict[str, Dict[str, Any]]:
+        """
+        Restore các shard từ backup: kiểm tra checksum của tất cả shard trước khi thay shard nào;
+        shard không có trong backup bị xóa dữ liệu
+
+        Returns:
+            Dict: {shard_name: manifest backup của shard}
+        """
+        try:
+            with open(os.path.join(backup_path, "shards.json"), 'r', encoding='utf-8') as f:
+                backup_shards = json.load(f)
+            if backup_shards.get("partition") != self.partition:
+                raise ValueError(
+                    f"Backup partition {backup_shards.get('partition')} "
+                    f"does not match configured partition {self.partition}"
+                )
+            shard_categories = backup_shards.get("shards", {})
+            if self.partition == "hash" and len(shard_categories) != self.num_shards:
+                raise ValueError(f"Backup has {len(shard_categories)} hash shards, configured {self.num_shards}")
+
+            shard_paths = {
+                shard_name: os.path.join(backup_path, "shards", shard_name)
+                for shard_name in shard_categories
+            }
+            if verify:
+                for shard_path in shard_paths.values():
+                    read_manifest(shard_path, verify=True)
+
+            manifests = {}
+            for shard_name, category in shard_categories.items():
+                shard = self._get_or_create_shard(shard_name, category)
+                manifests[shard_name] = shard.restore(shard_paths[shard_name], verify=False)
+            for shard_name, shard in self._shards.items():
+                if shard_name not in shard_categories:
+                    shard.clear_all()
+                    shard.save_index()
+            self._write_manifest()
+
+            logger.info(f"✅ Restored {len(manifests)} shards from {backup_path}")
+            return manifests
+
+        except Exception as e:
+            logger.error(f"❌ Error restoring sharded FAISS store: {e}")
+            raise
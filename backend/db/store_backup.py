@@ -0,0 +1,174 @@
+"""
+Store Backup - Snapshot backup bằng hardlink/reflink kèm manifest checksum
+Các file của store sau checkpoint là bất biến (ghi file mới rồi rename) hoặc chỉ append:
+backup chỉ cần link các file đó (phần append-only giữ nguyên prefix đã ghi nhận)
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import logging
+from datetime import datetime
+from typing import List, Dict, Any, Tuple
+
+logger = logging.getLogger(__name__)
+
+BACKUP_MANIFEST = "backup_manifest.json"
+CHECKSUM_BLOCK = 1024 * 1024
+
+def link_or_copy(source: str, target: str, size: int, link: bool = True) -> str:
+    """
+    Hardlink source vào target; link=False, khác filesystem hoặc không hỗ trợ hardlink
+    thì copy size bytes đầu (copy_file_range: reflink trên btrfs/xfs)
+
+    Returns:
+        str: "hardlink" hoặc "copy"
+    """
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    if os.path.lexists(target):
+        os.remove(target)
+    if link:
+        try:
+            os.link(source, target)
+            return "hardlink"
+        except OSError:
+            pass
+
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        copied = 0
+        if hasattr(os, "copy_file_range"):
+            try:
+                while copied < size:
+                    written = os.copy_file_range(src.fileno(), dst.fileno(), size - copied, copied, copied)
+                    if written == 0:
+                        break
+                    copied += written
+            except OSError:
+                copied = 0
+        if copied < size:
+            src.seek(copied)
+            dst.seek(copied)
+            remaining = size - copied
+            while remaining > 0:
+                block = src.read(min(CHECKSUM_BLOCK, remaining))
+                if not block:
+                    break
+                dst.write(block)
+                remaining -= len(block)
+        dst.flush()
+        os.fsync(dst.fileno())
+    return "copy"
+
+def file_checksum(path: str, size: int) -> str:
+    """
+    SHA-256 của size bytes đầu của file (file append-only có thể dài hơn lúc backup)
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        remaining = size
+        while remaining > 0:
+            block = f.read(min(CHECKSUM_BLOCK, remaining))
+            if not block:
+                break
+            digest.update(block)
+            remaining -= len(block)
+    return digest.hexdigest()
+
+def snapshot_files(files: List[Tuple[str, str, int, bool]], backup_path: str) -> List[Dict[str, Any]]:
+    """
+    Link các file vào backup_path (gọi khi store không ghi, ngay sau checkpoint)
+
+    Args:
+        files: Danh sách (đường dẫn nguồn, đường dẫn tương đối trong backup, số bytes cần giữ,
+            append_only - file còn được append sau này, chỉ prefix size bytes thuộc backup)
+        backup_path: Thư mục backup
+
+    Returns:
+        List[Dict]: {path, size, append_only, method} cho từng file (chưa có checksum)
+    """
+    entries = []
+    for source, relative_path, size, append_only in files:
+        method = link_or_copy(source, os.path.join(backup_path, relative_path), size)
+        entries.append({"path": relative_path, "size": size, "append_only": append_only, "method": method})
+    return entries
+
+def restore_files(backup_path: str, manifest: Dict[str, Any], targets: Dict[str, str]):
+    """
+    Đưa các file của backup vào thư mục của store: file bất biến được hardlink, file
+    append-only được copy (store sẽ append tiếp, không được ghi vào file của backup)
+
+    Args:
+        backup_path: Thư mục backup
+        manifest: Manifest đã kiểm tra (read_manifest)
+        targets: {thư mục gốc trong backup: thư mục đích} (vd. {"index": index_path})
+    """
+    for entry in manifest["files"]:
+        root, _, relative_path = entry["path"].partition("/")
+        link_or_copy(
+            os.path.join(backup_path, entry["path"]),
+            os.path.join(targets[root], relative_path),
+            entry["size"],
+            link=not entry["append_only"]
+        )
+
+def write_manifest(backup_path: str, entries: List[Dict[str, Any]], info: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Tính checksum các file đã link và ghi manifest (atomic); manifest có mặt nghĩa là backup hoàn tất
+
+    Returns:
+        Dict: Manifest đã ghi
+    """
+    for entry in entries:
+        entry["sha256"] = file_checksum(os.path.join(backup_path, entry["path"]), entry["size"])
+
+    manifest = {
+        "version": 1,
+        "created_at": datetime.now().isoformat(),
+        **info,
+        "total_bytes": sum(entry["size"] for entry in entries),
+        "files": entries
+    }
+    manifest_file = os.path.join(backup_path, BACKUP_MANIFEST)
+    tmp_file = manifest_file + ".tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, manifest_file)
+    return manifest
+
+def read_manifest(backup_path: str, verify: bool = True) -> Dict[str, Any]:
+    """
+    Đọc manifest của backup và kiểm tra kích thước + checksum từng file
+
+    Raises:
+        ValueError: Backup không đầy đủ hoặc file bị thay đổi/hỏng
+    """
+    manifest_file = os.path.join(backup_path, BACKUP_MANIFEST)
+    if not os.path.exists(manifest_file):
+        raise ValueError(f"No backup manifest in {backup_path}")
+    with open(manifest_file, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get("version") != 1:
+        raise ValueError(f"Unsupported backup version: {manifest.get('version')}")
+
+    if verify:
+        for entry in manifest["files"]:
+            path = os.path.join(backup_path, entry["path"])
+            if not os.path.exists(path) or os.path.getsize(path) < entry["size"]:
+                raise ValueError(f"Backup file missing or truncated: {entry['path']}")
+            if file_checksum(path, entry["size"]) != entry["sha256"]:
+                raise ValueError(f"Checksum mismatch for backup file: {entry['path']}")
+        logger.info(f"✅ Verified {len(manifest['files'])} backup files ({manifest['total_bytes']} bytes)")
+    return manifest
+
+def clear_backup(backup_path: str, directories: List[str]):
+    """
+    Xóa manifest và các thư mục của backup cũ tại backup_path trước khi ghi backup mới
+    """
+    manifest_file = os.path.join(backup_path, BACKUP_MANIFEST)
+    if os.path.exists(manifest_file):
+        os.remove(manifest_file)
+    for directory in directories:
+        shutil.rmtree(os.path.join(backup_path, directory), ignore_errors=True)
@@ -1,35 +1,104 @@
 """
 Vector Database với FAISS
-Xử lý lưu trữ và tìm kiếm vector embeddings
+Xử lý lưu trữ và tìm kiếm vector embeddings (engine IndexFlatIP + metadata pickle
+của interface VectorStore, cùng schema metadata với FAISSStore)
 """
 
 import faiss
 import numpy as np
 import pickle
 import os
+import time
+import atexit
+import weakref
+import threading
 from typing import List, Dict, Any, Optional, Tuple
 import logging
 from pathlib import Path
 
+from .vector_store import VectorStore, normalize_chunk_metadata
+
 logger = logging.getLogger(__name__)
 
-class VectorDB:
+# Các VectorDB đang mở, flush khi process thoát
+_open_databases: "weakref.WeakSet[VectorDB]" = weakref.WeakSet()
+
+def _group_positions(keys: List[Any]) -> Tuple[np.ndarray, Dict[Any, int], Dict[Any, np.ndarray]]:
+    """
+    Nhóm các vị trí theo key (doc_id hoặc category)
+
+    Returns:
+        (mã key của từng vị trí, key -> mã, key -> vị trí tăng dần)
+    """
+    codes: Dict[Any, int] = {}
+    position_codes = np.fromiter(
+        (codes.setdefault(key, len(codes)) for key in keys), dtype=np.int64, count=len(keys)
+    )
+    order = np.argsort(position_codes, kind="stable")
+    bounds = np.searchsorted(position_codes[order], np.arange(len(codes) + 1))
+    positions = {key: order[bounds[code]:bounds[code + 1]] for key, code in codes.items()}
+    return position_codes, codes, positions
+
+@atexit.register
+def _flush_open_databases():
+    """Đảm bảo thay đổi chưa lưu được ghi xuống disk khi shutdown"""
+    for db in list(_open_databases):
+        db.close()
+
+class VectorDB(VectorStore):
     """Vector Database sử dụng FAISS"""
     
-    def __init__(self, dimension: int = 768, index_path: str = "data/faiss_index"):
+    def __init__(self,
+                 dimension: int = 768,
+                 index_path: str = "data/faiss_index",
+                 flush_interval: Optional[float] = 5.0,
+                 flush_max_pending: int = 10000):
+        """
+        Args:
+            dimension: Dimension của vector
+            index_path: Thư mục chứa faiss_index.bin và metadata.pkl
+            flush_interval: Số giây tối đa một thay đổi nằm trong bộ nhớ trước khi background
+                flush ghi xuống disk (None: chỉ flush theo kích thước, flush() hoặc khi shutdown)
+            flush_max_pending: Flush ngay khi số vectors thay đổi chưa lưu đạt ngưỡng này
+                (1: ghi xuống disk sau mỗi thao tác)
+        """
         self.dimension = dimension
         self.index_path = Path(index_path)
         self.metadata_path = self.index_path / "metadata.pkl"
         
         # FAISS index
         self.index: Optional[faiss.IndexFlatIP] = None  # Inner Product for cosine similarity
-        self.metadata: List[Dict[str, Any]] = []
+        self.metadata: List[Dict[str, Any]] = []  # vector_index = vị trí trong list, gắn vào khi đọc
+        # doc_id -> vị trí (vector_index) các vectors của document (np.ndarray tăng dần)
+        self.doc_positions: Dict[str, np.ndarray] = {}
+        # Mã document của từng vị trí: xóa chỉ cập nhật doc_positions của các documents bị dồn vị trí
+        self._position_docs = np.empty(0, dtype=np.int64)
+        self._doc_codes: Dict[str, int] = {}
+        self._code_docs: List[str] = []
+        # category -> vị trí các vectors thuộc category (filter category không duyệt metadata), dồn vị trí như doc_positions
+        self.category_positions: Dict[Optional[str], np.ndarray] = {}
+        self._position_categories = np.empty(0, dtype=np.int64)
+        self._category_codes: Dict[Optional[str], int] = {}
+        self._code_categories: List[Optional[str]] = []
+        
+        # Write-behind: thao tác chỉ đánh dấu dirty, ghi xuống disk theo thời gian/kích thước
+        self.flush_interval = flush_interval
+        self.flush_max_pending = flush_max_pending
+        self._dirty = False
+        self._pending_vectors = 0
+        self._dirty_since: Optional[float] = None
+        self._lock = threading.RLock()
+        self._flush_event = threading.Event()
+        self._closed = threading.Event()
+        self._flush_thread: Optional[threading.Thread] = None
+        self.flush_stats = {"flushes": 0, "last_flush": None, "last_flush_seconds": None}
         
         # Create directory if not exists
         self.index_path.mkdir(parents=True, exist_ok=True)
         
         # Load existing index if available
         self._load_index()
+        _open_databases.add(self)
     
     def _load_index(self):
         """Load FAISS index từ disk"""
@@ -42,12 +111,18 @@ class VectorDB:
                 # Load metadata
                 with open(self.metadata_path, 'rb') as f:
                     self.metadata = pickle.load(f)
+                # Metadata cũ (document_id, index_id) được đưa về schema chung
+                self.metadata = [normalize_chunk_metadata(metadata) for metadata in self.metadata]
+                for metadata in self.metadata:
+                    metadata.pop("vector_index", None)
+                self._rebuild_doc_positions()
                 
                 logger.info(f"✅ Loaded FAISS index with {self.index.ntotal} vectors")
             else:
                 # Create new index
                 self.index = faiss.IndexFlatIP(self.dimension)
                 self.metadata = []
+                self._rebuild_doc_positions()
                 logger.info("🆕 Created new FAISS index")
                 
         except Exception as e:
@@ -55,26 +130,135 @@ class VectorDB:
             # Create new index on error
             self.index = faiss.IndexFlatIP(self.dimension)
             self.metadata = []
+            self._rebuild_doc_positions()
+    
+    def _rebuild_doc_positions(self):
+        """Build lại index doc_id / category -> vị trí và mã của từng vị trí từ metadata (khi load)"""
+        self._position_docs, self._doc_codes, self.doc_positions = _group_positions(
+            [metadata["doc_id"] for metadata in self.metadata]
+        )
+        self._code_docs = list(self._doc_codes)
+        self._position_categories, self._category_codes, self.category_positions = _group_positions(
+            [metadata.get("category") for metadata in self.metadata]
+        )
+        self._code_categories = list(self._category_codes)
+    
+    def _chunk(self, position: int) -> Dict[str, Any]:
+        """Metadata của vector tại vị trí position (kèm vector_index)"""
+        return {**self.metadata[position], "vector_index": int(position)}
+    
+    def load_index(self):
+        """Load lại index + metadata từ disk (bỏ các thay đổi chưa flush)"""
+        with self._lock:
+            self._load_index()
+            self._dirty = False
+            self._pending_vectors = 0
+            self._dirty_since = None
+    
+    def save_index(self):
+        """Ghi index + metadata xuống disk ngay"""
+        self._save_index()
     
     def _save_index(self):
-        """Save FAISS index to disk"""
+        """Save FAISS index to disk (ghi file tạm rồi rename để không để lại file ghi dở)"""
         try:
             if self.index is None:
                 return
             
-            # Save FAISS index
-            index_file = self.index_path / "faiss_index.bin"
-            faiss.write_index(self.index, str(index_file))
-            
-            # Save metadata
-            with open(self.metadata_path, 'wb') as f:
-                pickle.dump(self.metadata, f)
+            with self._lock:
+                start = time.time()
+                
+                # Save FAISS index
+                index_file = self.index_path / "faiss_index.bin"
+                faiss.write_index(self.index, str(index_file) + ".tmp")
+                
+                # Save metadata
+                with open(str(self.metadata_path) + ".tmp", 'wb') as f:
+                    pickle.dump(self.metadata, f)
+                
+                os.replace(str(index_file) + ".tmp", index_file)
+                os.replace(str(self.metadata_path) + ".tmp", self.metadata_path)
+                
+                self._dirty = False
+                self._pending_vectors = 0
+                self._dirty_since = None
+                self.flush_stats["flushes"] += 1
+                self.flush_stats["last_flush"] = start
+                self.flush_stats["last_flush_seconds"] = round(time.time() - start, 4)
             
             logger.info(f"💾 Saved FAISS index with {self.index.ntotal} vectors")
             
         except Exception as e:
             logger.error(f"❌ Error saving FAISS index: {e}")
     
+    def _mark_dirty(self, changed_vectors: int):
+        """
+        Ghi nhận thay đổi chưa lưu: flush ngay khi đủ flush_max_pending vectors,
+        nếu không thì để background flush ghi sau tối đa flush_interval giây
+        """
+        with self._lock:
+            self._dirty = True
+            self._pending_vectors += max(changed_vectors, 1)
+            if self._dirty_since is None:
+                self._dirty_since = time.time()
+            
+            if self._pending_vectors >= self.flush_max_pending or self._closed.is_set():
+                self._save_index()
+                return
+        
+        if self.flush_interval is not None:
+            self._start_flush_thread()
+            self._flush_event.set()
+    
+    def _start_flush_thread(self):
+        """Start background flush thread (lần đầu có thay đổi)"""
+        if self._flush_thread is not None:
+            return
+        with self._lock:
+            if self._flush_thread is None:
+                self._flush_thread = threading.Thread(target=self._flush_worker, name="vector-db-flush", daemon=True)
+                self._flush_thread.start()
+    
+    def _flush_worker(self):
+        """Flush thay đổi chưa lưu khi đã quá flush_interval giây kể từ thay đổi đầu tiên"""
+        while not self._closed.is_set():
+            self._flush_event.wait()
+            self._flush_event.clear()
+            while self._dirty_since is not None and not self._closed.is_set():
+                remaining = self._dirty_since + self.flush_interval - time.time()
+                if remaining > 0:
+                    self._closed.wait(remaining)
+                    continue
+                with self._lock:
+                    if self._dirty_since is not None and time.time() - self._dirty_since >= self.flush_interval:
+                        self._save_index()
+                        if self._dirty:
+                            # Ghi lỗi: thử lại sau flush_interval
+                            self._dirty_since = time.time()
+    
+    def flush(self) -> bool:
+        """
+        Ghi index + metadata xuống disk nếu có thay đổi chưa lưu
+        
+        Returns:
+            bool: True nếu đã ghi
+        """
+        with self._lock:
+            if not self._dirty:
+                return False
+            self._save_index()
+            return not self._dirty
+    
+    def close(self):
+        """
+        Dừng background flush và ghi các thay đổi còn lại (gọi khi shutdown)
+        """
+        self._closed.set()
+        self._flush_event.set()
+        if self._flush_thread is not None and self._flush_thread is not threading.current_thread():
+            self._flush_thread.join(timeout=30)
+        self.flush()
+    
     def add_vectors(
         self, 
         vectors: np.ndarray, 
@@ -85,10 +269,11 @@ class VectorDB:
         
         Args:
             vectors: Array of vectors (numpy array)
-            metadata_list: List of metadata for each vector
+            metadata_list: Metadata từng vector theo schema chung (doc_id, chunk_index,
+                content, filename, category; chấp nhận field cũ document_id)
             
         Returns:
-            List of vector IDs
+            List of chunk IDs
         """
         try:
             if self.index is None:
@@ -97,142 +282,220 @@ class VectorDB:
             if len(vectors) != len(metadata_list):
                 raise ValueError("Number of vectors must match number of metadata")
             
+            records = [normalize_chunk_metadata(metadata) for metadata in metadata_list]
+            
             # Normalize vectors for cosine similarity
+            vectors = np.ascontiguousarray(vectors, dtype=np.float32)
             faiss.normalize_L2(vectors)
             
-            # Add to index
-            start_id = self.index.ntotal
-            self.index.add(vectors)
-            
-            # Generate vector IDs and add metadata
-            vector_ids = []
-            for i, metadata in enumerate(metadata_list):
-                vector_id = f"vec_{start_id + i}"
-                metadata["vector_id"] = vector_id
-                metadata["index_id"] = start_id + i
-                self.metadata.append(metadata)
-                vector_ids.append(vector_id)
-            
-            # Save to disk
-            self._save_index()
+            with self._lock:
+                # Add to index
+                start_id = self.index.ntotal
+                self.index.add(vectors)
+                
+                # Generate vector IDs and add metadata
+                codes = np.empty(len(records), dtype=np.int64)
+                category_codes = np.empty(len(records), dtype=np.int64)
+                for i, record in enumerate(records):
+                    record.pop("vector_index", None)
+                    record["vector_id"] = f"vec_{start_id + i}"
+                    record["embedding_dimension"] = self.dimension
+                    self.metadata.append(record)
+                    code = self._doc_codes.get(record["doc_id"])
+                    if code is None:
+                        code = self._doc_codes[record["doc_id"]] = len(self._code_docs)
+                        self._code_docs.append(record["doc_id"])
+                    codes[i] = code
+                    category_code = self._category_codes.get(record["category"])
+                    if category_code is None:
+                        category_code = self._category_codes[record["category"]] = len(self._code_categories)
+                        self._code_categories.append(record["category"])
+                    category_codes[i] = category_code
+                self._position_docs = np.concatenate([self._position_docs, codes])
+                self._position_categories = np.concatenate([self._position_categories, category_codes])
+                
+                new_positions = np.arange(start_id, start_id + len(records), dtype=np.int64)
+                for code in np.unique(codes):
+                    doc_id = self._code_docs[code]
+                    self.doc_positions[doc_id] = np.concatenate([
+                        self.doc_positions.get(doc_id, np.empty(0, dtype=np.int64)),
+                        new_positions[codes == code]
+                    ])
+                for category_code in np.unique(category_codes):
+                    category = self._code_categories[category_code]
+                    self.category_positions[category] = np.concatenate([
+                        self.category_positions.get(category, np.empty(0, dtype=np.int64)),
+                        new_positions[category_codes == category_code]
+                    ])
+                
+                # Write-behind: ghi xuống disk theo flush_interval / flush_max_pending
+                self._mark_dirty(len(vectors))
             
             logger.info(f"✅ Added {len(vectors)} vectors to FAISS index")
-            return vector_ids
+            return [record["chunk_id"] for record in records]
             
         except Exception as e:
             logger.error(f"❌ Error adding vectors: {e}")
             raise
     
-    def search(
-        self, 
-        query_vector: np.ndarray, 
-        k: int = 5,
-        document_id: Optional[str] = None
-    ) -> List[Dict[str, Any]]:
+    def search_batch(
+        self,
+        query_vectors: np.ndarray,
+        top_k: int = 5,
+        doc_id: Optional[str] = None,
+        category: Optional[str] = None,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None
+    ) -> List[List[Dict[str, Any]]]:
         """
-        Tìm kiếm vectors tương tự
+        Tìm kiếm vectors tương tự cho nhiều queries
+        Không filter: một lần index.search; có filter thì tính điểm trực tiếp trên các
+        vectors của document/category (nprobe, ef_search không áp dụng cho IndexFlatIP)
         
         Args:
-            query_vector: Query vector (1D numpy array)
-            k: Number of results to return
-            document_id: Filter by document ID (optional)
+            query_vectors: Ma trận queries (nq, dimension)
+            top_k: Number of results to return
+            doc_id: Filter by document ID (optional)
+            category: Filter by category (optional)
             
         Returns:
-            List of results with metadata and scores
+            List of results with metadata and scores, theo thứ tự các queries
         """
         try:
-            if self.index is None or self.index.ntotal == 0:
-                return []
+            # Normalize query vectors
+            queries = np.array(query_vectors, dtype=np.float32).reshape(-1, self.dimension)
+            if len(queries) == 0:
+                return [[] for _ in range(len(queries))]
+            faiss.normalize_L2(queries)
             
-            # Normalize query vector
-            query_vector = query_vector.reshape(1, -1)
-            faiss.normalize_L2(query_vector)
-            
-            # Search
-            scores, indices = self.index.search(query_vector, min(k, self.index.ntotal))
-            
-            # Prepare results
-            results = []
-            for score, idx in zip(scores[0], indices[0]):
-                if idx == -1:  # Invalid index
-                    continue
+            # Đọc index + metadata dưới cùng lock với thao tác thêm/xóa (sửa tại chỗ, vị trí bị dồn)
+            with self._lock:
+                if self.index is None or self.index.ntotal == 0:
+                    return [[] for _ in range(len(queries))]
                 
-                metadata = self.metadata[idx].copy()
-                metadata["similarity_score"] = float(score)
+                if doc_id is not None or category is not None:
+                    # Chỉ tính điểm trên các vectors thỏa filter
+                    positions = self._candidate_positions(doc_id, category)
+                    if len(positions) == 0:
+                        return [[] for _ in range(len(queries))]
+                    candidate_scores = queries @ self.index.reconstruct_batch(positions).T
+                    order = np.argsort(-candidate_scores, axis=1, kind="stable")[:, :top_k]
+                    scores, indices = np.take_along_axis(candidate_scores, order, axis=1), positions[order]
+                else:
+                    # Search
+                    scores, indices = self.index.search(queries, min(top_k, self.index.ntotal))
                 
-                # Filter by document_id if specified
-                if document_id and metadata.get("document_id") != document_id:
-                    continue
+                # Prepare results
+                batch_results = []
+                for row_scores, row_indices in zip(scores, indices):
+                    results = []
+                    for score, idx in zip(row_scores, row_indices):
+                        if idx == -1:  # Invalid index
+                            continue
+                        results.append({**self._chunk(idx), "similarity_score": float(score)})
+                    batch_results.append(results)
                 
-                results.append(metadata)
-            
-            return results
+                return batch_results
             
         except Exception as e:
             logger.error(f"❌ Error searching vectors: {e}")
             raise
     
+    def _candidate_positions(self, doc_id: Optional[str], category: Optional[str]) -> np.ndarray:
+        """Vị trí các vectors thỏa filter doc_id / category (tra doc_positions / category_positions)"""
+        empty = np.empty(0, dtype=np.int64)
+        if category is None:
+            return self.doc_positions.get(doc_id, empty)
+        category_positions = self.category_positions.get(category, empty)
+        if doc_id is None:
+            return category_positions
+        return np.intersect1d(self.doc_positions.get(doc_id, empty), category_positions, assume_unique=True)
+    
     def get_vector_count(self) -> int:
         """Lấy số lượng vectors trong index"""
         return self.index.ntotal if self.index else 0
     
-    def get_document_vectors(self, document_id: str) -> List[Dict[str, Any]]:
-        """Lấy tất cả vectors của một document"""
+    def get_document_chunks(self, doc_id: str) -> List[Dict[str, Any]]:
+        """Lấy tất cả chunks của một document theo chunk_index"""
         try:
-            document_vectors = []
-            for metadata in self.metadata:
-                if metadata.get("document_id") == document_id:
-                    document_vectors.append(metadata)
-            
-            return document_vectors
+            with self._lock:
+                chunks = [self._chunk(position) for position in self.doc_positions.get(doc_id, [])]
+            chunks.sort(key=lambda chunk: chunk["chunk_index"])
+            return chunks
             
         except Exception as e:
-            logger.error(f"❌ Error getting document vectors: {e}")
+            logger.error(f"❌ Error getting document chunks: {e}")
             raise
     
-    def delete_document_vectors(self, document_id: str) -> int:
+    def get_chunk_windows(self, windows: List[Tuple[str, int, int]]) -> List[List[Dict[str, Any]]]:
+        """Lấy chunks theo khoảng chunk_index qua doc_positions (chỉ duyệt chunks của document)"""
+        results = []
+        with self._lock:
+            for doc_id, start, end in windows:
+                chunks = [
+                    self._chunk(position) for position in self.doc_positions.get(doc_id, [])
+                    if start <= self.metadata[position]["chunk_index"] <= end
+                ]
+                chunks.sort(key=lambda chunk: chunk["chunk_index"])
+                results.append(chunks)
+        return results
+    
+    def delete_document_vectors(self, doc_id: str) -> int:
         """
         Xóa tất cả vectors của một document
-        Note: FAISS không hỗ trợ xóa trực tiếp, cần rebuild index
+        IndexFlat.remove_ids dồn các vectors còn lại trong một lần (không reconstruct
+        từng vector, không normalize lại), metadata xóa theo từng đoạn vị trí liên tiếp,
+        vị trí của các documents phía sau dồn lên bằng phép trừ vector hóa.
+        Thay đổi được ghi xuống disk theo write-behind (flush_interval / flush_max_pending)
         """
         try:
-            # Find vectors to remove
-            vectors_to_remove = []
-            for i, metadata in enumerate(self.metadata):
-                if metadata.get("document_id") == document_id:
-                    vectors_to_remove.append(i)
-            
-            if not vectors_to_remove:
-                return 0
-            
-            # Rebuild index without removed vectors
-            new_metadata = []
-            new_vectors = []
-            
-            for i, metadata in enumerate(self.metadata):
-                if i not in vectors_to_remove:
-                    new_metadata.append(metadata)
-                    # Get vector from index
-                    vector = self.index.reconstruct(i)
-                    new_vectors.append(vector)
-            
-            # Create new index
-            if new_vectors:
-                new_vectors = np.array(new_vectors)
-                self.index = faiss.IndexFlatIP(self.dimension)
-                faiss.normalize_L2(new_vectors)
-                self.index.add(new_vectors)
-            else:
-                self.index = faiss.IndexFlatIP(self.dimension)
-            
-            # Update metadata
-            self.metadata = new_metadata
-            
-            # Save to disk
-            self._save_index()
+            with self._lock:
+                positions = self.doc_positions.get(doc_id)
+                
+                if positions is None or len(positions) == 0:
+                    return 0
+                
+                # Xóa theo vị trí: các vectors phía sau dồn lên, giữ nguyên thứ tự
+                removed = self.index.remove_ids(positions)
+                if removed != len(positions):
+                    raise RuntimeError(f"Removed {removed} vectors, expected {len(positions)}")
+                
+                # Update metadata: xóa từng đoạn vị trí liên tiếp từ cuối lên (del slice dồn list trong C)
+                breaks = np.flatnonzero(np.diff(positions) != 1) + 1
+                starts = positions[np.concatenate([[0], breaks])]
+                ends = positions[np.concatenate([breaks - 1, [len(positions) - 1]])] + 1
+                for start, end in zip(starts[::-1].tolist(), ends[::-1].tolist()):
+                    del self.metadata[start:end]
+                
+                # Chỉ các documents có vector phía sau vị trí bị xóa đầu tiên bị dồn vị trí
+                keep = np.ones(len(self._position_docs), dtype=bool)
+                keep[positions] = False
+                first_removed = int(positions[0])
+                moved_codes = np.unique(self._position_docs[first_removed:][keep[first_removed:]])
+                # Categories có vector từ vị trí bị xóa đầu tiên trở đi: bỏ vị trí đã xóa và dồn vị trí
+                changed_categories = np.unique(self._position_categories[first_removed:])
+                self._position_docs = self._position_docs[keep]
+                self._position_categories = self._position_categories[keep]
+                del self.doc_positions[doc_id]
+                del self._doc_codes[doc_id]
+                for code in moved_codes.tolist():
+                    moved_doc = self._code_docs[code]
+                    doc_positions = self.doc_positions[moved_doc]
+                    self.doc_positions[moved_doc] = doc_positions - np.searchsorted(positions, doc_positions)
+                for category_code in changed_categories.tolist():
+                    category = self._code_categories[category_code]
+                    category_positions = self.category_positions[category]
+                    category_positions = category_positions[~np.isin(category_positions, positions, assume_unique=True)]
+                    if len(category_positions) > 0:
+                        self.category_positions[category] = (
+                            category_positions - np.searchsorted(positions, category_positions)
+                        )
+                    else:
+                        del self.category_positions[category]
+                self._mark_dirty(len(positions))
             
-            logger.info(f"✅ Removed {len(vectors_to_remove)} vectors for document {document_id}")
-            return len(vectors_to_remove)
+            logger.info(f"✅ Removed {len(positions)} vectors for document {doc_id}")
+            return len(positions)
             
         except Exception as e:
             logger.error(f"❌ Error deleting document vectors: {e}")
@@ -245,8 +508,10 @@ class VectorDB:
                 "total_vectors": self.get_vector_count(),
                 "dimension": self.dimension,
                 "index_type": "IndexFlatIP",
-                "documents_count": len(set(m.get("document_id") for m in self.metadata if m.get("document_id"))),
-                "index_size_mb": self._get_index_size()
+                "total_documents": len(self.doc_positions),
+                "index_size_mb": self._get_index_size(),
+                "pending_vectors": self._pending_vectors,
+                "flush": dict(self.flush_stats)
             }
             
             return stats
@@ -268,13 +533,19 @@ class VectorDB:
     def clear_all(self):
         """Xóa tất cả vectors"""
         try:
-            self.index = faiss.IndexFlatIP(self.dimension)
-            self.metadata = []
-            self._save_index()
+            with self._lock:
+                removed = self.get_vector_count()
+                self.index = faiss.IndexFlatIP(self.dimension)
+                self.metadata = []
+                self._rebuild_doc_positions()
+                self._mark_dirty(removed)
             logger.info("🗑️ Cleared all vectors from FAISS index")
         except Exception as e:
             logger.error(f"❌ Error clearing index: {e}")
             raise
 
 # Global vector database instance
-vector_db = VectorDB()
+vector_db = VectorDB(
+    flush_interval=float(os.getenv("VECTOR_DB_FLUSH_INTERVAL", "5")),
+    flush_max_pending=int(os.getenv("VECTOR_DB_FLUSH_MAX_PENDING", "10000"))
+)
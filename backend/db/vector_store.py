@@ -0,0 +1,429 @@
+"""
+Vector Store - Interface chung cho các storage engine (FAISSStore, ShardedFAISSStore, VectorDB)
+Một schema metadata cho chunks, registry metadata backend; các thao tác dẫn xuất
+(search text, similar contexts, ...) viết một lần trên các primitive của engine
+"""
+
+import logging
+import numpy as np
+import faiss
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Callable, Tuple
+
+from .metadata_store import ChunkMetadataStore
+
+logger = logging.getLogger(__name__)
+
+# Schema metadata của một chunk, giống nhau ở mọi engine:
+# chunk_id, doc_id, chunk_index, content, filename, category, vector_index, created_at, embedding_dimension
+CHUNK_FIELDS = (
+    "chunk_id", "doc_id", "chunk_index", "content", "filename",
+    "category", "vector_index", "created_at", "embedding_dimension"
+)
+
+# Tên field cũ (VectorDB, router embedding) -> field trong schema
+LEGACY_FIELD_ALIASES = {
+    "document_id": "doc_id",
+    "text": "content",
+    "index_id": "vector_index"
+}
+
+# Metadata backend: tên -> factory(metadata_path, dimension)
+METADATA_BACKENDS: Dict[str, Callable[[str, int], Any]] = {
+    "columnar": ChunkMetadataStore
+}
+
+def register_metadata_backend(name: str, factory: Callable[[str, int], Any]):
+    """
+    Đăng ký metadata backend mới cho FAISSStore (metadata_backend=name)
+
+    Args:
+        name: Tên backend
+        factory: Callable(metadata_path, dimension) trả về store có API giống ChunkMetadataStore
+    """
+    METADATA_BACKENDS[name] = factory
+
+def create_metadata_store(backend: str, metadata_path: str, dimension: int):
+    """
+    Tạo metadata store theo tên backend
+
+    Raises:
+        ValueError: Backend chưa được đăng ký
+    """
+    if backend not in METADATA_BACKENDS:
+        raise ValueError(f"Unsupported metadata backend: {backend}. Supported: {', '.join(METADATA_BACKENDS)}")
+    return METADATA_BACKENDS[backend](metadata_path, dimension)
+
+def normalize_chunk_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Đưa metadata của chunk về schema chung: đổi tên field cũ, điền chunk_id/filename/category
+
+    Raises:
+        ValueError: Thiếu doc_id
+    """
+    record = dict(metadata)
+    for legacy_field, field in LEGACY_FIELD_ALIASES.items():
+        if legacy_field in record:
+            value = record.pop(legacy_field)
+            record.setdefault(field, value)
+    if record.get("doc_id") is None:
+        raise ValueError("Chunk metadata requires doc_id")
+    record["chunk_index"] = int(record.get("chunk_index", 0))
+    record.setdefault("content", "")
+    record.setdefault("filename", "")
+    record.setdefault("category", None)
+    record.setdefault("created_at", datetime.now().isoformat())
+    record["chunk_id"] = f"{record['doc_id']}_{record['chunk_index']}"
+    return record
+
+class VectorStore(ABC):
+    """
+    Interface của storage engine mà routers và services dùng
+
+    Engine cài đặt các primitive (add_vectors, search_batch, get_document_chunks,
+    delete_document_vectors, ...); search text, similar contexts và các thao tác
+    theo document được dẫn xuất ở đây nên mọi engine có cùng hành vi.
+    """
+
+    dimension: int
+
+    # ------------------------------------------------------------------
+    # Primitives (engine cài đặt)
+    # ------------------------------------------------------------------
+
+    @abstractmethod
+    def load_index(self):
+        """Load index + metadata từ disk"""
+
+    @abstractmethod
+    def save_index(self):
+        """Ghi index + metadata xuống disk"""
+
+    @abstractmethod
+    def add_vectors(self, vectors: np.ndarray, metadata_list: List[Dict[str, Any]]) -> List[str]:
+        """
+        Thêm vectors đã có sẵn embedding kèm metadata (schema chung, chấp nhận field cũ)
+
+        Returns:
+            List[str]: Chunk IDs theo thứ tự vectors
+        """
+
+    @abstractmethod
+    def search_batch(self,
+                     query_vectors: np.ndarray,
+                     top_k: int = 5,
+                     doc_id: Optional[str] = None,
+                     category: Optional[str] = None,
+                     nprobe: Optional[int] = None,
+                     ef_search: Optional[int] = None) -> List[List[Dict[str, Any]]]:
+        """Tìm kiếm nhiều queries đã normalize, kết quả theo thứ tự các queries"""
+
+    @abstractmethod
+    def get_document_chunks(self, doc_id: str) -> List[Dict[str, Any]]:
+        """Tất cả chunks của document theo chunk_index"""
+
+    @abstractmethod
+    def get_chunk_windows(self, windows: List[Tuple[str, int, int]]) -> List[List[Dict[str, Any]]]:
+        """
+        Lấy chunks theo khoảng chunk_index của document, cho nhiều khoảng trong một lần
+
+        Args:
+            windows: Danh sách (doc_id, chunk_index đầu, chunk_index cuối) - gồm cả hai đầu
+
+        Returns:
+            List[List[Dict]]: Chunks của từng khoảng theo chunk_index
+        """
+
+    @abstractmethod
+    def delete_document_vectors(self, doc_id: str) -> int:
+        """
+        Xóa tất cả vectors của document
+
+        Returns:
+            int: Số vectors đã xóa (0 nếu không có document)
+        """
+
+    @abstractmethod
+    def clear_all(self):
+        """Xóa tất cả dữ liệu"""
+
+    @abstractmethod
+    def get_stats(self) -> Dict[str, Any]:
+        """Thống kê của engine (tối thiểu total_vectors, total_documents, dimension)"""
+
+    # ------------------------------------------------------------------
+    # Thao tác dẫn xuất
+    # ------------------------------------------------------------------
+
+    def clear_doc(self, doc_id: str) -> bool:
+        """
+        Xóa document, trả về True nếu có vectors bị xóa
+        """
+        try:
+            return self.delete_document_vectors(doc_id) > 0
+        except Exception as e:
+            logger.error(f"❌ Error clearing document {doc_id}: {e}")
+            return False
+
+    def search(self,
+               query_vector: np.ndarray,
+               top_k: int = 5,
+               doc_id: Optional[str] = None,
+               category: Optional[str] = None,
+               nprobe: Optional[int] = None,
+               ef_search: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Tìm kiếm vectors tương tự
+
+        Args:
+            query_vector: Vector query đã được normalize
+            top_k: Số lượng kết quả trả về
+            doc_id: Nếu có, chỉ tìm trong document này
+            category: Nếu có, chỉ tìm trong category này
+            nprobe: Số cluster quét cho query này (IVF), mặc định theo index
+            ef_search: Độ rộng search cho query này (HNSW), mặc định theo index
+
+        Returns:
+            List[Dict]: Danh sách kết quả với metadata
+        """
+        query = np.asarray(query_vector, dtype=np.float32).reshape(1, -1)
+        return self.search_batch(query, top_k, doc_id, category, nprobe=nprobe, ef_search=ef_search)[0]
+
+    def search_with_context(self,
+                            query_vector: np.ndarray,
+                            top_k: int = 5,
+                            doc_id: Optional[str] = None,
+                            category: Optional[str] = None,
+                            window: int = 1,
+                            nprobe: Optional[int] = None,
+                            ef_search: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Tìm kiếm và trả mỗi hit kèm ±window chunks lân cận trong cùng document.
+        Hits cùng document có cửa sổ chồng lấp (hoặc liền kề) được gộp thành một kết quả;
+        chunks của tất cả cửa sổ được lấy trong một lần get_chunk_windows
+
+        Args:
+            query_vector: Vector query đã được normalize
+            top_k: Số hits tìm kiếm (số kết quả có thể ít hơn sau khi gộp)
+            doc_id: Nếu có, chỉ tìm trong document này
+            category: Nếu có, chỉ tìm trong category này
+            window: Số chunks lân cận mỗi phía của hit
+            nprobe: Số cluster quét (IVF)
+            ef_search: Độ rộng search (HNSW)
+
+        Returns:
+            List[Dict]: Metadata của hit tốt nhất trong cửa sổ kèm matched_chunks, context_window
+                ([chunk_index đầu, cuối]), context_chunks và context (nội dung cửa sổ), giảm dần theo score
+        """
+        try:
+            hits = self.search(query_vector, top_k, doc_id, category, nprobe=nprobe, ef_search=ef_search)
+            return self.expand_with_context([hits], window)[0]
+
+        except Exception as e:
+            logger.error(f"❌ Error in search with context: {e}")
+            raise
+
+    def expand_with_context(self,
+                            batch_hits: List[List[Dict[str, Any]]],
+                            window: int = 1) -> List[List[Dict[str, Any]]]:
+        """
+        Mở rộng kết quả search của nhiều queries thành các cửa sổ ±window chunks (xem search_with_context)
+        """
+        window = max(int(window), 0)
+        # window=0 tắt mở rộng: mỗi hit một kết quả, không gộp các chunks liền kề
+        merge_gap = 1 if window else 0
+
+        # Gộp các cửa sổ chồng lấp/liền kề của cùng document: [doc_id, đầu, cuối, hits]
+        batch_windows = []
+        for hits in batch_hits:
+            doc_hits: Dict[str, List[Dict[str, Any]]] = {}
+            for hit in hits:
+                doc_hits.setdefault(hit["doc_id"], []).append(hit)
+            windows = []
+            for hit_doc_id, hits_of_doc in doc_hits.items():
+                hits_of_doc.sort(key=lambda hit: hit["chunk_index"])
+                for hit in hits_of_doc:
+                    start, end = max(hit["chunk_index"] - window, 0), hit["chunk_index"] + window
+                    if windows and windows[-1][0] == hit_doc_id and start <= windows[-1][2] + merge_gap:
+                        windows[-1][2] = max(windows[-1][2], end)
+                        windows[-1][3].append(hit)
+                    else:
+                        windows.append([hit_doc_id, start, end, [hit]])
+            batch_windows.append(windows)
+
+        # Một lần lấy chunks cho tất cả cửa sổ của tất cả queries
+        window_chunks = iter(self.get_chunk_windows([
+            (window_doc_id, start, end)
+            for windows in batch_windows for window_doc_id, start, end, _ in windows
+        ]))
+
+        batch_results = []
+        for windows in batch_windows:
+            results = []
+            for (_, start, end, hits), chunks in zip(windows, window_chunks):
+                best = max(hits, key=lambda hit: hit["similarity_score"])
+                if not chunks:
+                    chunks = hits
+                results.append({
+                    **best,
+                    "matched_chunks": [hit["chunk_id"] for hit in hits],
+                    "context_window": [chunks[0]["chunk_index"], chunks[-1]["chunk_index"]],
+                    "context_chunks": [
+                        {"chunk_id": chunk["chunk_id"], "chunk_index": chunk["chunk_index"], "content": chunk["content"]}
+                        for chunk in chunks
+                    ],
+                    "context": "\n".join(chunk["content"] for chunk in chunks)
+                })
+            results.sort(key=lambda result: result["similarity_score"], reverse=True)
+            batch_results.append(results)
+        return batch_results
+
+    def search_text(self,
+                   query_text: str,
+                   top_k: int = 5,
+                   doc_id: Optional[str] = None,
+                   category: Optional[str] = None,
+                   embedding_service=None,
+                   nprobe: Optional[int] = None,
+                   ef_search: Optional[int] = None,
+                   query_embedding: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        """
+        Tìm kiếm bằng text query
+
+        Args:
+            query_text: Text query
+            top_k: Số lượng kết quả
+            doc_id: Nếu có, chỉ tìm trong document này
+            category: Nếu có, chỉ tìm trong category này
+            embedding_service: Embedding service instance
+            nprobe: Số cluster quét (IVF)
+            ef_search: Độ rộng search (HNSW)
+            query_embedding: Embedding của query đã tính sẵn (vd qua micro-batcher), bỏ qua bước encode
+
+        Returns:
+            List[Dict]: Danh sách kết quả
+        """
+        if embedding_service is None:
+            raise ValueError("Embedding service is required")
+
+        try:
+            # Tạo embedding cho query
+            if query_embedding is None:
+                query_embedding = embedding_service.generate_embedding(query_text)
+            query_embedding = embedding_service.normalize_embedding(query_embedding)
+
+            # Tìm kiếm
+            return self.search(
+                query_embedding, top_k, doc_id, category,
+                nprobe=nprobe, ef_search=ef_search
+            )
+
+        except Exception as e:
+            logger.error(f"❌ Error in text search: {e}")
+            raise
+
+    def search_text_batch(self,
+                          query_texts: List[str],
+                          top_k: int = 5,
+                          doc_id: Optional[str] = None,
+                          category: Optional[str] = None,
+                          embedding_service=None,
+                          nprobe: Optional[int] = None,
+                          ef_search: Optional[int] = None) -> List[List[Dict[str, Any]]]:
+        """
+        Tìm kiếm nhiều text queries: encode tất cả trong một lần forward, search một lần
+
+        Args:
+            query_texts: Danh sách text queries
+            top_k: Số lượng kết quả mỗi query
+            doc_id: Nếu có, chỉ tìm trong document này
+            category: Nếu có, chỉ tìm trong category này
+            embedding_service: Embedding service instance
+            nprobe: Số cluster quét (IVF)
+            ef_search: Độ rộng search (HNSW)
+
+        Returns:
+            List[List[Dict]]: Kết quả theo thứ tự các queries
+        """
+        if embedding_service is None:
+            raise ValueError("Embedding service is required")
+        if not query_texts:
+            return []
+
+        try:
+            # Tạo embeddings cho tất cả queries trong một batch
+            query_embeddings = embedding_service.generate_embeddings_batch(
+                query_texts,
+                batch_size=len(query_texts),
+                show_progress_bar=False
+            )
+            query_embeddings = np.ascontiguousarray(query_embeddings, dtype=np.float32)
+            faiss.normalize_L2(query_embeddings)
+
+            # Tìm kiếm
+            return self.search_batch(
+                query_embeddings, top_k, doc_id, category,
+                nprobe=nprobe, ef_search=ef_search
+            )
+
+        except Exception as e:
+            logger.error(f"❌ Error in batch text search: {e}")
+            raise
+
+    def search_similar_contexts(self,
+                                context_text: str,
+                                top_k: int = 5,
+                                doc_id: Optional[str] = None,
+                                embedding_service=None,
+                                category: Optional[str] = None,
+                                query_embedding: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        """
+        Tìm các contexts tương tự một đoạn text (bỏ qua chunk trùng nội dung với đoạn text)
+
+        Args:
+            context_text: Đoạn text gốc
+            top_k: Số lượng kết quả
+            doc_id: Nếu có, chỉ tìm trong document này
+            embedding_service: Embedding service instance
+            category: Nếu có, chỉ tìm trong category này
+            query_embedding: Embedding của đoạn text đã tính sẵn
+
+        Returns:
+            List[Dict]: Danh sách contexts tương tự
+        """
+        # Lấy dư một kết quả: chunk chứa chính đoạn text thường đứng đầu
+        results = self.search_text(
+            context_text, top_k + 1, doc_id, category, embedding_service, query_embedding=query_embedding
+        )
+        normalized_text = context_text.strip()
+        return [result for result in results if result.get("content", "").strip() != normalized_text][:top_k]
+
+    def get_contexts_by_document(self, doc_id: str) -> List[Dict[str, Any]]:
+        """
+        Lấy tất cả contexts (chunks) của một document theo thứ tự chunk
+
+        Args:
+            doc_id: ID của document
+
+        Returns:
+            List[Dict]: Danh sách contexts
+        """
+        return self.get_document_chunks(doc_id)
+
+    def get_document_vectors(self, doc_id: str) -> List[Dict[str, Any]]:
+        """
+        Lấy thông tin vectors của một document (metadata, không kèm vector data)
+
+        Args:
+            doc_id: ID của document
+
+        Returns:
+            List[Dict]: Metadata từng vector kèm vector_id và content_length
+        """
+        vectors = []
+        for chunk in self.get_document_chunks(doc_id):
+            chunk.setdefault("vector_id", chunk["vector_index"])
+            chunk["content_length"] = len(chunk["content"])
+            vectors.append(chunk)
+        return vectors
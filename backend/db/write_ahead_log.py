@@ -0,0 +1,155 @@
+"""
+Write-Ahead Log cho FAISS Store
+Ghi append-only các thao tác thêm/xóa giữa hai lần checkpoint để phục hồi sau crash
+"""
+
+import os
+import json
+import struct
+import zlib
+import logging
+import numpy as np
+from typing import Dict, Any, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Header mỗi record: lsn (uint64), độ dài payload (uint32), crc32 của payload (uint32)
+RECORD_HEADER = struct.Struct("<QII")
+# Payload: độ dài phần JSON (uint32) + JSON + vectors float32 (nếu có)
+JSON_LENGTH = struct.Struct("<I")
+
+class WriteAheadLog:
+    def __init__(self, wal_file: str, sync: bool = True):
+        """
+        Khởi tạo WAL
+
+        Args:
+            wal_file: Đường dẫn file log
+            sync: fsync sau mỗi record (mỗi batch) để đảm bảo bền vững khi mất điện
+        """
+        self.wal_file = wal_file
+        self.sync = sync
+        self.last_lsn = 0  # LSN của record cuối cùng đã ghi
+        self.records = 0  # Số record trong file kể từ checkpoint
+        self._file = None
+
+    def open(self):
+        """
+        Mở file log để append; quét file để lấy LSN cuối và cắt record ghi dở
+        """
+        if self._file is not None:
+            return
+        valid_size = 0
+        records = 0
+        if os.path.exists(self.wal_file):
+            for lsn, _, _, end_offset in self._scan():
+                self.last_lsn = max(self.last_lsn, lsn)
+                valid_size = end_offset
+                records += 1
+            if os.path.getsize(self.wal_file) > valid_size:
+                logger.warning(f"⚠️ Truncating torn WAL tail at offset {valid_size}")
+                with open(self.wal_file, "r+b") as f:
+                    f.truncate(valid_size)
+        self.records = records
+        self._file = open(self.wal_file, "ab")
+
+    def close(self):
+        """
+        Đóng file log
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def append(self, operation: Dict[str, Any], vectors: Optional[np.ndarray] = None) -> int:
+        """
+        Ghi một thao tác vào log
+
+        Args:
+            operation: Mô tả thao tác (JSON)
+            vectors: Ma trận vectors float32 đi kèm (thao tác add)
+
+        Returns:
+            int: LSN của record
+        """
+        self.open()
+        header = json.dumps(operation, ensure_ascii=False).encode("utf-8")
+        payload = JSON_LENGTH.pack(len(header)) + header
+        if vectors is not None:
+            payload += np.ascontiguousarray(vectors, dtype=np.float32).tobytes()
+
+        lsn = self.last_lsn + 1
+        self._file.write(RECORD_HEADER.pack(lsn, len(payload), zlib.crc32(payload)) + payload)
+        self._file.flush()
+        if self.sync:
+            os.fsync(self._file.fileno())
+        self.last_lsn = lsn
+        self.records += 1
+        return lsn
+
+    def replay(self, after_lsn: int = 0) -> Iterator[Tuple[int, Dict[str, Any], Optional[np.ndarray]]]:
+        """
+        Đọc các record có LSN lớn hơn after_lsn (phần đuôi chưa checkpoint)
+
+        Yields:
+            (lsn, operation, vectors) - vectors có shape (n, dimension) hoặc None
+        """
+        if not os.path.exists(self.wal_file):
+            return
+        for lsn, operation, vectors, _ in self._scan():
+            if lsn > after_lsn:
+                yield lsn, operation, vectors
+
+    def reset(self, checkpoint_lsn: int):
+        """
+        Xóa nội dung log sau khi checkpoint; LSN tiếp tục tăng từ checkpoint_lsn
+        """
+        self.close()
+        with open(self.wal_file, "wb") as f:
+            f.flush()
+            os.fsync(f.fileno())
+        self.last_lsn = max(self.last_lsn, checkpoint_lsn)
+        self.records = 0
+
+    def size(self) -> int:
+        """
+        Kích thước file log (bytes)
+        """
+        return os.path.getsize(self.wal_file) if os.path.exists(self.wal_file) else 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Thống kê WAL
+        """
+        return {
+            "wal_file": self.wal_file,
+            "wal_bytes": self.size(),
+            "wal_records": self.records,
+            "last_lsn": self.last_lsn,
+            "sync": self.sync
+        }
+
+    def _scan(self) -> Iterator[Tuple[int, Dict[str, Any], Optional[np.ndarray], int]]:
+        """
+        Duyệt các record hợp lệ; dừng ở record đầu tiên bị cắt hoặc sai checksum
+        """
+        with open(self.wal_file, "rb") as f:
+            offset = 0
+            while True:
+                header = f.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    return
+                lsn, length, crc = RECORD_HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    return
+                offset += RECORD_HEADER.size + length
+
+                (json_length,) = JSON_LENGTH.unpack_from(payload)
+                json_end = JSON_LENGTH.size + json_length
+                operation = json.loads(payload[JSON_LENGTH.size:json_end].decode("utf-8"))
+                vectors = None
+                if json_end < length:
+                    vectors = np.frombuffer(payload, dtype=np.float32, offset=json_end)
+                    vectors = vectors.reshape(-1, operation["dimension"])
+                yield lsn, operation, vectors, offset
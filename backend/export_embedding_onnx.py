@@ -0,0 +1,96 @@
+"""
+Export embedding model sang ONNX (fp32 + int8) cho backend EMBEDDING_BACKEND=onnx
+Sau khi export, kiểm tra cosine similarity giữa embeddings ONNX và PyTorch trên một tập texts mẫu
+"""
+
+import os
+import sys
+import json
+import argparse
+import logging
+
+# Add backend to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.onnx_embedding import (
+    EXPORT_CONFIG_FILE, OnnxEmbeddingModel, embedding_parity, export_onnx_model
+)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+SAMPLE_TEXTS = [
+    "Điều 5. Các hành vi bị nghiêm cấm trong lĩnh vực an toàn thông tin mạng",
+    "Tổ chức, cá nhân có trách nhiệm bảo vệ thông tin cá nhân của mình",
+    "Hệ thống thông tin cấp độ 3 phải được kiểm tra, đánh giá an toàn thông tin định kỳ hằng năm",
+    "Mã độc là phần mềm có khả năng gây ra hoạt động không bình thường cho một phần hay toàn bộ hệ thống",
+    "Firewall kiểm soát lưu lượng mạng vào ra dựa trên các quy tắc bảo mật đã định nghĩa",
+    "Phishing là hình thức lừa đảo nhằm đánh cắp thông tin đăng nhập của người dùng",
+    "Mật khẩu phải có tối thiểu 12 ký tự, gồm chữ hoa, chữ thường, chữ số và ký tự đặc biệt",
+    "Sự cố an toàn thông tin mạng phải được báo cáo cho cơ quan chức năng trong vòng 24 giờ",
+    "Encryption protects data confidentiality both at rest and in transit",
+    "xin chào"
+]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export embedding model sang ONNX và kiểm tra parity với PyTorch")
+    parser.add_argument("--model-path", default="models/embedding", help="Thư mục model sentence-transformers")
+    parser.add_argument("--output-dir", default="models/embedding_onnx", help="Thư mục ghi model ONNX")
+    parser.add_argument("--no-quantize", action="store_true", help="Chỉ export fp32, không tạo bản int8")
+    parser.add_argument("--opset", type=int, default=17, help="ONNX opset")
+    parser.add_argument("--parity-texts", help="File texts kiểm tra parity (mỗi dòng một text)")
+    parser.add_argument("--min-cosine", type=float, default=0.99, help="Cosine tối thiểu giữa ONNX và PyTorch")
+    parser.add_argument("--threads", type=int, help="Số intra-op threads của ONNX Runtime")
+    parser.add_argument("--skip-export", action="store_true", help="Chỉ kiểm tra parity với model đã export")
+    return parser.parse_args()
+
+def load_parity_texts(path: str = None):
+    if not path:
+        return SAMPLE_TEXTS
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+def main():
+    args = parse_args()
+
+    print("🔄 Embedding ONNX Export")
+    print("=" * 50)
+
+    if args.skip_export:
+        with open(os.path.join(args.output_dir, EXPORT_CONFIG_FILE), 'r', encoding='utf-8') as f:
+            export_config = json.load(f)
+    else:
+        export_config = export_onnx_model(
+            args.model_path, args.output_dir, quantize=not args.no_quantize, opset=args.opset
+        )
+    print(f"✅ Exported: {', '.join(export_config['files'].values())} to {args.output_dir}")
+
+    # Embeddings tham chiếu từ PyTorch (cùng prefix E5 như EmbeddingService)
+    from sentence_transformers import SentenceTransformer
+
+    texts = ["query: " + text for text in load_parity_texts(args.parity_texts)]
+    reference = SentenceTransformer(args.model_path, device="cpu").encode(
+        texts, convert_to_numpy=True, show_progress_bar=False, batch_size=8
+    )
+
+    print(f"\n🧪 Parity check on {len(texts)} texts (min cosine {args.min_cosine})")
+    parity = {}
+    for variant in export_config["files"]:
+        model = OnnxEmbeddingModel(args.output_dir, quantized=variant == "int8", intra_op_threads=args.threads)
+        parity[variant] = embedding_parity(reference, model.encode(texts, batch_size=8))
+        status = "✅" if parity[variant]["min_cosine"] >= args.min_cosine else "❌"
+        print(f"{status} {variant}: min cosine {parity[variant]['min_cosine']:.6f}, "
+              f"mean {parity[variant]['mean_cosine']:.6f}, max abs diff {parity[variant]['max_abs_diff']:.6f}")
+
+    export_config["parity"] = {**parity, "min_cosine_threshold": args.min_cosine}
+    with open(os.path.join(args.output_dir, EXPORT_CONFIG_FILE), 'w', encoding='utf-8') as f:
+        json.dump(export_config, f, indent=2)
+
+    if any(result["min_cosine"] < args.min_cosine for result in parity.values()):
+        raise SystemExit("❌ ONNX embeddings diverge from PyTorch, do not switch EMBEDDING_BACKEND to onnx")
+    print("\n✅ ONNX model ready: set EMBEDDING_BACKEND=onnx")
+
+if __name__ == "__main__":
+    main()
@@ -16,7 +16,7 @@ from routers import health, documents, chat, embedding, search, chat_sessions, d
 # Import services
 from services.model_manager import ModelManager
 from services.config import Settings
-from services.embedding_service import embedding_service
+from services.embedding_service import embedding_service, embedding_batcher
 from services.llm_service import llm_service
 from services.chat_session_service import chat_session_service
 from services.rag_service import rag_service
@@ -104,6 +104,7 @@ async def shutdown_event():
     """Cleanup khi shutdown app"""
     print("🛑 Shutting down RAG + LLM Chatbot API...")
     await model_manager.cleanup()
+    await embedding_batcher.stop()
     await embedding_service.cleanup()
     await llm_service.cleanup()
     await chat_session_service.cleanup()
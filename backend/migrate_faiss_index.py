@@ -0,0 +1,95 @@
+"""
+Migration script cho FAISS index
+Rebuild index hiện có (ví dụ IndexFlatIP) thành index nén/xấp xỉ: SQ8, fp16, HNSW, IVF-Flat, IVF-PQ, OPQ+IVF-PQ
+và tùy chọn cắt chiều index cho two-stage search (--coarse-dimension)
+"""
+
+import os
+import sys
+import argparse
+import logging
+
+# Add backend to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from db.faiss_store import FAISSStore
+from db.sharded_store import PARTITIONS, ShardedFAISSStore
+from db.index_factory import INDEX_TYPES
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Migrate FAISS index sang loại index khác")
+    parser.add_argument("--index-type", required=True, choices=INDEX_TYPES, help="Loại index đích")
+    parser.add_argument("--index-path", default="data/faiss_index", help="Thư mục FAISS index")
+    parser.add_argument("--metadata-path", default="data/metadata", help="Thư mục metadata")
+    parser.add_argument("--dimension", type=int, default=1024, help="Dimension của vector")
+    parser.add_argument("--shard-by", default=os.getenv("FAISS_SHARD_BY", ""), choices=("",) + PARTITIONS,
+                        help="Store chia shard (mặc định theo FAISS_SHARD_BY)")
+    parser.add_argument("--num-shards", type=int, default=int(os.getenv("FAISS_NUM_SHARDS", "4")),
+                        help="Số shard khi chia theo hash")
+    parser.add_argument("--nlist", type=int, help="Số cluster IVF")
+    parser.add_argument("--nprobe", type=int, help="Số cluster quét mặc định khi search (IVF)")
+    parser.add_argument("--hnsw-m", type=int, help="Số neighbor mỗi node (HNSW)")
+    parser.add_argument("--ef-construction", type=int, help="efConstruction (HNSW)")
+    parser.add_argument("--ef-search", type=int, help="efSearch mặc định (HNSW)")
+    parser.add_argument("--pq-m", type=int, help="Số sub-quantizer (PQ)")
+    parser.add_argument("--train-sample-size", type=int, help="Số vector tối đa dùng để train")
+    parser.add_argument("--coarse-dimension", type=int,
+                        help="Two-stage search: số chiều giữ trong index (bằng --dimension để tắt)")
+    parser.add_argument("--backup-path", help="Backup store trước khi migrate")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+
+    print("🔄 FAISS Index Migration")
+    print("=" * 50)
+
+    if args.shard_by:
+        store = ShardedFAISSStore(
+            index_path=args.index_path,
+            metadata_path=args.metadata_path,
+            dimension=args.dimension,
+            partition=args.shard_by,
+            num_shards=args.num_shards
+        )
+    else:
+        store = FAISSStore(
+            index_path=args.index_path,
+            metadata_path=args.metadata_path,
+            dimension=args.dimension
+        )
+    store.load_index()
+
+    before = store.get_stats()
+    print(f"Current index: {before['index_type']} ({before['total_vectors']} vectors)")
+
+    if args.backup_path:
+        store.backup(args.backup_path)
+        print(f"💾 Backed up store to {args.backup_path}")
+
+    store.migrate_index(
+        args.index_type,
+        index_params={
+            "nlist": args.nlist,
+            "nprobe": args.nprobe,
+            "hnsw_m": args.hnsw_m,
+            "ef_construction": args.ef_construction,
+            "ef_search": args.ef_search,
+            "pq_m": args.pq_m,
+            "train_sample_size": args.train_sample_size
+        },
+        coarse_dimension=args.coarse_dimension
+    )
+    store.save_index()
+
+    after = store.get_stats()
+    layout = after.get("faiss_class") or f"{after.get('num_shards')} shards"
+    print(f"✅ Migrated to {after['index_type']} ({layout}, {after['total_vectors']} vectors)")
+
+if __name__ == "__main__":
+    main()
@@ -12,9 +12,11 @@ import time
 import logging
 import json
 import asyncio
+import numpy as np
 
 # Import services
-from services.embedding_service import embedding_service
+from services.embedding_service import embedding_service, embedding_batcher
+from services.stage_executor import faiss_executor, get_stage_stats, StageOverloadedError
 from services.llm_service import llm_service
 from services.security_filter import security_filter
 from services.chat_session_service import chat_session_service
@@ -40,6 +42,7 @@ class ChatRequest(BaseModel):
     temperature: float = 0.7
     top_k: int = 5  # Số chunks liên quan nhất
     memory_limit: int = 5  # Số tin nhắn gần nhất để lấy từ lịch sử
+    context_window: int = 1  # Số chunks lân cận mỗi phía của mỗi chunk tìm được (0 để tắt)
 
 class ChatResponse(BaseModel):
     """Response model cho chat"""
@@ -76,17 +79,51 @@ def create_context_from_sources(sources: List[Dict[str, Any]]) -> str:
     
     context_parts = []
     for i, source in enumerate(sources, 1):
-        content = source.get("content", "")
+        # Kết quả đã mở rộng (expand_with_context) mang nội dung cả cửa sổ chunks
+        content = source.get("context", source.get("content", ""))
         filename = source.get("filename", "Unknown")
-        chunk_index = source.get("chunk_index", 0)
+        start, end = source.get("context_window", [source.get("chunk_index", 0)] * 2)
+        location = f"đoạn {start + 1}" if start == end else f"đoạn {start + 1}-{end + 1}"
         
         context_parts.append(
             f"[{i}] {content}\n"
-            f"    (Nguồn: {filename}, đoạn {chunk_index + 1})"
+            f"    (Nguồn: {filename}, {location})"
         )
     
     return "\n\n".join(context_parts)
 
+def search_relevant_chunks(question: str, request: ChatRequest, query_embedding: np.ndarray) -> List[Dict[str, Any]]:
+    """
+    Search chunks liên quan (blocking, chạy trên thread pool FAISS)
+    
+    Args:
+        question: Câu hỏi
+        request: Chat request (top_k, doc_id, category, context_window)
+        query_embedding: Embedding của câu hỏi
+        
+    Returns:
+        List[Dict]: Kết quả search (đã mở rộng context nếu context_window > 0)
+    """
+    search_results = faiss_store.search_text(
+        query_text=question,
+        top_k=request.top_k,
+        doc_id=request.doc_id,
+        category=request.category,
+        embedding_service=embedding_service,
+        query_embedding=query_embedding
+    )
+    if search_results and request.context_window > 0:
+        # Mỗi hit kèm các chunks lân cận trong document (cửa sổ chồng lấp được gộp)
+        search_results = faiss_store.expand_with_context([search_results], request.context_window)[0]
+    return search_results
+
+async def search_chunks(question: str, request: ChatRequest) -> List[Dict[str, Any]]:
+    """
+    Encode câu hỏi qua micro-batcher rồi search trên thread pool FAISS (không chặn event loop)
+    """
+    query_embedding = await embedding_batcher.embed(question)
+    return await faiss_executor.run(search_relevant_chunks, question, request, query_embedding)
+
 @router.post("/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest) -> ChatResponse:
     """
@@ -128,18 +165,12 @@ async def chat(request: ChatRequest) -> ChatResponse:
         
         # Step 1: Search relevant chunks
         logger.info(f"🔍 Searching for relevant chunks...")
-        search_results = faiss_store.search_text(
-            query_text=question,
-            top_k=request.top_k,
-            doc_id=request.doc_id,
-            category=request.category,
-            embedding_service=embedding_service
-        )
+        search_results = await search_chunks(question, request)
         
         if not search_results:
             logger.warning("⚠️ No relevant chunks found")
             # Generate answer without context
-            response = llm_service.generate_answer(question, "")
+            response = await llm_service.generate_answer_async(question, "")
             sources = []
         else:
             # Step 2: Create context from chunks
@@ -157,7 +188,7 @@ async def chat(request: ChatRequest) -> ChatResponse:
             
             # Step 4: Generate answer with full context (including memory)
             logger.info("🤖 Generating answer with LLM and memory...")
-            response = llm_service.generate_answer(question, full_context)
+            response = await llm_service.generate_answer_async(question, full_context)
             
             # Step 5: Format sources
             sources = []
@@ -165,7 +196,7 @@ async def chat(request: ChatRequest) -> ChatResponse:
                 source = {
                     "content": result.get("content", "")[:200] + "...",  # Preview
                     "similarity_score": result.get("similarity_score", 0.0),
-                    "document_id": result.get("document_id", ""),
+                    "document_id": result.get("doc_id", ""),
                     "chunk_id": result.get("chunk_id", ""),
                     "filename": result.get("filename", ""),
                     "chunk_index": result.get("chunk_index", 0)
@@ -196,6 +227,9 @@ async def chat(request: ChatRequest) -> ChatResponse:
         
     except HTTPException:
         raise
+    except StageOverloadedError as e:
+        logger.warning(f"⚠️ Error in chat: {e}")
+        raise HTTPException(status_code=503, detail=f"Hệ thống đang quá tải, vui lòng thử lại: {str(e)}")
     except Exception as e:
         logger.error(f"❌ Error in chat: {e}")
         raise HTTPException(
@@ -278,13 +312,7 @@ async def stream_chat(request: ChatRequest):
             logger.info(f"💾 Saved user message to session: {request.session_id}")
         
         # Step 1: Search relevant chunks
-        search_results = faiss_store.search_text(
-            query_text=question,
-            top_k=request.top_k,
-            doc_id=request.doc_id,
-            category=request.category,
-            embedding_service=embedding_service
-        )
+        search_results = await search_chunks(question, request)
         
         # Step 2: Create context from chunks
         retrieved_context = create_context_from_sources(search_results) if search_results else ""
@@ -297,7 +325,10 @@ async def stream_chat(request: ChatRequest):
             memory_limit=request.memory_limit
         )
         
-        # Step 3: Stream response
+        # Step 3.5: Xếp generate vào hàng đợi LLM trước khi trả StreamingResponse: quá tải -> 503 thay vì lỗi giữa stream
+        answer_future = llm_service.submit_answer(question, full_context)
+        
+        # Step 4: Stream response
         async def generate_stream():
             try:
                 # Send initial metadata
@@ -305,7 +336,7 @@ async def stream_chat(request: ChatRequest):
                 
                 # Stream response tokens
                 full_response = ""
-                for token in llm_service.generate_answer_with_streaming(question, full_context):
+                async for token in llm_service.generate_answer_with_streaming(question, full_context, answer_future=answer_future):
                     full_response += token
                     yield f"data: {json.dumps({'type': 'token', 'content': token})}\n\n"
                 
@@ -324,6 +355,9 @@ async def stream_chat(request: ChatRequest):
             except Exception as e:
                 logger.error(f"❌ Error in streaming: {e}")
                 yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
+            finally:
+                # Client ngắt kết nối khi việc còn chờ trong hàng đợi -> bỏ việc đó
+                answer_future.cancel()
         
         return StreamingResponse(
             generate_stream(),
@@ -336,6 +370,9 @@ async def stream_chat(request: ChatRequest):
         
     except HTTPException:
         raise
+    except StageOverloadedError as e:
+        logger.warning(f"⚠️ Error in stream chat: {e}")
+        raise HTTPException(status_code=503, detail=f"Hệ thống đang quá tải, vui lòng thử lại: {str(e)}")
     except Exception as e:
         logger.error(f"❌ Error in stream chat: {e}")
         raise HTTPException(
@@ -405,6 +442,7 @@ async def get_chat_stats():
             "llm_service": llm_info,
             "embedding_service": embedding_info,
             "faiss_store": faiss_stats,
+            "stages": get_stage_stats(),
             "security_filter": security_filter_stats,
             "chat_capabilities": {
                 "text_chat": True,
@@ -14,7 +14,7 @@ from datetime import datetime
 from pathlib import Path
 
 # Import services
-from services.embedding_service import embedding_service
+from services.embedding_service import embedding_service, embedding_batcher
 from db.faiss_store import faiss_store
 
 logger = logging.getLogger(__name__)
@@ -204,17 +204,15 @@ async def embed_document(
                 detail="Số lượng embeddings không khớp với số chunks"
             )
         
-        # Chuẩn bị metadata cho FAISS
+        # Chuẩn bị metadata cho FAISS (schema chung của vector store)
         vectors_metadata = []
         for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
             metadata = {
-                "document_id": document_id,
-                "chunk_id": f"{document_id}_chunk_{i}",
+                "doc_id": document_id,
                 "chunk_index": i,
                 "content": chunk,
-                "content_length": len(chunk),
-                "created_at": datetime.now().isoformat(),
-                "filename": doc_metadata["filename"]
+                "filename": doc_metadata["filename"],
+                "category": doc_metadata.get("category")
             }
             vectors_metadata.append(metadata)
         
@@ -293,6 +291,7 @@ async def get_embedding_stats() -> JSONResponse:
         stats = {
             "faiss_store": faiss_stats,
             "embedding_service": embedding_info,
+            "embedding_batcher": embedding_batcher.get_stats(),
             "documents": {
                 "total_documents": len(documents_metadata),
                 "processed_documents": len([
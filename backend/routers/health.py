@@ -32,6 +32,21 @@ async def health_check() -> Dict[str, Any]:
         "version": "1.0.0"
     }
 
+@router.get("/health/stages")
+async def stage_health() -> Dict[str, Any]:
+    """
+    Queue depth của các stage inference (FAISS search, embedding, LLM)
+    Returns:
+        Dict: Gauges từng stage và hàng đợi micro-batch embedding
+    """
+    from services.stage_executor import get_stage_stats
+    from services.embedding_service import embedding_batcher
+    
+    return {
+        "stages": get_stage_stats(),
+        "embedding_batcher": embedding_batcher.get_stats()
+    }
+
 @router.get("/health/detailed")
 async def detailed_health_check():
     """
@@ -5,24 +5,30 @@ API tìm kiếm vector và context
 
 from fastapi import APIRouter, HTTPException, Depends
 from fastapi.responses import JSONResponse
-from typing import List, Dict, Any, Optional
-from pydantic import BaseModel
+from typing import Callable, List, Dict, Any, Optional
+from pydantic import BaseModel, Field
 import logging
 import numpy as np
 
 # Import services
-from services.embedding_service import embedding_service
+from services.embedding_service import embedding_service, embedding_batcher
+from services.stage_executor import faiss_executor, get_stage_stats, StageOverloadedError
 from db.faiss_store import faiss_store
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Số queries tối đa trong một request batch search và top_k tối đa mỗi query (queries * top_k kết quả)
+MAX_BATCH_QUERIES = 128
+MAX_BATCH_TOP_K = 100
+
 class SearchRequest(BaseModel):
     """Request model cho search"""
     query: str
     top_k: int = 5
     doc_id: Optional[str] = None
+    context_window: int = Field(1, ge=0)  # Số chunks lân cận mỗi phía của mỗi hit (0 để tắt)
 
 class SearchResponse(BaseModel):
     """Response model cho search"""
@@ -31,11 +37,35 @@ class SearchResponse(BaseModel):
     total_found: int
     search_time: float
 
+class BatchSearchRequest(BaseModel):
+    """Request model cho batch search"""
+    queries: List[str]
+    top_k: int = Field(5, ge=1, le=MAX_BATCH_TOP_K)
+    doc_id: Optional[str] = None
+    category: Optional[str] = None
+
+class BatchSearchResponse(BaseModel):
+    """Response model cho batch search"""
+    results: List[SearchResponse]
+    total_queries: int
+    search_time: float
+
 class VectorSearchRequest(BaseModel):
     """Request model cho vector search"""
     vector: List[float]
     top_k: int = 5
     doc_id: Optional[str] = None
+    context_window: int = Field(1, ge=0)  # Số chunks lân cận mỗi phía của mỗi hit
+
+def _search_with_context(search: Callable, context_window: int, **kwargs) -> List[Dict[str, Any]]:
+    """
+    Chạy search (blocking, trên thread pool FAISS) rồi mở rộng mỗi hit thành ±context_window
+    chunks lân cận trong document (context_window = 0 thì trả hits như cũ)
+    """
+    results = search(**kwargs)
+    if results and context_window > 0:
+        results = faiss_store.expand_with_context([results], context_window)[0]
+    return results
 
 @router.post("/search/text", response_model=SearchResponse)
 async def search_text(request: SearchRequest) -> SearchResponse:
@@ -53,11 +83,19 @@ async def search_text(request: SearchRequest) -> SearchResponse:
             )
         
         # Search using FAISS store
-        results = faiss_store.search_text(
+        # Encode qua micro-batcher: queries đồng thời dùng chung một lần forward model
+        query_embedding = await embedding_batcher.embed(request.query.strip())
+        
+        # Search (kèm chunks lân cận) trên thread pool FAISS, event loop không bị chặn
+        results = await faiss_executor.run(
+            _search_with_context,
+            faiss_store.search_text,
+            request.context_window,
             query_text=request.query.strip(),
             top_k=request.top_k,
             doc_id=request.doc_id,
-            embedding_service=embedding_service
+            embedding_service=embedding_service,
+            query_embedding=query_embedding
         )
         
         search_time = time.time() - start_time
@@ -73,6 +111,9 @@ async def search_text(request: SearchRequest) -> SearchResponse:
         
     except HTTPException:
         raise
+    except StageOverloadedError as e:
+        logger.warning(f"⚠️ Error in text search: {e}")
+        raise HTTPException(status_code=503, detail=f"Hệ thống đang quá tải, vui lòng thử lại: {str(e)}")
     except Exception as e:
         logger.error(f"❌ Error in text search: {e}")
         raise HTTPException(
@@ -80,6 +121,71 @@ async def search_text(request: SearchRequest) -> SearchResponse:
             detail=f"Lỗi khi tìm kiếm: {str(e)}"
         )
 
+@router.post("/search/batch", response_model=BatchSearchResponse)
+async def search_batch(request: BatchSearchRequest) -> BatchSearchResponse:
+    """
+    Tìm kiếm nhiều text queries trong một request (encode một lần, search một lần)
+    """
+    try:
+        import time
+        start_time = time.time()
+        
+        queries = [query.strip() for query in request.queries]
+        if not queries or any(not query for query in queries):
+            raise HTTPException(
+                status_code=400,
+                detail="Danh sách queries không được rỗng và không chứa query trống"
+            )
+        
+        if len(queries) > MAX_BATCH_QUERIES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Tối đa {MAX_BATCH_QUERIES} queries mỗi request, nhận được {len(queries)}"
+            )
+        
+        # Encode qua micro-batcher, search một lần trên thread pool FAISS
+        query_embeddings = await embedding_batcher.embed_many(queries)
+        query_vectors = np.stack([
+            embedding_service.normalize_embedding(embedding) for embedding in query_embeddings
+        ]).astype(np.float32)
+        batch_results = await faiss_executor.run(
+            faiss_store.search_batch,
+            query_vectors,
+            request.top_k,
+            request.doc_id,
+            request.category
+        )
+        
+        search_time = time.time() - start_time
+        
+        logger.info(f"✅ Batch search completed: {len(queries)} queries in {search_time:.3f}s")
+        
+        return BatchSearchResponse(
+            results=[
+                SearchResponse(
+                    query=query,
+                    results=results,
+                    total_found=len(results),
+                    search_time=search_time
+                )
+                for query, results in zip(request.queries, batch_results)
+            ],
+            total_queries=len(queries),
+            search_time=search_time
+        )
+        
+    except HTTPException:
+        raise
+    except StageOverloadedError as e:
+        logger.warning(f"⚠️ Error in batch search: {e}")
+        raise HTTPException(status_code=503, detail=f"Hệ thống đang quá tải, vui lòng thử lại: {str(e)}")
+    except Exception as e:
+        logger.error(f"❌ Error in batch search: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Lỗi khi tìm kiếm batch: {str(e)}"
+        )
+
 @router.post("/search/vector", response_model=SearchResponse)
 async def search_vector(request: VectorSearchRequest) -> SearchResponse:
     """
@@ -106,10 +212,12 @@ async def search_vector(request: VectorSearchRequest) -> SearchResponse:
             )
         
         # Search using FAISS store
-        results = faiss_store.search_with_context(
+        results = await faiss_executor.run(
+            faiss_store.search_with_context,
             query_vector=query_vector,
             top_k=request.top_k,
-            doc_id=request.doc_id
+            doc_id=request.doc_id,
+            window=request.context_window
         )
         
         search_time = time.time() - start_time
@@ -125,6 +233,9 @@ async def search_vector(request: VectorSearchRequest) -> SearchResponse:
         
     except HTTPException:
         raise
+    except StageOverloadedError as e:
+        logger.warning(f"⚠️ Error in vector search: {e}")
+        raise HTTPException(status_code=503, detail=f"Hệ thống đang quá tải, vui lòng thử lại: {str(e)}")
     except Exception as e:
         logger.error(f"❌ Error in vector search: {e}")
         raise HTTPException(
@@ -138,7 +249,7 @@ async def search_document_contexts(document_id: str) -> JSONResponse:
     Lấy tất cả contexts của một document
     """
     try:
-        contexts = faiss_store.get_contexts_by_document(document_id)
+        contexts = await faiss_executor.run(faiss_store.get_contexts_by_document, document_id)
         
         return JSONResponse(
             status_code=200,
@@ -149,6 +260,9 @@ async def search_document_contexts(document_id: str) -> JSONResponse:
             }
         )
         
+    except StageOverloadedError as e:
+        logger.warning(f"⚠️ Error getting document contexts: {e}")
+        raise HTTPException(status_code=503, detail=f"Hệ thống đang quá tải, vui lòng thử lại: {str(e)}")
     except Exception as e:
         logger.error(f"❌ Error getting document contexts: {e}")
         raise HTTPException(
@@ -172,11 +286,16 @@ async def search_similar_contexts(request: SearchRequest) -> SearchResponse:
             )
         
         # Search similar contexts
-        results = faiss_store.search_similar_contexts(
+        query_embedding = await embedding_batcher.embed(request.query.strip())
+        results = await faiss_executor.run(
+            _search_with_context,
+            faiss_store.search_similar_contexts,
+            request.context_window,
             context_text=request.query.strip(),
             top_k=request.top_k,
             doc_id=request.doc_id,
-            embedding_service=embedding_service
+            embedding_service=embedding_service,
+            query_embedding=query_embedding
         )
         
         search_time = time.time() - start_time
@@ -192,6 +311,9 @@ async def search_similar_contexts(request: SearchRequest) -> SearchResponse:
         
     except HTTPException:
         raise
+    except StageOverloadedError as e:
+        logger.warning(f"⚠️ Error in similar contexts search: {e}")
+        raise HTTPException(status_code=503, detail=f"Hệ thống đang quá tải, vui lòng thử lại: {str(e)}")
     except Exception as e:
         logger.error(f"❌ Error in similar contexts search: {e}")
         raise HTTPException(
@@ -209,8 +331,11 @@ async def get_search_stats() -> JSONResponse:
         
         stats = {
             "faiss_store": faiss_stats,
+            "embedding_batcher": embedding_batcher.get_stats(),
+            "stages": get_stage_stats(),
             "search_capabilities": {
                 "text_search": True,
+                "batch_search": True,
                 "vector_search": True,
                 "document_filter": True,
                 "similarity_search": True
@@ -229,6 +354,46 @@ async def get_search_stats() -> JSONResponse:
             detail=f"Lỗi khi lấy thống kê: {str(e)}"
         )
 
+@router.get("/search/compaction")
+async def get_compaction_status() -> JSONResponse:
+    """
+    Trạng thái tombstones và compaction của index
+    """
+    try:
+        return JSONResponse(
+            status_code=200,
+            content=faiss_store.get_compaction_status()
+        )
+    
+    except Exception as e:
+        logger.error(f"❌ Error getting compaction status: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Lỗi khi lấy trạng thái compaction: {str(e)}"
+        )
+
+@router.post("/search/compaction")
+async def start_compaction() -> JSONResponse:
+    """
+    Chạy compaction trong background (không chờ xong), theo dõi qua GET /search/compaction
+    """
+    try:
+        started = faiss_store.start_compaction()
+        return JSONResponse(
+            status_code=202 if started else 200,
+            content={
+                "started": started,
+                "status": faiss_store.get_compaction_status()
+            }
+        )
+    
+    except Exception as e:
+        logger.error(f"❌ Error starting compaction: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Lỗi khi chạy compaction: {str(e)}"
+        )
+
 @router.post("/search/embed")
 async def embed_and_search(request: SearchRequest) -> SearchResponse:
     """
@@ -245,14 +410,16 @@ async def embed_and_search(request: SearchRequest) -> SearchResponse:
             )
         
         # Generate embedding
-        embedding = embedding_service.generate_embedding(request.query.strip())
-        query_vector = np.array(embedding, dtype=np.float32)
+        embedding = await embedding_batcher.embed(request.query.strip())
+        query_vector = np.array(embedding_service.normalize_embedding(embedding), dtype=np.float32)
         
         # Search with context
-        results = faiss_store.search_with_context(
+        results = await faiss_executor.run(
+            faiss_store.search_with_context,
             query_vector=query_vector,
             top_k=request.top_k,
-            doc_id=request.doc_id
+            doc_id=request.doc_id,
+            window=request.context_window
         )
         
         search_time = time.time() - start_time
@@ -268,6 +435,9 @@ async def embed_and_search(request: SearchRequest) -> SearchResponse:
         
     except HTTPException:
         raise
+    except StageOverloadedError as e:
+        logger.warning(f"⚠️ Error in embed and search: {e}")
+        raise HTTPException(status_code=503, detail=f"Hệ thống đang quá tải, vui lòng thử lại: {str(e)}")
     except Exception as e:
         logger.error(f"❌ Error in embed and search: {e}")
         raise HTTPException(
@@ -28,6 +28,9 @@ class DataInitializationService:
         self.embedding_service = None
         self.vector_service = None
         self.pdf_processor = None
+        # Số worker processes encode dữ liệu ban đầu (0 = encode trong API process)
+        self.embedding_pool_workers = int(os.getenv("EMBEDDING_POOL_WORKERS", "0"))
+        self.embedding_pool_chunk_size = int(os.getenv("EMBEDDING_POOL_CHUNK_SIZE", "256"))
         
     async def initialize(self, embedding_service, vector_service, pdf_processor):
         """Khởi tạo service với dependencies"""
@@ -78,6 +81,16 @@ class DataInitializationService:
             total_documents = 0
             total_chunks = 0
             
+            # Worker pool chỉ sống trong lúc load dữ liệu ban đầu (giải phóng RAM của các bản model sau đó)
+            if self.embedding_pool_workers > 0:
+                try:
+                    self.embedding_service.start_pool(
+                        self.embedding_pool_workers,
+                        chunk_size=self.embedding_pool_chunk_size
+                    )
+                except Exception as e:
+                    logger.warning(f"⚠️ Embedding pool not available, encoding in-process: {e}")
+            
             # Load từng category
             for category_name, category_path in self.categories.items():
                 if category_name == "Uploads":
@@ -100,15 +113,19 @@ class DataInitializationService:
                 else:
                     logger.warning(f"⚠️ Category directory not found: {category_full_path}")
             
+            self.embedding_service.stop_pool()
+            
             logger.info(f"🎉 Initial data loading completed: {total_documents} documents, {total_chunks} chunks")
             
         except Exception as e:
             logger.error(f"❌ Error loading initial data: {e}")
+            self.embedding_service.stop_pool()
             raise
     
     async def _process_category(self, category_path: str, category_name: str) -> tuple[int, int]:
         """
         Xử lý tất cả tài liệu trong một category
+        Chunks của cả category được encode trong một lần bulk ingestion (chia cho worker pool nếu có)
         
         Args:
             category_path: Đường dẫn thư mục category
@@ -118,60 +135,48 @@ class DataInitializationService:
             tuple[int, int]: (số documents, số chunks)
         """
         try:
-            documents_processed = 0
-            chunks_created = 0
-            
-            # Tìm tất cả files trong category
-            files = self._find_documents(category_path)
+            documents = await self._collect_category_documents(category_path, category_name)
             
-            if not files:
+            if not documents:
                 logger.info(f"📂 No documents found in category: {category_name}")
                 return 0, 0
             
-            logger.info(f"📄 Found {len(files)} documents in category: {category_name}")
-            
-            # Xử lý từng file
-            for file_path in files:
-                try:
-                    logger.info(f"🔄 Processing document: {os.path.basename(file_path)}")
-                    
-                    # Extract text from document
-                    text_content = await self._extract_text_from_file(file_path)
-                    
-                    if text_content and text_content.strip():
-                        # Create document ID
-                        doc_id = self._generate_document_id(file_path, category_name)
-                        
-                        # Add to vector store with category metadata
-                        chunks = await self.vector_service.add_document(
-                            text=text_content,
-                            doc_id=doc_id,
-                            metadata={
-                                "category": category_name,
-                                "filename": os.path.basename(file_path),
-                                "file_path": file_path,
-                                "source": "initial_data",
-                                "processed_at": datetime.now().isoformat()
-                            }
-                        )
-                        
-                        documents_processed += 1
-                        chunks_created += len(chunks)
-                        
-                        logger.info(f"✅ Processed: {os.path.basename(file_path)} -> {len(chunks)} chunks")
-                    else:
-                        logger.warning(f"⚠️ No text extracted from: {os.path.basename(file_path)}")
-                        
-                except Exception as e:
-                    logger.error(f"❌ Error processing document {file_path}: {e}")
-                    continue
-            
-            return documents_processed, chunks_created
+            result = self.vector_service.add_documents_batch(documents)
+            return len(result["chunk_ids"]), result["total_chunks"]
             
         except Exception as e:
             logger.error(f"❌ Error processing category {category_name}: {e}")
             return 0, 0
     
+    async def _collect_category_documents(self, category_path: str, category_name: str) -> List[Dict[str, Any]]:
+        """
+        Trích xuất text và chia chunks cho tất cả tài liệu trong category
+        
+        Args:
+            category_path: Đường dẫn thư mục category
+            category_name: Tên category
+            
+        Returns:
+            List[Dict]: Danh sách {"doc_id", "chunks", "filename", "category"}
+        """
+        documents = []
+        for file_path in self._find_documents(category_path):
+            text_content = await self._extract_text_from_file(file_path)
+            
+            if not text_content or not text_content.strip():
+                logger.warning(f"⚠️ No text extracted from: {os.path.basename(file_path)}")
+                continue
+            
+            documents.append({
+                "doc_id": self._generate_document_id(file_path, category_name),
+                "chunks": self.vector_service.chunk_text(text_content),
+                "filename": os.path.basename(file_path),
+                "category": category_name
+            })
+        
+        logger.info(f"📄 Collected {len(documents)} documents in category: {category_name}")
+        return documents
+    
     def _find_documents(self, directory_path: str) -> List[str]:
         """
         Tìm tất cả documents trong thư mục
@@ -397,14 +402,12 @@ class DataInitializationService:
             
             logger.info(f"🔄 Reloading category: {category_name}")
             
-            # Clear existing documents from this category
-            # TODO: Implement clear by category in vector service
-            
-            # Process category
-            documents_processed, chunks_created = await self._process_category(
-                category_path, 
-                category_name
-            )
+            # Đọc và chia chunks trước, sau đó thay dữ liệu cũ của category trong một lần ghi
+            # (store chia shard theo category chỉ ghi vào shard của category này)
+            documents = await self._collect_category_documents(category_path, category_name)
+            result = self.vector_service.reload_category(category_name, documents)
+            documents_processed = len(result["chunk_ids"])
+            chunks_created = result["total_chunks"]
             
             logger.info(f"✅ Reloaded category {category_name}: {documents_processed} documents, {chunks_created} chunks")
             
@@ -412,6 +415,7 @@ class DataInitializationService:
                 "success": True,
                 "category": category_name,
                 "documents_processed": documents_processed,
+                "documents_removed": result["removed_documents"],
                 "chunks_created": chunks_created
             }
             
@@ -0,0 +1,190 @@
+"""
+Embedding Batcher - Micro-batching động trước EmbeddingService
+Các request async đưa text vào hàng đợi; worker gom tối đa max_batch_size texts hoặc chờ tối đa
+max_wait_ms, chạy một lần generate_embeddings_batch rồi trả kết quả cho từng request
+"""
+
+import time
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .stage_executor import StageExecutor
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingBatcher:
+    def __init__(self,
+                 embedding_service,
+                 max_batch_size: int = 32,
+                 max_wait_ms: float = 5.0,
+                 executor: Optional[StageExecutor] = None):
+        """
+        Khởi tạo Embedding Batcher
+
+        Args:
+            embedding_service: Embedding service instance (generate_embeddings_batch)
+            max_batch_size: Số texts tối đa mỗi lần forward model
+            max_wait_ms: Thời gian tối đa chờ gom thêm texts sau text đầu tiên của batch
+            executor: Stage executor chạy model (mặc định một thread inference riêng)
+        """
+        self.embedding_service = embedding_service
+        self.max_batch_size = max(int(max_batch_size), 1)
+        self.max_wait_ms = max(float(max_wait_ms), 0.0)
+
+        # Queue và worker gắn với event loop đang chạy, tạo lazy ở request đầu tiên
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        # Model chỉ forward một batch tại một thời điểm -> một thread inference
+        self._executor = executor or StageExecutor("embedding-batcher", max_workers=1)
+
+        self.metrics = {
+            "batches": 0,
+            "items": 0,
+            "errors": 0,
+            "last_batch_size": 0,
+            "max_observed_batch_size": 0,
+            "total_wait_ms": 0.0,
+            "max_observed_wait_ms": 0.0,
+            "total_encode_ms": 0.0
+        }
+
+        logger.info(f"Embedding Batcher initialized (max_batch_size={self.max_batch_size}, max_wait_ms={self.max_wait_ms})")
+
+    def _ensure_worker(self):
+        """Khởi động worker trên event loop hiện tại (hoặc khởi động lại nếu loop đã đổi)"""
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+    async def embed(self, text: str) -> np.ndarray:
+        """
+        Tạo embedding cho một text qua micro-batch
+
+        Args:
+            text: Đoạn text cần tạo embedding
+
+        Returns:
+            np.ndarray: Vector embedding (như generate_embedding)
+        """
+        return (await self.embed_many([text]))[0]
+
+    async def embed_many(self, texts: List[str]) -> List[np.ndarray]:
+        """
+        Tạo embeddings cho nhiều texts (có thể nằm ở nhiều batch, gộp chung với request khác)
+
+        Args:
+            texts: Danh sách texts
+
+        Returns:
+            List[np.ndarray]: Embeddings theo thứ tự texts
+        """
+        self._ensure_worker()
+        futures = []
+        for text in texts:
+            future = self._loop.create_future()
+            self._queue.put_nowait((text, future, time.perf_counter()))
+            futures.append(future)
+        return list(await asyncio.gather(*futures))
+
+    async def _run(self):
+        """Worker: gom batch theo max_batch_size / max_wait_ms rồi encode"""
+        queue = self._queue
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + self.max_wait_ms / 1000
+            while len(batch) < self.max_batch_size:
+                if not queue.empty():
+                    batch.append(queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            await self._process(batch)
+
+    async def _process(self, batch: List[Tuple[str, asyncio.Future, float]]):
+        """Encode một batch trong thread inference và trả kết quả cho các futures"""
+        # Request đã bị hủy (client ngắt kết nối) thì không encode
+        batch = [item for item in batch if not item[1].done()]
+        if not batch:
+            return
+
+        started = time.perf_counter()
+        wait_ms = (started - min(enqueued_at for _, _, enqueued_at in batch)) * 1000
+        texts = [text for text, _, _ in batch]
+
+        try:
+            embeddings = await self._executor.run(
+                self.embedding_service.generate_embeddings_batch,
+                texts,
+                batch_size=len(texts),
+                show_progress_bar=False
+            )
+        except Exception as e:
+            logger.error(f"❌ Error encoding micro-batch of {len(texts)} texts: {e}")
+            self.metrics["errors"] += 1
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future, _), embedding in zip(batch, embeddings):
+            if not future.done():
+                future.set_result(embedding)
+
+        self.metrics["batches"] += 1
+        self.metrics["items"] += len(batch)
+        self.metrics["last_batch_size"] = len(batch)
+        self.metrics["max_observed_batch_size"] = max(self.metrics["max_observed_batch_size"], len(batch))
+        self.metrics["total_wait_ms"] += wait_ms
+        self.metrics["max_observed_wait_ms"] = max(self.metrics["max_observed_wait_ms"], wait_ms)
+        self.metrics["total_encode_ms"] += (time.perf_counter() - started) * 1000
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Lấy cấu hình và metrics của micro-batcher
+        """
+        batches = self.metrics["batches"]
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "batches": batches,
+            "items": self.metrics["items"],
+            "errors": self.metrics["errors"],
+            "last_batch_size": self.metrics["last_batch_size"],
+            "max_observed_batch_size": self.metrics["max_observed_batch_size"],
+            "avg_batch_size": round(self.metrics["items"] / batches, 2) if batches else 0.0,
+            "avg_wait_ms": round(self.metrics["total_wait_ms"] / batches, 3) if batches else 0.0,
+            "max_observed_wait_ms": round(self.metrics["max_observed_wait_ms"], 3),
+            "avg_encode_ms": round(self.metrics["total_encode_ms"] / batches, 3) if batches else 0.0
+        }
+
+    async def stop(self):
+        """
+        Dừng worker (texts còn trong hàng đợi nhận lỗi hủy)
+        """
+        if self._worker is not None and not self._worker.done():
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        if self._queue is not None:
+            while not self._queue.empty():
+                _, future, _ = self._queue.get_nowait()
+                future.cancel()
+        self._worker = None
+        logger.info("✅ Embedding Batcher stopped")
@@ -0,0 +1,391 @@
+"""
+Embedding Cache - Cache embeddings theo hash nội dung
+Tầng bộ nhớ (LRU giới hạn số entries) + tầng disk (file vectors đọc bằng mmap + file keys làm hash index,
+giới hạn số entries: vượt ngưỡng thì ghi lại file chỉ giữ các entries dùng gần nhất)
+"""
+
+import os
+import json
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+KEY_SIZE = 16  # bytes của blake2b digest
+
+def normalize_text(text: str) -> str:
+    """
+    Chuẩn hóa text trước khi hash: Unicode NFC + gộp khoảng trắng
+    (tokenizer sentencepiece của E5 cũng chuẩn hóa như vậy nên embedding không đổi)
+    """
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+def make_cache_key(model_id: str, prefix: str, text: str) -> bytes:
+    """
+    Tạo key cache từ (model, prefix, hash text đã chuẩn hóa)
+
+    Args:
+        model_id: Định danh model (đổi model thì key đổi)
+        prefix: Prefix thêm vào text trước khi encode (vd: "query: ")
+        text: Text gốc
+
+    Returns:
+        bytes: Key KEY_SIZE bytes
+    """
+    payload = "\x00".join((model_id, prefix, normalize_text(text))).encode("utf-8")
+    return hashlib.blake2b(payload, digest_size=KEY_SIZE).digest()
+
+class EmbeddingCache:
+    def __init__(self,
+                 dimension: int,
+                 cache_dir: Optional[str] = None,
+                 memory_size: int = 10000,
+                 max_disk_entries: Optional[int] = 200000):
+        """
+        Khởi tạo Embedding Cache
+
+        Args:
+            dimension: Dimension của embedding
+            cache_dir: Thư mục tầng disk (None để chỉ cache trong bộ nhớ)
+            memory_size: Số embeddings tối đa giữ trong LRU bộ nhớ
+            max_disk_entries: Số embeddings tối đa trên disk (None/0 = không giới hạn); vượt ngưỡng thì
+                compact còn 3/4 ngưỡng, giữ các entries được ghi/đọc gần nhất
+        """
+        self.dimension = dimension
+        self.cache_dir = cache_dir
+        self.memory_size = max(int(memory_size), 0)
+        self.max_disk_entries = int(max_disk_entries) if max_disk_entries else None
+
+        self._memory: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._lock = threading.RLock()
+
+        # Tầng disk: vectors.f32 (float32 append-only) + keys.bin (key từng row), mở lazy
+        self._disk_index: Optional[Dict[bytes, int]] = None
+        self._disk_rows = 0
+        self._disk_map: Optional[np.memmap] = None
+        self._keys_file = None
+        self._vectors_file = None
+        # Lần dùng gần nhất của từng row trên disk (chọn entries giữ lại khi compact)
+        self._row_ticks: List[int] = []
+        self._tick = 0
+
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "encoded": 0, "disk_evicted": 0}
+
+    @property
+    def _vectors_path(self) -> str:
+        return os.path.join(self.cache_dir, "vectors.f32")
+
+    @property
+    def _keys_path(self) -> str:
+        return os.path.join(self.cache_dir, "keys.bin")
+
+    @property
+    def _meta_path(self) -> str:
+        return os.path.join(self.cache_dir, "cache_meta.json")
+
+    def _write_meta(self, compacting: bool = False):
+        """Ghi layout của tầng disk; compacting=True đánh dấu đang thay file (crash giữa chừng -> reset khi mở)"""
+        meta = {"dimension": self.dimension, "key_size": KEY_SIZE}
+        if compacting:
+            meta["compacting"] = True
+        tmp_path = self._meta_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._meta_path)
+
+    def _open_disk(self) -> bool:
+        """
+        Mở tầng disk (lần đầu dùng): đọc keys.bin thành hash index key -> row
+
+        Returns:
+            bool: True nếu có tầng disk
+        """
+        if not self.cache_dir:
+            return False
+        if self._disk_index is not None:
+            return True
+
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+            meta = {"dimension": self.dimension, "key_size": KEY_SIZE}
+            if os.path.exists(self._meta_path):
+                with open(self._meta_path, 'r', encoding='utf-8') as f:
+                    if json.load(f) != meta:
+                        logger.warning(f"⚠️ Embedding cache at {self.cache_dir} has different layout, resetting")
+                        for path in (self._vectors_path, self._keys_path):
+                            if os.path.exists(path):
+                                os.remove(path)
+            self._write_meta()
+
+            row_bytes = self.dimension * 4
+            keys_size = os.path.getsize(self._keys_path) if os.path.exists(self._keys_path) else 0
+            vectors_size = os.path.getsize(self._vectors_path) if os.path.exists(self._vectors_path) else 0
+            rows = min(keys_size // KEY_SIZE, vectors_size // row_bytes)
+
+            # Ghi dở khi crash (vector đã ghi nhưng key chưa, hoặc row không đủ bytes) -> cắt về rows đầy đủ
+            for path, size, expected in ((self._keys_path, keys_size, rows * KEY_SIZE),
+                                         (self._vectors_path, vectors_size, rows * row_bytes)):
+                if size != expected:
+                    logger.warning(f"⚠️ Truncating partial write in {path}")
+                    with open(path, 'r+b') as f:
+                        f.truncate(expected)
+
+            index = {}
+            if rows:
+                with open(self._keys_path, 'rb') as f:
+                    raw = f.read(rows * KEY_SIZE)
+                for row in range(rows):
+                    index[raw[row * KEY_SIZE:(row + 1) * KEY_SIZE]] = row
+
+            self._keys_file = open(self._keys_path, 'ab')
+            self._vectors_file = open(self._vectors_path, 'ab')
+            self._disk_rows = rows
+            self._disk_map = None
+            self._disk_index = index
+            # Chưa biết lần dùng của các rows cũ: row ghi sau coi như mới hơn
+            self._row_ticks = list(range(rows))
+            self._tick = rows
+
+            logger.info(f"✅ Embedding cache opened: {rows} embeddings on disk")
+            return True
+
+        except Exception as e:
+            logger.error(f"❌ Error opening embedding cache: {e}")
+            raise
+
+    def _read_disk_rows(self, rows: Sequence[int]) -> np.ndarray:
+        """Đọc các rows của vectors.f32 qua mmap (map lại khi file đã lớn hơn vùng đang map)"""
+        if self._disk_map is None or self._disk_map.shape[0] < self._disk_rows:
+            self._disk_map = np.memmap(
+                self._vectors_path, dtype=np.float32, mode="r", shape=(self._disk_rows, self.dimension)
+            )
+        return np.array(self._disk_map[np.asarray(rows, dtype=np.int64)])
+
+    def _remember(self, key: bytes, vector: np.ndarray):
+        """Đưa embedding vào LRU bộ nhớ, bỏ entry cũ nhất khi vượt memory_size"""
+        if not self.memory_size:
+            return
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def get_many(self, keys: Sequence[bytes]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Tra cache cho nhiều keys (bộ nhớ trước, sau đó disk trong một lần đọc mmap)
+
+        Args:
+            keys: Danh sách keys (make_cache_key)
+
+        Returns:
+            Tuple: (ma trận (n, dimension) float32 với rows tìm thấy, mask bool các keys tìm thấy)
+        """
+        with self._lock:
+            vectors = np.zeros((len(keys), self.dimension), dtype=np.float32)
+            found = np.zeros(len(keys), dtype=bool)
+
+            disk_lookups: List[Tuple[int, int]] = []
+            has_disk = self._open_disk()
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    vectors[i] = vector
+                    found[i] = True
+                    self.counters["memory_hits"] += 1
+                elif has_disk and key in self._disk_index:
+                    disk_lookups.append((i, self._disk_index[key]))
+
+            if disk_lookups:
+                disk_vectors = self._read_disk_rows([row for _, row in disk_lookups])
+                for (i, row), vector in zip(disk_lookups, disk_vectors):
+                    vectors[i] = vector
+                    found[i] = True
+                    self._remember(keys[i], vector)
+                    self._row_ticks[row] = self._tick
+                self._tick += 1
+                self.counters["disk_hits"] += len(disk_lookups)
+
+            self.counters["misses"] += len(keys) - int(found.sum())
+            return vectors, found
+
+    def put_many(self, keys: Sequence[bytes], vectors: np.ndarray):
+        """
+        Lưu embeddings vào cache (bộ nhớ + append vào tầng disk)
+
+        Args:
+            keys: Danh sách keys
+            vectors: Ma trận (n, dimension)
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(len(keys), -1)
+        if vectors.shape[1] != self.dimension:
+            raise ValueError(f"Embedding dimension {vectors.shape[1]} != cache dimension {self.dimension}")
+
+        with self._lock:
+            has_disk = self._open_disk()
+            new_rows: Dict[bytes, int] = {}
+            for i, key in enumerate(keys):
+                self._remember(key, vectors[i].copy())
+                if has_disk and key not in self._disk_index:
+                    new_rows.setdefault(key, i)
+
+            if not new_rows:
+                return
+
+            try:
+                # Ghi vectors trước keys: key chỉ xuất hiện trên disk khi vector của nó đã đủ bytes
+                self._vectors_file.write(vectors[list(new_rows.values())].tobytes())
+                self._vectors_file.flush()
+                self._keys_file.write(b"".join(new_rows))
+                self._keys_file.flush()
+
+                for key in new_rows:
+                    self._disk_index[key] = self._disk_rows
+                    self._disk_rows += 1
+                self._row_ticks.extend([self._tick] * len(new_rows))
+                self._tick += 1
+
+            except Exception as e:
+                logger.error(f"❌ Error writing embedding cache: {e}")
+                raise
+
+            if self.max_disk_entries and self._disk_rows > self.max_disk_entries:
+                self._compact_disk(self.max_disk_entries * 3 // 4)
+
+    def _compact_disk(self, keep_rows: int):
+        """
+        Ghi lại tầng disk chỉ với keep_rows entries dùng gần nhất (file tạm rồi rename)
+
+        Args:
+            keep_rows: Số entries giữ lại
+        """
+        try:
+            start_rows = self._disk_rows
+            ticks = np.asarray(self._row_ticks, dtype=np.int64)
+            # Mới nhất theo (tick, row); giữ thứ tự row cũ trong file mới
+            keep = np.sort(np.lexsort((np.arange(len(ticks)), ticks))[::-1][:keep_rows])
+            row_keys: List[bytes] = [b""] * self._disk_rows
+            for key, row in self._disk_index.items():
+                row_keys[row] = key
+
+            tmp_vectors_path = self._vectors_path + ".tmp"
+            tmp_keys_path = self._keys_path + ".tmp"
+            with open(tmp_vectors_path, 'wb') as f:
+                for offset in range(0, len(keep), 65536):
+                    f.write(self._read_disk_rows(keep[offset:offset + 65536]).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(tmp_keys_path, 'wb') as f:
+                f.write(b"".join(row_keys[row] for row in keep.tolist()))
+                f.flush()
+                os.fsync(f.fileno())
+
+            # Hai file không thay được trong một bước: đánh dấu trong meta, crash giữa chừng thì cache bị reset
+            self._write_meta(compacting=True)
+            self._keys_file.close()
+            self._vectors_file.close()
+            self._disk_map = None
+            os.replace(tmp_vectors_path, self._vectors_path)
+            os.replace(tmp_keys_path, self._keys_path)
+            self._write_meta()
+
+            self._keys_file = open(self._keys_path, 'ab')
+            self._vectors_file = open(self._vectors_path, 'ab')
+            self._disk_index = {row_keys[row]: new_row for new_row, row in enumerate(keep.tolist())}
+            self._disk_rows = len(keep)
+            self._row_ticks = ticks[keep].tolist()
+            self.counters["disk_evicted"] += start_rows - len(keep)
+
+            logger.info(f"🗑️ Compacted embedding cache: {start_rows} -> {len(keep)} embeddings on disk")
+
+        except Exception as e:
+            logger.error(f"❌ Error compacting embedding cache: {e}")
+            # File có thể đang dở: mở lại từ disk ở lần dùng tiếp theo
+            self.close()
+            raise
+
+    def get_or_compute(self,
+                       keys: Sequence[bytes],
+                       compute: Callable[[List[int]], np.ndarray]) -> np.ndarray:
+        """
+        Lấy embeddings từ cache, chỉ gọi compute cho các keys chưa có (mỗi key trùng chỉ tính một lần)
+
+        Args:
+            keys: Danh sách keys
+            compute: Hàm nhận danh sách vị trí (trong keys) cần encode, trả ma trận embeddings theo thứ tự đó
+
+        Returns:
+            np.ndarray: Ma trận (n, dimension) float32 theo thứ tự keys
+        """
+        vectors, found = self.get_many(keys)
+
+        missing: Dict[bytes, List[int]] = {}
+        for i in np.flatnonzero(~found):
+            missing.setdefault(keys[i], []).append(int(i))
+        if not missing:
+            return vectors
+
+        positions = [indices[0] for indices in missing.values()]
+        computed = np.asarray(compute(positions), dtype=np.float32).reshape(len(positions), -1)
+        for indices, vector in zip(missing.values(), computed):
+            vectors[indices] = vector
+
+        self.put_many(list(missing), computed)
+        with self._lock:
+            self.counters["encoded"] += len(positions)
+        return vectors
+
+    def get_stats(self) -> Dict[str, object]:
+        """
+        Lấy thống kê cache (hits theo tầng, misses, số embeddings đã encode)
+        """
+        with self._lock:
+            hits = self.counters["memory_hits"] + self.counters["disk_hits"]
+            lookups = hits + self.counters["misses"]
+            return {
+                **self.counters,
+                "hits": hits,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "memory_size": self.memory_size,
+                "disk_entries": self._disk_rows if self._disk_index is not None else None,
+                "max_disk_entries": self.max_disk_entries,
+                "cache_dir": self.cache_dir
+            }
+
+    def clear(self):
+        """
+        Xóa toàn bộ cache (bộ nhớ và disk)
+        """
+        with self._lock:
+            self._memory.clear()
+            if self._open_disk():
+                self._disk_map = None
+                self._keys_file.truncate(0)
+                self._vectors_file.truncate(0)
+                self._disk_index = {}
+                self._disk_rows = 0
+                self._row_ticks = []
+            logger.info("🗑️ Cleared embedding cache")
+
+    def close(self):
+        """
+        Đóng file tầng disk (mở lại lazy ở lần dùng tiếp theo)
+        """
+        with self._lock:
+            for f in (self._keys_file, self._vectors_file):
+                if f is not None:
+                    f.close()
+            self._keys_file = None
+            self._vectors_file = None
+            self._disk_map = None
+            self._disk_index = None
+            self._disk_rows = 0
+            self._row_ticks = []
@@ -0,0 +1,283 @@
+"""
+Embedding Pool - Encode texts bằng nhiều worker processes cho ingestion lớn
+Mỗi worker giữ một bản model với phần threads riêng (cpu_count // số workers), nhận tasks từ một queue chung
+và ghi embeddings float32 thẳng vào shared memory do process chính cấp phát; qua queue chỉ có texts
+và vài số nguyên (không pickle ma trận embeddings)
+"""
+
+import os
+import time
+import queue
+import logging
+import threading
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Biến môi trường giới hạn threads của BLAS/OpenMP trong mỗi worker
+THREAD_ENV_VARIABLES = ("OMP_NUM_THREADS", "MKL_NUM_THREADS")
+
+def default_threads_per_worker(num_workers: int) -> int:
+    """
+    Chia đều CPU cores cho các workers (tối thiểu 1 thread mỗi worker)
+    """
+    return max((os.cpu_count() or 1) // max(num_workers, 1), 1)
+
+def _worker_main(worker_index: int,
+                 encoder_factory: Callable[[int], Callable[[List[str]], np.ndarray]],
+                 threads: int,
+                 dimension: int,
+                 task_queue,
+                 result_queue):
+    """
+    Vòng lặp của worker process: load model một lần, sau đó encode tasks
+    (buffer_name, offset, texts) và ghi vào rows [offset, offset + len(texts)) của buffer
+    """
+    try:
+        encode = encoder_factory(threads)
+    except Exception as e:
+        result_queue.put(("error", worker_index, None, f"{type(e).__name__}: {e}"))
+        return
+    result_queue.put(("ready", worker_index, None, None))
+
+    buffer = None
+    try:
+        while True:
+            task = task_queue.get()
+            if task is None:
+                break
+
+            task_id, buffer_name, total, offset, texts = task
+            try:
+                # Mỗi lần encode() của pool dùng một buffer mới, chỉ giữ attach tới buffer hiện tại
+                if buffer is None or buffer.name != buffer_name:
+                    if buffer is not None:
+                        buffer.close()
+                    buffer = shared_memory.SharedMemory(name=buffer_name)
+                output = np.ndarray((total, dimension), dtype=np.float32, buffer=buffer.buf)
+
+                embeddings = np.asarray(encode(texts), dtype=np.float32)
+                if embeddings.shape != (len(texts), dimension):
+                    raise ValueError(f"Encoder returned shape {embeddings.shape}, expected {(len(texts), dimension)}")
+                output[offset:offset + len(texts)] = embeddings
+                del output
+                result_queue.put(("done", worker_index, task_id, len(texts)))
+            except Exception as e:
+                result_queue.put(("error", worker_index, task_id, f"{type(e).__name__}: {e}"))
+    finally:
+        if buffer is not None:
+            buffer.close()
+
+class EmbeddingPool:
+    def __init__(self,
+                 encoder_factory: Callable[[int], Callable[[List[str]], np.ndarray]],
+                 dimension: int,
+                 num_workers: int = 2,
+                 threads_per_worker: Optional[int] = None,
+                 chunk_size: int = 256,
+                 start_method: str = "spawn"):
+        """
+        Khởi tạo Embedding Pool (chưa start processes)
+
+        Args:
+            encoder_factory: Hàm picklable factory(threads) -> encode(texts) trả ma trận (n, dimension),
+                chạy một lần trong mỗi worker để load model
+            dimension: Dimension của embeddings
+            num_workers: Số worker processes
+            threads_per_worker: Số threads của model trong mỗi worker (None: cpu_count // num_workers)
+            chunk_size: Số texts mỗi task trong queue
+            start_method: Cách tạo process ("spawn" an toàn với torch/OpenMP đã khởi tạo trong process chính)
+        """
+        if num_workers < 1:
+            raise ValueError("num_workers must be >= 1")
+
+        self.encoder_factory = encoder_factory
+        self.dimension = dimension
+        self.num_workers = num_workers
+        self.threads_per_worker = threads_per_worker or default_threads_per_worker(num_workers)
+        self.chunk_size = max(int(chunk_size), 1)
+        self.context = mp.get_context(start_method)
+
+        self.processes = []
+        self.task_queue = None
+        self.result_queue = None
+        self.is_started = False
+        self._lock = threading.Lock()  # Mỗi thời điểm một lần encode() dùng queue
+        self._next_task_id = 0
+        self.stats = {"jobs": 0, "tasks": 0, "texts": 0, "seconds": 0.0, "tasks_per_worker": [0] * num_workers}
+
+        logger.info(f"Embedding Pool initialized: {num_workers} workers x {self.threads_per_worker} threads")
+
+    def start(self, timeout: Optional[float] = None):
+        """
+        Start worker processes và chờ tất cả load xong model
+
+        Args:
+            timeout: Thời gian chờ tối đa (giây), None = chờ tới khi workers sẵn sàng hoặc lỗi
+        """
+        if self.is_started:
+            return
+
+        try:
+            logger.info(f"⏳ Starting {self.num_workers} embedding workers...")
+            start_time = time.perf_counter()
+            self.task_queue = self.context.Queue()
+            self.result_queue = self.context.Queue()
+            self.processes = [
+                self.context.Process(
+                    target=_worker_main,
+                    args=(index, self.encoder_factory, self.threads_per_worker, self.dimension,
+                          self.task_queue, self.result_queue),
+                    name=f"embedding-worker-{index}",
+                    daemon=True
+                )
+                for index in range(self.num_workers)
+            ]
+            # OMP/MKL đọc biến môi trường khi được import lúc unpickle args (trước _worker_main),
+            # nên đặt trong process chính để worker spawn thừa hưởng, rồi trả lại giá trị cũ
+            previous_env = {variable: os.environ.get(variable) for variable in THREAD_ENV_VARIABLES}
+            os.environ.update({variable: str(self.threads_per_worker) for variable in THREAD_ENV_VARIABLES})
+            try:
+                for process in self.processes:
+                    process.start()
+            finally:
+                for variable, value in previous_env.items():
+                    if value is None:
+                        os.environ.pop(variable, None)
+                    else:
+                        os.environ[variable] = value
+
+            ready = 0
+            while ready < self.num_workers:
+                if timeout is not None and time.perf_counter() - start_time > timeout:
+                    raise TimeoutError(f"Embedding workers not ready after {timeout}s")
+                kind, worker_index, _, error = self._get_result()
+                if kind == "error":
+                    raise RuntimeError(f"Embedding worker {worker_index} failed to load model: {error}")
+                ready += kind == "ready"
+
+            self.is_started = True
+            logger.info(f"✅ Embedding Pool started in {time.perf_counter() - start_time:.1f}s")
+
+        except Exception as e:
+            logger.error(f"❌ Error starting Embedding Pool: {e}")
+            self.stop()
+            raise
+
+    def encode(self, texts: List[str], show_progress_bar: bool = False) -> np.ndarray:
+        """
+        Encode texts bằng các workers
+
+        Args:
+            texts: Danh sách texts (chưa preprocess, encoder của worker tự preprocess)
+            show_progress_bar: Log tiến độ khi từng task hoàn thành
+
+        Returns:
+            np.ndarray: Ma trận embeddings float32 (n_texts, dimension) theo thứ tự texts
+        """
+        if not self.is_started:
+            raise RuntimeError("Embedding Pool not started. Please call start() first.")
+        if not texts:
+            return np.empty((0, self.dimension), dtype=np.float32)
+
+        with self._lock:
+            start_time = time.perf_counter()
+            # Dài trước: task nặng nhất được nhận sớm nhất, mỗi task gồm texts dài gần nhau (ít padding)
+            order = np.argsort(-np.fromiter((len(text) for text in texts), dtype=np.int64, count=len(texts)), kind="stable")
+            buffer = shared_memory.SharedMemory(create=True, size=len(texts) * self.dimension * 4)
+            try:
+                pending = {}
+                for offset in range(0, len(texts), self.chunk_size):
+                    task_id = self._next_task_id
+                    self._next_task_id += 1
+                    pending[task_id] = offset
+                    self.task_queue.put((
+                        task_id, buffer.name, len(texts), offset,
+                        [texts[i] for i in order[offset:offset + self.chunk_size]]
+                    ))
+
+                # Chờ hết tasks của job (kể cả khi có task lỗi) trước khi giải phóng buffer
+                errors = []
+                done = 0
+                while pending:
+                    kind, worker_index, task_id, payload = self._get_result()
+                    if task_id not in pending:
+                        continue
+                    pending.pop(task_id)
+                    if kind == "error":
+                        errors.append(f"worker {worker_index}: {payload}")
+                        continue
+                    done += payload
+                    self.stats["tasks_per_worker"][worker_index] += 1
+                    if show_progress_bar:
+                        logger.info(f"⏳ Pool encoded {done}/{len(texts)} texts")
+                if errors:
+                    raise RuntimeError(f"Embedding Pool task failed: {errors[0]}")
+
+                embeddings = np.empty((len(texts), self.dimension), dtype=np.float32)
+                embeddings[order] = np.ndarray((len(texts), self.dimension), dtype=np.float32, buffer=buffer.buf)
+            finally:
+                buffer.close()
+                buffer.unlink()
+
+            elapsed = time.perf_counter() - start_time
+            self.stats["jobs"] += 1
+            self.stats["tasks"] += -(-len(texts) // self.chunk_size)
+            self.stats["texts"] += len(texts)
+            self.stats["seconds"] += elapsed
+            logger.info(f"✅ Pool encoded {len(texts)} texts in {elapsed:.2f}s ({len(texts) / elapsed:.1f} texts/s)")
+            return embeddings
+
+    def _get_result(self):
+        """
+        Lấy một message từ result queue; báo lỗi nếu có worker chết (crash, OOM kill) trong lúc chờ
+        """
+        while True:
+            try:
+                return self.result_queue.get(timeout=1.0)
+            except queue.Empty:
+                dead = [process.name for process in self.processes if not process.is_alive()]
+                if dead:
+                    raise RuntimeError(f"Embedding workers exited unexpectedly: {', '.join(dead)}")
+
+    def stop(self, timeout: float = 10.0):
+        """
+        Dừng các worker processes
+        """
+        if self.processes:
+            logger.info("🧹 Stopping embedding workers...")
+            for process in self.processes:
+                if process.is_alive():
+                    self.task_queue.put(None)
+            for process in self.processes:
+                process.join(timeout)
+                if process.is_alive():
+                    logger.warning(f"⚠️ Terminating {process.name}")
+                    process.terminate()
+                    process.join()
+        for pool_queue in (self.task_queue, self.result_queue):
+            if pool_queue is not None:
+                pool_queue.close()
+                pool_queue.join_thread()
+        self.processes = []
+        self.task_queue = None
+        self.result_queue = None
+        self.is_started = False
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Thống kê pool: cấu hình, số tasks/texts và throughput
+        """
+        return {
+            "workers": self.num_workers,
+            "threads_per_worker": self.threads_per_worker,
+            "chunk_size": self.chunk_size,
+            "started": self.is_started,
+            **self.stats,
+            "tasks_per_worker": list(self.stats["tasks_per_worker"]),
+            "texts_per_second": round(self.stats["texts"] / self.stats["seconds"], 2) if self.stats["seconds"] else 0.0
+        }
@@ -4,7 +4,9 @@ Service xử lý embedding hoàn toàn offline
 """
 
 import os
+import asyncio
 import logging
+import functools
 import numpy as np
 from typing import List, Union, Optional
 import torch
@@ -13,25 +15,73 @@ import pickle
 import json
 from pathlib import Path
 
+from .embedding_cache import EmbeddingCache, make_cache_key
+from .embedding_batcher import EmbeddingBatcher
+from .stage_executor import embedding_executor
+from .onnx_embedding import OnnxEmbeddingModel
+from .length_batching import fixed_batches, padding_stats, plan_token_batches
+from .embedding_pool import EmbeddingPool, default_threads_per_worker
+
 logger = logging.getLogger(__name__)
 
+EMBEDDING_BACKENDS = ("torch", "onnx")
+
 class EmbeddingService:
-    def __init__(self, model_path: str = "models/embedding"):
+    def __init__(self,
+                 model_path: str = "models/embedding",
+                 cache_dir: Optional[str] = None,
+                 cache_size: int = 10000,
+                 cache_max_disk_entries: Optional[int] = 200000,
+                 backend: str = "torch",
+                 onnx_model_path: str = "models/embedding_onnx",
+                 onnx_quantized: bool = True,
+                 onnx_threads: Optional[int] = None,
+                 max_batch_tokens: int = 8192,
+                 max_batch_size: int = 128):
         """
         Khởi tạo Embedding Service
         
         Args:
             model_path: Đường dẫn đến thư mục chứa model offline
+            cache_dir: Thư mục cache embeddings trên disk (None để chỉ cache trong bộ nhớ)
+            cache_size: Số embeddings tối đa trong LRU bộ nhớ (0 để tắt)
+            cache_max_disk_entries: Số embeddings tối đa trong cache disk (None/0 = không giới hạn)
+            backend: "torch" (SentenceTransformer) hoặc "onnx" (ONNX Runtime trên CPU)
+            onnx_model_path: Thư mục model đã export (export_embedding_onnx.py)
+            onnx_quantized: Dùng bản int8 của model ONNX
+            onnx_threads: Số intra-op threads của ONNX Runtime (None: mặc định của ONNX Runtime)
+            max_batch_tokens: Token budget mỗi lần forward (số texts * token dài nhất, tính cả padding)
+            max_batch_size: Số texts tối đa mỗi lần forward
         """
+        if backend not in EMBEDDING_BACKENDS:
+            raise ValueError(f"Unknown embedding backend: {backend}. Available: {EMBEDDING_BACKENDS}")
+        
         self.model_path = model_path
         self.model = None
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.backend = backend
+        self.onnx_model_path = onnx_model_path
+        self.onnx_quantized = onnx_quantized
+        self.onnx_threads = onnx_threads
+        self.device = "cuda" if backend == "torch" and torch.cuda.is_available() else "cpu"
         self.model_name = "intfloat/multilingual-e5-large"
         self.dimension = 1024  # Dimension của multilingual-e5-large
+        self.text_prefix = "query: "  # Prefix E5
         self.is_loaded = False
         
-        logger.info(f"Embedding Service initialized. Device: {self.device}")
-        logger.info(f"Model path: {self.model_path}")
+        # Batching theo độ dài token: texts dài gần nhau chung batch, kích thước batch theo token budget
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.batching_stats = {"batches": 0, "real_tokens": 0, "padded_tokens": 0}
+        
+        # Cache theo (model, prefix, hash text đã chuẩn hóa): text lặp lại không phải forward model lần nữa
+        self.cache = EmbeddingCache(self.dimension, cache_dir=cache_dir, memory_size=cache_size,
+                                    max_disk_entries=cache_max_disk_entries)
+        
+        # Worker pool cho ingestion lớn (start_pool), None = encode trong process hiện tại
+        self.pool = None
+        
+        logger.info(f"Embedding Service initialized. Backend: {self.backend}, device: {self.device}")
+        logger.info(f"Model path: {self.model_path if backend == 'torch' else self.onnx_model_path}")
 
     async def load_model(self):
         """
@@ -42,19 +92,28 @@ class EmbeddingService:
             return
 
         try:
-            logger.info(f"⏳ Loading embedding model from {self.model_path}...")
+            model_path = self.model_path if self.backend == "torch" else self.onnx_model_path
+            logger.info(f"⏳ Loading embedding model ({self.backend}) from {model_path}...")
             
             # Kiểm tra thư mục model
-            if not os.path.exists(self.model_path):
-                logger.error(f"❌ Model path not found: {self.model_path}")
-                raise FileNotFoundError(f"Embedding model not found at {self.model_path}. Please download it first.")
-
-            # Load model với local_files_only=True để đảm bảo offline
-            self.model = SentenceTransformer(
-                self.model_path,
-                device=self.device,
-                local_files_only=True  # Quan trọng: chỉ load từ local
-            )
+            if not os.path.exists(model_path):
+                logger.error(f"❌ Model path not found: {model_path}")
+                raise FileNotFoundError(f"Embedding model not found at {model_path}. Please download it first.")
+
+            if self.backend == "onnx":
+                # ONNX Runtime trên CPU (fp32 hoặc int8), cùng interface encode() với SentenceTransformer
+                self.model = OnnxEmbeddingModel(
+                    self.onnx_model_path,
+                    quantized=self.onnx_quantized,
+                    intra_op_threads=self.onnx_threads
+                )
+            else:
+                # Load model với local_files_only=True để đảm bảo offline
+                self.model = SentenceTransformer(
+                    self.model_path,
+                    device=self.device,
+                    local_files_only=True  # Quan trọng: chỉ load từ local
+                )
             
             self.is_loaded = True
             logger.info(f"✅ Embedding model loaded successfully on {self.device}")
@@ -71,11 +130,13 @@ class EmbeddingService:
         Giải phóng tài nguyên model
         """
         logger.info("🧹 Cleaning up embedding model resources...")
+        self.stop_pool()
         if self.model is not None:
             del self.model
             torch.cuda.empty_cache()
         self.model = None
         self.is_loaded = False
+        self.cache.close()
         logger.info("✅ Embedding model resources cleaned up")
 
     def generate_embedding(self, text: str) -> np.ndarray:
@@ -92,20 +153,11 @@ class EmbeddingService:
             raise RuntimeError("Model not loaded. Please call load_model() first.")
 
         try:
-            # Preprocess text cho E5 model
-            processed_text = self._preprocess_text(text)
-            
-            # Tạo embedding
-            embedding = self.model.encode(
-                processed_text,
-                convert_to_numpy=True,
-                show_progress_bar=False,
-                batch_size=1
-            )
-            
-            # Đảm bảo embedding là 1D array
-            if embedding.ndim > 1:
-                embedding = embedding.flatten()
+            # Lấy từ cache, chỉ encode khi miss
+            embedding = self.cache.get_or_compute(
+                [self._cache_key(text)],
+                lambda positions: self._encode([text], batch_size=1, show_progress_bar=False)
+            )[0]
             
             logger.debug(f"Generated embedding for text: {text[:50]}...")
             return embedding
@@ -114,12 +166,18 @@ class EmbeddingService:
             logger.error(f"❌ Error generating embedding: {e}")
             raise
 
-    def generate_embeddings_batch(self, texts: List[str]) -> np.ndarray:
+    def generate_embeddings_batch(self, 
+                                  texts: List[str],
+                                  batch_size: Optional[int] = None,
+                                  show_progress_bar: bool = True) -> np.ndarray:
         """
         Tạo embeddings cho nhiều đoạn text cùng lúc
         
         Args:
             texts: Danh sách các đoạn text
+            batch_size: Số text tối đa mỗi lần forward qua model (mặc định max_batch_size);
+                kích thước thực tế của từng batch do token budget quyết định
+            show_progress_bar: Log tiến độ theo từng batch
             
         Returns:
             np.ndarray: Ma trận embeddings (n_texts, dimension)
@@ -128,34 +186,151 @@ class EmbeddingService:
             raise RuntimeError("Model not loaded. Please call load_model() first.")
 
         try:
-            # Preprocess texts
-            processed_texts = [self._preprocess_text(text) for text in texts]
+            encoded = []
             
-            # Tạo embeddings batch
-            embeddings = self.model.encode(
-                processed_texts,
-                convert_to_numpy=True,
-                show_progress_bar=True,
-                batch_size=8
-            )
+            def encode_misses(positions: List[int]) -> np.ndarray:
+                encoded.extend(positions)
+                miss_texts = [texts[i] for i in positions]
+                # Đủ nhiều texts để chia tasks cho các workers thì encode bằng pool
+                if self.pool is not None and len(miss_texts) >= self.pool.chunk_size:
+                    return self.pool.encode(miss_texts, show_progress_bar=show_progress_bar)
+                return self._encode(miss_texts, batch_size, show_progress_bar)
+            
+            # Chỉ texts chưa có trong cache (và không trùng nhau) được forward qua model
+            embeddings = self.cache.get_or_compute([self._cache_key(text) for text in texts], encode_misses)
             
-            logger.info(f"Generated {len(embeddings)} embeddings")
+            logger.info(f"Generated {len(embeddings)} embeddings ({len(encoded)} encoded, "
+                        f"{len(embeddings) - len(encoded)} from cache)")
             return embeddings
             
         except Exception as e:
             logger.error(f"❌ Error generating batch embeddings: {e}")
             raise
 
+    def _encode(self, texts: List[str], batch_size: Optional[int], show_progress_bar: bool) -> np.ndarray:
+        """
+        Forward model cho các texts (đã preprocess), trả ma trận (n_texts, dimension) float32 theo thứ tự texts
+        Texts được chia batch theo độ dài token (plan_token_batches) để giảm padding
+        """
+        processed_texts = [self._preprocess_text(text) for text in texts]
+        if len(processed_texts) <= 1:
+            embeddings = self.model.encode(
+                processed_texts,
+                convert_to_numpy=True,
+                show_progress_bar=False,
+                batch_size=1
+            )
+            return np.asarray(embeddings, dtype=np.float32).reshape(len(texts), -1)
+        
+        lengths = self._token_lengths(processed_texts)
+        batches = plan_token_batches(lengths, self.max_batch_tokens, batch_size or self.max_batch_size)
+        
+        embeddings = None
+        done = 0
+        for batch in batches:
+            batch_embeddings = self.model.encode(
+                [processed_texts[i] for i in batch],
+                convert_to_numpy=True,
+                show_progress_bar=False,
+                batch_size=len(batch)
+            )
+            if embeddings is None:
+                embeddings = np.empty((len(texts), batch_embeddings.shape[-1]), dtype=np.float32)
+            # Trả về đúng thứ tự gốc
+            embeddings[batch] = batch_embeddings
+            done += len(batch)
+            if show_progress_bar:
+                logger.info(f"⏳ Encoded {done}/{len(texts)} texts")
+        
+        stats = padding_stats(lengths, batches)
+        baseline = padding_stats(lengths, fixed_batches(len(texts), batch_size or 8))
+        for key in self.batching_stats:
+            self.batching_stats[key] += stats[key]
+        logger.info(f"📊 Encoded {len(texts)} texts in {stats['batches']} length-bucketed batches, "
+                    f"padding {stats['padding_ratio']:.1%} (fixed batches in original order: {baseline['padding_ratio']:.1%})")
+        return embeddings
+
+    def start_pool(self, num_workers: int, threads_per_worker: Optional[int] = None, chunk_size: int = 256):
+        """
+        Start worker pool cho ingestion lớn: mỗi worker load một bản model (cùng backend/config)
+        với threads_per_worker threads; generate_embeddings_batch chuyển các lần encode lớn sang pool
+        
+        Args:
+            num_workers: Số worker processes
+            threads_per_worker: Số threads mỗi worker (None: cpu_count // num_workers)
+            chunk_size: Số texts mỗi task
+        """
+        if self.pool is not None:
+            return
+        if self.device != "cpu":
+            logger.warning("⚠️ Embedding pool is CPU-only, keep encoding in-process on GPU")
+            return
+        
+        threads_per_worker = threads_per_worker or default_threads_per_worker(num_workers)
+        encoder_factory = functools.partial(load_pool_encoder, {
+            "model_path": self.model_path,
+            "backend": self.backend,
+            "onnx_model_path": self.onnx_model_path,
+            "onnx_quantized": self.onnx_quantized,
+            "max_batch_tokens": self.max_batch_tokens,
+            "max_batch_size": self.max_batch_size
+        })
+        pool = EmbeddingPool(
+            encoder_factory,
+            self.dimension,
+            num_workers=num_workers,
+            threads_per_worker=threads_per_worker,
+            chunk_size=chunk_size
+        )
+        pool.start()
+        self.pool = pool
+
+    def stop_pool(self):
+        """
+        Dừng worker pool, các lần encode sau chạy lại trong process hiện tại
+        """
+        if self.pool is not None:
+            self.pool.stop()
+            self.pool = None
+
+    def _token_lengths(self, processed_texts: List[str]) -> np.ndarray:
+        """
+        Số tokens của từng text sau truncation (cả special tokens), dùng tokenizer của model
+        """
+        input_ids = self.model.tokenizer(
+            processed_texts,
+            add_special_tokens=True,
+            truncation=True,
+            max_length=self.model.max_seq_length,
+            return_attention_mask=False
+        )["input_ids"]
+        return np.array([len(ids) for ids in input_ids], dtype=np.int64)
+
+    def _cache_key(self, text: str) -> bytes:
+        """
+        Key cache của text: (model, prefix, hash text đã chuẩn hóa)
+        """
+        return make_cache_key(self.model_id, self.text_prefix, text)
+
+    @property
+    def model_id(self) -> str:
+        """
+        Định danh model + backend (bản int8 cho vector khác fp32 nên không dùng chung cache)
+        """
+        if self.backend == "onnx":
+            return f"{self.model_name}:onnx-{'int8' if self.onnx_quantized else 'fp32'}"
+        return self.model_name
+
     def _preprocess_text(self, text: str) -> str:
         """
         Preprocess text cho E5 model
         E5 model cần prefix để hiểu context
         """
         if not text.strip():
-            return "query: " + text
+            return self.text_prefix + text
         
         # Thêm prefix cho query (có thể customize cho retrieval)
-        return "query: " + text.strip()
+        return self.text_prefix + text.strip()
 
     def get_embedding_dimension(self) -> int:
         """
@@ -169,11 +344,22 @@ class EmbeddingService:
         """
         return {
             "model_name": self.model_name,
-            "model_path": self.model_path,
+            "model_path": self.model_path if self.backend == "torch" else self.onnx_model_path,
+            "backend": self.backend,
+            "model_id": self.model_id,
             "loaded": self.is_loaded,
             "device": self.device,
             "dimension": self.dimension,
-            "model_loaded": self.model is not None
+            "model_loaded": self.model is not None,
+            "batching": {
+                "max_batch_tokens": self.max_batch_tokens,
+                "max_batch_size": self.max_batch_size,
+                **self.batching_stats,
+                "padding_ratio": round(1 - self.batching_stats["real_tokens"] / self.batching_stats["padded_tokens"], 4)
+                if self.batching_stats["padded_tokens"] else 0.0
+            },
+            "cache": self.cache.get_stats(),
+            "pool": self.pool.get_stats() if self.pool is not None else None
         }
 
     def validate_embedding(self, embedding: np.ndarray) -> bool:
@@ -242,5 +428,53 @@ class EmbeddingService:
             logger.error(f"❌ Error loading embeddings: {e}")
             raise
 
+    def get_cache_stats(self) -> dict:
+        """
+        Lấy thống kê cache embeddings (hits/misses)
+        """
+        return self.cache.get_stats()
+
+    def clear_cache(self):
+        """
+        Xóa cache embeddings (bộ nhớ và disk)
+        """
+        self.cache.clear()
+
+def load_pool_encoder(config: dict, threads: int):
+    """
+    Factory chạy trong mỗi worker của EmbeddingPool: load model với số threads được chia
+    và trả hàm encode(texts) (preprocess + batching theo độ dài token như process chính)
+    
+    Args:
+        config: Cấu hình model của EmbeddingService tạo pool
+        threads: Số threads của worker
+        
+    Returns:
+        Callable: encode(texts) -> np.ndarray (n_texts, dimension)
+    """
+    torch.set_num_threads(threads)
+    # Cache nằm ở process chính, worker chỉ encode
+    service = EmbeddingService(cache_size=0, onnx_threads=threads, **config)
+    asyncio.run(service.load_model())
+    return lambda texts: service._encode(texts, None, False)
+
 # Global instance
-embedding_service = EmbeddingService()
\ No newline at end of file
+embedding_service = EmbeddingService(
+    cache_dir=os.getenv("EMBEDDING_CACHE_DIR", "data/embedding_cache") or None,
+    cache_size=int(os.getenv("EMBEDDING_CACHE_SIZE", "10000")),
+    cache_max_disk_entries=int(os.getenv("EMBEDDING_CACHE_MAX_DISK_ENTRIES", "200000")),
+    backend=os.getenv("EMBEDDING_BACKEND", "torch"),
+    onnx_model_path=os.getenv("EMBEDDING_ONNX_PATH", "models/embedding_onnx"),
+    onnx_quantized=os.getenv("EMBEDDING_ONNX_INT8", "true").lower() == "true",
+    onnx_threads=int(os.getenv("EMBEDDING_ONNX_THREADS", "0")) or None,
+    max_batch_tokens=int(os.getenv("EMBEDDING_MAX_BATCH_TOKENS", "8192")),
+    max_batch_size=int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", "128"))
+)
+
+# Micro-batcher cho các request async (gom nhiều queries vào một lần forward)
+embedding_batcher = EmbeddingBatcher(
+    embedding_service,
+    max_batch_size=int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", "32")),
+    max_wait_ms=float(os.getenv("EMBEDDING_BATCH_MAX_WAIT_MS", "5")),
+    executor=embedding_executor
+)
\ No newline at end of file
@@ -0,0 +1,65 @@
+"""
+Length Batching - Chia texts thành batches theo độ dài token
+Texts được sắp theo số tokens (dài trước) nên mỗi batch gồm texts dài gần nhau; kích thước batch
+được chọn theo token budget (batch_size * độ dài dài nhất của batch) thay vì một số lượng cố định
+"""
+
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+def plan_token_batches(lengths: Sequence[int],
+                       max_tokens: int,
+                       max_batch_size: Optional[int] = None) -> List[np.ndarray]:
+    """
+    Lập các batches theo token budget
+
+    Args:
+        lengths: Số tokens của từng text (đã tính special tokens và truncation)
+        max_tokens: Token budget mỗi batch, tính cả padding (len(batch) * token dài nhất)
+        max_batch_size: Số texts tối đa mỗi batch (None = không giới hạn)
+
+    Returns:
+        List[np.ndarray]: Vị trí (trong lengths) của texts thuộc từng batch, text dài nhất đứng đầu
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    # Dài trước: batch nặng nhất chạy đầu tiên (thiếu bộ nhớ thì lỗi ngay), padding chỉ trong một nhóm độ dài
+    order = np.argsort(-lengths, kind="stable")
+
+    batches = []
+    start = 0
+    while start < len(order):
+        # Batch bắt đầu bằng text dài nhất còn lại -> token dài nhất của batch là lengths[order[start]]
+        size = max(int(max_tokens) // max(int(lengths[order[start]]), 1), 1)
+        if max_batch_size:
+            size = min(size, int(max_batch_size))
+        batches.append(order[start:start + size])
+        start += size
+    return batches
+
+def padding_stats(lengths: Sequence[int], batches: Sequence[Sequence[int]]) -> Dict[str, float]:
+    """
+    Thống kê padding của một cách chia batch
+
+    Args:
+        lengths: Số tokens của từng text
+        batches: Vị trí texts của từng batch
+
+    Returns:
+        Dict: real_tokens, padded_tokens (tokens model thực sự xử lý) và padding_ratio
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    real_tokens = int(lengths.sum())
+    padded_tokens = int(sum(len(batch) * int(lengths[batch].max()) for batch in map(np.asarray, batches) if len(batch)))
+    return {
+        "batches": len(batches),
+        "real_tokens": real_tokens,
+        "padded_tokens": padded_tokens,
+        "padding_ratio": round(1 - real_tokens / padded_tokens, 4) if padded_tokens else 0.0
+    }
+
+def fixed_batches(count: int, batch_size: int) -> List[np.ndarray]:
+    """
+    Batches theo thứ tự gốc với kích thước cố định (cách chia cũ, dùng để so sánh padding)
+    """
+    return [np.arange(start, min(start + batch_size, count)) for start in range(0, count, max(int(batch_size), 1))]
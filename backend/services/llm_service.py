@@ -17,6 +17,9 @@ from transformers import (
 from typing import List, Dict, Any, Optional, AsyncGenerator
 import logging
 from pathlib import Path
+from concurrent.futures import Future
+
+from .stage_executor import llm_executor
 
 # Suppress warnings
 warnings.filterwarnings("ignore")
@@ -474,7 +477,29 @@ Bản dịch tiếng Việt:"""
             logger.error(f"❌ Error translating to Vietnamese: {e}")
             return text  # Return original if translation fails
     
-    async def generate_answer_with_streaming(self, question: str, context: str = "", max_tokens: int = 1000, temperature: float = 0.7) -> AsyncGenerator[str, None]:
+    async def generate_answer_async(self, question: str, context: str = "", max_tokens: int = 1000, temperature: float = 0.7) -> str:
+        """
+        generate_answer chạy trên inference worker của LLM (llm_executor), không chặn event loop
+        
+        Raises:
+            StageOverloadedError: Hàng đợi LLM đã đầy
+        """
+        return await llm_executor.run(self.generate_answer, question, context, max_tokens, temperature)
+
+    def submit_answer(self, question: str, context: str = "", max_tokens: int = 1000, temperature: float = 0.7) -> Future:
+        """
+        Đưa generate_answer vào hàng đợi LLM ngay (trước khi bắt đầu stream) để quá tải được báo sớm
+        
+        Returns:
+            Future: Kết quả generate_answer, truyền vào generate_answer_with_streaming(answer_future=...)
+            
+        Raises:
+            StageOverloadedError: Hàng đợi LLM đã đầy
+        """
+        return llm_executor.submit(self.generate_answer, question, context, max_tokens, temperature)
+
+    async def generate_answer_with_streaming(self, question: str, context: str = "", max_tokens: int = 1000, temperature: float = 0.7,
+                                             answer_future: Optional[Future] = None) -> AsyncGenerator[str, None]:
         """
         Tạo câu trả lời với streaming (async generator) - Luôn trả lời bằng tiếng Việt
         
@@ -483,71 +508,27 @@ Bản dịch tiếng Việt:"""
             context: Context từ RAG search
             max_tokens: Số token tối đa
             temperature: Độ ngẫu nhiên
+            answer_future: Future từ submit_answer (None: submit khi generator bắt đầu chạy)
             
         Yields:
             str: Từng phần của câu trả lời (luôn bằng tiếng Việt)
         """
         try:
-            if not self.model_loaded or self.model is None or self.tokenizer is None:
-                raise RuntimeError("LLM model not loaded")
-            
-            # Detect language and translate if needed
-            question_vi, context_vi = self._ensure_vietnamese_input(question.strip(), context.strip())
-            
-            # Create prompt
-            prompt = self._create_prompt(question_vi, context_vi)
-            
-            # Tokenize input
-            inputs = self.tokenizer(
-                prompt,
-                return_tensors="pt",
-                truncation=True,
-                max_length=self.max_length - max_tokens,
-                padding=True,
-                add_special_tokens=True
-            )
-            
-            # Move to device
-            inputs = {k: v.to(self.device) for k, v in inputs.items()}
+            # Generate trên inference worker, event loop vẫn phục vụ request khác
+            if answer_future is not None:
+                response = await asyncio.wrap_future(answer_future)
+            else:
+                response = await self.generate_answer_async(question, context, max_tokens, temperature)
             
-            # Generate with streaming
-            with torch.no_grad():
-                outputs = self.model.generate(
-                    **inputs,
-                    max_new_tokens=max_tokens,
-                    temperature=temperature,
-                    top_p=0.9,
-                    top_k=50,
-                    do_sample=True,
-                    pad_token_id=self.tokenizer.pad_token_id,
-                    eos_token_id=self.tokenizer.eos_token_id,
-                    repetition_penalty=1.1,
-                    no_repeat_ngram_size=3,
-                    early_stopping=True,
-                    use_cache=True
-                )
-                
-                # Decode full response
-                response = self.tokenizer.decode(
-                    outputs[0][inputs['input_ids'].shape[1]:],
-                    skip_special_tokens=True
-                ).strip()
-                
-                # Clean response
-                response = self._clean_response(response)
-                
-                # Ensure response is in Vietnamese
-                response = self._ensure_vietnamese_output(response)
-                
-                # Yield response in chunks for streaming effect
-                words = response.split()
-                for i, word in enumerate(words):
-                    if i == len(words) - 1:
-                        yield word
-                    else:
-                        yield word + " "
-                    # Small delay for streaming effect
-                    await asyncio.sleep(0.05)
+            # Yield response in chunks for streaming effect
+            words = response.split()
+            for i, word in enumerate(words):
+                if i == len(words) - 1:
+                    yield word
+                else:
+                    yield word + " "
+                # Small delay for streaming effect
+                await asyncio.sleep(0.05)
             
         except Exception as e:
             logger.error(f"❌ Error in streaming generation: {e}")
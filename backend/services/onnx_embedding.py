@@ -0,0 +1,260 @@
+"""
+ONNX Embedding Backend - Chạy embedding model qua ONNX Runtime trên CPU
+Export model sentence-transformers sang ONNX (tùy chọn quantize int8 động) và encode với cùng pooling/normalize
+"""
+
+import os
+import json
+import logging
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CONFIG_FILE = "onnx_export.json"
+ONNX_FP32_FILE = "model.onnx"
+ONNX_INT8_FILE = "model.int8.onnx"
+
+def read_sentence_transformer_config(model_path: str) -> Dict[str, Any]:
+    """
+    Đọc cấu hình pooling/normalize/max_seq_length của model sentence-transformers đã lưu local
+
+    Args:
+        model_path: Thư mục model (SentenceTransformer.save)
+
+    Returns:
+        Dict: {"pooling": "mean" | "cls", "normalize": bool, "max_seq_length": int}
+    """
+    with open(os.path.join(model_path, "modules.json"), 'r', encoding='utf-8') as f:
+        modules = json.load(f)
+
+    pooling = "mean"
+    normalize = False
+    for module in modules:
+        module_type = module.get("type", "")
+        if module_type.endswith("Normalize"):
+            normalize = True
+        elif module_type.endswith("Pooling"):
+            with open(os.path.join(model_path, module["path"], "config.json"), 'r', encoding='utf-8') as f:
+                pooling_config = json.load(f)
+            if pooling_config.get("pooling_mode_mean_tokens"):
+                pooling = "mean"
+            elif pooling_config.get("pooling_mode_cls_token"):
+                pooling = "cls"
+            else:
+                raise ValueError(f"Unsupported pooling config: {pooling_config}")
+
+    max_seq_length = 512
+    bert_config_path = os.path.join(model_path, "sentence_bert_config.json")
+    if os.path.exists(bert_config_path):
+        with open(bert_config_path, 'r', encoding='utf-8') as f:
+            max_seq_length = json.load(f).get("max_seq_length", max_seq_length)
+
+    return {"pooling": pooling, "normalize": normalize, "max_seq_length": max_seq_length}
+
+def pool_embeddings(hidden_states: np.ndarray,
+                    attention_mask: np.ndarray,
+                    pooling: str = "mean",
+                    normalize: bool = True) -> np.ndarray:
+    """
+    Pooling token embeddings thành sentence embeddings (giống module Pooling/Normalize của sentence-transformers)
+
+    Args:
+        hidden_states: last_hidden_state (batch, seq, dim)
+        attention_mask: Mask (batch, seq), 0 ở vị trí padding
+        pooling: "mean" (trung bình tokens không phải padding) hoặc "cls"
+        normalize: L2 normalize kết quả
+
+    Returns:
+        np.ndarray: Ma trận (batch, dim) float32
+    """
+    if pooling == "cls":
+        embeddings = hidden_states[:, 0].astype(np.float32)
+    else:
+        mask = attention_mask[..., None].astype(np.float32)
+        embeddings = (hidden_states * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        embeddings = embeddings.astype(np.float32)
+
+    if normalize:
+        embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+    return embeddings
+
+def embedding_parity(reference: np.ndarray, candidate: np.ndarray) -> Dict[str, float]:
+    """
+    So sánh embeddings của backend mới với backend tham chiếu (PyTorch) theo cosine từng text
+
+    Args:
+        reference: Ma trận (n, dim) từ PyTorch
+        candidate: Ma trận (n, dim) từ ONNX
+
+    Returns:
+        Dict: min/mean/p01 cosine và sai khác tuyệt đối lớn nhất (sau normalize)
+    """
+    reference = reference / np.maximum(np.linalg.norm(reference, axis=1, keepdims=True), 1e-12)
+    candidate = candidate / np.maximum(np.linalg.norm(candidate, axis=1, keepdims=True), 1e-12)
+    cosine = (reference * candidate).sum(axis=1)
+    return {
+        "texts": int(len(cosine)),
+        "min_cosine": round(float(cosine.min()), 6),
+        "mean_cosine": round(float(cosine.mean()), 6),
+        "p01_cosine": round(float(np.percentile(cosine, 1)), 6),
+        "max_abs_diff": round(float(np.abs(reference - candidate).max()), 6)
+    }
+
+def export_onnx_model(model_path: str,
+                      output_dir: str,
+                      quantize: bool = True,
+                      opset: int = 17) -> Dict[str, Any]:
+    """
+    Export model sentence-transformers sang ONNX và (tùy chọn) quantize int8 động
+
+    Args:
+        model_path: Thư mục model sentence-transformers
+        output_dir: Thư mục ghi model.onnx, model.int8.onnx, tokenizer và onnx_export.json
+        quantize: Tạo thêm bản int8 (quantize_dynamic, weights QInt8)
+        opset: ONNX opset
+
+    Returns:
+        Dict: Cấu hình export (ghi vào onnx_export.json)
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+        config = read_sentence_transformer_config(model_path)
+
+        logger.info(f"⏳ Exporting {model_path} to ONNX...")
+        tokenizer = AutoTokenizer.from_pretrained(model_path, local_files_only=True)
+        model = AutoModel.from_pretrained(model_path, local_files_only=True).eval()
+        sample = tokenizer(["query: xin chào", "query: an toàn thông tin"], padding=True, return_tensors="pt")
+
+        fp32_path = os.path.join(output_dir, ONNX_FP32_FILE)
+        with torch.no_grad():
+            # Model > 2GB được torch ghi weights ra file external data cạnh model.onnx
+            torch.onnx.export(
+                model,
+                (sample["input_ids"], sample["attention_mask"]),
+                fp32_path,
+                input_names=["input_ids", "attention_mask"],
+                output_names=["last_hidden_state"],
+                dynamic_axes={
+                    "input_ids": {0: "batch", 1: "sequence"},
+                    "attention_mask": {0: "batch", 1: "sequence"},
+                    "last_hidden_state": {0: "batch", 1: "sequence"}
+                },
+                opset_version=opset,
+                do_constant_folding=True
+            )
+        tokenizer.save_pretrained(output_dir)
+        files = {"fp32": ONNX_FP32_FILE}
+        logger.info(f"✅ Exported FP32 ONNX model to {fp32_path}")
+
+        if quantize:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+
+            int8_path = os.path.join(output_dir, ONNX_INT8_FILE)
+            quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+            files["int8"] = ONNX_INT8_FILE
+            logger.info(f"✅ Quantized INT8 ONNX model to {int8_path}")
+
+        export_config = {
+            **config,
+            "source_model": os.path.abspath(model_path),
+            "dimension": int(model.config.hidden_size),
+            "opset": opset,
+            "files": files
+        }
+        with open(os.path.join(output_dir, EXPORT_CONFIG_FILE), 'w', encoding='utf-8') as f:
+            json.dump(export_config, f, indent=2)
+        return export_config
+
+    except Exception as e:
+        logger.error(f"❌ Error exporting ONNX model: {e}")
+        raise
+
+class OnnxEmbeddingModel:
+    """Encode bằng ONNX Runtime (CPU), cùng interface encode() với SentenceTransformer"""
+
+    def __init__(self,
+                 model_dir: str,
+                 quantized: bool = True,
+                 intra_op_threads: Optional[int] = None):
+        """
+        Load model ONNX đã export
+
+        Args:
+            model_dir: Thư mục output của export_onnx_model
+            quantized: Dùng bản int8 (False: fp32)
+            intra_op_threads: Số threads intra-op của ONNX Runtime (None: mặc định = số core vật lý)
+        """
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError("onnxruntime is required for the ONNX embedding backend (pip install onnxruntime)") from e
+        from transformers import AutoTokenizer
+
+        with open(os.path.join(model_dir, EXPORT_CONFIG_FILE), 'r', encoding='utf-8') as f:
+            self.export_config = json.load(f)
+
+        variant = "int8" if quantized else "fp32"
+        if variant not in self.export_config["files"]:
+            raise FileNotFoundError(f"ONNX {variant} model not exported in {model_dir}")
+        self.variant = variant
+        self.model_file = os.path.join(model_dir, self.export_config["files"][variant])
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.inter_op_num_threads = 1
+        if intra_op_threads:
+            options.intra_op_num_threads = int(intra_op_threads)
+        self.intra_op_threads = intra_op_threads
+
+        self.session = ort.InferenceSession(self.model_file, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+        self.output_name = self.session.get_outputs()[0].name
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir, local_files_only=True)
+
+        self.pooling = self.export_config["pooling"]
+        self.normalize = self.export_config["normalize"]
+        self.max_seq_length = self.export_config["max_seq_length"]
+        self.dimension = self.export_config["dimension"]
+
+    def encode(self,
+               sentences: Union[str, List[str]],
+               batch_size: int = 32,
+               show_progress_bar: bool = False,
+               convert_to_numpy: bool = True) -> np.ndarray:
+        """
+        Tạo embeddings (giống SentenceTransformer.encode, chỉ trả numpy)
+
+        Args:
+            sentences: Một text hoặc danh sách texts (đã preprocess)
+            batch_size: Số texts mỗi lần chạy session
+            show_progress_bar: Không dùng (giữ cho cùng interface)
+            convert_to_numpy: Không dùng (luôn trả numpy)
+
+        Returns:
+            np.ndarray: Vector (dim,) với một text, ma trận (n, dim) với danh sách
+        """
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        batch_size = max(int(batch_size), 1)
+
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            tokens = self.tokenizer(
+                texts[start:start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np"
+            )
+            feeds = {name: tokens[name].astype(np.int64) for name in self.input_names if name in tokens}
+            hidden_states = self.session.run([self.output_name], feeds)[0]
+            batches.append(pool_embeddings(hidden_states, tokens["attention_mask"], self.pooling, self.normalize))
+
+        embeddings = np.concatenate(batches) if batches else np.zeros((0, self.dimension), dtype=np.float32)
+        return embeddings[0] if single else embeddings
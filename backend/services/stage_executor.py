@@ -0,0 +1,150 @@
+"""
+Stage Executors - Chạy search/inference blocking ngoài event loop
+Mỗi stage (faiss, embedding, llm) có executor riêng giới hạn số workers và số việc chờ, kèm gauge queue depth
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+class StageOverloadedError(RuntimeError):
+    """Stage đã đủ max_queue việc chờ - request nên được trả 503 thay vì xếp hàng vô hạn"""
+
+class StageExecutor:
+    def __init__(self, name: str, max_workers: int = 1, max_queue: int = 0):
+        """
+        Khởi tạo executor cho một stage
+
+        Args:
+            name: Tên stage (prefix tên thread và key trong metrics)
+            max_workers: Số threads chạy song song
+            max_queue: Số việc tối đa đang chờ worker (0 = không giới hạn)
+        """
+        self.name = name
+        self.max_workers = max(int(max_workers), 1)
+        self.max_queue = max(int(max_queue), 0)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+
+        # Gauges
+        self.queued = 0
+        self.running = 0
+
+        self.metrics = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "cancelled": 0,
+            "rejected": 0,
+            "max_queue_depth": 0,
+            "total_wait_ms": 0.0,
+            "total_run_ms": 0.0
+        }
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """
+        Đưa fn(*args, **kwargs) vào hàng đợi của stage
+
+        Returns:
+            Future: concurrent.futures.Future của kết quả
+
+        Raises:
+            StageOverloadedError: Hàng đợi đã đủ max_queue việc
+        """
+        with self._lock:
+            if self.max_queue and self.queued >= self.max_queue:
+                self.metrics["rejected"] += 1
+                raise StageOverloadedError(f"Stage {self.name} overloaded: {self.queued} tasks waiting")
+            self.queued += 1
+            self.metrics["submitted"] += 1
+            self.metrics["max_queue_depth"] = max(self.metrics["max_queue_depth"], self.queued)
+        enqueued_at = time.perf_counter()
+
+        def task():
+            started = time.perf_counter()
+            with self._lock:
+                self.queued -= 1
+                self.running += 1
+                self.metrics["total_wait_ms"] += (started - enqueued_at) * 1000
+            outcome = "failed"
+            try:
+                result = fn(*args, **kwargs)
+                outcome = "completed"
+                return result
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.metrics[outcome] += 1
+                    self.metrics["total_run_ms"] += (time.perf_counter() - started) * 1000
+
+        future = self._executor.submit(task)
+        # Việc bị hủy khi còn trong hàng đợi (request bị hủy) không bao giờ chạy task()
+        future.add_done_callback(lambda f: f.cancelled() and self._on_cancelled())
+        return future
+
+    def _on_cancelled(self):
+        with self._lock:
+            self.queued -= 1
+            self.metrics["cancelled"] += 1
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Chạy fn(*args, **kwargs) trên thread của stage, event loop tiếp tục phục vụ request khác trong lúc chờ
+
+        Returns:
+            Any: Kết quả của fn
+        """
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Lấy gauges (queue_depth, running) và metrics của stage
+        """
+        with self._lock:
+            finished = self.metrics["completed"] + self.metrics["failed"]
+            started = finished + self.running
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queue_depth": self.queued,
+                "running": self.running,
+                **{key: value for key, value in self.metrics.items() if not key.startswith("total_")},
+                "avg_wait_ms": round(self.metrics["total_wait_ms"] / started, 3) if started else 0.0,
+                "avg_run_ms": round(self.metrics["total_run_ms"] / finished, 3) if finished else 0.0
+            }
+
+    def shutdown(self, wait: bool = True):
+        """
+        Dừng executor (việc đang chờ bị hủy)
+        """
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+        logger.info(f"✅ Stage executor {self.name} stopped")
+
+# Global instances: FAISS search chạy song song (faiss nhả GIL), mỗi model một inference worker
+faiss_executor = StageExecutor(
+    "faiss",
+    max_workers=int(os.getenv("FAISS_SEARCH_WORKERS", "4")),
+    max_queue=int(os.getenv("FAISS_SEARCH_MAX_QUEUE", "256"))
+)
+embedding_executor = StageExecutor(
+    "embedding",
+    max_workers=1,
+    max_queue=int(os.getenv("EMBEDDING_MAX_QUEUE", "64"))
+)
+llm_executor = StageExecutor(
+    "llm",
+    max_workers=int(os.getenv("LLM_WORKERS", "1")),
+    max_queue=int(os.getenv("LLM_MAX_QUEUE", "8"))
+)
+
+def get_stage_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Gauges của tất cả stages
+    """
+    return {executor.name: executor.get_stats() for executor in (faiss_executor, embedding_executor, llm_executor)}
@@ -104,7 +104,8 @@ class VectorService:
     def add_document_chunks(self, 
                            chunks: List[str], 
                            doc_id: str,
-                           filename: str = "") -> List[str]:
+                           filename: str = "",
+                           category: Optional[str] = None) -> List[str]:
         """
         Thêm nhiều chunks của document
         
@@ -112,6 +113,7 @@ class VectorService:
             chunks: Danh sách text chunks
             doc_id: ID của document
             filename: Tên file
+            category: Category của document (dùng cho filtered search)
             
         Returns:
             List[str]: Danh sách chunk IDs
@@ -124,7 +126,8 @@ class VectorService:
                 chunks=chunks,
                 doc_id=doc_id,
                 filename=filename,
-                embedding_service=self.embedding_service
+                embedding_service=self.embedding_service,
+                category=category
             )
             
             logger.info(f"✅ Added {len(chunks)} chunks for document {doc_id}")
@@ -134,6 +137,32 @@ class VectorService:
             logger.error(f"❌ Error adding document chunks: {e}")
             raise
 
+    def add_documents_batch(self, documents: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Thêm chunks của nhiều documents trong một lần bulk ingestion
+
+        Args:
+            documents: Danh sách {"doc_id": str, "chunks": List[str], "filename": str}
+
+        Returns:
+            Dict: Chunk IDs theo document và timings từng stage
+        """
+        if not self.is_initialized:
+            raise RuntimeError("Vector Service not initialized. Call initialize() first.")
+
+        try:
+            result = self.faiss_store.add_documents_batch(
+                documents=documents,
+                embedding_service=self.embedding_service
+            )
+
+            logger.info(f"✅ Bulk added {result['total_chunks']} chunks for {len(documents)} documents")
+            return result
+
+        except Exception as e:
+            logger.error(f"❌ Error in bulk ingestion: {e}")
+            raise
+
     def search(self, 
                query: str, 
                top_k: int = 5, 
@@ -167,6 +196,42 @@ class VectorService:
             logger.error(f"❌ Error searching: {e}")
             raise
 
+    def search_batch(self,
+                     queries: List[str],
+                     top_k: int = 5,
+                     doc_id: Optional[str] = None,
+                     category: Optional[str] = None) -> List[List[Dict[str, Any]]]:
+        """
+        Tìm kiếm nhiều queries trong một lần encode + một lần search
+        
+        Args:
+            queries: Danh sách text queries
+            top_k: Số lượng kết quả mỗi query
+            doc_id: Nếu có, chỉ tìm trong document này
+            category: Nếu có, chỉ tìm trong category này
+            
+        Returns:
+            List[List[Dict]]: Kết quả theo thứ tự các queries
+        """
+        if not self.is_initialized:
+            raise RuntimeError("Vector Service not initialized. Call initialize() first.")
+        
+        try:
+            results = self.faiss_store.search_text_batch(
+                query_texts=queries,
+                top_k=top_k,
+                doc_id=doc_id,
+                category=category,
+                embedding_service=self.embedding_service
+            )
+            
+            logger.info(f"✅ Batch search completed: {len(queries)} queries")
+            return results
+            
+        except Exception as e:
+            logger.error(f"❌ Error in batch search: {e}")
+            raise
+
     def clear_doc(self, doc_id: str) -> bool:
         """
         Xóa document khỏi vector database
@@ -194,6 +259,55 @@ class VectorService:
             logger.error(f"❌ Error clearing document: {e}")
             raise
 
+    def clear_category(self, category: str) -> int:
+        """
+        Xóa tất cả documents của một category
+        
+        Args:
+            category: Tên category
+            
+        Returns:
+            int: Số documents đã xóa
+        """
+        if not self.is_initialized:
+            raise RuntimeError("Vector Service not initialized. Call initialize() first.")
+        
+        try:
+            removed = self.faiss_store.clear_category(category)
+            logger.info(f"✅ Cleared {removed} documents of category {category}")
+            return removed
+            
+        except Exception as e:
+            logger.error(f"❌ Error clearing category: {e}")
+            raise
+
+    def reload_category(self, category: str, documents: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Thay toàn bộ documents của category (store chia shard theo category chỉ ghi shard đó)
+        
+        Args:
+            category: Tên category
+            documents: Danh sách {"doc_id": str, "chunks": List[str], "filename": str}
+            
+        Returns:
+            Dict: Số documents đã xóa, chunk IDs theo document và tổng số chunks
+        """
+        if not self.is_initialized:
+            raise RuntimeError("Vector Service not initialized. Call initialize() first.")
+        
+        try:
+            result = self.faiss_store.reload_category(
+                category,
+                documents,
+                embedding_service=self.embedding_service
+            )
+            logger.info(f"✅ Reloaded category {category}: {result['total_chunks']} chunks")
+            return result
+            
+        except Exception as e:
+            logger.error(f"❌ Error reloading category: {e}")
+            raise
+
     def get_document_chunks(self, doc_id: str) -> List[Dict[str, Any]]:
         """
         Lấy tất cả chunks của document
@@ -255,6 +369,21 @@ class VectorService:
             logger.error(f"❌ Error backing up: {e}")
             raise
 
+    def restore(self, backup_path: str, verify: bool = True):
+        """
+        Restore vector database từ backup (kiểm tra checksum trước khi thay dữ liệu)
+        """
+        if not self.is_initialized:
+            raise RuntimeError("Vector Service not initialized. Call initialize() first.")
+        
+        try:
+            self.faiss_store.restore(backup_path, verify=verify)
+            logger.info(f"✅ Restored vector database from {backup_path}")
+        
+        except Exception as e:
+            logger.error(f"❌ Error restoring: {e}")
+            raise
+
     def clear_all(self):
         """
         Xóa tất cả dữ liệu
@@ -0,0 +1,120 @@
+"""
+Test script cho Embedding Batcher
+Test gom requests đồng thời thành micro-batch với embedding service giả lập (không cần model)
+"""
+
+import os
+import sys
+import time
+import asyncio
+import threading
+import numpy as np
+
+# Add backend to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.embedding_batcher import EmbeddingBatcher
+
+DIMENSION = 16
+
+class FakeEmbeddingService:
+    """Embedding service giả lập: ghi lại kích thước từng batch, encode mất encode_ms"""
+
+    def __init__(self, encode_ms: float = 10.0):
+        self.encode_ms = encode_ms
+        self.batches = []
+        self.threads = set()
+        self.fail_next = False
+
+    @staticmethod
+    def embed(text: str) -> np.ndarray:
+        return np.full(DIMENSION, len(text), dtype=np.float32)
+
+    def generate_embeddings_batch(self, texts, batch_size: int = 8, show_progress_bar: bool = True) -> np.ndarray:
+        self.threads.add(threading.current_thread().name)
+        time.sleep(self.encode_ms / 1000)
+        if self.fail_next:
+            self.fail_next = False
+            raise RuntimeError("model error")
+        self.batches.append(len(texts))
+        return np.stack([self.embed(text) for text in texts])
+
+def test_concurrent_requests_are_batched():
+    """Requests đồng thời dùng chung forward model, không batch nào vượt max_batch_size"""
+    print("\n🧪 Testing concurrent requests are batched...")
+    service = FakeEmbeddingService()
+    batcher = EmbeddingBatcher(service, max_batch_size=8, max_wait_ms=20)
+    texts = ["x" * (i + 1) for i in range(20)]
+
+    async def run():
+        results = await asyncio.gather(*(batcher.embed(text) for text in texts))
+        await batcher.stop()
+        return results
+
+    results = asyncio.run(run())
+    for text, embedding in zip(texts, results):
+        assert np.array_equal(embedding, FakeEmbeddingService.embed(text))
+    assert sum(service.batches) == 20 and max(service.batches) <= 8 and len(service.batches) == 3
+    assert service.threads == {"embedding-batcher_0"}
+
+    stats = batcher.get_stats()
+    assert stats["batches"] == 3 and stats["items"] == 20 and stats["max_observed_batch_size"] == 8
+    assert stats["avg_batch_size"] == round(20 / 3, 2) and stats["queue_depth"] == 0
+    print(f"✅ Concurrent requests batched: {service.batches}")
+
+def test_max_wait_and_event_loop():
+    """Request đơn lẻ chỉ chờ tối đa max_wait_ms; event loop vẫn chạy trong lúc encode"""
+    print("\n🧪 Testing max wait and event loop...")
+    service = FakeEmbeddingService(encode_ms=50)
+    batcher = EmbeddingBatcher(service, max_batch_size=32, max_wait_ms=5)
+
+    async def run():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.005)
+                ticks += 1
+
+        ticker_task = asyncio.create_task(ticker())
+        start = time.perf_counter()
+        embedding = await batcher.embed("một câu hỏi")
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        ticker_task.cancel()
+        await batcher.stop()
+        return embedding, elapsed_ms, ticks
+
+    embedding, elapsed_ms, ticks = asyncio.run(run())
+    assert np.array_equal(embedding, FakeEmbeddingService.embed("một câu hỏi"))
+    assert elapsed_ms < 50 + 5 + 100, elapsed_ms
+    assert ticks >= 5, ticks
+    assert batcher.get_stats()["max_observed_wait_ms"] < 5 + 50
+    print(f"✅ Single request served in {elapsed_ms:.1f} ms")
+
+def test_errors_and_restart():
+    """Lỗi model trả về cho mọi request trong batch; worker tiếp tục và chạy được trên event loop mới"""
+    print("\n🧪 Testing errors and restart...")
+    service = FakeEmbeddingService(encode_ms=1)
+    batcher = EmbeddingBatcher(service, max_batch_size=4, max_wait_ms=10)
+
+    async def run():
+        service.fail_next = True
+        results = await asyncio.gather(*(batcher.embed(t) for t in ("a", "bb")), return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+        return await batcher.embed_many(["ccc", "dddd"])
+
+    embeddings = asyncio.run(run())
+    assert [float(e[0]) for e in embeddings] == [3.0, 4.0]
+    assert batcher.get_stats()["errors"] == 1
+
+    # asyncio.run mới -> worker được tạo lại trên loop mới
+    embedding = asyncio.run(batcher.embed("eeeee"))
+    assert float(embedding[0]) == 5.0 and batcher.get_stats()["batches"] == 2
+    print("✅ Errors and restart OK")
+
+if __name__ == "__main__":
+    test_concurrent_requests_are_batched()
+    test_max_wait_and_event_loop()
+    test_errors_and_restart()
+    print("\n✅ All embedding batcher tests completed successfully!")
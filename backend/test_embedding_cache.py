@@ -0,0 +1,174 @@
+"""
+Test script cho Embedding Cache
+Test key theo nội dung, LRU bộ nhớ, tầng disk mmap và batch chỉ encode các texts chưa có (không cần model)
+"""
+
+import os
+import sys
+import tempfile
+import unicodedata
+import numpy as np
+
+# Add backend to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.embedding_cache import EmbeddingCache, make_cache_key, KEY_SIZE
+
+DIMENSION = 32
+MODEL = "intfloat/multilingual-e5-large"
+
+class FakeEncoder:
+    """Encoder giả lập: vector cố định theo text, đếm số texts đã encode"""
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.encoded = []
+
+    def __call__(self, positions):
+        self.encoded.extend(self.texts[i] for i in positions)
+        return np.stack([self.embed(self.texts[i]) for i in positions])
+
+    @staticmethod
+    def embed(text: str) -> np.ndarray:
+        seed = sum(text.encode("utf-8")) + len(text)
+        return np.random.default_rng(seed).standard_normal(DIMENSION).astype(np.float32)
+
+def keys_of(texts):
+    return [make_cache_key(MODEL, "query: ", text) for text in texts]
+
+def test_cache_keys():
+    """Key theo (model, prefix, text đã chuẩn hóa)"""
+    print("\n🧪 Testing embedding cache keys...")
+    text = "Điều 5. Quyền và nghĩa vụ"
+    key = make_cache_key(MODEL, "query: ", text)
+    assert len(key) == KEY_SIZE
+    assert make_cache_key(MODEL, "query: ", f"  {text}\n") == key
+    assert make_cache_key(MODEL, "query: ", text.replace(" ", "   ")) == key
+    assert make_cache_key(MODEL, "query: ", unicodedata.normalize("NFD", text)) == key
+    assert make_cache_key(MODEL, "passage: ", text) != key
+    assert make_cache_key("other-model", "query: ", text) != key
+    assert make_cache_key(MODEL, "query: ", text.lower()) != key
+    print("✅ Embedding cache keys OK")
+
+def test_batch_encodes_only_misses():
+    """get_or_compute chỉ encode keys chưa có, mỗi text trùng trong batch encode một lần"""
+    print("\n🧪 Testing batch encodes only misses...")
+    cache = EmbeddingCache(DIMENSION, memory_size=100)
+    texts = ["a", "b", "a", "c"]
+    encoder = FakeEncoder(texts)
+    vectors = cache.get_or_compute(keys_of(texts), encoder)
+    assert encoder.encoded == ["a", "b", "c"]
+    assert np.allclose(vectors, np.stack([FakeEncoder.embed(text) for text in texts]))
+
+    texts = ["c", "d", "a", "d"]
+    encoder = FakeEncoder(texts)
+    vectors = cache.get_or_compute(keys_of(texts), encoder)
+    assert encoder.encoded == ["d"]
+    assert np.allclose(vectors, np.stack([FakeEncoder.embed(text) for text in texts]))
+
+    # Kết quả trả về là bản sao: sửa in-place (vd normalize) không làm hỏng cache
+    vectors[:] = 0
+    assert np.allclose(cache.get_or_compute(keys_of(["a"]), FakeEncoder(["a"]))[0], FakeEncoder.embed("a"))
+
+    stats = cache.get_stats()
+    assert stats["encoded"] == 4 and stats["memory_hits"] == 3 and stats["misses"] == 6
+    assert stats["disk_entries"] is None and stats["memory_entries"] == 4
+    assert cache.get_or_compute([], FakeEncoder([])).shape == (0, DIMENSION)
+    print("✅ Batch encodes only misses OK")
+
+def test_lru_and_disk_tier():
+    """LRU bỏ entry cũ nhất, tầng disk vẫn giữ và được đọc lại sau khi mở lại cache"""
+    print("\n🧪 Testing LRU and disk tier...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        texts = [f"đoạn {i}" for i in range(5)]
+        cache = EmbeddingCache(DIMENSION, cache_dir=tmp_dir, memory_size=2)
+        cache.get_or_compute(keys_of(texts), FakeEncoder(texts))
+        stats = cache.get_stats()
+        assert stats["memory_entries"] == 2 and stats["disk_entries"] == 5
+
+        # "đoạn 0" đã bị LRU bỏ -> đọc từ disk
+        encoder = FakeEncoder(texts[:1])
+        vector = cache.get_or_compute(keys_of(texts[:1]), encoder)[0]
+        assert encoder.encoded == [] and cache.get_stats()["disk_hits"] == 1
+        assert np.allclose(vector, FakeEncoder.embed(texts[0]))
+        cache.close()
+
+        # Mở lại (process mới): toàn bộ từ disk, không encode
+        cache = EmbeddingCache(DIMENSION, cache_dir=tmp_dir, memory_size=10)
+        encoder = FakeEncoder(texts + ["mới"])
+        vectors = cache.get_or_compute(keys_of(texts + ["mới"]), encoder)
+        assert encoder.encoded == ["mới"]
+        assert np.allclose(vectors, np.stack([FakeEncoder.embed(text) for text in texts + ["mới"]]))
+        assert cache.get_stats()["disk_entries"] == 6
+        cache.close()
+
+        # Crash giữa lúc ghi: vector đã ghi, key chưa -> row dở bị cắt khi mở lại
+        with open(os.path.join(tmp_dir, "vectors.f32"), "ab") as f:
+            f.write(np.ones(DIMENSION + 3, dtype=np.float32).tobytes())
+        cache = EmbeddingCache(DIMENSION, cache_dir=tmp_dir)
+        _, found = cache.get_many(keys_of(texts + ["mới", "khác"]))
+        assert found.tolist() == [True] * 6 + [False]
+        assert os.path.getsize(os.path.join(tmp_dir, "vectors.f32")) == 6 * DIMENSION * 4
+
+        cache.clear()
+        _, found = cache.get_many(keys_of(texts))
+        assert not found.any() and cache.get_stats()["disk_entries"] == 0
+        cache.close()
+
+        # Dimension khác -> cache cũ bị reset thay vì đọc sai
+        cache = EmbeddingCache(DIMENSION * 2, cache_dir=tmp_dir)
+        assert cache.get_stats()["disk_entries"] is None
+        _, found = cache.get_many(keys_of(texts))
+        assert not found.any()
+        cache.close()
+    print("✅ LRU and disk tier OK")
+
+def test_disk_cap_compaction():
+    """Vượt max_disk_entries -> compact giữ các entries dùng gần nhất, mở lại vẫn đọc đúng"""
+    print("\n🧪 Testing disk cap compaction...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        texts = [f"điều {i}" for i in range(8)]
+        cache = EmbeddingCache(DIMENSION, cache_dir=tmp_dir, memory_size=0, max_disk_entries=8)
+        cache.get_or_compute(keys_of(texts), FakeEncoder(texts))
+        assert cache.get_stats()["disk_entries"] == 8
+
+        # Đọc lại "điều 0" -> mới hơn các entries chưa đọc
+        cache.get_or_compute(keys_of(texts[:1]), FakeEncoder(texts[:1]))
+        new_texts = ["mới 0", "mới 1"]
+        cache.get_or_compute(keys_of(new_texts), FakeEncoder(new_texts))
+        stats = cache.get_stats()
+        assert stats["disk_entries"] == 6 and stats["disk_evicted"] == 4
+        assert os.path.getsize(os.path.join(tmp_dir, "vectors.f32")) == 6 * DIMENSION * 4
+        assert os.path.getsize(os.path.join(tmp_dir, "keys.bin")) == 6 * KEY_SIZE
+
+        kept = [texts[0]] + texts[5:] + new_texts
+        _, found = cache.get_many(keys_of(texts + new_texts))
+        assert found.tolist() == [True] + [False] * 4 + [True] * 5
+        # Ghi tiếp sau compact vẫn append đúng
+        cache.get_or_compute(keys_of(["sau"]), FakeEncoder(["sau"]))
+        cache.close()
+
+        cache = EmbeddingCache(DIMENSION, cache_dir=tmp_dir, max_disk_entries=8)
+        encoder = FakeEncoder(kept + ["sau"])
+        vectors = cache.get_or_compute(keys_of(kept + ["sau"]), encoder)
+        assert encoder.encoded == []
+        assert np.allclose(vectors, np.stack([FakeEncoder.embed(text) for text in kept + ["sau"]]))
+        cache.close()
+
+        # Crash giữa lúc thay file (meta còn đánh dấu compacting) -> reset thay vì đọc lệch row
+        cache = EmbeddingCache(DIMENSION, cache_dir=tmp_dir)
+        cache.get_many(keys_of(kept))
+        cache._write_meta(compacting=True)
+        cache.close()
+        cache = EmbeddingCache(DIMENSION, cache_dir=tmp_dir)
+        _, found = cache.get_many(keys_of(kept))
+        assert not found.any()
+        cache.close()
+    print("✅ Disk cap compaction OK")
+
+if __name__ == "__main__":
+    test_cache_keys()
+    test_batch_encodes_only_misses()
+    test_lru_and_disk_tier()
+    test_disk_cap_compaction()
+    print("\n✅ All embedding cache tests completed successfully!")
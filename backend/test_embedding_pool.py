@@ -0,0 +1,147 @@
+"""
+Test script cho Embedding Pool
+Test encode bằng nhiều worker processes, chia threads, shared memory và xử lý lỗi (encoder giả lập, không cần model)
+"""
+
+import os
+import sys
+import time
+import zlib
+import functools
+import numpy as np
+from multiprocessing import shared_memory
+
+# Add backend to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.embedding_pool import EmbeddingPool
+
+DIMENSION = 8
+
+def fake_vector(text: str, threads: int) -> list:
+    """Embedding giả lập: (crc32 text, độ dài text, threads của worker, pid, ...)"""
+    return [zlib.crc32(text.encode()) % 100000, len(text), threads, os.getpid() % 100000] + [0.5] * (DIMENSION - 4)
+
+def make_fake_encoder(threads: int, fail_on: str = None, fail_load: bool = False):
+    """Factory chạy trong worker (module-level để picklable với spawn)"""
+    if fail_load:
+        raise RuntimeError("model not found")
+
+    def encode(texts):
+        if fail_on is not None and fail_on in texts:
+            raise ValueError(f"cannot encode {fail_on}")
+        time.sleep(0.01)  # Giả lập forward model để các workers cùng nhận tasks
+        return np.array([fake_vector(text, threads) for text in texts], dtype=np.float32)
+    return encode
+
+# Trong worker: biến môi trường threads lúc module được import khi unpickle args (trước _worker_main)
+IMPORT_THREAD_ENV = [int(os.environ.get(variable, "0")) for variable in ("OMP_NUM_THREADS", "MKL_NUM_THREADS")]
+
+def make_env_encoder(threads: int):
+    """Factory trả biến môi trường threads mà worker thấy lúc import (như torch/numpy load BLAS)"""
+    def encode(texts):
+        return np.array([IMPORT_THREAD_ENV + [0.0] * (DIMENSION - 2) for _ in texts], dtype=np.float32)
+    return encode
+
+def test_pool_encode():
+    """Kết quả đúng thứ tự texts, tasks được chia cho các workers, buffer shared memory được giải phóng"""
+    print("\n🧪 Testing pool encode...")
+    texts = [f"chunk {i} " + "x" * (i * 37 % 200) for i in range(300)]
+    pool = EmbeddingPool(make_fake_encoder, DIMENSION, num_workers=2, threads_per_worker=3, chunk_size=16)
+    pool.start()
+    try:
+        embeddings = pool.encode(texts)
+        assert embeddings.dtype == np.float32 and embeddings.shape == (len(texts), DIMENSION)
+        expected = np.array([fake_vector(text, 3) for text in texts], dtype=np.float32)
+        assert np.array_equal(embeddings[:, :3], expected[:, :3])
+        worker_pids = {process.pid % 100000 for process in pool.processes}
+        assert set(embeddings[:, 3].tolist()) == worker_pids and os.getpid() % 100000 not in worker_pids
+
+        assert pool.encode([]).shape == (0, DIMENSION)
+        stats = pool.get_stats()
+        assert stats["texts"] == len(texts) and stats["tasks"] == -(-len(texts) // 16)
+        assert sum(stats["tasks_per_worker"]) == stats["tasks"] and min(stats["tasks_per_worker"]) > 0
+
+        # Lần encode sau dùng buffer mới, buffer cũ đã unlink
+        again = pool.encode(texts[:40])
+        assert np.array_equal(again[:, :3], embeddings[:40, :3])
+    finally:
+        pool.stop()
+    assert not pool.is_started and pool.processes == []
+    print(f"✅ Pool encode OK: {stats['tasks_per_worker']} tasks per worker")
+
+def test_shared_memory_released():
+    """Không để lại shared memory sau encode, kể cả khi task lỗi"""
+    print("\n🧪 Testing shared memory release...")
+    created = []
+    original = shared_memory.SharedMemory.__init__
+
+    def tracking_init(self, *args, **kwargs):
+        original(self, *args, **kwargs)
+        if kwargs.get("create"):
+            created.append(self.name)
+
+    shared_memory.SharedMemory.__init__ = tracking_init
+    pool = EmbeddingPool(functools.partial(make_fake_encoder, fail_on="bad"), DIMENSION, num_workers=2, chunk_size=4)
+    pool.start()
+    try:
+        pool.encode(["a", "b", "c", "d", "e"])
+        try:
+            pool.encode(["a", "b", "bad", "c", "d", "e", "f", "g", "h"])
+            assert False, "worker error should be raised"
+        except RuntimeError as e:
+            assert "cannot encode bad" in str(e)
+
+        # Pool vẫn dùng được sau task lỗi
+        assert pool.encode(["ok"]).shape == (1, DIMENSION)
+    finally:
+        pool.stop()
+        shared_memory.SharedMemory.__init__ = original
+
+    assert len(created) == 3
+    for name in created:
+        try:
+            shared_memory.SharedMemory(name=name)
+            assert False, f"shared memory {name} was not unlinked"
+        except FileNotFoundError:
+            pass
+    print("✅ Shared memory released")
+
+def test_worker_load_failure():
+    """Worker không load được model -> start() báo lỗi và dọn processes"""
+    print("\n🧪 Testing worker load failure...")
+    pool = EmbeddingPool(functools.partial(make_fake_encoder, fail_load=True), DIMENSION, num_workers=2)
+    try:
+        pool.start()
+        assert False, "load failure should be raised"
+    except RuntimeError as e:
+        assert "model not found" in str(e)
+    assert not pool.is_started and pool.processes == []
+
+    try:
+        pool.encode(["text"])
+        assert False, "encode before start should be rejected"
+    except RuntimeError:
+        pass
+    print("✅ Worker load failure OK")
+
+def test_worker_thread_env():
+    """Worker thấy OMP/MKL_NUM_THREADS = threads_per_worker ngay từ lúc start, process chính giữ nguyên"""
+    print("\n🧪 Testing worker thread env...")
+    before = {variable: os.environ.get(variable) for variable in ("OMP_NUM_THREADS", "MKL_NUM_THREADS")}
+    pool = EmbeddingPool(make_env_encoder, DIMENSION, num_workers=2, threads_per_worker=3, chunk_size=1)
+    pool.start()
+    try:
+        embeddings = pool.encode(["a", "b", "c", "d"])
+        assert np.array_equal(embeddings[:, :2], np.full((4, 2), 3.0, dtype=np.float32))
+    finally:
+        pool.stop()
+    assert {variable: os.environ.get(variable) for variable in before} == before
+    print("✅ Worker thread env OK")
+
+if __name__ == "__main__":
+    test_pool_encode()
+    test_shared_memory_released()
+    test_worker_load_failure()
+    test_worker_thread_env()
+    print("\n✅ All embedding pool tests completed successfully!")
@@ -0,0 +1,1281 @@
+"""
+Test script cho FAISS Store
+Test ingestion, search và xóa document với embedding giả lập (không cần model)
+"""
+
+import os
+import sys
+import json
+import tempfile
+import time
+import hashlib
+import threading
+import numpy as np
+
+# Add backend to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from db.faiss_store import FAISSStore
+from db.sharded_store import ShardedFAISSStore
+from db.store_backup import read_manifest
+from db.vector_db import VectorDB
+from db.vector_store import VectorStore, CHUNK_FIELDS, create_metadata_store
+
+DIMENSION = 64
+
+class FakeEmbeddingService:
+    """Embedding service giả lập: vector ngẫu nhiên cố định theo nội dung text"""
+
+    def __init__(self, dimension: int = DIMENSION):
+        self.dimension = dimension
+        self.batch_calls = 0
+        self.single_calls = 0
+
+    def _embed(self, text: str) -> np.ndarray:
+        seed = int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+        return np.random.default_rng(seed).standard_normal(self.dimension).astype(np.float32)
+
+    def generate_embedding(self, text: str) -> np.ndarray:
+        self.single_calls += 1
+        return self._embed(text)
+
+    def generate_embeddings_batch(self, texts, batch_size: int = 8, show_progress_bar: bool = True) -> np.ndarray:
+        self.batch_calls += 1
+        return np.stack([self._embed(text) for text in texts])
+
+    def normalize_embedding(self, embedding: np.ndarray) -> np.ndarray:
+        norm = np.linalg.norm(embedding)
+        return embedding if norm == 0 else embedding / norm
+
+    def validate_embedding(self, embedding: np.ndarray) -> bool:
+        return embedding.ndim == 1 and embedding.shape[0] == self.dimension
+
+def create_store(tmp_dir: str) -> FAISSStore:
+    """Tạo FAISS store trong thư mục tạm"""
+    store = FAISSStore(
+        index_path=os.path.join(tmp_dir, "faiss_index"),
+        metadata_path=os.path.join(tmp_dir, "metadata"),
+        dimension=DIMENSION
+    )
+    store.initialize_index()
+    return store
+
+def make_chunks(doc_id: str, count: int):
+    return [f"{doc_id} - đoạn văn bản số {i}" for i in range(count)]
+
+def test_bulk_ingestion():
+    """Bulk ingestion encode một lần và trả về timings"""
+    print("\n🧪 Testing bulk ingestion...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = create_store(tmp_dir)
+        embedding_service = FakeEmbeddingService()
+
+        result = store.add_documents_batch(
+            documents=[
+                {"doc_id": "doc_a", "chunks": make_chunks("doc_a", 5), "filename": "a.txt"},
+                {"doc_id": "doc_b", "chunks": make_chunks("doc_b", 3), "filename": "b.txt"}
+            ],
+            embedding_service=embedding_service
+        )
+
+        assert result["total_chunks"] == 8
+        assert embedding_service.batch_calls == 1
+        assert embedding_service.single_calls == 0
+        assert result["chunk_ids"]["doc_b"] == ["doc_b_0", "doc_b_1", "doc_b_2"]
+        for stage in ("embedding", "normalize", "index_add", "metadata", "total"):
+            assert stage in result["timings"]
+        assert store._snapshot.ntotal == 8
+        assert store.get_stats()["total_chunks"] == 8
+
+        # Kết quả search phải trỏ đúng chunk
+        query = embedding_service.normalize_embedding(embedding_service._embed("doc_a - đoạn văn bản số 3"))
+        results = store.search(query.astype(np.float32), top_k=1)
+        assert results[0]["chunk_id"] == "doc_a_3"
+        print("✅ Bulk ingestion OK")
+
+def test_clear_doc_keeps_vector_ids():
+    """Xóa document theo ID, vector_index của các chunk còn lại không đổi"""
+    print("\n🧪 Testing clear_doc with stable vector IDs...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = create_store(tmp_dir)
+        embedding_service = FakeEmbeddingService()
+        store.add_document_chunks(make_chunks("doc_a", 4), "doc_a", "a.txt", embedding_service)
+        store.add_document_chunks(make_chunks("doc_b", 4), "doc_b", "b.txt", embedding_service)
+        before = {m["chunk_id"]: m["vector_index"] for m in store.metadata.values()}
+
+        assert store.clear_doc("doc_a")
+        assert store.get_stats()["total_vectors"] == 4
+        for chunk in store.get_document_chunks("doc_b"):
+            assert chunk["vector_index"] == before[chunk["chunk_id"]]
+
+        # vector_index vẫn trỏ đúng vector trong index
+        chunk = store.get_document_chunks("doc_b")[2]
+        query = embedding_service.normalize_embedding(embedding_service._embed(chunk["content"]))
+        results = store.search(query.astype(np.float32), top_k=1)
+        assert results[0]["vector_index"] == chunk["vector_index"]
+
+        # ID mới không dùng lại ID đã xóa, kể cả sau khi save/load
+        store.save_index()
+        reloaded = create_store(tmp_dir)
+        reloaded.load_index()
+        new_ids = reloaded.add_document_chunks(make_chunks("doc_c", 1), "doc_c", "c.txt", embedding_service)
+        new_vector_id = reloaded.doc_metadata["doc_c"]["vector_ids"][0]
+        assert new_ids == ["doc_c_0"]
+        assert new_vector_id == max(before.values()) + 1
+        print("✅ clear_doc OK")
+
+def test_migrate_index_types():
+    """Migrate flat index sang các index xấp xỉ, search và xóa vẫn đúng"""
+    print("\n🧪 Testing index migration...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = create_store(tmp_dir)
+        store.index_params.update({"nlist": 4, "pq_m": 8, "pq_nbits": 4, "hnsw_m": 8})
+        embedding_service = FakeEmbeddingService()
+        store.add_document_chunks(make_chunks("doc_a", 300), "doc_a", "a.txt", embedding_service)
+        store.add_document_chunks(make_chunks("doc_b", 20), "doc_b", "b.txt", embedding_service)
+        query = embedding_service.normalize_embedding(embedding_service._embed("doc_b - đoạn văn bản số 7"))
+
+        for index_type in ("hnsw", "ivf_flat", "ivf_pq", "opq_ivf_pq"):
+            store.migrate_index(index_type)
+            assert store.get_stats()["index_type"] == index_type
+            assert store._snapshot.ntotal == 320
+            results = store.search(query.astype(np.float32), top_k=3, nprobe=4, ef_search=64)
+            assert results[0]["chunk_id"] == "doc_b_7"
+
+        # Loại index được giữ sau save/load, xóa document vẫn hoạt động
+        store.save_index()
+        reloaded = create_store(tmp_dir)
+        reloaded.load_index()
+        assert reloaded.get_stats()["index_type"] == "opq_ivf_pq"
+        assert reloaded.clear_doc("doc_b")
+        assert reloaded.get_stats()["total_vectors"] == 300
+
+        reloaded.migrate_index("hnsw")
+        assert reloaded.clear_doc("doc_a")
+        assert reloaded.get_stats()["total_vectors"] == 0
+        print("✅ Index migration OK")
+
+def test_filtered_search_returns_top_k():
+    """Search theo doc_id/category luôn trả đủ top_k chunks thỏa filter"""
+    print("\n🧪 Testing pre-filtered search...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = create_store(tmp_dir)
+        embedding_service = FakeEmbeddingService()
+        store.add_documents_batch(
+            documents=[
+                {"doc_id": "luat_1", "chunks": make_chunks("luat_1", 200), "category": "Luat"},
+                {"doc_id": "luat_2", "chunks": make_chunks("luat_2", 50), "category": "Luat"},
+                {"doc_id": "tv_1", "chunks": make_chunks("tv_1", 6), "category": "TaiLieuTiengViet"}
+            ],
+            embedding_service=embedding_service
+        )
+        # Query gần với luat_1 -> top_k toàn cục không chứa tv_1
+        query = embedding_service.normalize_embedding(embedding_service._embed("luat_1 - đoạn văn bản số 1"))
+        query = query.astype(np.float32)
+
+        results = store.search(query, top_k=5, doc_id="tv_1")
+        assert len(results) == 5
+        assert all(r["doc_id"] == "tv_1" for r in results)
+        scores = [r["similarity_score"] for r in results]
+        assert scores == sorted(scores, reverse=True)
+
+        results = store.search(query, top_k=10, category="TaiLieuTiengViet")
+        assert len(results) == 6
+
+        # Tập ứng viên lớn hơn ngưỡng -> dùng IDSelector trong FAISS
+        store.exact_filter_threshold = 10
+        results = store.search(query, top_k=8, category="Luat")
+        assert len(results) == 8
+        assert all(r["category"] == "Luat" for r in results)
+        assert results[0]["chunk_id"] == "luat_1_1"
+
+        assert store.search(query, top_k=5, doc_id="tv_1", category="Luat") == []
+        assert store.search(query, top_k=5, doc_id="missing") == []
+        print("✅ Pre-filtered search OK")
+
+def test_columnar_metadata_store():
+    """Metadata lưu dạng cột + text blob, load lại bằng mmap, import metadata.json cũ"""
+    print("\n🧪 Testing columnar metadata store...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = create_store(tmp_dir)
+        embedding_service = FakeEmbeddingService()
+        store.add_document_chunks(make_chunks("doc_a", 10), "doc_a", "a.txt", embedding_service, category="Luat")
+        store.add_document_chunks(make_chunks("doc_b", 10), "doc_b", "b.txt", embedding_service)
+        store.save_index()
+        assert not os.path.exists(os.path.join(tmp_dir, "metadata", "metadata.json"))
+
+        reloaded = create_store(tmp_dir)
+        reloaded.load_index()
+        assert len(reloaded.metadata) == 20
+        chunk = reloaded.get_document_chunks("doc_a")[4]
+        assert chunk["content"] == "doc_a - đoạn văn bản số 4"
+        assert chunk["category"] == "Luat" and chunk["filename"] == "a.txt"
+
+        # Xóa hơn nửa số text -> blob được viết lại khi save
+        blob_before = reloaded.metadata.get_stats()["text_blob_bytes"]
+        reloaded.add_document_chunks(make_chunks("doc_c", 2), "doc_c", "c.txt", embedding_service)
+        assert reloaded.clear_doc("doc_a")
+        assert reloaded.clear_doc("doc_b")
+        reloaded.save_index()
+        stats = reloaded.metadata.get_stats()
+        assert stats["text_blob_bytes"] < blob_before
+        assert stats["deleted_text_bytes"] == 0
+        assert [c["content"] for c in reloaded.get_document_chunks("doc_c")] == make_chunks("doc_c", 2)
+
+    # Import metadata.json định dạng cũ
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = create_store(tmp_dir)
+        embedding_service = FakeEmbeddingService()
+        store.add_document_chunks(make_chunks("doc_a", 3), "doc_a", "a.txt", embedding_service)
+        store.save_index()
+        legacy = [dict(record) for record in store.metadata.values()]
+        store.metadata.clear()
+        store.metadata.save()
+        os.remove(os.path.join(tmp_dir, "metadata", "chunk_store.json"))
+        with open(os.path.join(tmp_dir, "metadata", "metadata.json"), "w", encoding="utf-8") as f:
+            json.dump(legacy, f, ensure_ascii=False)
+
+        reloaded = create_store(tmp_dir)
+        reloaded.load_index()
+        assert [c["content"] for c in reloaded.get_document_chunks("doc_a")] == make_chunks("doc_a", 3)
+    print("✅ Columnar metadata store OK")
+
+def test_mmap_index_loading():
+    """Load index bằng mmap: search trực tiếp trên file, ghi vào delta trong RAM"""
+    print("\n🧪 Testing mmap index loading...")
+    embedding_service = FakeEmbeddingService()
+    query = embedding_service.normalize_embedding(embedding_service._embed("doc_a - đoạn văn bản số 5"))
+    query = query.astype(np.float32)
+
+    for index_type in ("flat", "ivf_flat"):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            store = create_store(tmp_dir)
+            store.index_params.update({"nlist": 4})
+            store.add_document_chunks(make_chunks("doc_a", 100), "doc_a", "a.txt", embedding_service)
+            store.add_document_chunks(make_chunks("doc_b", 20), "doc_b", "b.txt", embedding_service)
+            store.migrate_index(index_type)
+            store.save_index()
+
+            reloaded = create_store(tmp_dir)
+            reloaded.mmap_index = True
+            reloaded.load_index()
+            stats = reloaded.get_stats()
+            assert stats["index_mmapped"] and stats["index_load"]["mmap"]
+            assert stats["index_load"]["load_time_seconds"] >= 0
+            assert stats["index_load"]["index_file_bytes"] > 0
+            assert "rss_bytes" in stats["process_memory"] or "max_rss_bytes" in stats["process_memory"]
+            assert reloaded.search(query, top_k=1, nprobe=4)[0]["chunk_id"] == "doc_a_5"
+
+            # Ghi sau khi mmap: vectors mới vào delta, index vẫn map từ file, kết quả không đổi
+            assert reloaded.clear_doc("doc_b")
+            reloaded.add_document_chunks(make_chunks("doc_c", 3), "doc_c", "c.txt", embedding_service)
+            assert reloaded.index_mmapped and reloaded.delta.ntotal == 3
+            assert reloaded.get_stats()["total_vectors"] == 103
+            assert reloaded.search(query, top_k=1, nprobe=4)[0]["chunk_id"] == "doc_a_5"
+
+            # Save ghi đè file đang map bằng rename atomic, merge delta rồi map lại file mới
+            reloaded.save_index()
+            assert reloaded.index_mmapped and reloaded.delta.ntotal == 0
+            assert reloaded.get_stats()["index_mmapped"] and reloaded.get_stats()["total_vectors"] == 103
+            assert reloaded.search(query, top_k=1, nprobe=4)[0]["chunk_id"] == "doc_a_5"
+            reloaded.add_document_chunks(make_chunks("doc_d", 2), "doc_d", "d.txt", embedding_service)
+            assert reloaded.index_mmapped and reloaded.delta.ntotal == 2
+            reloaded.save_index()
+            again = create_store(tmp_dir)
+            again.mmap_index = True
+            again.load_index()
+            assert again.get_stats()["total_vectors"] == 105
+    print("✅ mmap index loading OK")
+
+def test_wal_recovery():
+    """Thao tác sau checkpoint được phục hồi từ WAL, checkpoint xóa WAL"""
+    print("\n🧪 Testing WAL recovery...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = create_store(tmp_dir)
+        embedding_service = FakeEmbeddingService()
+        store.add_document_chunks(make_chunks("doc_a", 5), "doc_a", "a.txt", embedding_service)
+        store.save_index()
+        assert store.wal.size() == 0
+
+        # Không save: giả lập crash sau các thao tác này
+        store.add_document_chunks(make_chunks("doc_b", 4), "doc_b", "b.txt", embedding_service, category="Luat")
+        store.add_document("doc_c - một chunk", "doc_c", filename="c.txt", embedding_service=embedding_service)
+        assert store.clear_doc("doc_a")
+        assert store.wal.get_stats()["wal_records"] == 3
+        expected_ids = set(store.metadata.keys().tolist())
+
+        # Record ghi dở ở cuối file bị bỏ qua
+        with open(store.wal.wal_file, "ab") as f:
+            f.write(b"\x07\x00\x00")
+
+        recovered = create_store(tmp_dir)
+        recovered.load_index()
+        assert set(recovered.metadata.keys().tolist()) == expected_ids
+        assert recovered.get_stats()["total_vectors"] == 5
+        assert "doc_a" not in recovered.doc_metadata
+        assert recovered.doc_metadata["doc_b"]["category"] == "Luat"
+        assert [c["content"] for c in recovered.get_document_chunks("doc_b")] == make_chunks("doc_b", 4)
+        query = embedding_service.normalize_embedding(embedding_service._embed("doc_b - đoạn văn bản số 2"))
+        assert recovered.search(query.astype(np.float32), top_k=1)[0]["chunk_id"] == "doc_b_2"
+
+        # Replay lần hai (chưa checkpoint) không nhân đôi dữ liệu, LSN tiếp tục tăng
+        again = create_store(tmp_dir)
+        again.load_index()
+        assert again.get_stats()["total_vectors"] == 5 and len(again.metadata) == 5
+        again.add_document_chunks(make_chunks("doc_d", 2), "doc_d", "d.txt", embedding_service)
+        assert again.wal.last_lsn == 5
+
+        # Checkpoint tự động khi WAL vượt ngưỡng
+        again.checkpoint_wal_bytes = 1
+        again.add_document_chunks(make_chunks("doc_e", 2), "doc_e", "e.txt", embedding_service)
+        assert again.wal.size() == 0 and again.checkpoint_lsn == 6
+
+        final = create_store(tmp_dir)
+        final.load_index()
+        assert final.get_stats()["total_vectors"] == 9
+        assert final.get_stats()["wal"]["checkpoint_lsn"] == 6
+    print("✅ WAL recovery OK")
+
+def test_wal_transaction_rollback():
+    """Transaction lồng nhau bị rollback không để lại record WAL hay checkpoint của trạng thái chưa publish"""
+    print("\n🧪 Testing WAL transaction rollback...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = create_store(tmp_dir)
+        embedding_service = FakeEmbeddingService()
+        store.add_document_chunks(make_chunks("doc_a", 3), "doc_a", "a.txt", embedding_service)
+        store.save_index()
+        checkpoint_lsn = store.checkpoint_lsn
+        # Mọi record đều vượt ngưỡng checkpoint
+        store.checkpoint_wal_bytes = 1
+
+        try:
+            with store._write_transaction():
+                store.add_document_chunks(make_chunks("doc_x", 2), "doc_x", "x.txt", embedding_service)
+                assert store.clear_doc("doc_a")
+                raise RuntimeError("fail after inner logged operations")
+        except RuntimeError:
+            pass
+
+        assert set(store.doc_metadata) == {"doc_a"} and store.wal.records == 0
+        assert store.checkpoint_lsn == store.wal.last_lsn == checkpoint_lsn
+
+        recovered = create_store(tmp_dir)
+        recovered.load_index()
+        assert set(recovered.doc_metadata) == {"doc_a"}
+        assert recovered.get_stats()["total_vectors"] == 3
+
+        # Transaction thành công: records được ghi khi publish, checkpoint sau đó
+        with store._write_transaction():
+            store.add_document_chunks(make_chunks("doc_y", 2), "doc_y", "y.txt", embedding_service)
+            assert store.wal.records == 0 and store.checkpoint_lsn == checkpoint_lsn
+        assert store.wal.records == 0 and store.checkpoint_lsn == checkpoint_lsn + 1
+
+        recovered = create_store(tmp_dir)
+        recovered.load_index()
+        assert set(recovered.doc_metadata) == {"doc_a", "doc_y"}
+    print("✅ WAL transaction rollback OK")
+
+def test_reload_category_encode_failure():
+    """Reload category encode ngoài write lock; encode lỗi thì category cũ còn nguyên cả sau khi restart"""
+    print("\n🧪 Testing reload_category encode failure...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = create_store(tmp_dir)
+        embedding_service = FakeEmbeddingService()
+        store.add_document_chunks(make_chunks("a", 2), "a", "a.txt", embedding_service, category="Luat")
+        store.add_document_chunks(make_chunks("b", 2), "b", "b.txt", embedding_service, category="Other")
+
+        class FailingEmbeddingService(FakeEmbeddingService):
+            def generate_embeddings_batch(self, texts, batch_size: int = 8, show_progress_bar: bool = True):
+                # Writer khác vẫn lấy được lock trong lúc encode
+                acquired = []
+                worker = threading.Thread(target=lambda: acquired.append(store._write_lock.acquire(timeout=1)) or store._write_lock.release())
+                worker.start()
+                worker.join()
+                assert acquired == [True]
+                raise RuntimeError("embedding failed")
+
+        try:
+            store.reload_category("Luat", [{"doc_id": "c", "chunks": make_chunks("c", 2)}], FailingEmbeddingService())
+            assert False, "embedding failure should be raised"
+        except RuntimeError:
+            pass
+        assert set(store.doc_metadata) == {"a", "b"}
+
+        recovered = create_store(tmp_dir)
+        recovered.load_index()
+        assert set(recovered.doc_metadata) == {"a", "b"}
+
+        result = recovered.reload_category("Luat", [{"doc_id": "c", "chunks": make_chunks("c", 3)}], embedding_service)
+        assert result["removed_documents"] == 1 and result["total_chunks"] == 3
+        final = create_store(tmp_dir)
+        final.load_index()
+        assert set(final.doc_metadata) == {"b", "c"} and final.doc_metadata["c"]["category"] == "Luat"
+    print("✅ reload_category encode failure OK")
+
+def test_concurrent_search_during_writes():
+    """Search song song với thêm/xóa luôn thấy index và metadata cùng một generation"""
+    print("\n🧪 Testing concurrent search during writes...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = create_store(tmp_dir)
+        store.wal = None
+        embedding_service = FakeEmbeddingService()
+        store.add_document_chunks(make_chunks("base", 50), "base", "base.txt", embedding_service)
+        query = embedding_service.normalize_embedding(embedding_service._embed("hot - đoạn văn bản số 1"))
+        query = query.astype(np.float32)
+
+        stop = threading.Event()
+        errors = []
+
+        def writer():
+            try:
+                for _ in range(30):
+                    store.add_document_chunks(make_chunks("hot", 20), "hot", "hot.txt", embedding_service)
+                    assert store.clear_doc("hot")
+            except Exception as e:
+                errors.append(e)
+            finally:
+                stop.set()
+
+        def reader():
+            try:
+                while not stop.is_set():
+                    # Mọi hit đều có metadata -> luôn đủ top_k kết quả
+                    assert len(store.search(query, top_k=10)) == 10
+                    # Document "hot" hoặc đủ 20 chunks hoặc không có
+                    assert len(store.search(query, top_k=20, doc_id="hot")) in (0, 20)
+                    assert len(store.get_document_chunks("hot")) in (0, 20)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert not errors, errors
+        assert store.get_stats()["total_vectors"] == 50
+        assert store.get_stats()["generation"] > 60
+    print("✅ Concurrent search OK")
+
+def test_batch_search_matches_single():
+    """search_batch / search_text_batch trả đúng kết quả như search từng query"""
+    print("\n🧪 Testing batch search...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = create_store(tmp_dir)
+        embedding_service = FakeEmbeddingService()
+        store.add_documents_batch(
+            documents=[
+                {"doc_id": "luat_1", "chunks": make_chunks("luat_1", 60), "category": "Luat"},
+                {"doc_id": "tv_1", "chunks": make_chunks("tv_1", 30), "category": "TaiLieuTiengViet"}
+            ],
+            embedding_service=embedding_service
+        )
+        texts = [f"luat_1 - đoạn văn bản số {i}" for i in range(0, 60, 7)] + ["tv_1 - đoạn văn bản số 3"]
+        embedding_service.batch_calls = 0
+
+        batch_results = store.search_text_batch(texts, top_k=4, embedding_service=embedding_service)
+        assert embedding_service.batch_calls == 1
+        assert len(batch_results) == len(texts)
+        for text, results in zip(texts, batch_results):
+            single = store.search_text(text, top_k=4, embedding_service=embedding_service)
+            assert [r["chunk_id"] for r in results] == [r["chunk_id"] for r in single]
+            assert np.allclose([r["similarity_score"] for r in results], [r["similarity_score"] for r in single], atol=1e-5)
+
+        # Filter: tính điểm trực tiếp và qua IDSelector
+        queries = np.stack([embedding_service.normalize_embedding(embedding_service._embed(t)) for t in texts])
+        queries = queries.astype(np.float32)
+        for threshold in (4096, 10):
+            store.exact_filter_threshold = threshold
+            batch_results = store.search_batch(queries, top_k=5, category="Luat")
+            for query, results in zip(queries, batch_results):
+                single = store.search(query, top_k=5, category="Luat")
+                assert [r["chunk_id"] for r in results] == [r["chunk_id"] for r in single]
+                assert len(results) == 5 and all(r["category"] == "Luat" for r in results)
+
+        assert store.search_batch(queries, top_k=5, doc_id="missing") == [[] for _ in texts]
+        assert store.search_text_batch([], embedding_service=embedding_service) == []
+    print("✅ Batch search OK")
+
+def test_document_index():
+    """DocumentIndex (doc_id -> vector IDs, category -> documents) nhất quán qua add/xóa/load"""
+    print("\n🧪 Testing document index...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = create_store(tmp_dir)
+        embedding_service = FakeEmbeddingService()
+        store.add_documents_batch(
+            documents=[
+                {"doc_id": "luat_1", "chunks": make_chunks("luat_1", 8), "category": "Luat"},
+                {"doc_id": "luat_2", "chunks": make_chunks("luat_2", 4), "category": "Luat"},
+                {"doc_id": "tv_1", "chunks": make_chunks("tv_1", 5), "category": "TaiLieuTiengViet"}
+            ],
+            embedding_service=embedding_service
+        )
+        store.add_document("tv_1 - chunk bổ sung", "tv_1", chunk_index=5, embedding_service=embedding_service,
+                           category="TaiLieuTiengViet")
+
+        doc_index = store._snapshot.doc_index
+        assert doc_index.category_doc_ids("Luat") == {"luat_1", "luat_2"}
+        assert len(doc_index.category_vector_ids("Luat")) == 12
+        assert doc_index.vector_ids("tv_1").tolist() == store.doc_metadata["tv_1"]["vector_ids"]
+        assert [c["chunk_index"] for c in store.get_contexts_by_document("tv_1")] == list(range(6))
+        vectors = store.get_document_vectors("luat_2")
+        assert [v["vector_id"] for v in vectors] == store.doc_metadata["luat_2"]["vector_ids"]
+        assert vectors[0]["content_length"] == len(vectors[0]["content"])
+
+        # Snapshot cũ không bị ảnh hưởng bởi thao tác ghi sau đó
+        assert store.clear_doc("luat_1")
+        assert doc_index.category_doc_ids("Luat") == {"luat_1", "luat_2"}
+        assert store._snapshot.doc_index.category_doc_ids("Luat") == {"luat_2"}
+        assert store.get_document_chunks("luat_1") == []
+        assert store.get_stats()["document_index"]["categories"] == {"Luat": 1, "TaiLieuTiengViet": 1}
+
+        query = embedding_service.normalize_embedding(embedding_service._embed("luat_2 - đoạn văn bản số 1"))
+        results = store.search(query.astype(np.float32), top_k=10, category="Luat")
+        assert {r["doc_id"] for r in results} == {"luat_2"} and len(results) == 4
+
+        store.save_index()
+        reloaded = create_store(tmp_dir)
+        reloaded.load_index()
+        assert reloaded._snapshot.doc_index.category_doc_ids("TaiLieuTiengViet") == {"tv_1"}
+        assert len(reloaded.get_document_chunks("tv_1")) == 6
+    print("✅ Document index OK")
+
+def test_sharded_store():
+    """Sharded store: fan-out search khớp store đơn, reload_category chỉ ghi shard của category"""
+    print("\n🧪 Testing sharded store...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        embedding_service = FakeEmbeddingService()
+        documents = [
+            {"doc_id": f"{category}_{i}", "chunks": make_chunks(f"{category}_{i}", 6), "category": category}
+            for category in ("Luat", "TaiLieuTiengViet", "TaiLieuTiengAnh") for i in range(3)
+        ]
+        single = create_store(os.path.join(tmp_dir, "single"))
+        single.add_documents_batch(documents, embedding_service=embedding_service)
+        queries = np.stack([
+            embedding_service.normalize_embedding(embedding_service._embed(f"truy vấn {i}")) for i in range(4)
+        ]).astype(np.float32)
+        expected = single.search_batch(queries, top_k=7)
+
+        for partition in ("category", "hash"):
+            root = os.path.join(tmp_dir, partition)
+            store = ShardedFAISSStore(
+                index_path=os.path.join(root, "faiss_index"),
+                metadata_path=os.path.join(root, "metadata"),
+                dimension=DIMENSION,
+                partition=partition,
+                num_shards=3
+            )
+            result = store.add_documents_batch(documents, embedding_service=embedding_service)
+            assert result["total_chunks"] == 54 and len(result["shards"]) == 3
+
+            # Merge top-k qua heap cho cùng thứ tự với store không chia shard
+            for got, want in zip(store.search_batch(queries, top_k=7), expected):
+                assert [(r["doc_id"], r["chunk_index"]) for r in got] == [(r["doc_id"], r["chunk_index"]) for r in want]
+                assert np.allclose([r["similarity_score"] for r in got], [r["similarity_score"] for r in want])
+            results = store.search(queries[0], top_k=20, category="Luat")
+            assert len(results) == 18 and {r["doc_id"].split("_")[0] for r in results} == {"Luat"}
+            assert len(store.get_document_chunks("TaiLieuTiengAnh_1")) == 6
+
+            generations = {name: shard._snapshot.generation for name, shard in store._shards.items()}
+            reload = store.reload_category(
+                "Luat",
+                [{"doc_id": "Luat_new", "chunks": make_chunks("Luat_new", 4)}],
+                embedding_service=embedding_service
+            )
+            assert reload["removed_documents"] == 3 and reload["total_chunks"] == 4
+            if partition == "category":
+                # Chỉ shard của Luat được ghi
+                changed = {name for name, shard in store._shards.items() if shard._snapshot.generation != generations[name]}
+                assert changed == {"category_Luat"} == set(reload["shards"])
+            assert store.get_document_chunks("Luat_0") == []
+            assert {r["doc_id"] for r in store.search(queries[0], top_k=10, category="Luat")} == {"Luat_new"}
+
+            assert store.clear_doc("TaiLieuTiengViet_2")
+            stats = store.get_stats()
+            assert stats["total_documents"] == 6 and stats["total_chunks"] == 34
+
+            store.save_index()
+            reloaded = ShardedFAISSStore(
+                index_path=os.path.join(root, "faiss_index"),
+                metadata_path=os.path.join(root, "metadata"),
+                dimension=DIMENSION,
+                partition=partition,
+                num_shards=3
+            )
+            reloaded.load_index()
+            assert set(reloaded._shards) == set(store._shards)
+            assert reloaded.get_stats()["total_chunks"] == 34
+            assert len(reloaded.get_document_chunks("Luat_new")) == 4
+
+            # Backup/restore theo shard
+            reloaded.backup(os.path.join(root, "backup"))
+            reloaded.clear_category("Luat")
+            reloaded.restore(os.path.join(root, "backup"))
+            assert reloaded.get_stats()["total_chunks"] == 34
+            assert len(reloaded.get_document_chunks("Luat_new")) == 4
+    print("✅ Sharded store OK")
+
+def test_quantized_storage_with_rerank():
+    """Index SQ8/fp16 giảm bộ nhớ mỗi vector, re-rank bằng bản float32 cho kết quả như flat"""
+    print("\n🧪 Testing quantized storage with exact re-rank...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        embedding_service = FakeEmbeddingService()
+        documents = [{"doc_id": f"doc_{i}", "chunks": make_chunks(f"doc_{i}", 20)} for i in range(20)]
+        queries = np.stack([
+            embedding_service.normalize_embedding(embedding_service._embed(f"truy vấn {i}")) for i in range(8)
+        ]).astype(np.float32)
+
+        flat = create_store(os.path.join(tmp_dir, "flat"))
+        flat.add_documents_batch(documents, embedding_service=embedding_service)
+        expected = flat.search_batch(queries, top_k=5)
+        flat.save_index()
+
+        for index_type, compression in (("sq8", 4.0), ("fp16", 2.0)):
+            root = os.path.join(tmp_dir, index_type)
+            store = FAISSStore(
+                index_path=os.path.join(root, "faiss_index"),
+                metadata_path=os.path.join(root, "metadata"),
+                dimension=DIMENSION,
+                index_type=index_type,
+                exact_rerank=True
+            )
+            store.initialize_index()
+            store.add_documents_batch(documents, embedding_service=embedding_service)
+
+            stats = store.get_stats()
+            assert stats["index_type"] == index_type and stats["compression_ratio"] == compression
+            assert stats["memory_per_vector_bytes"] < flat.get_stats()["memory_per_vector_bytes"]
+            assert stats["raw_vectors"]["pending_rows"] == 400
+
+            # Re-rank bằng vectors float32: cùng kết quả và điểm với index flat
+            for got, want in zip(store.search_batch(queries, top_k=5), expected):
+                assert [r["vector_index"] for r in got] == [r["vector_index"] for r in want]
+                assert np.allclose([r["similarity_score"] for r in got], [r["similarity_score"] for r in want], atol=1e-5)
+
+            # Xóa + save: file float32 được compaction, load lại vẫn re-rank đúng
+            for i in range(12):
+                assert store.clear_doc(f"doc_{i}")
+            store.save_index()
+            assert store.get_stats()["raw_vectors"]["persisted_rows"] == 160
+            reloaded = FAISSStore(
+                index_path=os.path.join(root, "faiss_index"),
+                metadata_path=os.path.join(root, "metadata"),
+                dimension=DIMENSION,
+                exact_rerank=True
+            )
+            reloaded.load_index()
+            query = embedding_service.normalize_embedding(embedding_service._embed("doc_15 - đoạn văn bản số 3"))
+            results = reloaded.search(query.astype(np.float32), top_k=3)
+            assert results[0]["chunk_id"] == "doc_15_3" and abs(results[0]["similarity_score"] - 1.0) < 1e-5
+
+        # Bật exact_rerank trên store flat cũ: bản float32 được lấy lại từ index, migrate sang sq8 không mất độ chính xác
+        store = FAISSStore(
+            index_path=os.path.join(tmp_dir, "flat", "faiss_index"),
+            metadata_path=os.path.join(tmp_dir, "flat", "metadata"),
+            dimension=DIMENSION,
+            exact_rerank=True
+        )
+        store.load_index()
+        assert len(store.raw_vectors) == 400
+        store.migrate_index("sq8")
+        assert store.get_stats()["index_type"] == "sq8"
+        for got, want in zip(store.search_batch(queries, top_k=5), expected):
+            assert [r["vector_index"] for r in got] == [r["vector_index"] for r in want]
+    print("✅ Quantized storage with exact re-rank OK")
+
+def test_two_stage_coarse_search():
+    """Two-stage search: index coarse trong RAM, re-rank bằng vectors đầy đủ trên disk; báo cáo recall/latency"""
+    print("\n🧪 Testing two-stage coarse search...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        embedding_service = FakeEmbeddingService()
+        documents = [
+            {"doc_id": f"doc_{i}", "chunks": make_chunks(f"doc_{i}", 15), "category": "Luat" if i % 2 else "TaiLieuTiengViet"}
+            for i in range(20)
+        ]
+        store = FAISSStore(
+            index_path=os.path.join(tmp_dir, "faiss_index"),
+            metadata_path=os.path.join(tmp_dir, "metadata"),
+            dimension=DIMENSION,
+            coarse_dimension=DIMENSION // 2,
+            rerank_factor=8
+        )
+        store.initialize_index()
+        store.add_documents_batch(documents, embedding_service=embedding_service)
+
+        stats = store.get_stats()
+        assert stats["coarse_dimension"] == DIMENSION // 2 and store.index.d == DIMENSION // 2
+        assert stats["raw_vectors"]["pending_rows"] == 300
+
+        query = embedding_service.normalize_embedding(embedding_service._embed("doc_7 - đoạn văn bản số 4")).astype(np.float32)
+        results = store.search(query, top_k=3)
+        assert results[0]["chunk_id"] == "doc_7_4" and abs(results[0]["similarity_score"] - 1.0) < 1e-5
+        results = store.search(query, top_k=50, category="Luat")
+        assert len(results) == 50 and all(r["category"] == "Luat" for r in results)
+
+        # Load lại không cần cấu hình: coarse dimension lấy theo index trên disk
+        store.save_index()
+        reloaded = create_store(tmp_dir)
+        reloaded.load_index()
+        assert reloaded.coarse_dimension == DIMENSION // 2
+        assert reloaded.search(query, top_k=1)[0]["chunk_id"] == "doc_7_4"
+
+        # Báo cáo recall vs latency: full dimension cho recall 1, re-rank không làm giảm recall
+        report = reloaded.coarse_search_report([8, 16, DIMENSION], num_queries=50, top_k=5)
+        assert [row["coarse_dimension"] for row in report] == [8, 16, DIMENSION]
+        assert report[-1]["recall_two_stage"] == 1.0
+        for row in report:
+            assert row["recall_two_stage"] >= row["recall_coarse"] and row["latency_ms_two_stage"] > 0
+
+        # Migrate về full dimension: kết quả giống store flat
+        reloaded.migrate_index("flat", coarse_dimension=DIMENSION)
+        assert reloaded.index.d == DIMENSION and reloaded.get_stats()["coarse_dimension"] is None
+        flat = create_store(os.path.join(tmp_dir, "flat"))
+        flat.add_documents_batch(documents, embedding_service=embedding_service)
+        assert [r["vector_index"] for r in reloaded.search(query, top_k=10)] == \
+            [r["vector_index"] for r in flat.search(query, top_k=10)]
+
+        # Store flat cũ migrate sang two-stage: vectors đầy đủ được giữ trước khi cắt chiều
+        flat.migrate_index("flat", coarse_dimension=16)
+        assert flat.index.d == 16 and len(flat.raw_vectors) == 300
+        assert flat.search(query, top_k=1)[0]["chunk_id"] == "doc_7_4"
+
+        # Store chia shard: migrate sang two-stage trên mọi shard (cả shard tạo sau), báo cáo gộp các shard
+        sharded = ShardedFAISSStore(
+            index_path=os.path.join(tmp_dir, "sharded", "faiss_index"),
+            metadata_path=os.path.join(tmp_dir, "sharded", "metadata"),
+            dimension=DIMENSION,
+            partition="category"
+        )
+        sharded.add_documents_batch(documents, embedding_service=embedding_service)
+        sharded.migrate_index("flat", coarse_dimension=16)
+        assert all(shard.index.d == 16 for shard in sharded._shards.values())
+        assert sharded.search(query, top_k=1)[0]["chunk_id"] == "doc_7_4"
+        sharded.add_documents_batch(
+            [{"doc_id": "new", "chunks": make_chunks("new", 3), "category": "TaiLieuTiengAnh"}],
+            embedding_service=embedding_service
+        )
+        assert sharded._shards[sharded._category_shard_name("TaiLieuTiengAnh")].coarse_dimension == 16
+
+        sharded_report = sharded.coarse_search_report([8, DIMENSION], num_queries=40, top_k=5)
+        assert [row["coarse_dimension"] for row in sharded_report] == [8, DIMENSION]
+        assert all(row["shards"] == 3 for row in sharded_report)
+        assert sharded_report[-1]["recall_two_stage"] == 1.0
+        assert sharded_report[0]["recall_two_stage"] >= sharded_report[0]["recall_coarse"]
+    print("✅ Two-stage coarse search OK")
+
+def test_tombstones_and_compaction():
+    """Xóa chỉ đánh dấu tombstone (search loại ra ngay), compaction build lại index và thay atomic"""
+    print("\n🧪 Testing tombstones and background compaction...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = create_store(tmp_dir)
+        store.background_compaction = False
+        store.index_params.update({"hnsw_m": 8})
+        embedding_service = FakeEmbeddingService()
+        for doc_id in ("doc_a", "doc_b", "doc_c"):
+            store.add_document_chunks(make_chunks(doc_id, 20), doc_id, f"{doc_id}.txt", embedding_service)
+        store.save_index()  # Checkpoint: delta được merge vào index chính
+        query = embedding_service.normalize_embedding(embedding_service._embed("doc_a - đoạn văn bản số 3")).astype(np.float32)
+
+        # Xóa không sửa index: vectors vẫn nằm trong index nhưng search không trả về
+        index_before = store.index
+        assert store.clear_doc("doc_a")
+        assert store.index is index_before and store.index.ntotal == 60
+        status = store.get_compaction_status()
+        assert status["tombstones"] == 20 and abs(status["tombstone_ratio"] - 1 / 3) < 1e-9
+        results = store.search(query, top_k=10)
+        assert len(results) == 10 and all(r["doc_id"] != "doc_a" for r in results)
+
+        # Tombstones không lưu riêng: load lại tính từ index và metadata
+        store.save_index()
+        reloaded = create_store(tmp_dir)
+        reloaded.background_compaction = False
+        reloaded.load_index()
+        assert reloaded.get_compaction_status()["tombstones"] == 20
+        assert reloaded.get_stats()["total_vectors"] == 40
+
+        # HNSW compaction: thêm và xóa trong lúc build được áp dụng lên index mới
+        store.migrate_index("hnsw")
+        assert store.get_compaction_status()["tombstones"] == 0
+        assert store.clear_doc("doc_b")
+        rebuild_index = store._rebuild_index
+
+        def rebuild_with_concurrent_writes(*args):
+            store.add_document_chunks(make_chunks("doc_d", 5), "doc_d", "d.txt", embedding_service)
+            store.save_index()  # Checkpoint merge delta (doc_d) vào index đang được thay
+            assert store.clear_doc("doc_c")
+            return rebuild_index(*args)
+
+        store._rebuild_index = rebuild_with_concurrent_writes
+        run = store.compact()
+        del store._rebuild_index
+        assert run["status"] == "completed" and run["removed_vectors"] == 20 and run["caught_up_vectors"] == 5
+        assert store.index.ntotal == 25 and store.get_compaction_status()["tombstones"] == 20
+        query_d = embedding_service.normalize_embedding(embedding_service._embed("doc_d - đoạn văn bản số 2")).astype(np.float32)
+        assert store.search(query_d, top_k=1)[0]["chunk_id"] == "doc_d_2"
+        assert all(r["doc_id"] == "doc_d" for r in store.search(query_d, top_k=10))
+
+        # Vượt ngưỡng: compaction tự chạy trong background
+        store.background_compaction = True
+        store.compaction_threshold = 0.8
+        store.add_document_chunks(make_chunks("doc_e", 5), "doc_e", "e.txt", embedding_service)
+        assert store.get_compaction_status()["tombstone_ratio"] < 0.8
+        assert store.clear_doc("doc_d")
+        assert store.wait_for_compaction(timeout=30)
+        status = store.get_compaction_status()
+        assert status["runs"] == 2 and status["tombstones"] == 0 and status["last_run"]["status"] == "completed"
+        assert store._snapshot.ntotal == 5 and store.get_stats()["total_vectors"] == 5
+        assert store.compact()["status"] == "skipped"
+    print("✅ Tombstones and compaction OK")
+
+def test_delta_index_writes():
+    """Thêm vectors chỉ ghi vào delta (không copy index chính), merge khi vượt delta_max_vectors"""
+    print("\n🧪 Testing delta index writes...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = create_store(tmp_dir)
+        store.delta_max_vectors = 30
+        embedding_service = FakeEmbeddingService()
+        store.add_document_chunks(make_chunks("doc_a", 20), "doc_a", "a.txt", embedding_service)
+        store.save_index()
+        assert store.index.ntotal == 20 and store.delta.ntotal == 0
+
+        # Thêm từng chunk: index chính giữ nguyên object, snapshot cũ không thấy chunk mới
+        index_before = store.index
+        snapshot_before = store._snapshot
+        for i in range(3):
+            store.add_document(f"doc_b chunk {i}", "doc_b", i, "b.txt", embedding_service)
+        assert store.index is index_before and store.delta.ntotal == 3 and snapshot_before.delta.ntotal == 0
+        assert store.get_stats()["delta"]["vectors"] == 3 and store.get_stats()["total_vectors"] == 23
+        query = embedding_service.normalize_embedding(embedding_service._embed("doc_b chunk 1")).astype(np.float32)
+        assert store.search(query, top_k=1)[0]["chunk_id"] == "doc_b_1"
+        assert [r["chunk_id"] for r in store.search(query, top_k=5, doc_id="doc_b")][0] == "doc_b_1"
+        assert len(store.search(query, top_k=5, doc_id="doc_b")) == 3
+
+        # Rollback: delta quay về bản đã công bố
+        try:
+            with store._write_transaction():
+                store.add_document("doc_x chunk", "doc_x", 0, "x.txt", embedding_service)
+                raise RuntimeError("fail")
+        except RuntimeError:
+            pass
+        assert store.delta.ntotal == 3 and "doc_x" not in store.doc_metadata
+        store.add_document("doc_b chunk 3", "doc_b", 3, "b.txt", embedding_service)
+        assert store.delta.ntotal == 4 and store.search(query, top_k=1)[0]["chunk_id"] == "doc_b_1"
+
+        # Xóa chunk trong delta: search loại ra ngay, merge bỏ luôn vector đó
+        store.background_compaction = False
+        assert store.clear_doc("doc_b")
+        assert all(r["doc_id"] == "doc_a" for r in store.search(query, top_k=5))
+        store.add_document_chunks(make_chunks("doc_c", 30), "doc_c", "c.txt", embedding_service)
+        assert store.index is not index_before and store.delta.ntotal == 0
+        assert store.index.ntotal == 50 and store.get_compaction_status()["tombstones"] == 0
+        query_c = embedding_service.normalize_embedding(embedding_service._embed("doc_c - đoạn văn bản số 7")).astype(np.float32)
+        assert store.search(query_c, top_k=1)[0]["chunk_id"] == "doc_c_7"
+
+        # Delta chưa merge vẫn được phục hồi từ WAL
+        store.add_document_chunks(make_chunks("doc_d", 5), "doc_d", "d.txt", embedding_service)
+        recovered = create_store(tmp_dir)
+        recovered.load_index()
+        assert recovered.get_stats()["total_vectors"] == 55 and recovered.delta.ntotal == 39
+    print("✅ Delta index writes OK")
+
+def test_copy_on_write_structures():
+    """Write transaction không copy toàn bộ metadata: phần chưa lưu và doc metadata dùng chung với snapshot cũ"""
+    print("\n🧪 Testing copy-on-write structures...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = create_store(tmp_dir)
+        embedding_service = FakeEmbeddingService()
+        for i in range(200):
+            store.add_document(f"doc_{i} chunk", f"doc_{i}", 0, f"{i}.txt", embedding_service, category=f"cat_{i % 3}")
+
+        # Lần ghi mới dùng chung log chunks chưa lưu và các bucket không bị sửa
+        snapshot_before = store._snapshot
+        store.add_document("doc_new chunk", "doc_new", 0, "new.txt", embedding_service, category="cat_0")
+        assert store.metadata._pending._items is snapshot_before.metadata._pending._items
+        assert len(snapshot_before.metadata) == 200 and len(store.metadata) == 201
+        shared_buckets = sum(
+            new is old for new, old in zip(store.doc_metadata._buckets, snapshot_before.doc_metadata._buckets)
+        )
+        assert shared_buckets == len(store.doc_metadata._buckets) - 1
+        assert "doc_new" not in snapshot_before.doc_metadata and "doc_new" in store.doc_metadata
+        assert "doc_new" not in snapshot_before.doc_index.category_doc_ids("cat_0")
+        assert "doc_new" in store._snapshot.doc_index.category_doc_ids("cat_0")
+
+        # Xóa chunk chưa lưu: snapshot cũ vẫn thấy, bản mới không thấy
+        snapshot_before = store._snapshot
+        vector_id = store.doc_metadata["doc_5"]["vector_ids"][0]
+        assert store.delete_document_vectors("doc_5") == 1
+        assert vector_id in snapshot_before.metadata and vector_id not in store.metadata
+        assert len(store.metadata) == 200 and "doc_5" in snapshot_before.doc_index
+
+        # Rollback sau khi append: lần ghi tiếp theo tách log riêng, snapshot đã công bố không đổi
+        try:
+            with store._write_transaction():
+                store.add_document("doc_x chunk", "doc_x", 0, "x.txt", embedding_service)
+                raise RuntimeError("fail")
+        except RuntimeError:
+            pass
+        store.add_document("doc_y chunk", "doc_y", 0, "y.txt", embedding_service)
+        assert [r["doc_id"] for r in store.metadata.get_many(store.metadata.keys()[-2:])] == ["doc_new", "doc_y"]
+
+        store.save_index()
+        reloaded = create_store(tmp_dir)
+        reloaded.load_index()
+        assert set(reloaded.doc_metadata) == set(store.doc_metadata) and len(reloaded.metadata) == 201
+        assert len(reloaded.search(
+            embedding_service.normalize_embedding(embedding_service._embed("doc_7 chunk")).astype(np.float32),
+            top_k=5, category="cat_1"
+        )) == 5
+    print("✅ Copy-on-write structures OK")
+
+def test_snapshot_backup_restore():
+    """Backup hardlink các file của checkpoint kèm checksum; restore kiểm tra rồi load lại"""
+    print("\n🧪 Testing snapshot backup and restore...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = FAISSStore(
+            index_path=os.path.join(tmp_dir, "faiss_index"),
+            metadata_path=os.path.join(tmp_dir, "metadata"),
+            dimension=DIMENSION,
+            exact_rerank=True
+        )
+        store.initialize_index()
+        embedding_service = FakeEmbeddingService()
+        store.add_document_chunks(make_chunks("doc_a", 10), "doc_a", "a.txt", embedding_service)
+        store.add_document_chunks(make_chunks("doc_b", 10), "doc_b", "b.txt", embedding_service)
+
+        backup_dir = os.path.join(tmp_dir, "backup")
+        manifest = store.backup(backup_dir)
+        paths = {entry["path"]: entry for entry in manifest["files"]}
+        assert {"index/faiss_index.bin", "metadata/chunk_store.json", "metadata/doc_metadata.json",
+                "metadata/raw_vectors/raw_vectors.json"} <= set(paths)
+        assert all(entry["method"] == "hardlink" and len(entry["sha256"]) == 64 for entry in manifest["files"])
+        assert os.path.samefile(os.path.join(backup_dir, "index/faiss_index.bin"),
+                                os.path.join(tmp_dir, "faiss_index", "faiss_index.bin"))
+        assert manifest["total_chunks"] == 20 and manifest["wal_lsn"] == store.checkpoint_lsn
+
+        # Ghi tiếp sau backup (append vào text blob, thay index): backup không đổi
+        store.add_document_chunks(make_chunks("doc_c", 5), "doc_c", "c.txt", embedding_service)
+        assert store.clear_doc("doc_a")
+        store.save_index()
+        store.backup(os.path.join(tmp_dir, "backup_later"))
+        assert read_manifest(backup_dir)["files"] == manifest["files"]
+
+        store.restore(backup_dir)
+        assert set(store.doc_metadata) == {"doc_a", "doc_b"}
+        assert store.get_stats()["total_vectors"] == 20 and len(store.raw_vectors) == 20
+        assert store.wal.size() == 0
+        query = embedding_service.normalize_embedding(embedding_service._embed("doc_a - đoạn văn bản số 4")).astype(np.float32)
+        assert store.search(query, top_k=1)[0]["chunk_id"] == "doc_a_4"
+
+        # Store đã restore ghi tiếp không làm hỏng backup (file append-only được copy khi restore)
+        store.add_document_chunks(make_chunks("doc_d", 5), "doc_d", "d.txt", embedding_service)
+        store.save_index()
+        read_manifest(backup_dir)
+        read_manifest(os.path.join(tmp_dir, "backup_later"))
+
+        # Backup bị sửa: restore từ chối trước khi động vào store
+        doc_metadata_file = os.path.join(backup_dir, "metadata", "doc_metadata.json")
+        with open(doc_metadata_file + ".tmp", "w", encoding="utf-8") as f:
+            f.write("{}")
+        os.replace(doc_metadata_file + ".tmp", doc_metadata_file)
+        try:
+            store.restore(backup_dir)
+            assert False, "restore should reject a corrupted backup"
+        except ValueError:
+            pass
+        assert "doc_d" in store.doc_metadata
+
+        reloaded = create_store(tmp_dir)
+        reloaded.load_index()
+        assert set(reloaded.doc_metadata) == {"doc_a", "doc_b", "doc_d"}
+        assert reloaded.get_stats()["total_vectors"] == 25
+    print("✅ Snapshot backup and restore OK")
+
+def test_vector_db_vectorized_delete():
+    """VectorDB xóa document bằng remove_ids + mask: vị trí dồn đúng, chỉ ghi disk khi flush"""
+    print("\n🧪 Testing VectorDB vectorized delete...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index_path = os.path.join(tmp_dir, "vector_db")
+        db = VectorDB(dimension=DIMENSION, index_path=index_path)
+        rng = np.random.default_rng(0)
+        vectors = rng.standard_normal((30, DIMENSION)).astype(np.float32)
+        metadata_list = [
+            {"document_id": ["doc_a", "doc_b", "doc_c"][i % 3], "chunk_index": i, "category": ["Luat", "TV"][i % 2]}
+            for i in range(30)
+        ]
+        db.add_vectors(vectors.copy(), metadata_list)
+        db.flush()
+        expected = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+        assert db.delete_document_vectors("doc_b") == 10
+        assert db.delete_document_vectors("doc_missing") == 0
+        kept = [i for i in range(30) if i % 3 != 1]
+        assert db.get_vector_count() == 20 and set(db.doc_positions) == {"doc_a", "doc_c"}
+        assert [metadata["chunk_index"] for metadata in db.metadata] == kept
+        # Vị trí của documents còn lại dồn lên, khớp với metadata
+        for remaining_doc in ("doc_a", "doc_c"):
+            positions = db.doc_positions[remaining_doc].tolist()
+            assert [db.metadata[p]["doc_id"] for p in positions] == [remaining_doc] * 10
+            assert [chunk["vector_index"] for chunk in db.get_document_chunks(remaining_doc)] == positions
+        assert db.doc_positions["doc_c"].tolist() == list(range(1, 20, 2))
+        # Vị trí theo category dồn cùng doc_positions, filter category không duyệt metadata
+        for category in ("Luat", "TV"):
+            assert [db.metadata[p]["category"] for p in db.category_positions[category]] == [category] * 10
+        assert {r["chunk_index"] for r in db.search(vectors[4], top_k=20, category="Luat")} == {i for i in kept if i % 2 == 0}
+        assert [r["chunk_index"] for r in db.search(vectors[3], top_k=20, doc_id="doc_a", category="TV")][0] == 3
+        assert all(r["chunk_index"] % 2 == 1 for r in db.search(vectors[3], top_k=20, doc_id="doc_a", category="TV"))
+        assert db.search(vectors[3], top_k=5, category="missing") == []
+
+        assert np.allclose(db.index.reconstruct_n(0, 20), expected[kept], atol=1e-6)
+        result = db.search(vectors[5], top_k=1)[0]
+        assert result["chunk_index"] == 5 and result["doc_id"] == "doc_c"
+        assert [r["chunk_index"] for r in db.search(vectors[3], top_k=10, doc_id="doc_a")][0] == 3
+
+        # Document thêm lại sau khi xóa, xóa document đầu tiên dồn mọi document phía sau
+        db.add_vectors(vectors[:3].copy(), [{"document_id": "doc_b", "chunk_index": i} for i in range(3)])
+        assert db.doc_positions["doc_b"].tolist() == [20, 21, 22]
+        assert db.delete_document_vectors("doc_a") == 10
+        assert db.doc_positions["doc_c"].tolist() == list(range(10)) and db.doc_positions["doc_b"].tolist() == [10, 11, 12]
+        assert db.search(vectors[1], top_k=1, doc_id="doc_b")[0]["vector_index"] == 11
+        db.add_vectors(vectors[kept[:10]].copy(), [{"document_id": "doc_a", "chunk_index": i} for i in kept[:10]])
+        assert db.doc_positions["doc_a"].tolist() == list(range(13, 23))
+
+        # Chưa flush: trên disk vẫn là trạng thái trước khi xóa
+        assert VectorDB(dimension=DIMENSION, index_path=index_path).get_vector_count() == 30
+        assert db.flush() and not db.flush()
+        reloaded = VectorDB(dimension=DIMENSION, index_path=index_path)
+        assert reloaded.get_vector_count() == 23 and set(reloaded.doc_positions) == {"doc_a", "doc_b", "doc_c"}
+        assert {doc: p.tolist() for doc, p in reloaded.doc_positions.items()} == \
+            {doc: p.tolist() for doc, p in db.doc_positions.items()}
+        assert {c: p.tolist() for c, p in reloaded.category_positions.items()} == \
+            {c: p.tolist() for c, p in db.category_positions.items()} == {None: list(range(10, 23)), **{
+                category: [p for p in range(10) if db.metadata[p]["category"] == category] for category in ("Luat", "TV")
+            }}
+    print("✅ VectorDB vectorized delete OK")
+
+def test_vector_db_concurrent_search():
+    """VectorDB search song song với xóa/thêm: kết quả luôn khớp metadata của đúng vector"""
+    print("\n🧪 Testing VectorDB concurrent search...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = VectorDB(dimension=DIMENSION, index_path=os.path.join(tmp_dir, "vector_db"), flush_interval=None)
+        rng = np.random.default_rng(2)
+        vectors = rng.standard_normal((200, DIMENSION)).astype(np.float32)
+        # doc_hot nằm đầu index: mỗi lần xóa dồn vị trí của mọi vector phía sau
+        db.add_vectors(vectors[:20].copy(), [{"document_id": "doc_hot", "chunk_index": i} for i in range(20)])
+        db.add_vectors(vectors[20:].copy(), [{"document_id": f"doc_{i // 10}", "chunk_index": i} for i in range(20, 200)])
+
+        stop = threading.Event()
+        errors = []
+
+        def writer():
+            while not stop.is_set():
+                db.delete_document_vectors("doc_hot")
+                db.add_vectors(vectors[:20].copy(), [{"document_id": "doc_hot", "chunk_index": i} for i in range(20)])
+
+        def reader():
+            queries = vectors[20:]
+            while not stop.is_set():
+                for i, results in enumerate(db.search_batch(queries, top_k=1), start=20):
+                    if results[0]["chunk_index"] != i or results[0]["doc_id"] != f"doc_{i // 10}":
+                        errors.append((i, results[0]["chunk_index"]))
+
+        threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        time.sleep(1.0)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        db.close()
+        assert not errors, errors[:5]
+    print("✅ VectorDB concurrent search OK")
+
+def test_vector_db_write_behind():
+    """VectorDB ghi xuống disk theo kích thước/thời gian, flush() và close() khi shutdown"""
+    print("\n🧪 Testing VectorDB write-behind saves...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index_path = os.path.join(tmp_dir, "vector_db")
+        rng = np.random.default_rng(1)
+
+        def add_batch(db, document_id, count=10):
+            vectors = rng.standard_normal((count, DIMENSION)).astype(np.float32)
+            db.add_vectors(vectors, [{"document_id": document_id, "chunk_index": i} for i in range(count)])
+
+        def on_disk():
+            return VectorDB(dimension=DIMENSION, index_path=index_path, flush_interval=None).get_vector_count()
+
+        # Size-based: 100 vectors theo từng document, flush mỗi 30 vectors chưa lưu
+        db = VectorDB(dimension=DIMENSION, index_path=index_path, flush_interval=None, flush_max_pending=30)
+        for i in range(10):
+            add_batch(db, f"doc_{i}")
+        assert db.flush_stats["flushes"] == 3 and db.get_stats()["pending_vectors"] == 10
+        assert on_disk() == 90
+        assert db.flush() and on_disk() == 100 and not db.flush()
+
+        # Time-based: background flush sau flush_interval giây
+        timed = VectorDB(dimension=DIMENSION, index_path=index_path, flush_interval=0.2)
+        add_batch(timed, "doc_timed")
+        assert on_disk() == 100
+        deadline = time.time() + 5
+        while timed.flush_stats["flushes"] == 0 and time.time() < deadline:
+            time.sleep(0.05)
+        assert timed.flush_stats["flushes"] == 1 and on_disk() == 110
+
+        # Shutdown: close() ghi phần còn lại, sau đó mỗi thao tác được ghi ngay
+        assert timed.delete_document_vectors("doc_0") == 10
+        assert on_disk() == 110
+        timed.close()
+        assert on_disk() == 100 and not timed._flush_thread.is_alive()
+        add_batch(timed, "doc_after_close")
+        assert on_disk() == 110
+    print("✅ VectorDB write-behind saves OK")
+
+def test_vector_store_engines():
+    """FAISSStore, ShardedFAISSStore và VectorDB cùng interface VectorStore và cùng schema metadata"""
+    print("\n🧪 Testing unified vector store engines...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        embedding_service = FakeEmbeddingService()
+        engines = {
+            "faiss_store": create_store(os.path.join(tmp_dir, "single")),
+            "sharded": ShardedFAISSStore(
+                index_path=os.path.join(tmp_dir, "sharded", "faiss_index"),
+                metadata_path=os.path.join(tmp_dir, "sharded", "metadata"),
+                dimension=DIMENSION,
+                partition="hash",
+                num_shards=2
+            ),
+            "vector_db": VectorDB(dimension=DIMENSION, index_path=os.path.join(tmp_dir, "vector_db"))
+        }
+        texts = {doc_id: make_chunks(doc_id, 6) for doc_id in ("doc_a", "doc_b")}
+
+        for name, engine in engines.items():
+            assert isinstance(engine, VectorStore)
+            # Metadata kiểu cũ của router embedding (document_id) được đưa về schema chung
+            metadata_list = [
+                {"document_id": doc_id, "chunk_index": i, "content": text, "filename": f"{doc_id}.txt"}
+                for doc_id, chunks in texts.items() for i, text in enumerate(chunks)
+            ]
+            vectors = np.stack([embedding_service._embed(metadata["content"]) for metadata in metadata_list])
+            chunk_ids = engine.add_vectors(vectors, metadata_list)
+            assert chunk_ids == [f"{m['document_id']}_{m['chunk_index']}" for m in metadata_list], name
+
+            hit = engine.search_text("doc_b - đoạn văn bản số 3", top_k=1, embedding_service=embedding_service)[0]
+            assert set(CHUNK_FIELDS) <= set(hit) and hit["chunk_id"] == "doc_b_3" and hit["doc_id"] == "doc_b", name
+            filtered = engine.search_text("doc_b - đoạn văn bản số 3", top_k=3, doc_id="doc_a", embedding_service=embedding_service)
+            assert len(filtered) == 3 and {r["doc_id"] for r in filtered} == {"doc_a"}, name
+
+            similar = engine.search_similar_contexts("doc_a - đoạn văn bản số 2", top_k=3, embedding_service=embedding_service)
+            assert len(similar) == 3 and "doc_a_2" not in [r["chunk_id"] for r in similar], name
+
+            contexts = engine.get_contexts_by_document("doc_a")
+            assert [c["content"] for c in contexts] == texts["doc_a"], name
+            vectors_info = engine.get_document_vectors("doc_b")
+            assert [v["content_length"] for v in vectors_info] == [len(text) for text in texts["doc_b"]], name
+
+            assert engine.delete_document_vectors("doc_a") == 6, name
+            assert engine.delete_document_vectors("doc_a") == 0 and not engine.clear_doc("doc_a"), name
+            assert engine.get_stats()["total_vectors"] == 6 and engine.get_stats()["total_documents"] == 1, name
+            assert engine.search_text("doc_a - đoạn văn bản số 1", top_k=6, embedding_service=embedding_service)[0]["doc_id"] == "doc_b"
+
+        engines["vector_db"].close()
+        try:
+            create_metadata_store("unknown", tmp_dir, DIMENSION)
+            assert False, "unknown metadata backend should be rejected"
+        except ValueError:
+            pass
+    print("✅ Unified vector store engines OK")
+
+def test_search_with_context():
+    """search_with_context mở rộng hit thành ±window chunks lân cận, gộp cửa sổ chồng lấp của cùng document"""
+    print("\n🧪 Testing search with context...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        embedding_service = FakeEmbeddingService()
+        engines = {
+            "faiss_store": create_store(os.path.join(tmp_dir, "single")),
+            "sharded": ShardedFAISSStore(
+                index_path=os.path.join(tmp_dir, "sharded", "faiss_index"),
+                metadata_path=os.path.join(tmp_dir, "sharded", "metadata"),
+                dimension=DIMENSION,
+                partition="hash",
+                num_shards=2
+            ),
+            "vector_db": VectorDB(dimension=DIMENSION, index_path=os.path.join(tmp_dir, "vector_db"))
+        }
+        texts = {doc_id: make_chunks(doc_id, 10) for doc_id in ("doc_a", "doc_b", "doc_c")}
+        metadata_list = [
+            {"doc_id": doc_id, "chunk_index": i, "content": text}
+            for doc_id, chunks in texts.items() for i, text in enumerate(chunks)
+        ]
+        vectors = np.stack([embedding_service._embed(metadata["content"]) for metadata in metadata_list])
+
+        def hit(doc_id, chunk_index, score):
+            return {"chunk_id": f"{doc_id}_{chunk_index}", "doc_id": doc_id, "chunk_index": chunk_index,
+                    "content": texts[doc_id][chunk_index], "similarity_score": score}
+
+        for name, engine in engines.items():
+            engine.add_vectors(vectors, metadata_list)
+
+            query = embedding_service._embed("doc_b - đoạn văn bản số 5").reshape(1, -1)
+            result = engine.search_with_context(query, top_k=1, window=2)[0]
+            assert result["chunk_id"] == "doc_b_5" and result["context_window"] == [3, 7], name
+            assert [c["chunk_index"] for c in result["context_chunks"]] == [3, 4, 5, 6, 7], name
+            assert result["context"] == "\n".join(texts["doc_b"][3:8]), name
+
+            # Hits 1 và 3 của doc_a chồng lấp (gộp, cửa sổ bị cắt ở đầu document), hit 8 tách riêng
+            results = engine.expand_with_context([[
+                hit("doc_a", 8, 0.7), hit("doc_a", 1, 0.6), hit("doc_a", 3, 0.9), hit("doc_c", 9, 0.5)
+            ]], window=1)[0]
+            assert [r["context_window"] for r in results] == [[0, 4], [7, 9], [8, 9]], name
+            assert results[0]["chunk_id"] == "doc_a_3" and results[0]["matched_chunks"] == ["doc_a_1", "doc_a_3"], name
+            assert results[2]["doc_id"] == "doc_c", name
+            assert engine.expand_with_context([[hit("doc_a", 4, 0.5)]], window=0)[0][0]["context"] == texts["doc_a"][4]
+            # window=0: hits của các chunks liền kề không bị gộp
+            unexpanded = engine.expand_with_context([[hit("doc_a", 4, 0.5), hit("doc_a", 5, 0.8)]], window=0)[0]
+            assert [r["chunk_id"] for r in unexpanded] == ["doc_a_5", "doc_a_4"], name
+            assert [r["context_window"] for r in unexpanded] == [[5, 5], [4, 4]], name
+
+            # Sau khi xóa document khác, vị trí của doc_b vẫn đúng
+            engine.delete_document_vectors("doc_a")
+            result = engine.search_with_context(query, top_k=1, window=1)[0]
+            assert [c["chunk_id"] for c in result["context_chunks"]] == ["doc_b_4", "doc_b_5", "doc_b_6"], name
+            assert engine.search_with_context(query, top_k=3, doc_id="doc_c", window=9)[0]["context_window"] == [0, 9], name
+
+        # Sau save/load vẫn lấy được cửa sổ
+        engines["faiss_store"].save_index()
+        reloaded = FAISSStore(
+            index_path=os.path.join(tmp_dir, "single", "faiss_index"),
+            metadata_path=os.path.join(tmp_dir, "single", "metadata"),
+            dimension=DIMENSION
+        )
+        reloaded.load_index()
+        result = reloaded.search_with_context(query, top_k=1, window=1)[0]
+        assert result["context_window"] == [4, 6]
+        engines["vector_db"].close()
+    print("✅ Search with context OK")
+
+if __name__ == "__main__":
+    test_bulk_ingestion()
+    test_clear_doc_keeps_vector_ids()
+    test_migrate_index_types()
+    test_filtered_search_returns_top_k()
+    test_columnar_metadata_store()
+    test_mmap_index_loading()
+    test_wal_recovery()
+    test_wal_transaction_rollback()
+    test_reload_category_encode_failure()
+    test_concurrent_search_during_writes()
+    test_batch_search_matches_single()
+    test_document_index()
+    test_sharded_store()
+    test_quantized_storage_with_rerank()
+    test_two_stage_coarse_search()
+    test_tombstones_and_compaction()
+    test_delta_index_writes()
+    test_copy_on_write_structures()
+    test_snapshot_backup_restore()
+    test_vector_db_vectorized_delete()
+    test_vector_db_concurrent_search()
+    test_vector_db_write_behind()
+    test_vector_store_engines()
+    test_search_with_context()
+    print("\n✅ All FAISS store tests completed successfully!")
@@ -0,0 +1,76 @@
+"""
+Test script cho Length Batching
+Test chia batch theo token budget, thứ tự kết quả và padding ratio (không cần model)
+"""
+
+import os
+import sys
+import numpy as np
+
+# Add backend to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.length_batching import fixed_batches, padding_stats, plan_token_batches
+
+def make_lengths(count: int = 500, seed: int = 0) -> np.ndarray:
+    """Độ dài token kiểu chunks thực tế: đa số ngắn, một phần dài tới max_seq_length"""
+    rng = np.random.default_rng(seed)
+    return np.minimum(np.concatenate([
+        rng.integers(8, 64, size=count * 3 // 4),
+        rng.integers(200, 600, size=count - count * 3 // 4)
+    ]), 512)[rng.permutation(count)]
+
+def test_token_budget():
+    """Mỗi batch không vượt token budget (trừ text dài hơn cả budget) và max_batch_size"""
+    print("\n🧪 Testing token budget...")
+    lengths = make_lengths()
+    batches = plan_token_batches(lengths, max_tokens=4096, max_batch_size=64)
+
+    assert sorted(np.concatenate(batches).tolist()) == list(range(len(lengths)))
+    for batch in batches:
+        assert len(batch) <= 64
+        assert len(batch) * lengths[batch].max() <= 4096
+        assert lengths[batch[0]] == lengths[batch].max()
+    # Batch ngắn được gom nhiều texts hơn batch dài
+    assert len(batches[0]) == 4096 // 512 and max(len(batch) for batch in batches) == 64
+
+    # Text dài hơn budget vẫn được encode (batch một text)
+    assert [len(batch) for batch in plan_token_batches([600, 10], max_tokens=256)] == [1, 1]
+    assert plan_token_batches([], max_tokens=256) == []
+    print(f"✅ Token budget OK: {len(batches)} batches")
+
+def test_original_order():
+    """Ghép kết quả theo vị trí batch trả đúng thứ tự texts gốc"""
+    print("\n🧪 Testing original order...")
+    texts = [f"text {i} " + "x" * (i * 37 % 300) for i in range(200)]
+    lengths = [len(text) // 4 + 2 for text in texts]
+
+    embeddings = np.empty((len(texts), 2), dtype=np.float32)
+    for batch in plan_token_batches(lengths, max_tokens=1024, max_batch_size=32):
+        # Encoder giả lập: embedding = (vị trí gốc, độ dài text)
+        embeddings[batch] = [[int(texts[i].split()[1]), len(texts[i])] for i in batch]
+
+    assert embeddings[:, 0].tolist() == list(range(len(texts)))
+    assert embeddings[:, 1].tolist() == [len(text) for text in texts]
+    print("✅ Original order OK")
+
+def test_padding_ratio():
+    """Sắp theo độ dài giảm mạnh padding so với batch cố định theo thứ tự gốc"""
+    print("\n🧪 Testing padding ratio...")
+    lengths = make_lengths()
+    bucketed = padding_stats(lengths, plan_token_batches(lengths, max_tokens=4096, max_batch_size=64))
+    fixed = padding_stats(lengths, fixed_batches(len(lengths), 8))
+
+    assert bucketed["real_tokens"] == fixed["real_tokens"] == int(lengths.sum())
+    assert bucketed["padding_ratio"] < 0.1 < 0.5 < fixed["padding_ratio"], (bucketed, fixed)
+    assert bucketed["padded_tokens"] < fixed["padded_tokens"] / 2
+
+    assert padding_stats([5, 5], [[0, 1]])["padding_ratio"] == 0.0
+    assert padding_stats([], [])["padding_ratio"] == 0.0
+    print(f"✅ Padding ratio: {bucketed['padding_ratio']:.1%} vs {fixed['padding_ratio']:.1%} with fixed batches")
+
+if __name__ == "__main__":
+    test_token_budget()
+    test_original_order()
+    test_padding_ratio()
+    print("\n✅ All length batching tests completed successfully!")
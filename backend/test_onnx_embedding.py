@@ -0,0 +1,86 @@
+"""
+Test script cho ONNX embedding backend
+Test pooling, parity check và đọc cấu hình sentence-transformers (không cần onnxruntime/model)
+"""
+
+import os
+import sys
+import json
+import tempfile
+import numpy as np
+
+# Add backend to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.onnx_embedding import embedding_parity, pool_embeddings, read_sentence_transformer_config
+
+def test_pool_embeddings():
+    """Mean pooling bỏ qua padding, giống sentence-transformers"""
+    print("\n🧪 Testing pooling...")
+    rng = np.random.default_rng(0)
+    hidden_states = rng.standard_normal((2, 4, 8)).astype(np.float32)
+    attention_mask = np.array([[1, 1, 1, 1], [1, 1, 0, 0]])
+
+    pooled = pool_embeddings(hidden_states, attention_mask, "mean", normalize=False)
+    assert pooled.dtype == np.float32 and pooled.shape == (2, 8)
+    assert np.allclose(pooled[0], hidden_states[0].mean(axis=0), atol=1e-6)
+    assert np.allclose(pooled[1], hidden_states[1, :2].mean(axis=0), atol=1e-6)
+
+    normalized = pool_embeddings(hidden_states, attention_mask, "mean", normalize=True)
+    assert np.allclose(np.linalg.norm(normalized, axis=1), 1.0, atol=1e-6)
+    assert np.allclose(normalized[1], pooled[1] / np.linalg.norm(pooled[1]), atol=1e-6)
+
+    cls = pool_embeddings(hidden_states, attention_mask, "cls", normalize=False)
+    assert np.allclose(cls, hidden_states[:, 0])
+    print("✅ Pooling OK")
+
+def test_embedding_parity():
+    """Cosine từng text giữa embeddings tham chiếu và backend mới"""
+    print("\n🧪 Testing parity check...")
+    rng = np.random.default_rng(1)
+    reference = rng.standard_normal((16, 32)).astype(np.float32)
+
+    same = embedding_parity(reference, reference * 3)
+    assert same["texts"] == 16 and same["min_cosine"] >= 0.999999 and same["max_abs_diff"] < 1e-6
+
+    noisy = reference + rng.standard_normal(reference.shape).astype(np.float32) * 0.05
+    noisy[3] = -reference[3]
+    parity = embedding_parity(reference, noisy)
+    assert parity["min_cosine"] < -0.99 and parity["p01_cosine"] < 0
+    others = embedding_parity(np.delete(reference, 3, axis=0), np.delete(noisy, 3, axis=0))
+    assert others["min_cosine"] > 0.99
+    assert abs(parity["mean_cosine"] - (others["mean_cosine"] * 15 - 1) / 16) < 1e-4
+    print("✅ Parity check OK")
+
+def test_read_sentence_transformer_config():
+    """Đọc pooling/normalize/max_seq_length theo layout SentenceTransformer.save (multilingual-e5-large)"""
+    print("\n🧪 Testing sentence-transformers config...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with open(os.path.join(tmp_dir, "modules.json"), 'w') as f:
+            json.dump([
+                {"idx": 0, "name": "0", "path": "", "type": "sentence_transformers.models.Transformer"},
+                {"idx": 1, "name": "1", "path": "1_Pooling", "type": "sentence_transformers.models.Pooling"},
+                {"idx": 2, "name": "2", "path": "2_Normalize", "type": "sentence_transformers.models.Normalize"}
+            ], f)
+        os.makedirs(os.path.join(tmp_dir, "1_Pooling"))
+        with open(os.path.join(tmp_dir, "1_Pooling", "config.json"), 'w') as f:
+            json.dump({"word_embedding_dimension": 1024, "pooling_mode_cls_token": False, "pooling_mode_mean_tokens": True}, f)
+        with open(os.path.join(tmp_dir, "sentence_bert_config.json"), 'w') as f:
+            json.dump({"max_seq_length": 512, "do_lower_case": False}, f)
+
+        assert read_sentence_transformer_config(tmp_dir) == {"pooling": "mean", "normalize": True, "max_seq_length": 512}
+
+        with open(os.path.join(tmp_dir, "1_Pooling", "config.json"), 'w') as f:
+            json.dump({"pooling_mode_max_tokens": True}, f)
+        try:
+            read_sentence_transformer_config(tmp_dir)
+            assert False, "unsupported pooling should be rejected"
+        except ValueError:
+            pass
+    print("✅ Sentence-transformers config OK")
+
+if __name__ == "__main__":
+    test_pool_embeddings()
+    test_embedding_parity()
+    test_read_sentence_transformer_config()
+    print("\n✅ All ONNX embedding tests completed successfully!")
@@ -0,0 +1,112 @@
+"""
+Test script cho Stage Executors
+Test chạy việc blocking ngoài event loop, giới hạn hàng đợi và gauge queue depth
+"""
+
+import os
+import sys
+import time
+import asyncio
+import threading
+
+# Add backend to path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.stage_executor import StageExecutor, StageOverloadedError
+
+def test_event_loop_keeps_serving():
+    """Việc blocking chạy trên thread của stage, event loop vẫn xử lý coroutine khác"""
+    print("\n🧪 Testing event loop keeps serving...")
+    executor = StageExecutor("llm-test", max_workers=1)
+
+    def generate(question: str) -> str:
+        time.sleep(0.2)
+        return f"{question} -> {threading.current_thread().name}"
+
+    async def run():
+        ticks = 0
+
+        async def health_check():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        health = asyncio.create_task(health_check())
+        answer = await executor.run(generate, "câu hỏi")
+        health.cancel()
+        return answer, ticks
+
+    answer, ticks = asyncio.run(run())
+    assert answer == "câu hỏi -> llm-test_0"
+    assert ticks >= 10, ticks
+    stats = executor.get_stats()
+    assert stats["completed"] == 1 and stats["queue_depth"] == 0 and stats["running"] == 0
+    assert stats["avg_run_ms"] >= 200
+    executor.shutdown()
+    print(f"✅ Event loop served {ticks} ticks during generation")
+
+def test_bounded_queue_and_gauges():
+    """Gauge queue_depth/running theo thời gian thực; vượt max_queue bị từ chối; việc bị hủy rời hàng đợi"""
+    print("\n🧪 Testing bounded queue and gauges...")
+    executor = StageExecutor("faiss-test", max_workers=2, max_queue=3)
+    release = threading.Event()
+
+    def search(i: int) -> int:
+        release.wait(5)
+        return i * 10
+
+    async def run():
+        tasks = [asyncio.create_task(executor.run(search, i)) for i in range(5)]
+        await asyncio.sleep(0.05)
+        stats = executor.get_stats()
+        assert stats["running"] == 2 and stats["queue_depth"] == 3, stats
+
+        try:
+            await executor.run(search, 99)
+            assert False, "queue full should reject"
+        except StageOverloadedError:
+            pass
+
+        # Request bị hủy khi còn trong hàng đợi -> không chạy, queue depth giảm
+        tasks[4].cancel()
+        await asyncio.sleep(0.05)
+        assert executor.get_stats()["queue_depth"] == 2
+
+        release.set()
+        return await asyncio.gather(*tasks[:4])
+
+    results = asyncio.run(run())
+    assert results == [0, 10, 20, 30]
+    stats = executor.get_stats()
+    assert stats["rejected"] == 1 and stats["cancelled"] == 1 and stats["completed"] == 4
+    assert stats["max_queue_depth"] == 3 and stats["queue_depth"] == 0 and stats["running"] == 0
+    executor.shutdown()
+    print("✅ Bounded queue and gauges OK")
+
+def test_errors_propagate():
+    """Exception của việc blocking được raise ở coroutine await"""
+    print("\n🧪 Testing errors propagate...")
+    executor = StageExecutor("error-test")
+
+    def fail():
+        raise ValueError("model error")
+
+    async def run():
+        try:
+            await executor.run(fail)
+            assert False, "error should propagate"
+        except ValueError as e:
+            assert str(e) == "model error"
+
+    asyncio.run(run())
+    stats = executor.get_stats()
+    assert stats["failed"] == 1 and stats["completed"] == 0 and stats["running"] == 0
+    executor.shutdown()
+    print("✅ Errors propagate OK")
+
+if __name__ == "__main__":
+    test_event_loop_keeps_serving()
+    test_bounded_queue_and_gauges()
+    test_errors_propagate()
+    print("\n✅ All stage executor tests completed successfully!")